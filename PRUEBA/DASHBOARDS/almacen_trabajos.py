@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+🗃️ almacen_trabajos.py - TABLA DE TRABAJOS COMPARTIDA ENTRE WORKERS WEB Y HOSTS DE RENDER
+- Modo distribuido (DASH_MODO=distribuido): los dashboards encolan y los trabajadores
+  (trabajador_render.py) reclaman trabajos de forma atómica
+- SQLite en modo WAL sobre una carpeta compartida (en una sola máquina basta /tmp o /dev/shm)
+- Latidos: un trabajo cuyo trabajador dejó de latir se vuelve a encolar (hasta MAX_INTENTOS)
+- Cualquier worker web puede consultar estado y ruta del resultado de cualquier trabajo
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import tempfile
+import threading
+
+from progreso import TrabajoCancelado
+
+MODO_DISTRIBUIDO = os.environ.get("DASH_MODO", "local").lower() == "distribuido"
+RUTA_COMPARTIDA = os.environ.get("DASH_COMPARTIDO", os.path.join(tempfile.gettempdir(), "dash_compartido"))
+RUTA_BD_TRABAJOS = os.environ.get("DASH_TRABAJOS_DB", os.path.join(RUTA_COMPARTIDA, "trabajos.sqlite3"))
+
+LATIDO_S = 10            # Cada cuánto late un trabajador por sus trabajos en curso
+LATIDO_VENCIDO_S = 60    # Sin latido por más de esto, el trabajo se considera abandonado
+MAX_INTENTOS = 2
+
+ESTADOS_FINALES = ('terminado', 'error', 'cancelado')
+
+_LOCAL = threading.local()
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id          TEXT PRIMARY KEY,
+    usuario     TEXT,
+    tipo        TEXT,
+    carril      TEXT,
+    parametros  TEXT,
+    estado      TEXT NOT NULL DEFAULT 'pendiente',
+    trabajador  TEXT,
+    intentos    INTEGER NOT NULL DEFAULT 0,
+    creado      REAL,
+    inicio      REAL,
+    latido      REAL,
+    fin         REAL,
+    ruta        TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS trabajos_cola ON trabajos (estado, carril, creado);
+"""
+
+
+def _conexion():
+    """Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+    con = getattr(_LOCAL, 'con', None)
+    if con is None:
+        os.makedirs(os.path.dirname(RUTA_BD_TRABAJOS), exist_ok=True)
+        con = sqlite3.connect(RUTA_BD_TRABAJOS, timeout=30, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.executescript(_ESQUEMA)
+        _LOCAL.con = con
+    return con
+
+
+def _a_dict(fila):
+    if fila is None:
+        return None
+    trabajo = dict(fila)
+    trabajo['parametros'] = json.loads(trabajo['parametros'] or '{}')
+    return trabajo
+
+
+def nombre_trabajador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ════════════════════════════════════════════════════════════════════════
+# LADO WEB: ENCOLAR, CONSULTAR, CANCELAR
+# ════════════════════════════════════════════════════════════════════════
+def encolar_trabajo(id_trab, nombre_usuario, tipo, carril, parametros):
+    """
+    Registra un trabajo pendiente. Si ya existe uno terminado con el mismo id se reemplaza;
+    si hay uno activo con ese id, se devuelve False.
+    """
+    con = _conexion()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        fila = con.execute("SELECT estado FROM trabajos WHERE id = ?", (id_trab,)).fetchone()
+        if fila is not None and fila['estado'] not in ESTADOS_FINALES:
+            con.execute("ROLLBACK")
+            return False
+        con.execute(
+            "INSERT OR REPLACE INTO trabajos (id, usuario, tipo, carril, parametros, estado, intentos, creado) "
+            "VALUES (?, ?, ?, ?, ?, 'pendiente', 0, ?)",
+            (id_trab, nombre_usuario, tipo, carril, json.dumps(parametros, ensure_ascii=False), time.time()))
+        con.execute("COMMIT")
+        return True
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+
+
+def obtener_trabajo(id_trab):
+    return _a_dict(_conexion().execute("SELECT * FROM trabajos WHERE id = ?", (id_trab,)).fetchone())
+
+
+def cancelar_pendiente(id_trab):
+    """Cancela un trabajo que todavía no tomó ningún trabajador (True si se canceló)"""
+    cur = _conexion().execute(
+        "UPDATE trabajos SET estado = 'cancelado', fin = ?, error = 'Cancelado por el usuario' "
+        "WHERE id = ? AND estado = 'pendiente'", (time.time(), id_trab))
+    return cur.rowcount > 0
+
+
+def esperar_resultado(id_trab, intervalo=1.0, tiempo_max=None):
+    """Bloquea hasta que el trabajo termina; devuelve la fila final (o None si se venció tiempo_max)"""
+    inicio = time.time()
+    while True:
+        trabajo = obtener_trabajo(id_trab)
+        if trabajo is None or trabajo['estado'] in ESTADOS_FINALES:
+            return trabajo
+        if tiempo_max is not None and time.time() - inicio > tiempo_max:
+            return None
+        time.sleep(intervalo)
+
+
+def ejecutar_en_cola(id_trab, nombre_usuario, tipo, carril, parametros, intervalo=1.0):
+    """
+    Encola el trabajo y espera a que un trabajador lo termine (lo usa el callback del dashboard).
+
+    Retorna:
+    - ruta del resultado en el almacenamiento compartido, o None si el generador falló
+    Lanza TrabajoCancelado si el trabajo se canceló.
+    """
+    if not encolar_trabajo(id_trab, nombre_usuario, tipo, carril, parametros):
+        raise RuntimeError(f"Ya hay un trabajo en curso con el id {id_trab}")
+    print(f"   📨 Trabajo {id_trab} encolado (carril {carril})")
+
+    trabajo = esperar_resultado(id_trab, intervalo=intervalo)
+    if trabajo is None:
+        return None
+    if trabajo['estado'] == 'cancelado':
+        raise TrabajoCancelado(trabajo['error'] or "Cancelado")
+    if trabajo['estado'] == 'error':
+        print(f"   ❌ Trabajo {id_trab} falló en {trabajo['trabajador']}: {trabajo['error']}")
+        return None
+    return trabajo['ruta']
+
+
+def resumen_cola():
+    """Cantidad de trabajos por estado y carril (para diagnóstico)"""
+    filas = _conexion().execute("SELECT estado, carril, COUNT(*) AS n FROM trabajos GROUP BY estado, carril").fetchall()
+    return [dict(f) for f in filas]
+
+
+# ════════════════════════════════════════════════════════════════════════
+# LADO TRABAJADOR: RECLAMAR, LATIR, FINALIZAR
+# ════════════════════════════════════════════════════════════════════════
+def recuperar_abandonados():
+    """Reencola (o da por fallidos) los trabajos cuyo trabajador dejó de latir"""
+    con = _conexion()
+    limite = time.time() - LATIDO_VENCIDO_S
+    con.execute(
+        "UPDATE trabajos SET estado = 'error', fin = ?, error = 'El trabajador dejó de responder' "
+        "WHERE estado = 'en_curso' AND latido < ? AND intentos >= ?", (time.time(), limite, MAX_INTENTOS))
+    cur = con.execute(
+        "UPDATE trabajos SET estado = 'pendiente', trabajador = NULL "
+        "WHERE estado = 'en_curso' AND latido < ?", (limite,))
+    if cur.rowcount:
+        print(f"   ♻️ Trabajos reencolados por falta de latido: {cur.rowcount}")
+
+
+def reclamar_trabajo(carriles, trabajador=None):
+    """
+    Toma de forma atómica el trabajo pendiente más antiguo de los carriles indicados.
+    BEGIN IMMEDIATE serializa a los trabajadores, así dos procesos nunca toman el mismo trabajo.
+
+    Retorna:
+    - el trabajo (diccionario) o None si la cola está vacía
+    """
+    trabajador = trabajador or nombre_trabajador()
+    con = _conexion()
+    marcas = ",".join("?" * len(carriles))
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        fila = con.execute(
+            f"SELECT id FROM trabajos WHERE estado = 'pendiente' AND carril IN ({marcas}) "
+            "ORDER BY creado LIMIT 1", tuple(carriles)).fetchone()
+        if fila is None:
+            con.execute("COMMIT")
+            return None
+        ahora = time.time()
+        con.execute(
+            "UPDATE trabajos SET estado = 'en_curso', trabajador = ?, intentos = intentos + 1, "
+            "inicio = ?, latido = ? WHERE id = ?", (trabajador, ahora, ahora, fila['id']))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return obtener_trabajo(fila['id'])
+
+
+def latir(ids_trabajos):
+    if not ids_trabajos:
+        return
+    marcas = ",".join("?" * len(ids_trabajos))
+    _conexion().execute(
+        f"UPDATE trabajos SET latido = ? WHERE estado = 'en_curso' AND id IN ({marcas})",
+        (time.time(), *ids_trabajos))
+
+
+def finalizar_trabajo(id_trab, estado, ruta=None, error=None):
+    _conexion().execute(
+        "UPDATE trabajos SET estado = ?, ruta = ?, error = ?, fin = ? WHERE id = ?",
+        (estado, ruta, error, time.time(), id_trab))
+
+
+def limpiar_trabajos_antiguos(horas=48):
+    _conexion().execute(
+        "DELETE FROM trabajos WHERE estado IN ('terminado', 'error', 'cancelado') AND fin < ?",
+        (time.time() - horas * 3600,))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+📦 almacenamiento.py - ALMACENAMIENTO DE LOS MAPAS GENERADOS (LOCAL O COMPATIBLE CON S3)
+- Los generadores siguen calculando su ruta local (ruta_base/USUARIOS/...) y llaman a guardar_figura():
+  con el backend local se escribe ahí mismo; con S3 la misma ruta relativa es la clave del objeto
+- La figura se codifica directamente hacia el destino (archivo temporal + rename, o subida por partes
+  a S3 a través de un pipe), sin armar el PNG completo en memoria
+- Los archivos que ya están en disco (PDF y ZIP del paquete de distrito) se publican con guardar_archivo();
+  los que acompañan al mapa (estadísticas, GeoPackage) van junto a él: mismo nombre base más un sufijo (asociado())
+- Las descargas se sirven con una ruta Flask (/descargas/<clave>) con soporte de Range, ETag y caché,
+  en lugar de pasar el archivo en base64 por un callback de Dash
+
+Configuración (variables de entorno):
+    DASH_ALMACEN=local | s3
+    DASH_S3_BUCKET, DASH_S3_ENDPOINT (p. ej. http://127.0.0.1:9000 para un MinIO local), DASH_S3_PREFIJO
+    DASH_RESULTADOS: carpeta compartida donde trabajador_render publica los mapas (<usuario>/<carpeta>/...);
+                     sus archivos tienen la misma clave 'USUARIOS/...' que los de ruta_base
+"""
+
+import os
+import shutil
+import mimetypes
+import threading
+from urllib.parse import quote
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+BACKEND = os.environ.get("DASH_ALMACEN", "local").lower()
+S3_BUCKET = os.environ.get("DASH_S3_BUCKET", "mapas")
+S3_ENDPOINT = os.environ.get("DASH_S3_ENDPOINT")
+S3_PREFIJO = os.environ.get("DASH_S3_PREFIJO", "")
+RUTA_RESULTADOS = os.environ.get("DASH_RESULTADOS")
+
+PREFIJO_URL = "/descargas"
+PREFIJOS_PERMITIDOS = ("USUARIOS/",)   # Solo se sirven mapas de usuarios por la ruta de descargas
+CACHE_DESCARGAS_S = 3600
+
+_CLIENTE_S3 = None
+_BLOQUEO = threading.Lock()
+
+
+def _cliente_s3():
+    global _CLIENTE_S3
+    with _BLOQUEO:
+        if _CLIENTE_S3 is None:
+            import boto3
+            _CLIENTE_S3 = boto3.client("s3", endpoint_url=S3_ENDPOINT)
+        return _CLIENTE_S3
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RUTAS, CLAVES Y REFERENCIAS
+# ════════════════════════════════════════════════════════════════════════
+def clave_de(ref):
+    """Clave relativa ('USUARIOS/<usuario>/<carpeta>/<archivo>') de una ruta local o referencia s3://"""
+    if ref.startswith("s3://"):
+        clave = ref.split("/", 3)[3]
+        return clave[len(S3_PREFIJO):].lstrip("/") if S3_PREFIJO and clave.startswith(S3_PREFIJO) else clave
+    ruta = os.path.abspath(ref)
+    if RUTA_RESULTADOS and _dentro_de(ruta, RUTA_RESULTADOS):
+        return "USUARIOS/" + os.path.relpath(ruta, os.path.abspath(RUTA_RESULTADOS)).replace(os.sep, "/")
+    return os.path.relpath(ruta, ruta_base).replace(os.sep, "/")
+
+
+def _dentro_de(ruta, carpeta):
+    carpeta = os.path.abspath(carpeta)
+    return os.path.commonpath([ruta, carpeta]) == carpeta
+
+
+def _ruta_de_clave(clave):
+    """Archivo local de una clave segura: primero en DASH_RESULTADOS, luego en ruta_base (o None)"""
+    candidatas = []
+    if RUTA_RESULTADOS and clave.startswith("USUARIOS/"):
+        candidatas.append(os.path.join(RUTA_RESULTADOS, clave[len("USUARIOS/"):]))
+    candidatas.append(os.path.join(ruta_base, clave))
+    return next((r for r in candidatas if os.path.isfile(r)), None)
+
+
+def _clave_segura(clave):
+    """Normaliza la clave y rechaza rutas fuera de los prefijos permitidos (o con '..')"""
+    clave = os.path.normpath(clave).replace(os.sep, "/").lstrip("/")
+    if clave.startswith("..") or not clave.startswith(PREFIJOS_PERMITIDOS):
+        return None
+    return clave
+
+
+def _objeto_s3(clave):
+    return f"{S3_PREFIJO.rstrip('/')}/{clave}" if S3_PREFIJO else clave
+
+
+def ruta_local(ref):
+    """Ruta en disco de una referencia, o None si vive en S3"""
+    return None if ref.startswith("s3://") else ref
+
+
+def asociado(ref, sufijo):
+    """Referencia de un archivo que acompaña al mapa: '<mapa sin extensión><sufijo>' (local o s3://)"""
+    return os.path.splitext(ref)[0] + sufijo
+
+
+def url_descarga(ref):
+    """URL de la ruta Flask que sirve el archivo"""
+    return f"{PREFIJO_URL}/{quote(clave_de(ref))}"
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ESCRITURA
+# ════════════════════════════════════════════════════════════════════════
+def guardar_figura(fig, ruta_destino, **kwargs_savefig):
+    """
+    Guarda una figura de matplotlib en el almacenamiento configurado.
+
+    Parámetros:
+    - fig: figura a guardar
+    - ruta_destino: ruta local que habría usado el generador (define la clave)
+    - kwargs_savefig: se pasan a fig.savefig (dpi, bbox_inches, ...)
+
+    Retorna:
+    - referencia del archivo: la misma ruta local, o 's3://bucket/clave'
+    """
+    formato = os.path.splitext(ruta_destino)[1].lstrip(".").lower() or "png"
+    kwargs_savefig.setdefault("format", formato)
+
+    if BACKEND != "s3":
+        # Se codifica a un temporal en la misma carpeta y se publica con rename atómico
+        os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+        temporal = f"{ruta_destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, "wb") as f:
+                fig.savefig(f, **kwargs_savefig)
+            os.replace(temporal, ruta_destino)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return ruta_destino
+
+    # S3: matplotlib escribe en un extremo del pipe y boto3 sube por partes desde el otro
+    clave = clave_de(ruta_destino)
+    lectura, escritura = os.pipe()
+    errores = []
+    abortar = threading.Event()
+
+    def _subir():
+        try:
+            with os.fdopen(lectura, "rb") as origen:
+                _cliente_s3().upload_fileobj(_LecturaAbortable(origen, abortar), S3_BUCKET, _objeto_s3(clave),
+                                             ExtraArgs={"ContentType": f"image/{formato}" if formato != "pdf" else "application/pdf"})
+        except Exception as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=_subir, daemon=True)
+    hilo.start()
+    try:
+        with os.fdopen(escritura, "wb") as destino:
+            try:
+                fig.savefig(destino, **kwargs_savefig)
+            except BaseException:
+                # Antes de cerrar el pipe: el fin de datos hace fallar la subida (boto3 aborta la
+                # subida por partes) en lugar de publicar un objeto truncado
+                abortar.set()
+                raise
+    finally:
+        hilo.join()
+    if errores:
+        raise errores[0]
+    return f"s3://{S3_BUCKET}/{_objeto_s3(clave)}"
+
+
+def guardar_archivo(ruta_origen, ruta_destino):
+    """
+    Publica en el almacenamiento configurado un archivo ya escrito en disco (PDF, ZIP, estadísticas, GeoPackage).
+
+    Parámetros:
+    - ruta_origen: archivo local
+    - ruta_destino: ruta local que define la clave (para los archivos del mapa, asociado(mapa, sufijo))
+
+    Retorna:
+    - referencia del archivo: la ruta local de destino, o 's3://bucket/clave'
+    """
+    if BACKEND != "s3":
+        if os.path.abspath(ruta_origen) != os.path.abspath(ruta_destino):
+            os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+            temporal = f"{ruta_destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                shutil.copy2(ruta_origen, temporal)
+                os.replace(temporal, ruta_destino)
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+        return ruta_destino
+
+    # upload_file aborta la subida por partes si falla: no quedan objetos truncados
+    clave = clave_de(ruta_destino)
+    tipo = mimetypes.guess_type(ruta_destino)[0] or "application/octet-stream"
+    _cliente_s3().upload_file(ruta_origen, S3_BUCKET, _objeto_s3(clave), ExtraArgs={"ContentType": tipo})
+    return f"s3://{S3_BUCKET}/{_objeto_s3(clave)}"
+
+
+class _LecturaAbortable:
+    """Extremo de lectura del pipe que, si la escritura falló, convierte el fin de datos en un error"""
+
+    def __init__(self, origen, abortar):
+        self._origen = origen
+        self._abortar = abortar
+
+    def read(self, n=-1):
+        datos = self._origen.read(n)
+        if not datos and self._abortar.is_set():
+            raise IOError("La figura no se terminó de codificar: subida abortada")
+        return datos
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CONSULTA
+# ════════════════════════════════════════════════════════════════════════
+def _cabecera_s3(ref):
+    from botocore.exceptions import ClientError
+    try:
+        return _cliente_s3().head_object(Bucket=S3_BUCKET, Key=_objeto_s3(clave_de(ref)))
+    except ClientError:
+        return None
+
+
+def existe(ref):
+    if not ref:
+        return False
+    if ref.startswith("s3://"):
+        return _cabecera_s3(ref) is not None
+    return os.path.exists(ref)
+
+
+def leer_bytes(ref):
+    """Contenido de un archivo (ruta local o s3://), o None si no existe"""
+    if not ref.startswith("s3://"):
+        try:
+            with open(ref, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+    from botocore.exceptions import ClientError
+    try:
+        return _cliente_s3().get_object(Bucket=S3_BUCKET, Key=_objeto_s3(clave_de(ref)))['Body'].read()
+    except ClientError:
+        return None
+
+
+def tamano(ref):
+    """Tamaño en bytes (0 si no existe)"""
+    if ref.startswith("s3://"):
+        cabecera = _cabecera_s3(ref)
+        return cabecera['ContentLength'] if cabecera else 0
+    return os.path.getsize(ref) if os.path.exists(ref) else 0
+
+
+# ════════════════════════════════════════════════════════════════════════
+# DESCARGAS (RUTA FLASK)
+# ════════════════════════════════════════════════════════════════════════
+def registrar_descargas(server):
+    """Agrega /descargas/<clave> al servidor Flask de un dashboard"""
+    from flask import send_file, request, Response, abort
+
+    @server.route(f"{PREFIJO_URL}/<path:clave>")
+    def descargar_mapa(clave):
+        clave = _clave_segura(clave)
+        if clave is None:
+            abort(404)
+        nombre = os.path.basename(clave)
+
+        if BACKEND != "s3":
+            ruta = _ruta_de_clave(clave)
+            if ruta is None:
+                abort(404)
+            # conditional=True: responde Range (206), If-None-Match / If-Modified-Since (304)
+            return send_file(ruta, as_attachment=True, download_name=nombre,
+                             conditional=True, max_age=CACHE_DESCARGAS_S)
+
+        from botocore.exceptions import ClientError
+        parametros = {'Bucket': S3_BUCKET, 'Key': _objeto_s3(clave)}
+        if request.headers.get('Range'):
+            parametros['Range'] = request.headers['Range']
+        if request.headers.get('If-None-Match'):
+            parametros['IfNoneMatch'] = request.headers['If-None-Match']
+        try:
+            objeto = _cliente_s3().get_object(**parametros)
+        except ClientError as e:
+            codigo = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 404)
+            if codigo == 304:
+                return Response(status=304)
+            abort(416 if codigo == 416 else 404)
+
+        cabeceras = {
+            'Content-Length': str(objeto['ContentLength']),
+            'Accept-Ranges': 'bytes',
+            'ETag': objeto.get('ETag', ''),
+            'Cache-Control': f"private, max-age={CACHE_DESCARGAS_S}",
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(nombre)}",
+        }
+        if objeto.get('LastModified'):
+            cabeceras['Last-Modified'] = objeto['LastModified'].strftime('%a, %d %b %Y %H:%M:%S GMT')
+        if objeto.get('ContentRange'):
+            cabeceras['Content-Range'] = objeto['ContentRange']
+        return Response(objeto['Body'].iter_chunks(chunk_size=256 * 1024),
+                        status=206 if objeto.get('ContentRange') else 200,
+                        headers=cabeceras, mimetype=objeto.get('ContentType', 'application/octet-stream'),
+                        direct_passthrough=True)
+
+    return descargar_mapa
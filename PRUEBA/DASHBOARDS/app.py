@@ -12,7 +12,15 @@ from climatica_final import generar_mapa_climatica
 from poblacion_final import generar_mapa_poblacion
 from vias_final import generar_mapa_vias
 from pendientes_final import generar_mapa_pendientes
+from pendientes_dem import RUTA_DEM_PENDIENTES, RUTA_PENDIENTES_NACIONAL
 from geologia_final import generar_mapa_geologia
+from rios_final import generar_mapa_rios, UMBRALES as UMBRALES_RIOS
+from progreso import id_trabajo, TOKEN_PAGINA_JS, trabajo_en_curso, leer_progreso, formatear_segundos, cancelar_trabajo
+from planificador import turno, TrabajoCancelado, TrabajoRechazado
+from estimador import estimar_trabajo, resumen_estimacion
+from planificador import carril_de
+from almacen_trabajos import MODO_DISTRIBUIDO, ejecutar_en_cola, cancelar_pendiente
+from almacenamiento import registrar_descargas, url_descarga, existe, tamano
 
 # ==================== CONFIGURACIÓN DE LA APP ====================
 app = Dash(
@@ -25,6 +33,11 @@ app = Dash(
     suppress_callback_exceptions=True
 )
 
+# Servidor WSGI para varios workers web (modo distribuido): gunicorn -w 3 -b :8051 app:server
+server = app.server
+# Descargas servidas por Flask (Range, ETag, caché) en lugar de dcc.send_file
+registrar_descargas(server)
+
 # Inyectar CSS con tema verde y animaciones
 app.index_string = '''
 <!DOCTYPE html>
@@ -542,9 +555,9 @@ login_layout = dbc.Container([
 
 # ==================== LAYOUT DEL DASHBOARD ====================
 dashboard_layout = dbc.Container([
-    dcc.Download(id="download-map-image"),
     dcc.Store(id='map-filepath-store', storage_type='memory'),
     dcc.Store(id='loading-state', storage_type='memory', data=False),
+    dcc.Interval(id='progreso-intervalo', interval=1000, disabled=True),
     
     # Footer de contactos
     html.Div([
@@ -633,12 +646,30 @@ dashboard_layout = dbc.Container([
                                         {'label': '📐 Mapa de pendientes', 'value': 'pendientes'},
                                         {'label': '🛣️ Mapa de vías', 'value': 'vias'},
                                         {'label': '🏘️ Mapa de centros poblados', 'value': 'centros'},
-                                        {'label': '🪨 Mapa de geología', 'value': 'geologia'}
+                                        {'label': '🪨 Mapa de geología', 'value': 'geologia'},
+                                        {'label': '🌊 Mapa de red hidrográfica', 'value': 'rios'}
                                     ],
                                     placeholder='Seleccione el tipo de mapa',
                                     className='mb-4'
                                 )
-                            ])
+                            ]),
+                            
+                            # Solo para el mapa de ríos: todas las intensidades salen de la misma
+                            # acumulación de flujo en caché, así que cambiarla no recalcula el DEM
+                            html.Div([
+                                html.Label([
+                                    html.I(className="bi bi-water me-2"),
+                                    "Intensidad de red"
+                                ]),
+                                dcc.Dropdown(
+                                    id='intensidad-rios',
+                                    options=[{'label': f"{k.replace('_', ' ').capitalize()} (≥ {v} celdas)", 'value': k}
+                                             for k, v in UMBRALES_RIOS.items()],
+                                    value='media',
+                                    clearable=False,
+                                    className='mb-4'
+                                )
+                            ], id='intensidad-rios-panel', style={'display': 'none'})
                         ], md=12)
                     ]),
                     
@@ -710,6 +741,14 @@ dashboard_layout = dbc.Container([
                         className="result-panel"
                     ),
                     
+                    # Progreso del mapa en curso (lo alimenta progreso.etapa desde el generador)
+                    html.Div([
+                        dbc.Progress(id='progreso-barra', value=0, striped=True, animated=True,
+                                     color='success', className='mb-2', style={'height': '22px'}),
+                        html.Div(id='progreso-texto', className='text-center',
+                                 style={'color': '#558B2F', 'fontWeight': '600'})
+                    ], id='progreso-panel', style={'display': 'none'}, className='mt-3'),
+                    
                     html.Hr(style={'borderTop': '2px dashed #C5E1A5', 'margin': '20px 0'}),
                     
                     dbc.Row([
@@ -745,6 +784,16 @@ dashboard_layout = dbc.Container([
                             className='w-100 mb-3',
                             disabled=True),
                             
+                            dbc.Button([
+                                html.I(className="bi bi-x-octagon me-2"),
+                                'Cancelar'
+                            ],
+                            id='cancel-map-button',
+                            color='danger',
+                            size='lg',
+                            className='w-100 mb-3',
+                            style={'display': 'none'}),
+                            
                             dbc.Button([
                                 html.I(className="bi bi-download me-2"),
                                 'Descargar Mapa'
@@ -753,6 +802,7 @@ dashboard_layout = dbc.Container([
                             color='info',
                             size='lg',
                             className='w-100 mb-3',
+                            external_link=True,
                             disabled=True),
                             
                             dbc.Button([
@@ -773,11 +823,16 @@ dashboard_layout = dbc.Container([
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
     dcc.Store(id='session-store', storage_type='session'),
+    dcc.Store(id='token-pagina', storage_type='memory'),
     dcc.Store(id='loading-state', storage_type='memory', data=False),
     html.Div(id='page-content')
 ])
 
 # ==================== CALLBACKS ====================
+# Token de la pestaña para los ids de trabajo (progreso.id_trabajo)
+app.clientside_callback(TOKEN_PAGINA_JS, Output('token-pagina', 'data'), Input('url', 'pathname'),
+                        State('token-pagina', 'data'))
+
 @app.callback(Output('page-content', 'children'), Input('session-store', 'data'))
 def display_page(session_data): 
     return dashboard_layout if session_data and session_data.get('logged_in') else login_layout
@@ -859,11 +914,16 @@ def enable_buttons(*values):
     all_filled = all(form_values)
     return not all_filled, not all_filled, False
 
+@app.callback(Output('intensidad-rios-panel', 'style'), Input('map-type', 'value'))
+def toggle_intensidad_rios(map_type):
+    return {'display': 'block'} if map_type == 'rios' else {'display': 'none'}
+
 @app.callback(
     Output('selection-summary', 'children'), 
-    [Input(c, 'value') for c in ['user-name-input', 'map-type', 'departamento-dropdown', 'provincia-dropdown', 'distrito-dropdown']]
+    [Input(c, 'value') for c in ['user-name-input', 'map-type', 'departamento-dropdown', 'provincia-dropdown', 'distrito-dropdown']],
+    Input('intensidad-rios', 'value')
 )
-def update_summary(user_name, map_type, departamento, provincia, distrito):
+def update_summary(user_name, map_type, departamento, provincia, distrito, intensidad_rios):
     if not any([user_name, map_type, departamento, provincia, distrito]): 
         return dbc.Alert([
             html.I(className="bi bi-info-circle me-2"),
@@ -877,7 +937,8 @@ def update_summary(user_name, map_type, departamento, provincia, distrito):
         'pendientes': 'Pendientes',
         'vias': 'Vías',
         'centros': 'Centros Poblados',
-        'geologia': 'Mapa Geológico'
+        'geologia': 'Mapa Geológico',
+        'rios': 'Red Hidrográfica'
     }
     
     summary_items = []
@@ -891,6 +952,11 @@ def update_summary(user_name, map_type, departamento, provincia, distrito):
         html.Strong("Tipo: "),
         map_types_dict.get(map_type, '')
     ], className='mb-2'))
+    if map_type == 'rios' and intensidad_rios: summary_items.append(html.Div([
+        html.I(className="bi bi-water me-2", style={'color': '#7CB342'}),
+        html.Strong("Intensidad: "),
+        f"{intensidad_rios.replace('_', ' ')} (umbral {UMBRALES_RIOS[intensidad_rios]} celdas)"
+    ], className='mb-2'))
     if departamento: summary_items.append(html.Div([
         html.I(className="bi bi-geo-alt-fill me-2", style={'color': '#7CB342'}),
         html.Strong("Departamento: "),
@@ -907,8 +973,31 @@ def update_summary(user_name, map_type, departamento, provincia, distrito):
         distrito
     ], className='mb-2'))
     
+    # Estimación previa (sin generar nada) para advertir antes de lanzar mapas muy grandes
+    if all([map_type, departamento, provincia, distrito]):
+        estimacion = estimar_sin_errores(map_type, departamento, provincia, distrito)
+        if estimacion:
+            summary_items.append(html.Div([
+                html.I(className="bi bi-stopwatch me-2", style={'color': '#7CB342'}),
+                html.Strong("Estimado: "),
+                resumen_estimacion(estimacion)
+            ], className='mb-2'))
+            for advertencia in estimacion['advertencias']:
+                summary_items.append(dbc.Alert([
+                    html.I(className="bi bi-exclamation-triangle-fill me-2"),
+                    advertencia
+                ], color="warning", className='py-2 mb-2'))
+    
     return html.Div(summary_items)
 
+def estimar_sin_errores(map_type, departamento, provincia, distrito):
+    """La estimación es orientativa: si falla, el mapa se genera igual"""
+    try:
+        return estimar_trabajo(map_type, departamento, provincia, distrito)
+    except Exception as e:
+        print(f"⚠️ No se pudo estimar el costo del mapa: {e}")
+        return None
+
 # Callback para activar el estado de carga al presionar el botón
 @app.callback(
     Output('loading-state', 'data', allow_duplicate=True),
@@ -923,6 +1012,69 @@ def activate_loading(n_clicks):
         'Procesando...'
     ]
 
+# El intervalo de consulta solo corre mientras se genera un mapa
+@app.callback(
+    Output('progreso-intervalo', 'disabled'),
+    Output('progreso-intervalo', 'n_intervals'),
+    Output('cancel-map-button', 'style'),
+    Output('cancel-map-button', 'disabled'),
+    Input('loading-state', 'data')
+)
+def toggle_progreso(cargando):
+    return not cargando, 0, ({'display': 'block'} if cargando else {'display': 'none'}), False
+
+# Callback para cancelar el mapa en curso (el generador se detiene en su siguiente etapa)
+@app.callback(
+    Output('cancel-map-button', 'disabled', allow_duplicate=True),
+    Input('cancel-map-button', 'n_clicks'),
+    State('generate-map-button', 'n_clicks'),
+    State('user-name-input', 'value'),
+    State('map-type', 'value'),
+    State('token-pagina', 'data'),
+    prevent_initial_call=True
+)
+def cancel_map(n_clicks, generate_clicks, user_name, map_type, token_pagina):
+    if not n_clicks or not generate_clicks:
+        return False
+    print(f"\n🛑 Cancelación solicitada por {user_name} ({map_type})")
+    id_trab = id_trabajo(user_name, map_type, generate_clicks, token_pagina)
+    if MODO_DISTRIBUIDO:
+        cancelar_pendiente(id_trab)
+    cancelar_trabajo(id_trab)
+    return True
+
+# Callback que consulta la etapa actual del generador
+@app.callback(
+    Output('progreso-barra', 'value'),
+    Output('progreso-barra', 'label'),
+    Output('progreso-texto', 'children'),
+    Output('progreso-panel', 'style'),
+    Input('progreso-intervalo', 'n_intervals'),
+    State('loading-state', 'data'),
+    State('generate-map-button', 'n_clicks'),
+    State('user-name-input', 'value'),
+    State('map-type', 'value'),
+    State('token-pagina', 'data'),
+    prevent_initial_call=True
+)
+def actualizar_progreso(n_intervals, cargando, n_clicks, user_name, map_type, token_pagina):
+    if not cargando or not n_clicks:
+        return 0, "", "", {'display': 'none'}
+    
+    estado = leer_progreso(id_trabajo(user_name, map_type, n_clicks, token_pagina))
+    if not estado:
+        return 0, "", "Iniciando...", {'display': 'block'}
+    
+    pct = estado.get('pct', 0)
+    texto = [
+        html.I(className="bi bi-gear-wide-connected me-2"),
+        estado.get('etapa', ''),
+        html.Span(f"  ·  transcurrido {formatear_segundos(estado.get('transcurrido_s'))}"
+                  f"  ·  restante ~{formatear_segundos(estado.get('eta_s'))}",
+                  style={'color': '#689F38', 'fontWeight': '400'})
+    ]
+    return pct, f"{pct:.0f}%", texto, {'display': 'block'}
+
 # Callback de generación con estado de carga
 @app.callback(
     Output('map-container', 'children'),
@@ -934,40 +1086,59 @@ def activate_loading(n_clicks):
      State('map-type', 'value'),
      State('departamento-dropdown', 'value'),
      State('provincia-dropdown', 'value'),
-     State('distrito-dropdown', 'value')],
+     State('distrito-dropdown', 'value'),
+     State('intensidad-rios', 'value'),
+     State('token-pagina', 'data')],
     prevent_initial_call=True
 )
-def generate_and_save_map_callback(n_clicks, user_name, map_type, departamento, provincia, distrito):
+def generate_and_save_map_callback(n_clicks, user_name, map_type, departamento, provincia, distrito, intensidad_rios,
+                                   token_pagina):
     ruta_guardado = None
     
     try:
-        if map_type == 'geografico':
-            print(f"\n🗺️ Generando mapa geográfico para {distrito}...")
-            ruta_guardado = generar_mapa_final(user_name, departamento, provincia, distrito)
-        elif map_type == 'geomorfologia':
-            print(f"\n🌄 Generando mapa de geomorfología para {distrito}...")
-            ruta_guardado = generar_mapa_geomorfologia(user_name, departamento, provincia, distrito)
-        elif map_type == 'climatica':
-            print(f"\n🌡️ Generando mapa climático para {distrito}...")
-            ruta_guardado = generar_mapa_climatica(user_name, departamento, provincia, distrito)
-        elif map_type == 'pendientes':
-            print(f"\n📐 Generando mapa de pendientes para {distrito}...")
-            ruta_pendientes = "/workspaces/AUTOMATIZACION_DASH/PRUEBA/DATA/PENDIENTES/pendientes.tif"
-            if not os.path.exists(ruta_pendientes):
-                raise FileNotFoundError(f"Archivo de pendientes no encontrado: {ruta_pendientes}")
-            ruta_guardado = generar_mapa_pendientes(user_name, departamento, provincia, distrito)
-        elif map_type == 'vias':
-            print(f"\n🛣️ Generando mapa de vías para {distrito}...")
-            ruta_guardado = generar_mapa_vias(user_name, departamento, provincia, distrito)
-        elif map_type == 'centros':
-            print(f"\n🏘️ Generando mapa de centros poblados para {distrito}...")
-            ruta_guardado = generar_mapa_poblacion(user_name, departamento, provincia, distrito)
-        elif map_type == 'geologia':
-            print(f"\n🪨 Generando mapa geológico para {distrito}...")
-            ruta_guardado = generar_mapa_geologia(user_name, departamento, provincia, distrito)
+        # Las etapas que reporta el generador se muestran en la barra de progreso;
+        # el planificador decide cuándo empieza (carril ligero/pesado) y aplica el tiempo límite
+        id_trab = id_trabajo(user_name, map_type, n_clicks, token_pagina)
+        estimacion = estimar_sin_errores(map_type, departamento, provincia, distrito)
+        if MODO_DISTRIBUIDO:
+            # Un host de render (trabajador_render.py) genera el mapa; este worker web solo espera
+            ruta_guardado = ejecutar_en_cola(
+                id_trab, user_name, map_type, carril_de(map_type, estimacion),
+                {'departamento': departamento, 'provincia': provincia, 'distrito': distrito, 'estimacion': estimacion,
+                 'opciones': {'intensidad': intensidad_rios} if map_type == 'rios' else {}})
+        else:
+            with trabajo_en_curso(id_trab, f"{map_type} - {distrito}"), turno(id_trab, user_name, map_type, estimacion):
+                if map_type == 'geografico':
+                    print(f"\n🗺️ Generando mapa geográfico para {distrito}...")
+                    ruta_guardado = generar_mapa_final(user_name, departamento, provincia, distrito)
+                elif map_type == 'geomorfologia':
+                    print(f"\n🌄 Generando mapa de geomorfología para {distrito}...")
+                    ruta_guardado = generar_mapa_geomorfologia(user_name, departamento, provincia, distrito)
+                elif map_type == 'climatica':
+                    print(f"\n🌡️ Generando mapa climático para {distrito}...")
+                    ruta_guardado = generar_mapa_climatica(user_name, departamento, provincia, distrito)
+                elif map_type == 'pendientes':
+                    print(f"\n📐 Generando mapa de pendientes para {distrito}...")
+                    # Las pendientes salen del DEM (caché por distrito); el ráster nacional queda de respaldo
+                    if not (os.path.exists(RUTA_DEM_PENDIENTES) or os.path.exists(RUTA_PENDIENTES_NACIONAL)):
+                        raise FileNotFoundError(f"No se encontró el DEM de pendientes: {RUTA_DEM_PENDIENTES}")
+                    ruta_guardado = generar_mapa_pendientes(user_name, departamento, provincia, distrito)
+                elif map_type == 'vias':
+                    print(f"\n🛣️ Generando mapa de vías para {distrito}...")
+                    ruta_guardado = generar_mapa_vias(user_name, departamento, provincia, distrito)
+                elif map_type == 'centros':
+                    print(f"\n🏘️ Generando mapa de centros poblados para {distrito}...")
+                    ruta_guardado = generar_mapa_poblacion(user_name, departamento, provincia, distrito)
+                elif map_type == 'geologia':
+                    print(f"\n🪨 Generando mapa geológico para {distrito}...")
+                    ruta_guardado = generar_mapa_geologia(user_name, departamento, provincia, distrito)
+                elif map_type == 'rios':
+                    print(f"\n🌊 Generando mapa de red hidrográfica ({intensidad_rios}) para {distrito}...")
+                    ruta_guardado = generar_mapa_rios(user_name, departamento, provincia, distrito,
+                                                      intensidad=intensidad_rios or 'media')
         
-        if ruta_guardado and os.path.exists(ruta_guardado):
-            file_size_mb = os.path.getsize(ruta_guardado) / (1024 * 1024)
+        if existe(ruta_guardado):
+            file_size_mb = tamano(ruta_guardado) / (1024 * 1024)
             
             success_alert = html.Div([
                 dbc.Alert([
@@ -1059,6 +1230,25 @@ def generate_and_save_map_callback(n_clicks, user_name, map_type, departamento,
         
         return error_alert, None, False, button_text
         
+    except (TrabajoCancelado, TrabajoRechazado) as e:
+        print(f"🛑 Mapa no generado: {str(e)}")
+        
+        cancel_alert = dbc.Alert([
+            html.Div([
+                html.I(className="bi bi-stop-circle-fill", style={'fontSize': '3rem', 'color': '#F57C00'})
+            ], className='text-center mb-3'),
+            html.H4("Generación Detenida", className="alert-heading text-center", style={'fontWeight': '700'}),
+            html.Hr(),
+            html.P(str(e), className='text-center mb-0')
+        ], color="warning", className='border-0')
+        
+        button_text = [
+            html.I(className="bi bi-rocket-takeoff me-2"),
+            'Generar Mapa'
+        ]
+        
+        return cancel_alert, None, False, button_text
+        
     except Exception as e:
         print(f"❌ Excepción al generar mapa: {str(e)}")
         import traceback
@@ -1082,20 +1272,14 @@ def generate_and_save_map_callback(n_clicks, user_name, map_type, departamento,
         return error_alert, None, False, button_text
 
 @app.callback(
-    Output('download-map-image', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('map-filepath-store', 'data'),
-    prevent_initial_call=True
+    Output('download-button', 'href'),
+    Input('map-filepath-store', 'data')
 )
-def download_map(n_clicks, filepath):
-    if not n_clicks or not filepath or not os.path.exists(filepath):
-        return None
-    try:
-        print(f"📥 Iniciando descarga de: {filepath}")
-        return dcc.send_file(filepath)
-    except Exception as e:
-        print(f"❌ Error al descargar archivo: {e}")
+def download_map(filepath):
+    if not filepath:
         return None
+    print(f"📥 Descarga disponible de: {filepath}")
+    return url_descarga(filepath)
 
 @app.callback(
     Output('download-recursos-button', 'n_clicks'),
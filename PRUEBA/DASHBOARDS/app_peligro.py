@@ -1,12 +1,20 @@
 # Archivo: app_peligro.py - DASHBOARD PROFESIONAL PARA MAPA DE PELIGRO
 
-from dash import Dash, html, dcc, Input, Output, State
+from dash import Dash, html, dcc, Input, Output, State, no_update
 import dash_bootstrap_components as dbc
 import re
 import os
 
 # Importar la función del mapa de peligro
-from mapa_peligro import generar_mapa_peligro
+from mapa_peligro import generar_mapa_peligro, ESCENARIOS_PPMAX, ESCENARIO_PPMAX, escenarios_ppmax_disponibles
+from peligro_raster import NOMBRES_PESO, normalizar_pesos, describir_pesos, leer_estadisticas
+from modelos_peligro import MODELOS_PELIGRO, obtener_modelo, columnas_modelo, pesos_modelo
+from progreso import id_trabajo, TOKEN_PAGINA_JS, trabajo_en_curso, leer_progreso, formatear_segundos, cancelar_trabajo
+from planificador import turno, TrabajoCancelado, TrabajoRechazado
+from estimador import estimar_trabajo, resumen_estimacion
+from planificador import carril_de
+from almacen_trabajos import MODO_DISTRIBUIDO, ejecutar_en_cola, cancelar_pendiente
+from almacenamiento import registrar_descargas, url_descarga, existe, tamano
 
 # ==================== CONFIGURACIÓN DE LA APP ====================
 app = Dash(
@@ -19,6 +27,11 @@ app = Dash(
     suppress_callback_exceptions=True
 )
 
+# Servidor WSGI para varios workers web (modo distribuido): gunicorn -w 2 -b :8052 app_peligro:server
+server = app.server
+# Descargas servidas por Flask (Range, ETag, caché) en lugar de dcc.send_file
+registrar_descargas(server)
+
 # Inyectar CSS profesional moderno
 app.index_string = '''
 <!DOCTYPE html>
@@ -542,16 +555,6 @@ app.index_string = '''
                 opacity: 0.4;
             }
             
-            .badge-soon {
-                font-size: 0.65rem;
-                padding: 3px 8px;
-                background: rgba(241, 196, 15, 0.2);
-                color: #f1c40f;
-                border-radius: 6px;
-                font-weight: 600;
-                margin-top: -5px;
-            }
-            
             /* RESPONSIVE */
             @media (max-width: 768px) {
                 .main-container {
@@ -596,6 +599,42 @@ app.index_string = '''
 
 VALID_USERS = {'admin': 'admin', 'usuario': 'admin'}
 
+# ==================== PESOS POR MODELO DE PELIGRO ====================
+MODELO_INICIAL = 'inundacion'
+# Una casilla por columna de peso de cualquier modelo; cada modelo muestra solo las suyas
+COLUMNAS_FORMULARIO = list(dict.fromkeys(c for m in MODELOS_PELIGRO.values() for c in columnas_modelo(m)))
+
+def esquema_por_defecto(tipo_peligro):
+    modelo = obtener_modelo(tipo_peligro)
+    propios = [c for c in modelo.esquemas if c not in ('igual', 'ahp')]
+    return propios[0] if propios else 'igual'
+
+def opciones_esquemas(tipo_peligro):
+    modelo = obtener_modelo(tipo_peligro)
+    return ([{'label': etiqueta, 'value': clave} for clave, (etiqueta, _) in modelo.esquemas.items()]
+            + [{'label': "Manual", 'value': 'manual'}])
+
+def estilo_columna_peso(tipo_peligro, columna):
+    return {} if columna in columnas_modelo(obtener_modelo(tipo_peligro)) else {'display': 'none'}
+
+def valor_inicial_peso(columna):
+    """Peso de la columna en el esquema por defecto del primer modelo que la usa"""
+    for clave, modelo in MODELOS_PELIGRO.items():
+        pesos = pesos_modelo(modelo)
+        if columna in pesos:
+            return round(pesos[columna], 3)
+    return 0
+
+# ==================== ESCENARIOS DE PP MÁXIMA ====================
+def opciones_escenarios():
+    """Periodos de retorno de la PP máxima (los que no tienen capa se muestran deshabilitados)"""
+    disponibles = escenarios_ppmax_disponibles()
+    return [{'label': f"TR {tr} años", 'value': tr, 'disabled': tr not in disponibles} for tr in ESCENARIOS_PPMAX]
+
+def estilo_escenario(tipo_peligro):
+    modelo = obtener_modelo(tipo_peligro)
+    return {} if any(f.fuente == 'ppmax' for f in modelo.factores) else {'display': 'none'}
+
 def leer_sql(ruta):
     if not os.path.exists(ruta):
         print(f"⚠️  ADVERTENCIA: La ruta del archivo SQL no existe: '{ruta}'")
@@ -709,11 +748,11 @@ login_layout = dbc.Container([
 
 # ==================== LAYOUT DEL DASHBOARD ====================
 dashboard_layout = dbc.Container([
-    dcc.Download(id="download-map-image"),
     dcc.Store(id='map-filepath-store', storage_type='memory'),
     dcc.Store(id='loading-state', storage_type='memory', data=False),
     dcc.Store(id='selected-peligro', storage_type='memory', data='inundacion'),
     dcc.Store(id='peligro-locked', storage_type='memory', data=False),
+    dcc.Interval(id='progreso-intervalo', interval=1000, disabled=True),
     
     html.Div([
         html.A([
@@ -785,15 +824,13 @@ dashboard_layout = dbc.Container([
                             
                             dbc.Button([
                                 html.I(className="bi bi-arrow-down-right-circle-fill"),
-                                "Deslizamiento",
-                                html.Span("PRÓXIMAMENTE", className="badge-soon")
-                            ], id='btn-deslizamiento', className='btn-peligro', disabled=True, n_clicks=0),
+                                "Deslizamiento"
+                            ], id='btn-deslizamiento', className='btn-peligro', n_clicks=0),
                             
                             dbc.Button([
                                 html.I(className="bi bi-snow2"),
-                                "Heladas",
-                                html.Span("PRÓXIMAMENTE", className="badge-soon")
-                            ], id='btn-heladas', className='btn-peligro', disabled=True, n_clicks=0)
+                                "Heladas"
+                            ], id='btn-heladas', className='btn-peligro', n_clicks=0)
                         ])
                     ], className='mb-4'),
                     
@@ -836,7 +873,49 @@ dashboard_layout = dbc.Container([
                             disabled=True,
                             className='mb-4'
                         )
-                    ])
+                    ]),
+                    
+                    # Ponderación de los factores del modelo elegido: con un esquema distinto del de por
+                    # defecto el mapa usa el motor ráster, que guarda el cubo de pesos del distrito y
+                    # recalcula en segundos
+                    html.Div([
+                        html.Label([
+                            html.I(className="bi bi-sliders"),
+                            "Pesos de los factores"
+                        ]),
+                        dcc.Dropdown(
+                            id='esquema-pesos',
+                            options=opciones_esquemas(MODELO_INICIAL),
+                            value=esquema_por_defecto(MODELO_INICIAL),
+                            clearable=False,
+                            className='mb-2'
+                        ),
+                        dbc.Row([
+                            dbc.Col([
+                                html.Small(NOMBRES_PESO[columna], style={'color': 'var(--text-secondary)'}),
+                                dcc.Input(id=f'peso-{columna}', type='number', min=0, step=0.01,
+                                          value=valor_inicial_peso(columna),
+                                          className='form-control form-control-sm')
+                            ], id=f'col-peso-{columna}', width=4, className='mb-2',
+                               style=estilo_columna_peso(MODELO_INICIAL, columna)) for columna in COLUMNAS_FORMULARIO
+                        ], className='g-2 mb-4')
+                    ]),
+                    
+                    # Escenario de precipitación máxima (periodo de retorno): cada escenario tiene su
+                    # capa recortada y su cubo de pesos en caché, así que cambiarlo recalcula en segundos
+                    html.Div([
+                        html.Label([
+                            html.I(className="bi bi-cloud-rain-heavy"),
+                            "Escenario de PP máxima"
+                        ]),
+                        dcc.Dropdown(
+                            id='escenario-ppmax',
+                            options=opciones_escenarios(),
+                            value=ESCENARIO_PPMAX,
+                            clearable=False,
+                            className='mb-4'
+                        )
+                    ], id='panel-escenario', style=estilo_escenario(MODELO_INICIAL))
                 ])
             ], className='control-panel')
         ], lg=4, className='mb-4 mb-lg-0'),
@@ -858,6 +937,14 @@ dashboard_layout = dbc.Container([
                         className="result-panel"
                     ),
                     
+                    # Progreso del mapa en curso (lo alimenta progreso.etapa desde mapa_peligro.py)
+                    html.Div([
+                        dbc.Progress(id='progreso-barra', value=0, striped=True, animated=True,
+                                     className='mb-2', style={'height': '22px'}),
+                        html.Div(id='progreso-texto', className='text-center',
+                                 style={'color': 'var(--text-secondary)', 'fontWeight': '600'})
+                    ], id='progreso-panel', style={'display': 'none'}, className='mt-3'),
+                    
                     html.Hr(),
                     
                     dbc.Row([
@@ -884,10 +971,15 @@ dashboard_layout = dbc.Container([
                                 'Generar Mapa'
                             ], id='generate-map-button', color='success', className='w-100 mb-3 btn-success', disabled=True),
                             
+                            dbc.Button([
+                                html.I(className="bi bi-x-octagon me-2"),
+                                'Cancelar'
+                            ], id='cancel-map-button', color='danger', className='w-100 mb-3', style={'display': 'none'}),
+                            
                             dbc.Button([
                                 html.I(className="bi bi-download me-2"),
                                 'Descargar'
-                            ], id='download-button', color='info', className='w-100 btn-info', disabled=True)
+                            ], id='download-button', color='info', className='w-100 btn-info', external_link=True, disabled=True)
                         ], lg=7)
                     ], className='g-3')
                 ])
@@ -899,6 +991,7 @@ dashboard_layout = dbc.Container([
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
     dcc.Store(id='session-store', storage_type='session'),
+    dcc.Store(id='token-pagina', storage_type='memory'),
     dcc.Store(id='loading-state', storage_type='memory', data=False),
     dcc.Store(id='selected-peligro', storage_type='memory', data='inundacion'),
     dcc.Store(id='peligro-locked', storage_type='memory', data=False),
@@ -906,6 +999,10 @@ app.layout = html.Div([
 ])
 
 # ==================== CALLBACKS ====================
+# Token de la pestaña para los ids de trabajo (progreso.id_trabajo)
+app.clientside_callback(TOKEN_PAGINA_JS, Output('token-pagina', 'data'), Input('url', 'pathname'),
+                        State('token-pagina', 'data'))
+
 @app.callback(Output('page-content', 'children'), Input('session-store', 'data'))
 def display_page(session_data): 
     return dashboard_layout if session_data and session_data.get('logged_in') else login_layout
@@ -1086,12 +1183,60 @@ def enable_buttons(*values):
     all_filled = all(form_values)
     return not all_filled, not all_filled
 
+@app.callback(
+    Output('esquema-pesos', 'options'),
+    Output('esquema-pesos', 'value'),
+    [Output(f'col-peso-{columna}', 'style') for columna in COLUMNAS_FORMULARIO],
+    Output('panel-escenario', 'style'),
+    Input('selected-peligro', 'data'),
+    prevent_initial_call=True
+)
+def mostrar_pesos_modelo(tipo_peligro):
+    """Esquemas y casillas de peso del modelo elegido (las de los otros modelos se ocultan), y el
+    escenario de PP máxima solo si el modelo la usa"""
+    tipo_peligro = tipo_peligro or MODELO_INICIAL
+    return (opciones_esquemas(tipo_peligro), esquema_por_defecto(tipo_peligro),
+            *[estilo_columna_peso(tipo_peligro, columna) for columna in COLUMNAS_FORMULARIO],
+            estilo_escenario(tipo_peligro))
+
+def escenario_de_formulario(tipo_peligro, escenario):
+    """Periodo de retorno elegido si el modelo usa PP máxima y no es el de por defecto, si no None"""
+    if not escenario or estilo_escenario(tipo_peligro):
+        return None
+    return None if int(escenario) == ESCENARIO_PPMAX else int(escenario)
+
+@app.callback(
+    [Output(f'peso-{columna}', 'value') for columna in COLUMNAS_FORMULARIO],
+    Input('esquema-pesos', 'value'),
+    Input('selected-peligro', 'data'),
+    prevent_initial_call=True
+)
+def aplicar_esquema_pesos(esquema, tipo_peligro):
+    """Un esquema del modelo rellena sus pesos; en 'Manual' (y fuera del modelo) se dejan como están"""
+    modelo = obtener_modelo(tipo_peligro)
+    if esquema not in modelo.esquemas:
+        return [no_update] * len(COLUMNAS_FORMULARIO)
+    pesos = modelo.esquemas[esquema][1]
+    return [round(pesos[columna], 3) if columna in pesos else no_update for columna in COLUMNAS_FORMULARIO]
+
+def pesos_de_formulario(tipo_peligro, valores):
+    """Pesos elegidos en el panel para el modelo (None si son los de por defecto); ValueError si no son válidos"""
+    modelo = obtener_modelo(tipo_peligro)
+    columnas = columnas_modelo(modelo)
+    por_columna = dict(zip(COLUMNAS_FORMULARIO, valores))
+    w = normalizar_pesos([por_columna[c] for c in columnas], columnas)
+    if abs(w - normalizar_pesos(pesos_modelo(modelo), columnas)).max() < 1e-3:
+        return None
+    return [round(float(x), 4) for x in w]
+
 @app.callback(
     Output('selection-summary', 'children'), 
     [Input(c, 'value') for c in ['user-name-input', 'departamento-dropdown', 'provincia-dropdown', 'distrito-dropdown']],
-    Input('selected-peligro', 'data')
+    Input('selected-peligro', 'data'),
+    Input('escenario-ppmax', 'value'),
+    [Input(f'peso-{columna}', 'value') for columna in COLUMNAS_FORMULARIO]
 )
-def update_summary(user_name, departamento, provincia, distrito, tipo_peligro):
+def update_summary(user_name, departamento, provincia, distrito, tipo_peligro, escenario, *valores_pesos):
     if not any([user_name, departamento, provincia, distrito]): 
         return dbc.Alert([
             html.I(className="bi bi-info-circle me-2"),
@@ -1135,8 +1280,64 @@ def update_summary(user_name, departamento, provincia, distrito, tipo_peligro):
             html.Span([html.Strong("Distrito:"), f" {distrito}"])
         ]))
     
+    try:
+        pesos = pesos_de_formulario(tipo_peligro, valores_pesos)
+        if pesos:
+            summary_items.append(html.Div(className='summary-item', children=[
+                html.I(className="bi bi-sliders"),
+                html.Span([html.Strong("Pesos:"), f" {describir_pesos(pesos, columnas_modelo(obtener_modelo(tipo_peligro)))}"])
+            ]))
+    except ValueError as e:
+        summary_items.append(dbc.Alert([
+            html.I(className="bi bi-exclamation-triangle-fill me-2"),
+            f"Pesos no válidos: {e}"
+        ], color="warning", className='py-2 mb-2'))
+    
+    if escenario and not estilo_escenario(tipo_peligro or MODELO_INICIAL):
+        summary_items.append(html.Div(className='summary-item', children=[
+            html.I(className="bi bi-cloud-rain-heavy"),
+            html.Span([html.Strong("PP máxima:"), f" TR {escenario} años"])
+        ]))
+    
+    # Estimación previa (sin generar nada) para advertir antes de lanzar mapas muy grandes
+    if all([departamento, provincia, distrito]):
+        estimacion = estimar_sin_errores(tipo_peligro or 'inundacion', departamento, provincia, distrito)
+        if estimacion:
+            summary_items.append(html.Div(className='summary-item', children=[
+                html.I(className="bi bi-stopwatch"),
+                html.Span([html.Strong("Estimado:"), f" {resumen_estimacion(estimacion)}"])
+            ]))
+            for advertencia in estimacion['advertencias']:
+                summary_items.append(dbc.Alert([
+                    html.I(className="bi bi-exclamation-triangle-fill me-2"),
+                    advertencia
+                ], color="warning", className='py-2 mb-2'))
+    
     return html.Div(summary_items)
 
+def resumen_exposicion(ruta_guardado):
+    """Área por nivel y centros poblados expuestos (de las estadísticas guardadas junto al mapa, local o S3)"""
+    estadisticas = leer_estadisticas(ruta_guardado) if ruta_guardado else None
+    if not estadisticas:
+        return []
+    items = []
+    for fila in estadisticas['niveles']:
+        items.append(html.Div(className='summary-item', children=[
+            html.I(className="bi bi-square-fill"),
+            html.Span([html.Strong(f"{fila['peligro']}:"),
+                       f" {fila['area_km2']:.2f} km² ({fila['porcentaje_distrito']:.1f}%)"
+                       f" · {fila['centros_poblados']} centros poblados"])
+        ]))
+    return items
+
+def estimar_sin_errores(tipo_peligro, departamento, provincia, distrito):
+    """La estimación es orientativa: si falla, el mapa se genera igual"""
+    try:
+        return estimar_trabajo(tipo_peligro, departamento, provincia, distrito)
+    except Exception as e:
+        print(f"⚠️ No se pudo estimar el costo del mapa: {e}")
+        return None
+
 @app.callback(
     Output('loading-state', 'data', allow_duplicate=True),
     Output('generate-map-button', 'children', allow_duplicate=True),
@@ -1149,6 +1350,68 @@ def activate_loading(n_clicks):
         'Procesando...'
     ]
 
+@app.callback(
+    Output('progreso-intervalo', 'disabled'),
+    Output('progreso-intervalo', 'n_intervals'),
+    Output('cancel-map-button', 'style'),
+    Output('cancel-map-button', 'disabled'),
+    Input('loading-state', 'data')
+)
+def toggle_progreso(cargando):
+    return not cargando, 0, ({'display': 'block'} if cargando else {'display': 'none'}), False
+
+@app.callback(
+    Output('cancel-map-button', 'disabled', allow_duplicate=True),
+    Input('cancel-map-button', 'n_clicks'),
+    State('generate-map-button', 'n_clicks'),
+    State('user-name-input', 'value'),
+    State('selected-peligro', 'data'),
+    State('token-pagina', 'data'),
+    prevent_initial_call=True
+)
+def cancel_map(n_clicks, generate_clicks, user_name, tipo_peligro, token_pagina):
+    """Pide detener el mapa en curso (incluye las herramientas de WhiteboxTools)"""
+    if not n_clicks or not generate_clicks:
+        return False
+    print(f"\n🛑 Cancelación solicitada por {user_name}")
+    id_trab = id_trabajo(user_name, tipo_peligro or 'inundacion', generate_clicks, token_pagina)
+    if MODO_DISTRIBUIDO:
+        cancelar_pendiente(id_trab)
+    cancelar_trabajo(id_trab)
+    return True
+
+@app.callback(
+    Output('progreso-barra', 'value'),
+    Output('progreso-barra', 'label'),
+    Output('progreso-texto', 'children'),
+    Output('progreso-panel', 'style'),
+    Input('progreso-intervalo', 'n_intervals'),
+    State('loading-state', 'data'),
+    State('generate-map-button', 'n_clicks'),
+    State('user-name-input', 'value'),
+    State('selected-peligro', 'data'),
+    State('token-pagina', 'data'),
+    prevent_initial_call=True
+)
+def actualizar_progreso(n_intervals, cargando, n_clicks, user_name, tipo_peligro, token_pagina):
+    """Consulta la etapa que reporta mapa_peligro.py mientras se genera el mapa"""
+    if not cargando or not n_clicks:
+        return 0, "", "", {'display': 'none'}
+    
+    estado = leer_progreso(id_trabajo(user_name, tipo_peligro or 'inundacion', n_clicks, token_pagina))
+    if not estado:
+        return 0, "", "Iniciando...", {'display': 'block'}
+    
+    pct = estado.get('pct', 0)
+    texto = [
+        html.I(className="bi bi-gear-wide-connected me-2"),
+        estado.get('etapa', ''),
+        html.Span(f"  ·  transcurrido {formatear_segundos(estado.get('transcurrido_s'))}"
+                  f"  ·  restante ~{formatear_segundos(estado.get('eta_s'))}",
+                  style={'fontWeight': '400'})
+    ]
+    return pct, f"{pct:.0f}%", texto, {'display': 'block'}
+
 @app.callback(
     Output('map-container', 'children'),
     Output('map-filepath-store', 'data'),
@@ -1159,10 +1422,14 @@ def activate_loading(n_clicks):
      State('departamento-dropdown', 'value'),
      State('provincia-dropdown', 'value'),
      State('distrito-dropdown', 'value'),
-     State('selected-peligro', 'data')],
+     State('selected-peligro', 'data'),
+     State('escenario-ppmax', 'value'),
+     State('token-pagina', 'data')]
+    + [State(f'peso-{columna}', 'value') for columna in COLUMNAS_FORMULARIO],
     prevent_initial_call=True
 )
-def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia, distrito, tipo_peligro):
+def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia, distrito, tipo_peligro, escenario,
+                                   token_pagina, *valores_pesos):
     """
     ESTE ES EL ÚNICO CALLBACK QUE EJECUTA EL CÓDIGO mapa_peligro.py
     Se ejecuta SOLO cuando el usuario presiona "Generar Mapa" después de:
@@ -1187,11 +1454,34 @@ def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia,
         print(f"👤 Responsable: {user_name}")
         print(f"{'='*60}\n")
         
-        # AQUÍ SE EJECUTA EL CÓDIGO mapa_peligro.py
-        ruta_guardado = generar_mapa_peligro(user_name, departamento, provincia, distrito)
+        # AQUÍ SE EJECUTA EL CÓDIGO mapa_peligro.py (sus etapas alimentan la barra de progreso;
+        # espera turno en el carril pesado y se detiene si se cancela o vence su tiempo límite)
+        # Pesos propios: motor ráster (el cubo de pesos del distrito queda en caché y los
+        # siguientes cambios de ponderación solo rehacen la suma ponderada)
+        # Otro escenario de PP máxima: también motor ráster (cubo de pesos propio del escenario)
+        pesos = pesos_de_formulario(tipo_peligro, valores_pesos)
+        escenario = escenario_de_formulario(tipo_peligro or 'inundacion', escenario)
+        opciones = {'modelo': tipo_peligro or 'inundacion'}
+        if pesos:
+            opciones.update({'pesos': pesos, 'motor': 'raster'})
+        if escenario:
+            opciones.update({'escenario': escenario, 'motor': 'raster'})
         
-        if ruta_guardado and os.path.exists(ruta_guardado):
-            file_size_mb = os.path.getsize(ruta_guardado) / (1024 * 1024)
+        id_trab = id_trabajo(user_name, tipo_peligro or 'inundacion', n_clicks, token_pagina)
+        estimacion = estimar_sin_errores(tipo_peligro or 'inundacion', departamento, provincia, distrito)
+        if MODO_DISTRIBUIDO:
+            # Un host de render (trabajador_render.py) genera el mapa; este worker web solo espera
+            ruta_guardado = ejecutar_en_cola(
+                id_trab, user_name, tipo_peligro or 'inundacion', carril_de(tipo_peligro or 'inundacion', estimacion),
+                {'departamento': departamento, 'provincia': provincia, 'distrito': distrito, 'estimacion': estimacion,
+                 'opciones': opciones})
+        else:
+            with trabajo_en_curso(id_trab, f"Peligro {peligro_nombre} - {distrito}"), \
+                    turno(id_trab, user_name, tipo_peligro or 'inundacion', estimacion):
+                ruta_guardado = generar_mapa_peligro(user_name, departamento, provincia, distrito, **opciones)
+        
+        if existe(ruta_guardado):
+            file_size_mb = tamano(ruta_guardado) / (1024 * 1024)
             
             success_alert = html.Div([
                 dbc.Alert([
@@ -1217,7 +1507,7 @@ def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia,
                             html.I(className="bi bi-graph-up"),
                             html.Span([html.Strong("Clasificación:"), " Baja, Media, Alta, Muy Alta"])
                         ])
-                    ], className='mt-3')
+                    ] + resumen_exposicion(ruta_guardado), className='mt-3')
                 ], color="success", className='border-0 mb-3'),
                 
                 html.Div([
@@ -1286,6 +1576,25 @@ def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia,
         
         return error_alert, None, False, button_text
         
+    except (TrabajoCancelado, TrabajoRechazado) as e:
+        print(f"\n🛑 Mapa no generado: {str(e)}\n")
+        
+        cancel_alert = dbc.Alert([
+            html.Div([
+                html.I(className="bi bi-stop-circle-fill", style={'fontSize': '2.5rem', 'color': '#f39c12', 'marginBottom': '15px'})
+            ], className='text-center'),
+            html.H5("Generación Detenida", className="alert-heading text-center"),
+            html.Hr(style={'opacity': '0.5'}),
+            html.P(str(e), style={'fontSize': '0.9rem'})
+        ], color="warning", className='border-0')
+        
+        button_text = [
+            html.I(className="bi bi-lightning-fill me-2"),
+            'Generar Mapa'
+        ]
+        
+        return cancel_alert, None, False, button_text
+        
     except Exception as e:
         print(f"\n❌ ERROR INESPERADO en mapa_peligro.py")
         print(f"Detalle: {str(e)}\n")
@@ -1310,20 +1619,14 @@ def generate_and_save_map_callback(n_clicks, user_name, departamento, provincia,
         return error_alert, None, False, button_text
 
 @app.callback(
-    Output('download-map-image', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('map-filepath-store', 'data'),
-    prevent_initial_call=True
+    Output('download-button', 'href'),
+    Input('map-filepath-store', 'data')
 )
-def download_map(n_clicks, filepath):
-    if not n_clicks or not filepath or not os.path.exists(filepath):
-        return None
-    try:
-        print(f"📥 Iniciando descarga: {filepath}")
-        return dcc.send_file(filepath)
-    except Exception as e:
-        print(f"❌ Error al descargar: {e}")
+def download_map(filepath):
+    if not filepath:
         return None
+    print(f"📥 Descarga disponible: {filepath}")
+    return url_descarga(filepath)
 
 if __name__ == '__main__':
     print(f"\n{'='*80}")
@@ -1348,10 +1651,15 @@ if __name__ == '__main__':
     
     if os.path.exists(ruta_base_ppmax):
         ppmax_files = [f for r, d, files in os.walk(ruta_base_ppmax) for f in files if f.endswith('.shp')]
-        print(f"✅ PP_MAX: {len(ppmax_files)} archivos")
+        print(f"✅ PP_MAX: {len(ppmax_files)} archivos (escenarios TR: {', '.join(map(str, escenarios_ppmax_disponibles())) or 'ninguno'})")
     else:
         print("⚠️  PP_MAX: No encontrada")
     
+    from tablas_pesos import listar_tablas
+    tablas = listar_tablas()
+    print(f"✅ TABLAS DE PESOS: {', '.join(t[0] for t in tablas)}" if tablas
+          else "ℹ️  TABLAS DE PESOS: ninguna (se usan las capas con pesos)")
+    
     print(f"{'='*80}\n")
     
     print(f"\n{'='*80}")
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+🌊 cache_hidrologia.py - CACHÉ DE PRODUCTOS HIDROLÓGICOS POR DISTRITO
+- Clave: (ubigeo del distrito, huella del DEM, umbral de acumulación, BUFFERS_CONFIG, motores de hidrología y distancia,
+  regiones precalculadas y margen de la acumulación por distrito)
+- Guarda la red de ríos y los buffers con pesos de cada distrito en su propia carpeta
+- Si la clave existe se reutiliza sin preguntar; si no, se calcula y se publica de forma atómica
+- Nunca devuelve buffers de otro distrito ni de otro DEM
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from espacio_trabajo import espacio_trabajo
+from hidrologia_numpy import MOTOR_HIDROLOGIA
+from distancia_rios import MOTOR_BUFFERS
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_CACHE_HIDROLOGIA = f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO/CACHE"
+ARCHIVO_HUELLAS_DEM = "huellas_dem.json"
+NOMBRE_BUFFERS = "buffers_distancia_rios_PESOS.shp"
+NOMBRE_RIOS = "streams.shp"
+
+_HUELLAS = {}
+_BLOQUEO = threading.Lock()
+
+
+# ════════════════════════════════════════════════════════════════════════
+# HUELLA DEL DEM (SHA-256 DEL CONTENIDO, MEMORIZADA POR RUTA/TAMAÑO/FECHA)
+# ════════════════════════════════════════════════════════════════════════
+def _leer_huellas_guardadas():
+    ruta = os.path.join(RUTA_CACHE_HIDROLOGIA, ARCHIVO_HUELLAS_DEM)
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _guardar_huellas(huellas):
+    os.makedirs(RUTA_CACHE_HIDROLOGIA, exist_ok=True)
+    ruta = os.path.join(RUTA_CACHE_HIDROLOGIA, ARCHIVO_HUELLAS_DEM)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(huellas, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+def huella_dem(ruta_dem):
+    """
+    SHA-256 del archivo DEM. Leer varios GB en cada mapa sería caro, así que el resultado
+    se memoriza (en memoria y en disco) por ruta + tamaño + fecha de modificación.
+    """
+    st = os.stat(ruta_dem)
+    id_archivo = f"{os.path.abspath(ruta_dem)}|{st.st_size}|{st.st_mtime_ns}"
+
+    with _BLOQUEO:
+        if id_archivo in _HUELLAS:
+            return _HUELLAS[id_archivo]
+
+    huellas = _leer_huellas_guardadas()
+    if id_archivo in huellas:
+        with _BLOQUEO:
+            _HUELLAS[id_archivo] = huellas[id_archivo]
+        return huellas[id_archivo]
+
+    print(f"   🔐 Calculando huella del DEM (solo la primera vez): {ruta_dem}")
+    sha = hashlib.sha256()
+    with open(ruta_dem, 'rb') as f:
+        for bloque in iter(lambda: f.read(8 * 1024 * 1024), b''):
+            sha.update(bloque)
+    huella = sha.hexdigest()
+
+    with _BLOQUEO:
+        _HUELLAS[id_archivo] = huella
+    huellas[id_archivo] = huella
+    try:
+        _guardar_huellas(huellas)
+    except OSError as e:
+        print(f"   ⚠️ No se pudo guardar la huella del DEM: {e}")
+    return huella
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CLAVE Y CARPETAS DE LA CACHÉ
+# ════════════════════════════════════════════════════════════════════════
+def clave_hidrologia(ubigeo, ruta_dem, umbral, buffers_config):
+    """Clave estable de la caché (cambia si cambia cualquiera de las entradas)"""
+    entrada = {
+        'ubigeo': str(ubigeo),
+        'dem': huella_dem(ruta_dem),
+        'umbral': umbral,
+        'buffers': [[b['name'], b['inner'], b['outer'], b['peso']] for b in buffers_config],
+    }
+    # Los motores no dan exactamente la misma red: cada uno tiene sus propias entradas
+    if MOTOR_HIDROLOGIA != "whitebox":
+        entrada['motor'] = MOTOR_HIDROLOGIA
+    # Con hidrología regional (o la acumulación del distrito con margen) la red incluye el área
+    # aportante de fuera del distrito
+    from hidrologia_regional import regiones_de_dem, MARGEN_DISTRITO_M
+    regiones = sorted(f"{r['nombre']}@{r['creado']}" for r in regiones_de_dem(ruta_dem))
+    if regiones:
+        entrada['regiones'] = regiones
+    entrada['margen_acumulacion_m'] = MARGEN_DISTRITO_M
+    # Los anillos por transformada de distancia no coinciden con los de shapely (entradas viejas)
+    if MOTOR_BUFFERS != "vectorial":
+        entrada['distancia'] = MOTOR_BUFFERS
+    return hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+
+
+def carpeta_entrada(ubigeo, clave):
+    nombre_ubigeo = "".join(c if c.isalnum() else "_" for c in str(ubigeo))
+    return os.path.join(RUTA_CACHE_HIDROLOGIA, nombre_ubigeo, clave)
+
+
+def buscar_en_cache(ubigeo, clave):
+    """Retorna la carpeta de la entrada si está completa, o None"""
+    carpeta = carpeta_entrada(ubigeo, clave)
+    if os.path.exists(os.path.join(carpeta, "meta.json")) and os.path.exists(os.path.join(carpeta, NOMBRE_BUFFERS)):
+        return carpeta
+    return None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# OBTENER BUFFERS (REUTILIZA O CALCULA)
+# ════════════════════════════════════════════════════════════════════════
+def obtener_buffers_rios(gdf_distrito, ubigeo, ruta_dem, umbral, buffers_config, generar, nombre_usuario=None):
+    """
+    Devuelve la ruta del shapefile de buffers con pesos del distrito.
+
+    Parámetros:
+    - gdf_distrito: GeoDataFrame del distrito
+    - ubigeo: identificador del distrito (forma parte de la clave)
+    - ruta_dem, umbral, buffers_config: entradas del cálculo (forman parte de la clave)
+    - generar: función generar(gdf_distrito, carpeta_salida, temp_folder) -> ruta_shp | None
+    - nombre_usuario: dueño del trabajo (para la cuota de disco temporal)
+
+    Retorna:
+    - ruta del shapefile de buffers o None si falla
+    """
+    if not os.path.exists(ruta_dem):
+        print(f"❌ No se encontró el DEM en: {ruta_dem}")
+        return None
+
+    clave = clave_hidrologia(ubigeo, ruta_dem, umbral, buffers_config)
+    carpeta = buscar_en_cache(ubigeo, clave)
+    if carpeta:
+        print(f"   ⚡ Hidrología en caché para {ubigeo} (clave {clave}), se omite WhiteboxTools")
+        return os.path.join(carpeta, NOMBRE_BUFFERS)
+
+    print(f"   🆕 Sin caché hidrológica para {ubigeo} (clave {clave}): calculando...")
+    carpeta_final = carpeta_entrada(ubigeo, clave)
+    os.makedirs(os.path.dirname(carpeta_final), exist_ok=True)
+
+    # Se calcula en una carpeta propia del proceso y se publica con un rename atómico:
+    # un cálculo interrumpido o concurrente nunca deja una entrada a medias
+    carpeta_temporal = f"{carpeta_final}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(carpeta_temporal, ignore_errors=True)
+    os.makedirs(carpeta_temporal)
+
+    try:
+        # Los intermedios de WhiteboxTools van a una carpeta de trabajo aislada que se borra al salir
+        with espacio_trabajo(nombre_usuario, f"hidro_{ubigeo}") as carpeta_hidro:
+            ruta_buffers = generar(gdf_distrito, carpeta_temporal, temp_folder=carpeta_hidro)
+            if not ruta_buffers:
+                return None
+
+            # La red de ríos vectorizada se conserva junto a los buffers
+            base_rios = os.path.splitext(NOMBRE_RIOS)[0]
+            for archivo in os.listdir(carpeta_hidro):
+                if os.path.splitext(archivo)[0] == base_rios:
+                    shutil.copy2(os.path.join(carpeta_hidro, archivo), os.path.join(carpeta_temporal, archivo))
+
+        with open(os.path.join(carpeta_temporal, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'ubigeo': str(ubigeo),
+                'clave': clave,
+                'dem': os.path.abspath(ruta_dem),
+                'dem_sha256': huella_dem(ruta_dem),
+                'umbral': umbral,
+                'buffers_config': buffers_config,
+            }, f, indent=2, ensure_ascii=False)
+
+        try:
+            os.replace(carpeta_temporal, carpeta_final)
+        except OSError:
+            # Otro proceso publicó la misma clave primero: se usa la suya
+            if not buscar_en_cache(ubigeo, clave):
+                raise
+        print(f"   💾 Hidrología guardada en caché: {carpeta_final}")
+        return os.path.join(carpeta_final, NOMBRE_BUFFERS)
+    finally:
+        shutil.rmtree(carpeta_temporal, ignore_errors=True)
+
+
+def limpiar_cache_hidrologia(ubigeo=None):
+    """Borra la caché de un distrito (o toda si ubigeo es None)"""
+    if ubigeo is None:
+        objetivo = RUTA_CACHE_HIDROLOGIA
+    else:
+        objetivo = os.path.dirname(carpeta_entrada(ubigeo, "x"))
+    shutil.rmtree(objetivo, ignore_errors=True)
+    with _BLOQUEO:
+        _HUELLAS.clear()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+🗂️ capas_cache.py - CACHÉ DE CAPAS BASE COMPARTIDA ENTRE GENERADORES
+- Indexa una sola vez los shapefiles de ruta_base (antes cada generador recorría todo el árbol con os.walk)
+- Mantiene en memoria las capas ya leídas y reproyectadas a EPSG:3857
+- La clave incluye fecha de modificación y tamaño, así un shapefile actualizado se vuelve a leer
+- Las capas en memoria se descartan por antigüedad de uso (LRU) al pasar DASH_MAX_CAPAS_MEMORIA
+- Si una búsqueda no encuentra nada se vuelve a indexar (como mucho cada DASH_REESCANEO_INDICE_S
+  segundos), así un shapefile nuevo aparece sin reiniciar el dashboard
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import geopandas as gpd
+from shapely.geometry import box
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+# Poner en False para volver al comportamiento anterior (leer siempre desde disco)
+CACHE_CAPAS_ACTIVO = True
+MAX_CAPAS_MEMORIA = int(os.environ.get("DASH_MAX_CAPAS_MEMORIA", "16"))
+REESCANEO_INDICE_S = float(os.environ.get("DASH_REESCANEO_INDICE_S", "30"))
+
+# Columnas donde la capa de distritos guarda el ubigeo (según la fuente del shapefile)
+COLUMNAS_UBIGEO = ['IDDIST', 'UBIGEO', 'CODDIST', 'IDDISTRITO']
+
+_INDICE_SHP = None
+_ULTIMO_ESCANEO = 0.0
+_CAPAS = OrderedDict()
+_BLOQUEO = threading.Lock()
+
+
+def indice_shapefiles(refrescar=False):
+    """Lista (en el mismo orden que os.walk) de todos los .shp bajo ruta_base"""
+    global _INDICE_SHP, _ULTIMO_ESCANEO
+    with _BLOQUEO:
+        if _INDICE_SHP is not None and not refrescar:
+            return _INDICE_SHP
+    indice = []
+    for root, _, files in os.walk(ruta_base):
+        for file in files:
+            if file.lower().endswith(".shp"):
+                indice.append(os.path.join(root, file))
+    with _BLOQUEO:
+        _INDICE_SHP = indice
+        _ULTIMO_ESCANEO = time.monotonic()
+    return indice
+
+
+def _buscar_en_indice(indice, nombre):
+    return next((path for path in indice if nombre in os.path.basename(path).lower()), None)
+
+
+def buscar_shapefile_cacheado(nombre_busqueda):
+    """Equivalente a buscar_shapefile() de los generadores, pero sobre el índice en memoria"""
+    nombre = nombre_busqueda.lower()
+    path = _buscar_en_indice(indice_shapefiles(), nombre)
+    if path is not None and os.path.exists(path):
+        return path
+    # Borrado (índice desactualizado) o no encontrado (quizá es un archivo nuevo): se reindexa,
+    # pero los fallos repetidos no recorren el árbol más de una vez cada REESCANEO_INDICE_S
+    with _BLOQUEO:
+        reciente = time.monotonic() - _ULTIMO_ESCANEO < REESCANEO_INDICE_S
+    if path is None and reciente:
+        return None
+    path = _buscar_en_indice(indice_shapefiles(refrescar=True), nombre)
+    return path if path is not None and os.path.exists(path) else None
+
+
+def leer_capa(ruta, epsg_destino=3857, forzar_4326=False):
+    """
+    Lee un shapefile (o lo toma de la caché) y lo devuelve reproyectado.
+
+    Parámetros:
+    - ruta: ruta del archivo vectorial
+    - epsg_destino: EPSG de salida (None para no reproyectar)
+    - forzar_4326: replica la lógica de cargar_shapefile() (asigna 4326 si el CRS no es 4326)
+
+    Retorna:
+    - una copia del GeoDataFrame, para que el llamador pueda modificarla sin afectar la caché
+    """
+    st = os.stat(ruta)
+    clave = (os.path.abspath(ruta), st.st_mtime_ns, st.st_size, epsg_destino, forzar_4326)
+
+    with _BLOQUEO:
+        gdf = _CAPAS.get(clave)
+        if gdf is not None:
+            _CAPAS.move_to_end(clave)
+
+    if gdf is None:
+        gdf = gpd.read_file(ruta)
+        if forzar_4326:
+            if gdf.crs is None or gdf.crs.to_epsg() != 4326:
+                gdf.set_crs(epsg=4326, inplace=True)
+        elif gdf.crs is None:
+            gdf.set_crs(epsg=4326, inplace=True)
+        if epsg_destino is not None:
+            gdf = gdf.to_crs(epsg=epsg_destino)
+        if CACHE_CAPAS_ACTIVO:
+            with _BLOQUEO:
+                # Las versiones anteriores del mismo archivo ya no se volverán a pedir
+                for vieja in [c for c in _CAPAS if c[0] == clave[0] and c[1:3] != clave[1:3]]:
+                    del _CAPAS[vieja]
+                _CAPAS[clave] = gdf
+                while len(_CAPAS) > MAX_CAPAS_MEMORIA:
+                    _CAPAS.popitem(last=False)
+
+    return gdf.copy()
+
+
+def contar_entidades_bbox(ruta, bounds, epsg=3857):
+    """
+    Número de entidades de la capa que tocan el rectángulo `bounds` (en `epsg`).
+    Si la capa ya está en memoria usa su índice espacial; si no, lee solo los atributos
+    de las entidades del rectángulo (sin geometrías y sin guardarla en la caché).
+    """
+    ruta_abs = os.path.abspath(ruta)
+    with _BLOQUEO:
+        gdf = next((g for clave, g in _CAPAS.items() if clave[0] == ruta_abs and clave[3] == epsg), None)
+
+    if gdf is not None:
+        return len(gdf.sindex.query(box(*bounds), predicate='intersects'))
+
+    zona = gpd.GeoSeries([box(*bounds)], crs=f"EPSG:{epsg}")
+    return len(gpd.read_file(ruta, bbox=zona, ignore_geometry=True))
+
+
+def cargar_shapefile_cacheado(nombre, alias):
+    """Versión cacheada de cargar_shapefile(nombre, alias) de los generadores"""
+    path = buscar_shapefile_cacheado(nombre)
+    if not path:
+        print(f"   No se encontró shapefile: {alias}")
+        return None
+    try:
+        return leer_capa(path, forzar_4326=True)
+    except Exception as e:
+        print(f"   Error cargando {alias} desde {path}: {e}")
+        return None
+
+
+def ubigeo_de_distrito(gdf_distrito, departamento, provincia, distrito):
+    """Ubigeo de 6 dígitos del distrito; si la capa no lo trae, se usa 'DEP|PROV|DIST'"""
+    col_ubigeo = next((c for c in COLUMNAS_UBIGEO if c in gdf_distrito.columns), None)
+    if col_ubigeo is not None and not gdf_distrito.empty:
+        return str(gdf_distrito[col_ubigeo].iloc[0]).zfill(6)
+    return f"{departamento}|{provincia}|{distrito}"
+
+
+def precargar_capas_base():
+    """Carga departamentos, provincias, distritos, países y océano (útil antes de crear un pool de procesos)"""
+    for nombre, alias in [("departamento", "Departamentos"), ("provincia", "Provincias"), ("distrito", "Distritos del Perú")]:
+        cargar_shapefile_cacheado(nombre, alias)
+    for ruta in [f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp",
+                 f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp"]:
+        if os.path.exists(ruta):
+            try:
+                leer_capa(ruta)
+            except Exception as e:
+                print(f"   ⚠️ No se pudo precargar {ruta}: {e}")
+
+
+def limpiar_cache():
+    """Vacía la caché de capas y el índice de shapefiles"""
+    global _INDICE_SHP
+    with _BLOQUEO:
+        _CAPAS.clear()
+        _INDICE_SHP = None
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+🧩 capas_tematicas.py - DIBUJO DE LA CAPA TEMÁTICA DE CADA MAPA
+- Cada capa dibuja su tema sobre ax_main y devuelve (elementos de leyenda, columnas de la leyenda)
+- La usan los generadores (*_final.py) y paquete_distrito.py: el mapa suelto y la página del
+  paquete salen del mismo código de dibujo
+- Reciben las capas ya cargadas y recortadas (y la paleta del tema); cargar, recortar y armar el
+  lienzo sigue siendo tarea de quien llama
+"""
+
+import numpy as np
+import pyproj
+import geopandas as gpd
+import matplotlib.patheffects as path_effects
+from matplotlib.patches import Patch, PathPatch
+from matplotlib.path import Path
+from matplotlib.lines import Line2D
+from matplotlib.colors import BoundaryNorm, ListedColormap
+
+COLOR_DISTRITO = "#a8dda8"
+
+# Colores de vías vecinales por superficie
+COLORES_SUPERFICIE = {
+    'Trocha': '#FFFF00',
+    'Sin afirmar': '#4B0082',
+    'Afirmado': '#006400',
+    'Asfaltado': '#DA70D6',
+    'Pavimentado': '#9400D3'
+}
+COLUMNAS_SUPERFICIE = ['SUPERFIC_L', 'SUPERFICIE', 'TIPO_SUPERF', 'SUPERF']
+
+# Clases del ráster de pendientes (1..5)
+COLORES_PENDIENTE = ['#7FBF3F', '#BFDF3F', '#FFFF00', '#FF9F00', '#FF0000']
+ETIQUETAS_PENDIENTE = ['< 5°', '5° - 15°', '15° - 25°', '25° - 45°', '> 45°']
+
+
+def _con_datos(gdf):
+    return gdf is not None and not gdf.empty
+
+
+def _recortar_nombre(texto, largo):
+    texto = str(texto)
+    return texto[:largo] + '...' if len(texto) > largo else texto
+
+
+def _titulo_leyenda(texto):
+    return Patch(facecolor='white', edgecolor='white', label=texto, linewidth=0)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RECORTES
+# ════════════════════════════════════════════════════════════════════════
+def recortar_rios_vias(gdf_rios, vias, area):
+    """
+    Ríos y vías recortados al área del mapa (un error en una capa solo la deja fuera).
+
+    Retorna:
+    - (ríos recortados o None, {tipo: vías recortadas o None})
+    """
+    rios_clip = None
+    if gdf_rios is not None:
+        try:
+            rios_clip = gdf_rios.clip(area)
+        except Exception as e:
+            print(f"   ⚠️ Error al recortar ríos: {e}")
+    else:
+        print("   ⚠️ No hay datos de ríos para mostrar")
+
+    vias_clip = {}
+    for tipo in ['nacional', 'departamental', 'vecinal']:
+        vias_clip[tipo] = None
+        if vias.get(tipo) is not None:
+            try:
+                vias_clip[tipo] = vias[tipo].clip(area)
+            except Exception as e:
+                print(f"   ⚠️ Error al recortar vías {tipo}: {e}")
+    return rios_clip, vias_clip
+
+
+def recortar_tema(gdf_tema, gdf_distrito, columnas):
+    """
+    Capa temática por unidades (geomorfología, geología, clima) recortada al distrito.
+
+    Retorna:
+    - (capa recortada, columna de la unidad, unidades ordenadas), o None si no hay unidades
+    """
+    if gdf_tema is None:
+        return None
+    gdf_clip = gpd.clip(gdf_tema, gdf_distrito)
+    if gdf_clip.empty:
+        return None
+    columna = next((c for c in columnas if c in gdf_clip.columns), gdf_clip.columns[0])
+    return gdf_clip, columna, sorted(gdf_clip[columna].dropna().unique())
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RÍOS, VÍAS Y CENTROS POBLADOS
+# ════════════════════════════════════════════════════════════════════════
+def dibujar_rios_y_vias(ax_main, rios, vias, vecinal_por_superficie=False):
+    """Ríos y vías ya recortados. Retorna los tipos de superficie de la vía vecinal dibujados por color"""
+    if _con_datos(rios):
+        print(f"   🌊 Dibujando ríos... ({len(rios)} registros)")
+        rios.plot(ax=ax_main, color='#00BFFF', linewidth=2.0, zorder=11)
+    if _con_datos(vias.get('nacional')):
+        vias['nacional'].plot(ax=ax_main, color='#FF0000', linewidth=2.2, zorder=12)
+    if _con_datos(vias.get('departamental')):
+        vias['departamental'].plot(ax=ax_main, color='#32CD32', linewidth=1.8, zorder=13)
+
+    tipos_superficie = []
+    vecinal = vias.get('vecinal')
+    if _con_datos(vecinal):
+        col_superficie = next((c for c in COLUMNAS_SUPERFICIE if c in vecinal.columns), None)
+        if vecinal_por_superficie and col_superficie:
+            tipos_superficie = sorted(vecinal[col_superficie].dropna().unique())
+            for tipo in tipos_superficie:
+                vecinal[vecinal[col_superficie] == tipo].plot(ax=ax_main, color=COLORES_SUPERFICIE.get(tipo, '#FFFF00'),
+                                                               linewidth=1.5, linestyle='--', zorder=15,
+                                                               label=f'V.V. {tipo}')
+        else:
+            vecinal.plot(ax=ax_main, color='#FFFF00', linewidth=1.5, linestyle='--', zorder=15)
+    return tipos_superficie
+
+
+def capa_geografico(ax_main, gdf_distrito, rios, vias):
+    """Ubicación geográfica: distrito, ríos y vías"""
+    gdf_distrito.plot(ax=ax_main, color=COLOR_DISTRITO, edgecolor="black", linewidth=1.5, alpha=0.6, zorder=5)
+    dibujar_rios_y_vias(ax_main, rios, vias)
+    legend_elements = [
+        Patch(facecolor=COLOR_DISTRITO, edgecolor='black', label='Área del Distrito'),
+        Line2D([0], [0], color='#00BFFF', lw=2.5, label='Ríos'),
+        Line2D([0], [0], color='#FF0000', lw=2.5, label='Vía Nacional'),
+        Line2D([0], [0], color='#32CD32', lw=2.5, label='Vía Departamental'),
+        Line2D([0], [0], color='#FFFF00', lw=2.5, linestyle='--', label='Vía Vecinal'),
+        Line2D([0], [0], color='black', lw=2, label='Límite Distrital'),
+        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
+    ]
+    return legend_elements, 2
+
+
+def capa_vias(ax_main, gdf_distrito, rios, vias):
+    """Vías: las vecinales con un color por tipo de superficie"""
+    gdf_distrito.plot(ax=ax_main, facecolor=COLOR_DISTRITO, edgecolor="black", linewidth=1.5,
+                      linestyle='-', alpha=0.6, zorder=5)
+    tipos_superficie = dibujar_rios_y_vias(ax_main, rios, vias, vecinal_por_superficie=True)
+    legend_elements = [
+        Patch(facecolor=COLOR_DISTRITO, edgecolor='black', alpha=0.6, label='Área del Distrito'),
+        Line2D([0], [0], color='#00BFFF', lw=2.5, label='Ríos'),
+        Line2D([0], [0], color='#FF0000', lw=2.5, label='Vía Nacional'),
+        Line2D([0], [0], color='#32CD32', lw=2.5, label='Vía Departamental')
+    ]
+    if tipos_superficie:
+        legend_elements.append(_titulo_leyenda('VÍAS VECINALES:'))
+        for tipo in tipos_superficie:
+            legend_elements.append(Line2D([0], [0], color=COLORES_SUPERFICIE.get(tipo, '#FFFF00'), lw=2.5,
+                                          linestyle='--', label=f'  {tipo}'))
+    else:
+        legend_elements.append(Line2D([0], [0], color='#FFFF00', lw=2.5, linestyle='--', label='Vía Vecinal'))
+    legend_elements.append(Line2D([0], [0], color='black', lw=2, label='Límite Distrital'))
+    return legend_elements, 2 if len(legend_elements) <= 12 else 3
+
+
+def capa_centros(ax_main, gdf_distrito, rios, vias, gdf_centros, col_nombre):
+    """Centros poblados (ya recortados al distrito) con su nombre, sobre ríos y vías"""
+    gdf_distrito.plot(ax=ax_main, facecolor=COLOR_DISTRITO, edgecolor="black", linewidth=1.5,
+                      linestyle='-', alpha=0.6, zorder=5)
+    dibujar_rios_y_vias(ax_main, rios, vias)
+
+    if _con_datos(gdf_centros) and col_nombre:
+        print(f"   😀 Dibujando centros poblados ({len(gdf_centros)} puntos)...")
+        gdf_centros.plot(ax=ax_main, color='yellow', markersize=35, marker='o',
+                         edgecolor='black', linewidth=1, zorder=16)
+        for _, row in gdf_centros.iterrows():
+            try:
+                ax_main.text(row.geometry.x, row.geometry.y, row[col_nombre].title(),
+                             fontsize=6, fontweight='bold', color='white', ha='center', va='bottom', zorder=17,
+                             path_effects=[path_effects.withStroke(linewidth=2, foreground='black')])
+            except Exception:
+                pass
+
+    legend_elements = [
+        Patch(facecolor=COLOR_DISTRITO, edgecolor='black', alpha=0.6, label='Área del Distrito'),
+        Line2D([0], [0], marker='o', color='w', markerfacecolor='yellow', markeredgecolor='black', markersize=7, label='Centros Poblados'),
+        Line2D([0], [0], color='#00BFFF', lw=2.5, label='Ríos'),
+        Line2D([0], [0], color='#FF0000', lw=2.5, label='Vía Nacional'),
+        Line2D([0], [0], color='#32CD32', lw=2.5, label='Vía Departamental'),
+        Line2D([0], [0], color='#FFFF00', lw=2.5, linestyle='--', label='Vía Vecinal'),
+        Line2D([0], [0], color='black', lw=2, label='Límite Distrital')
+    ]
+    return legend_elements, 2 if len(legend_elements) <= 8 else 3
+
+
+# ════════════════════════════════════════════════════════════════════════
+# TEMAS POR UNIDADES (GEOMORFOLOGÍA, GEOLOGÍA, CLIMA)
+# ════════════════════════════════════════════════════════════════════════
+def _capa_categorica(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta, titulo, alpha=0.7,
+                     max_items_leyenda=5, largo_leyenda=25, separador=True, etiquetas=False):
+    """Polígonos por unidad + límite distrital rojo discontinuo; retorna los elementos de leyenda"""
+    for idx, unidad in enumerate(unidades):
+        gdf_unidad = gdf_clip[gdf_clip[columna] == unidad]
+        gdf_unidad.plot(ax=ax_main, color=paleta[idx], edgecolor='black', linewidth=0.5, alpha=alpha, zorder=4)
+        if etiquetas:
+            try:
+                centroid = gdf_unidad.geometry.unary_union.centroid
+                ax_main.text(centroid.x, centroid.y, _recortar_nombre(unidad, 25), fontsize=7, ha='center',
+                             va='center', color='white', fontweight='bold',
+                             bbox=dict(boxstyle='round,pad=0.3', facecolor='black', alpha=0.7, edgecolor='none'),
+                             zorder=10, path_effects=[path_effects.withStroke(linewidth=2, foreground='black')])
+            except Exception as e:
+                print(f"   ⚠️ No se pudo agregar etiqueta para {unidad}: {e}")
+
+    gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="red", linewidth=2,
+                      linestyle='--', alpha=0.9, zorder=15)
+
+    legend_elements = []
+    if len(unidades) > 0:
+        legend_elements.append(_titulo_leyenda(f'{titulo}:'))
+        n_items = min(max_items_leyenda, len(unidades))
+        for idx in range(n_items):
+            legend_elements.append(Patch(facecolor=paleta[idx], edgecolor='black',
+                                         label=_recortar_nombre(unidades[idx], largo_leyenda)))
+        if len(unidades) > n_items:
+            legend_elements.append(_titulo_leyenda(f'(+{len(unidades)-n_items} más)'))
+    if separador:
+        legend_elements.append(_titulo_leyenda(''))
+    legend_elements.extend([
+        Line2D([0], [0], color='red', lw=2, linestyle='--', label='Límite Distrital'),
+        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
+    ])
+    return legend_elements
+
+
+def capa_geomorfologia(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta):
+    legend_elements = _capa_categorica(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta, 'GEOMORFOLOGÍA')
+    return legend_elements, 2 if len(legend_elements) > 8 else 1
+
+
+def capa_geologia(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta):
+    legend_elements = _capa_categorica(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta, 'GEOLOGÍA',
+                                       alpha=0.75)
+    return legend_elements, 2 if len(legend_elements) > 8 else 1
+
+
+def capa_climatica(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta):
+    """Clasificación climática: con el nombre de cada unidad en su centroide y 3 unidades en la leyenda"""
+    legend_elements = _capa_categorica(ax_main, gdf_distrito, gdf_clip, columna, unidades, paleta,
+                                       'CLASIFICACIÓN CLIMÁTICA', max_items_leyenda=3, largo_leyenda=20,
+                                       separador=False, etiquetas=True)
+    return legend_elements, 2 if len(legend_elements) <= 6 else 3
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PENDIENTES (RÁSTER)
+# ════════════════════════════════════════════════════════════════════════
+def capa_pendientes(ax_main, gdf_distrito, raster_data, src_crs, raster_bounds):
+    """Clases de pendiente (ya recortadas al distrito) recortadas visualmente a su geometría"""
+    transformer = pyproj.Transformer.from_crs(src_crs, 3857, always_xy=True)
+    x0, y0 = transformer.transform(raster_bounds[0], raster_bounds[1])
+    x1, y1 = transformer.transform(raster_bounds[2], raster_bounds[3])
+
+    cmap = ListedColormap(COLORES_PENDIENTE)
+    cmap.set_bad(color='none', alpha=0)
+    norm = BoundaryNorm([0.5, 1.5, 2.5, 3.5, 4.5, 5.5], cmap.N)
+    print("   🎨 Renderizando raster de pendientes...")
+    masked_raster = np.ma.masked_invalid(raster_data)
+    im = ax_main.imshow(masked_raster, extent=[x0, x1, y0, y1], cmap=cmap, norm=norm,
+                        aspect='auto', alpha=0.8, zorder=4, origin='upper', interpolation='nearest')
+    print(f"   ✅ Raster renderizado - Píxeles válidos: {np.count_nonzero(~masked_raster.mask)}")
+
+    # Recorte visual del raster a la geometría del distrito
+    geom_distrito = gdf_distrito.geometry.iloc[0]
+    poligonos = [geom_distrito] if geom_distrito.geom_type == 'Polygon' else list(geom_distrito.geoms)
+    vertices, codes = [], []
+    for poly in poligonos:
+        exterior_coords = list(poly.exterior.coords)
+        vertices.extend(exterior_coords)
+        codes.extend([Path.MOVETO] + [Path.LINETO] * (len(exterior_coords) - 1))
+    patch = PathPatch(Path(vertices, codes), facecolor='none', edgecolor='none', transform=ax_main.transData)
+    ax_main.add_patch(patch)
+    im.set_clip_path(patch)
+
+    gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="black", linewidth=1.0, linestyle=':', alpha=1.0, zorder=15)
+
+    legend_elements = [_titulo_leyenda('PENDIENTES (°):')]
+    for idx, etiqueta in enumerate(ETIQUETAS_PENDIENTE):
+        legend_elements.append(Patch(facecolor=COLORES_PENDIENTE[idx], edgecolor='black', label=etiqueta))
+    legend_elements.extend([
+        _titulo_leyenda(''),
+        Line2D([0], [0], color='black', lw=1, linestyle=':', label='Límite Distrital')
+    ])
+    return legend_elements, 1
@@ -11,9 +11,12 @@ import matplotlib.patheffects as path_effects
 from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura
+from capas_tematicas import capa_climatica
 import matplotlib.colors as mcolors
 
 # --- RUTA BASE ORIGINAL ---
@@ -50,10 +53,7 @@ def cargar_clasificacion_climatica():
     if os.path.exists(ruta_directa):
         try:
             print(f"📂 Encontrado en: {ruta_directa}")
-            gdf_clima = gpd.read_file(ruta_directa)
-            if gdf_clima.crs is None:
-                gdf_clima.set_crs(epsg=4326, inplace=True)
-            gdf_clima = gdf_clima.to_crs(epsg=3857)
+            gdf_clima = leer_capa(ruta_directa)
             print(f"✅ Clasificación climática cargada: {len(gdf_clima)} unidades")
             return gdf_clima
         except Exception as e:
@@ -68,10 +68,7 @@ def cargar_clasificacion_climatica():
                 ruta_clima = os.path.join(root, file)
                 print(f"   📍 Intentando: {ruta_clima}")
                 try:
-                    gdf_clima = gpd.read_file(ruta_clima)
-                    if gdf_clima.crs is None:
-                        gdf_clima.set_crs(epsg=4326, inplace=True)
-                    gdf_clima = gdf_clima.to_crs(epsg=3857)
+                    gdf_clima = leer_capa(ruta_clima)
                     print(f"✅ Clasificación climática cargada desde: {ruta_clima}")
                     print(f"   📊 Total de registros: {len(gdf_clima)}")
                     return gdf_clima
@@ -119,19 +116,13 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 1.0, "FECHA:", fontweight='bold', va='center', fontsize=8); ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
     if not path: return None
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326: gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"❌ Error cargando {alias} desde {path}: {e}")
         return None
@@ -210,14 +201,15 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
         return None
 
     # --- CARGAR CAPAS BASE ---
+    etapa("Cargando capas base...", 10)
     print("\n📦 Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
 
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"❌ Error cargando shapefiles de Paises u Océano: {e}")
         gdf_paises = None
@@ -233,6 +225,7 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
     col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
 
     # --- FILTRAR DATOS DEL ÁREA SELECCIONADA ---
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n🔍 Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -244,6 +237,7 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
         return None
 
     # --- CARGAR Y RECORTAR CLASIFICACIÓN CLIMÁTICA ---
+    etapa("Cargando clasificación climática...", 30)
     print("\n🌡️ Cargando datos de clasificación climática...")
     gdf_clima = cargar_clasificacion_climatica()
 
@@ -282,6 +276,7 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
         return None
 
     # --- CREAR FIGURA ---
+    etapa("Armando el layout del mapa...", 45)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -326,43 +321,16 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
     # Agregar basemap
     print("   📡 Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, attribution=False, zoom='auto')
     except Exception as e:
         print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
         ax_main.set_facecolor("#e8e8e8")
 
-    # --- DIBUJAR CLASIFICACIÓN CLIMÁTICA CON ETIQUETAS ---
-    if gdf_clima_clipped is not None and not gdf_clima_clipped.empty:
-        print("   🌡️ Dibujando unidades climáticas...")
-        for idx, unidad in enumerate(unidades_clima):
-            gdf_unidad = gdf_clima_clipped[gdf_clima_clipped[col_clima] == unidad]
-            gdf_unidad.plot(ax=ax_main, color=paleta_clima[idx], edgecolor='black',
-                           linewidth=0.5, alpha=0.7, zorder=4)
-            
-            # Agregar etiqueta en el centroide de cada unidad
-            try:
-                centroid = gdf_unidad.geometry.unary_union.centroid
-                # Truncar nombre si es muy largo
-                nombre_etiqueta = str(unidad)[:25] + '...' if len(str(unidad)) > 25 else str(unidad)
-                ax_main.text(
-                    centroid.x, centroid.y,
-                    nombre_etiqueta,
-                    fontsize=7,
-                    ha='center',
-                    va='center',
-                    color='white',
-                    fontweight='bold',
-                    bbox=dict(boxstyle='round,pad=0.3', facecolor='black', alpha=0.7, edgecolor='none'),
-                    zorder=10,
-                    path_effects=[path_effects.withStroke(linewidth=2, foreground='black')]
-                )
-            except Exception as e:
-                print(f"   ⚠️ No se pudo agregar etiqueta para {unidad}: {e}")
-
-    # --- LÍMITE DEL DISTRITO ---
-    if not gdf_distrito.empty:
-        gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="red", linewidth=2,
-                         linestyle='--', alpha=0.9, zorder=15)
+    # --- CLASIFICACIÓN CLIMÁTICA CON ETIQUETAS Y LÍMITE DEL DISTRITO (MISMO DIBUJO QUE EL PAQUETE) ---
+    print("   🌡️ Dibujando unidades climáticas...")
+    legend_elements, ncols = capa_climatica(ax_main, gdf_distrito, gdf_clima_clipped, col_clima,
+                                            unidades_clima, paleta_clima)
 
     # --- GRILLADO, NORTE Y ESCALA ---
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
@@ -379,36 +347,6 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
 
-    legend_elements = []
-
-    # Agregar clasificación climática (máximo 3 unidades en leyenda)
-    if len(unidades_clima) > 0:
-        legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                     label='CLASIFICACIÓN CLIMÁTICA:', linewidth=0))
-        for idx, unidad in enumerate(unidades_clima[:3]):
-            nombre_corto = str(unidad)[:20] + '...' if len(str(unidad)) > 20 else str(unidad)
-            legend_elements.append(Patch(facecolor=paleta_clima[idx],
-                                         edgecolor='black', label=nombre_corto))
-        if len(unidades_clima) > 3:
-            legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                         label=f'(+{len(unidades_clima)-3} más)',
-                                         linewidth=0))
-
-    # Agregar otros elementos
-    legend_elements.extend([
-        Line2D([0], [0], color='red', lw=2, linestyle='--', label='Límite Distrital'),
-        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
-    ])
-
-    # Calcular número de columnas óptimo
-    num_elementos = len(legend_elements)
-    if num_elementos <= 6:
-        ncols = 2
-    elif num_elementos <= 12:
-        ncols = 3
-    else:
-        ncols = 3
-
     leg = ax_leyenda.legend(
         handles=legend_elements,
         loc='center',
@@ -428,6 +366,7 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
     leg.get_frame().set_linewidth(1.2)
 
     # --- MAPAS DE UBICACIÓN A LA DERECHA ---
+    etapa("Dibujando mapas de ubicación...", 75)
     print("   🗺️ Generando mapas de ubicación...")
 
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
@@ -461,12 +400,13 @@ def generar_mapa_climatica(nombre_usuario, departamento_sel, provincia_sel, dist
         spine.set_color('black')
 
     # --- GUARDAR MAPA FINAL ---
+    etapa("Guardando el mapa...", 90)
     print("\n💾 Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_CLIMATICO_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
 
-    plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+    ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
     plt.close(fig)
 
     print(f"✅ Mapa de clasificación climática guardado exitosamente en: {ruta_guardado_final}")
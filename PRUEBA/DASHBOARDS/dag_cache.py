@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+🔗 dag_cache.py - ETAPAS DE UN PROCESO COMO GRAFO CON RESULTADOS EN CACHÉ EN DISCO
+- Cada etapa declara su función, las etapas de las que depende y sus entradas externas (archivos,
+  carpetas o textos: ver peligro_raster.firma_fuentes)
+- Clave de una etapa = sha1(nombre, versión, huella de sus entradas, claves de sus dependencias):
+  si cambia una entrada, cambian su etapa y todas las que dependen de ella; el resto sale de la caché
+- Solo se cargan o calculan las etapas que hacen falta para los objetivos: una etapa en caché no
+  necesita a sus dependencias
+- Las etapas de un mismo nivel del grafo (p. ej. cargar y recortar cada capa) corren a la vez en un
+  pool de hilos que hereda el trabajo del hilo que llama (progreso, cancelación y tiempo límite) y se
+  reparte sus núcleos; la cancelación se revisa antes de cada etapa y dentro de ella en cada etapa()
+- Cada resultado se publica de forma atómica (pickle + os.replace)
+- Los resultados se podan por antigüedad (DASH_DIAS_DAG) y tamaño total (DASH_MAX_DAG_MB): primero
+  los usados hace más tiempo (cada acierto de caché renueva la fecha del archivo)
+
+Configuración:
+    DASH_HILOS_DAG=4
+    DASH_DIAS_DAG=30
+    DASH_MAX_DAG_MB=2048
+"""
+
+import os
+import time
+import json
+import pickle
+import shutil
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from progreso import verificar_cancelacion
+from planificador import contexto_hilo, en_hilo, nucleos_asignados
+
+HILOS_DAG = int(os.environ.get("DASH_HILOS_DAG", "4"))
+DIAS_DAG = float(os.environ.get("DASH_DIAS_DAG", "30"))
+MAX_DAG_MB = float(os.environ.get("DASH_MAX_DAG_MB", "2048"))
+VERSION_DAG = 1   # subirla invalida todos los resultados guardados (cambio de formato)
+
+# funcion(*resultados de 'dependencias') -> resultado; entradas: lista para firma_fuentes
+Etapa = namedtuple("Etapa", ["nombre", "funcion", "dependencias", "entradas"])
+
+
+# ════════════════════════════════════════════════════════════════════════
+# GRAFO
+# ════════════════════════════════════════════════════════════════════════
+def niveles_dag(etapas):
+    """
+    Etapas agrupadas por nivel (cada nivel solo depende de los anteriores).
+    Lanza ValueError si falta una dependencia o hay un ciclo.
+    """
+    por_nombre = {e.nombre: e for e in etapas}
+    for etapa in etapas:
+        faltan = [d for d in etapa.dependencias if d not in por_nombre]
+        if faltan:
+            raise ValueError(f"La etapa '{etapa.nombre}' depende de etapas inexistentes: {', '.join(faltan)}")
+
+    nivel = {}
+    pendientes = list(por_nombre)
+    while pendientes:
+        listas = [n for n in pendientes if all(d in nivel for d in por_nombre[n].dependencias)]
+        if not listas:
+            raise ValueError(f"Ciclo entre las etapas: {', '.join(pendientes)}")
+        for n in listas:
+            nivel[n] = 1 + max((nivel[d] for d in por_nombre[n].dependencias), default=-1)
+        pendientes = [n for n in pendientes if n not in nivel]
+
+    agrupado = [[] for _ in range(max(nivel.values(), default=-1) + 1)]
+    for etapa in etapas:
+        agrupado[nivel[etapa.nombre]].append(etapa)
+    return agrupado
+
+
+def claves_dag(etapas):
+    """Clave de cada etapa (encadena las claves de sus dependencias)"""
+    from peligro_raster import firma_fuentes
+
+    claves = {}
+    for nivel in niveles_dag(etapas):
+        for etapa in nivel:
+            entrada = {
+                'nombre': etapa.nombre,
+                'version': VERSION_DAG,
+                'entradas': firma_fuentes(etapa.entradas or []),
+                'dependencias': [claves[d] for d in etapa.dependencias],
+            }
+            claves[etapa.nombre] = hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    return claves
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RESULTADOS EN DISCO
+# ════════════════════════════════════════════════════════════════════════
+def ruta_resultado(carpeta, nombre, clave):
+    nombre_seguro = "".join(c if c.isalnum() or c in "-_" else "_" for c in nombre)
+    return os.path.join(carpeta, f"{nombre_seguro}_{clave}.pkl")
+
+
+def _guardar(ruta, resultado):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as f:
+        pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporal, ruta)
+
+
+def _cargar(ruta):
+    with open(ruta, 'rb') as f:
+        resultado = pickle.load(f)
+    try:
+        os.utime(ruta)   # usado ahora: la poda descarta primero lo que no se usa
+    except OSError:
+        pass
+    return resultado
+
+
+def podar_cache_dag(carpeta, dias=None, max_mb=None):
+    """
+    Borra los resultados (de todas las subcarpetas) sin usar en `dias` y, si el total sigue
+    pasando de `max_mb`, los usados hace más tiempo. Retorna el número de archivos borrados.
+    """
+    dias = DIAS_DAG if dias is None else dias
+    max_mb = MAX_DAG_MB if max_mb is None else max_mb
+    archivos = []
+    for raiz, _, nombres in os.walk(carpeta):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, ruta))
+
+    archivos.sort()
+    limite = time.time() - dias * 86400
+    total = sum(a[1] for a in archivos)
+    borrados = 0
+    for fecha, tamano, ruta in archivos:
+        if fecha >= limite and total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(ruta)
+            borrados += 1
+            total -= tamano
+        except OSError:
+            pass
+    return borrados
+
+
+# ════════════════════════════════════════════════════════════════════════
+# EJECUCIÓN
+# ════════════════════════════════════════════════════════════════════════
+def ejecutar_dag(etapas, carpeta, objetivos=None, hilos=None):
+    """
+    Resultados de los objetivos, calculando solo las etapas cuyo resultado no está en caché.
+
+    Parámetros:
+    - etapas: lista de Etapa (en cualquier orden)
+    - carpeta: dónde se guardan los resultados
+    - objetivos: nombres de las etapas a devolver (por defecto las que no son dependencia de otra)
+    - hilos: hilos para las etapas de un mismo nivel (por defecto DASH_HILOS_DAG)
+
+    Retorna:
+    - diccionario nombre de etapa -> resultado (solo los objetivos)
+    """
+    por_nombre = {e.nombre: e for e in etapas}
+    claves = claves_dag(etapas)
+    if objetivos is None:
+        usadas = {d for e in etapas for d in e.dependencias}
+        objetivos = [e.nombre for e in etapas if e.nombre not in usadas]
+
+    # Lo necesario: los objetivos y, de cada etapa que hay que calcular, sus dependencias
+    rutas = {n: ruta_resultado(carpeta, n, claves[n]) for n in por_nombre}
+    necesarias = set()
+    pila = list(objetivos)
+    while pila:
+        nombre = pila.pop()
+        if nombre in necesarias:
+            continue
+        necesarias.add(nombre)
+        if not os.path.exists(rutas[nombre]):
+            pila.extend(por_nombre[nombre].dependencias)
+
+    resultados = {}
+
+    def _resolver(etapa):
+        verificar_cancelacion()
+        ruta = rutas[etapa.nombre]
+        try:
+            return _cargar(ruta), None
+        except FileNotFoundError:
+            # No estaba en caché, o desapareció después de planificar (p. ej. podar_cache_dag de otro proceso)
+            pass
+        except Exception as e:
+            # Resultado ilegible (p. ej. de otra versión de las librerías): se recalcula
+            print(f"   ⚠️ Etapa '{etapa.nombre}': no se pudo leer la caché ({e}), se recalcula")
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        # Las dependencias que no se cargaron porque esta etapa estaba en caché al planificar
+        faltan = [d for d in etapa.dependencias if d not in resultados]
+        if faltan:
+            print(f"   ⚠️ Etapa '{etapa.nombre}': se recalcula con sus dependencias ({', '.join(faltan)})")
+            resultados.update(ejecutar_dag(etapas, carpeta, objetivos=faltan, hilos=1))
+        inicio = time.time()
+        resultado = etapa.funcion(*[resultados[d] for d in etapa.dependencias])
+        try:
+            _guardar(ruta, resultado)
+        except (OSError, pickle.PicklingError) as e:
+            print(f"   ⚠️ Etapa '{etapa.nombre}': no se pudo guardar en caché ({e})")
+        return resultado, time.time() - inicio
+
+    hilos = hilos or HILOS_DAG
+    # Los hilos del pool corren como parte del trabajo de este hilo y se reparten sus núcleos
+    # (sin esto etapa() no reporta, no se puede cancelar y WhiteboxTools usa los núcleos por defecto)
+    contexto = contexto_hilo()
+    for nivel in niveles_dag(etapas):
+        verificar_cancelacion()
+        tareas = [e for e in nivel if e.nombre in necesarias]
+        if not tareas:
+            continue
+        simultaneas = min(hilos, len(tareas), nucleos_asignados())
+        if simultaneas <= 1:
+            salidas = [_resolver(e) for e in tareas]
+        else:
+            reparto = max(1, nucleos_asignados() // simultaneas)
+
+            def _en_hilo(etapa):
+                with en_hilo(contexto, nucleos=reparto):
+                    return _resolver(etapa)
+
+            with ThreadPoolExecutor(max_workers=simultaneas) as pool:
+                salidas = list(pool.map(_en_hilo, tareas))
+        for etapa, (resultado, segundos) in zip(tareas, salidas):
+            resultados[etapa.nombre] = resultado
+            if segundos is None:
+                print(f"   ♻️ Etapa '{etapa.nombre}' en caché ({claves[etapa.nombre]})")
+            else:
+                print(f"   ⚙️ Etapa '{etapa.nombre}' calculada en {segundos:.1f} s")
+
+    return {n: resultados[n] for n in objetivos}
+
+
+def limpiar_cache_dag(carpeta):
+    """Borra los resultados guardados en la carpeta"""
+    shutil.rmtree(carpeta, ignore_errors=True)
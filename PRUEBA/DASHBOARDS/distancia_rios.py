@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+📏 distancia_rios.py - CLASES DE DISTANCIA A RÍOS POR TRANSFORMADA DE DISTANCIA
+- Rasteriza la red de ríos sobre una grilla del distrito (la del DEM cuando se conoce)
+- Distancia euclidiana de cada celda al río más cercano (scipy.ndimage si está disponible,
+  si no una transformada acotada en NumPy hasta la mayor distancia finita de BUFFERS_CONFIG)
+- Clasifica todas las celdas con BUFFERS_CONFIG en una sola pasada (np.digitize)
+- Poligonizar es opcional: solo hace falta para las capas vectoriales y el dibujo
+- Si la grilla no cabe en el techo de memoria (DASH_MEMORIA_BLOQUES_MB) se clasifica por bloques
+  con un halo igual a la mayor distancia finita: cada núcleo ve todos los ríos que lo afectan
+
+Selección (variables de entorno):
+    DASH_MOTOR_BUFFERS=raster (por defecto) | vectorial   (buffers de shapely, como antes)
+    DASH_RESOLUCION_DISTANCIA_M=10                         (cuando no se pasa la grilla del DEM)
+"""
+
+import os
+import math
+
+import numpy as np
+
+MOTOR_BUFFERS = os.environ.get("DASH_MOTOR_BUFFERS", "raster").lower()
+RESOLUCION_DISTANCIA_M = float(os.environ.get("DASH_RESOLUCION_DISTANCIA_M", "10"))
+
+SIN_CLASE = 255
+BYTES_POR_CELDA = 20      # distancia float32 + temporales de la transformada (float64, índices)
+
+try:
+    from scipy.ndimage import distance_transform_edt
+    SCIPY_DISPONIBLE = True
+except ImportError:
+    SCIPY_DISPONIBLE = False
+
+
+# ════════════════════════════════════════════════════════════════════════
+# GRILLA Y DISTANCIA
+# ════════════════════════════════════════════════════════════════════════
+def grilla_limite(limite_geom, resolucion):
+    """Transform y forma de una grilla que cubre el límite con celdas de 'resolucion' metros"""
+    from rasterio.transform import from_origin
+
+    minx, miny, maxx, maxy = limite_geom.bounds
+    columnas = max(1, math.ceil((maxx - minx) / resolucion))
+    filas = max(1, math.ceil((maxy - miny) / resolucion))
+    return from_origin(minx, maxy, resolucion, resolucion), (filas, columnas)
+
+
+def _distancia_acotada(rios, paso_y, paso_x, distancia_max):
+    """
+    Transformada de distancia euclidiana exacta hasta distancia_max sin scipy (en dos pasadas):
+    1) distancia por columna a la celda de río más cercana (barrido hacia abajo y hacia arriba)
+    2) por fila, mínimo de sqrt(g² + dx²) sobre los desplazamientos de columna |dx| <= distancia_max
+    Más allá de distancia_max el resultado puede quedar en infinito.
+    """
+    filas, columnas = rios.shape
+    g = np.empty(rios.shape, dtype=np.float32)
+    ultimo = np.full(columnas, np.inf, dtype=np.float32)
+    for f in range(filas):
+        ultimo = np.where(rios[f], 0, ultimo + paso_y)
+        g[f] = ultimo
+    ultimo[:] = np.inf
+    for f in range(filas - 1, -1, -1):
+        ultimo = np.where(rios[f], 0, ultimo + paso_y)
+        np.minimum(g[f], ultimo, out=g[f])
+
+    g2 = np.square(g)
+    distancia = np.full(rios.shape, np.inf, dtype=np.float32)
+    radio = int(distancia_max // paso_x)
+    for dc in range(-radio, radio + 1):
+        # Celda (f, c) contra la columna c + dc
+        origen = g2[:, max(dc, 0):columnas + min(dc, 0)]
+        destino = distancia[:, max(-dc, 0):columnas + min(-dc, 0)]
+        np.minimum(destino, origen + np.float32((dc * paso_x) ** 2), out=destino)
+    return np.sqrt(distancia)
+
+
+def distancia_a_rios(rios_gdf, limite_geom, transform=None, forma=None, resolucion=None, distancia_max=None):
+    """
+    Distancia (m) de cada celda de la grilla al río más cercano.
+
+    Parámetros:
+    - rios_gdf: red de ríos en un CRS proyectado (metros)
+    - limite_geom: geometría del distrito en el mismo CRS
+    - transform, forma: grilla a usar (p. ej. la del recorte del DEM); si faltan se arma una
+      sobre el límite con 'resolucion' (o RESOLUCION_DISTANCIA_M)
+    - distancia_max: solo hace falta saber distancias hasta este valor (acota el cálculo sin scipy)
+
+    Retorna:
+    - (distancia float32, celdas dentro del límite, transform)
+    """
+    from rasterio.features import rasterize
+
+    if transform is None or forma is None:
+        transform, forma = grilla_limite(limite_geom, resolucion or RESOLUCION_DISTANCIA_M)
+
+    lineas = [g for g in rios_gdf.geometry if g is not None and not g.is_empty]
+    rios = np.zeros(forma, dtype=bool)
+    if lineas:
+        rios = rasterize(((g, 1) for g in lineas), out_shape=forma, transform=transform,
+                         fill=0, all_touched=True, dtype='uint8').astype(bool)
+    dentro = rasterize([(limite_geom, 1)], out_shape=forma, transform=transform,
+                       fill=0, all_touched=True, dtype='uint8').astype(bool)
+
+    paso_x, paso_y = abs(transform.a), abs(transform.e)
+    if not rios.any():
+        distancia = np.full(forma, np.inf, dtype=np.float32)
+    elif SCIPY_DISPONIBLE:
+        distancia = distance_transform_edt(~rios, sampling=(paso_y, paso_x)).astype(np.float32)
+    else:
+        distancia = _distancia_acotada(rios, paso_y, paso_x, distancia_max or 1000.0)
+    return distancia, dentro, transform
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CLASIFICACIÓN Y POLIGONIZACIÓN
+# ════════════════════════════════════════════════════════════════════════
+def _cortes(buffers_config):
+    """Límites superiores finitos de las clases, en el orden de BUFFERS_CONFIG"""
+    return [b['outer'] for b in buffers_config if b['outer'] is not None]
+
+
+def clasificar_distancia(distancia, dentro, buffers_config):
+    """
+    Índice de clase de BUFFERS_CONFIG para cada celda (SIN_CLASE fuera del límite).
+    Las clases deben ser contiguas y estar ordenadas por distancia, como en BUFFERS_CONFIG.
+    """
+    clases = np.digitize(distancia, _cortes(buffers_config), right=False).astype(np.uint8)
+    clases[~dentro] = SIN_CLASE
+    return clases
+
+
+def poligonizar_clases(clases, transform, buffers_config, limite_geom=None):
+    """
+    Un polígono (multipolígono) por clase. Si se da el límite, cada clase se recorta con él
+    para que el borde del distrito no quede escalonado.
+
+    Retorna:
+    - diccionario nombre de clase -> geometría
+    """
+    from rasterio.features import shapes
+    from shapely.geometry import shape, GeometryCollection
+    from shapely.ops import unary_union
+
+    partes = {i: [] for i in range(len(buffers_config))}
+    for geom, valor in shapes(clases, mask=clases != SIN_CLASE, transform=transform, connectivity=8):
+        partes[int(valor)].append(shape(geom))
+
+    anillos = {}
+    for i, config in enumerate(buffers_config):
+        geometria = unary_union(partes[i]) if partes[i] else GeometryCollection()
+        if limite_geom is not None and not geometria.is_empty:
+            geometria = geometria.intersection(limite_geom)
+        anillos[config['name']] = geometria
+    return anillos
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ANILLOS DE DISTANCIA (RASTER O VECTORIAL)
+# ════════════════════════════════════════════════════════════════════════
+def _anillos_vectoriales(rios_gdf, limite_geom, buffers_config):
+    """Buffers de shapely; cada buffer se calcula una sola vez y sirve de interior a la clase siguiente"""
+    from shapely.ops import unary_union
+
+    rios_union = unary_union(rios_gdf.geometry)
+    buffers = {}
+
+    def buffer_de(distancia):
+        if distancia not in buffers:
+            buffers[distancia] = rios_union.buffer(distancia)
+        return buffers[distancia]
+
+    anillos = {}
+    for config in buffers_config:
+        interior = buffer_de(config['inner'])
+        if config['outer'] is None:
+            anillos[config['name']] = limite_geom.difference(interior)
+        else:
+            anillos[config['name']] = buffer_de(config['outer']).difference(interior).intersection(limite_geom)
+    return anillos
+
+
+def _clases_por_bloques(rios_gdf, limite_geom, transform, forma, buffers_config):
+    """
+    Clases de distancia bloque a bloque. El halo es la mayor distancia finita de las clases:
+    una celda más lejos que eso de todo río del bloque extendido cae en la última clase igual que
+    con la grilla completa, así que el resultado no tiene costuras.
+    """
+    from rasterio.transform import array_bounds
+    from rasterio.windows import Window, transform as transform_ventana
+    from shapely.geometry import box
+    from procesamiento_bloques import lado_bloque, ventanas_bloques
+    from progreso import verificar_cancelacion
+
+    cortes = _cortes(buffers_config)
+    paso = min(abs(transform.a), abs(transform.e))
+    halo = math.ceil(max(cortes) / paso) + 1 if cortes else 0
+    lado = lado_bloque(BYTES_POR_CELDA, halo=halo)
+    print(f"   🧱 Distancias por bloques: grilla {forma[1]} x {forma[0]}, bloques de {lado} px, halo {halo} px")
+
+    clases = np.full(forma, SIN_CLASE, dtype=np.uint8)
+    for bloque in ventanas_bloques(Window(0, 0, forma[1], forma[0]), lado, halo=halo):
+        verificar_cancelacion()
+        t = transform_ventana(bloque.lectura, transform)
+        forma_bloque = (int(bloque.lectura.height), int(bloque.lectura.width))
+        zona = box(*array_bounds(forma_bloque[0], forma_bloque[1], t))
+        rios_bloque = rios_gdf.iloc[rios_gdf.sindex.query(zona)]
+        distancia, dentro, _ = distancia_a_rios(rios_bloque, limite_geom, transform=t, forma=forma_bloque,
+                                                distancia_max=max(cortes) if cortes else None)
+        n = bloque.nucleo
+        clases[n.row_off:n.row_off + n.height, n.col_off:n.col_off + n.width] = \
+            clasificar_distancia(distancia, dentro, buffers_config)[bloque.interior]
+    return clases
+
+
+def clases_distancia(rios_gdf, limite_geom, buffers_config, transform=None, forma=None, resolucion=None):
+    """
+    Clases de BUFFERS_CONFIG sobre la grilla (la del DEM o una sobre el límite).
+    Con la grilla completa si cabe en el techo de memoria; si no, por bloques con halo.
+
+    Retorna:
+    - (clases uint8, transform)
+    """
+    from procesamiento_bloques import MEMORIA_BLOQUES_MB
+
+    if transform is None or forma is None:
+        transform, forma = grilla_limite(limite_geom, resolucion or RESOLUCION_DISTANCIA_M)
+
+    cortes = _cortes(buffers_config)
+    if forma[0] * forma[1] * BYTES_POR_CELDA > MEMORIA_BLOQUES_MB * 1024 * 1024:
+        return _clases_por_bloques(rios_gdf, limite_geom, transform, forma, buffers_config), transform
+
+    distancia, dentro, transform = distancia_a_rios(
+        rios_gdf, limite_geom, transform=transform, forma=forma,
+        distancia_max=max(cortes) if cortes else None)
+    return clasificar_distancia(distancia, dentro, buffers_config), transform
+
+
+def anillos_distancia(rios_gdf, limite_geom, buffers_config, transform=None, forma=None, resolucion=None):
+    """
+    Geometría de cada clase de distancia a ríos dentro del límite.
+
+    Retorna:
+    - diccionario nombre de clase -> geometría (mismo CRS que rios_gdf)
+    """
+    if MOTOR_BUFFERS == "vectorial":
+        return _anillos_vectoriales(rios_gdf, limite_geom, buffers_config)
+
+    clases, transform = clases_distancia(rios_gdf, limite_geom, buffers_config,
+                                         transform=transform, forma=forma, resolucion=resolucion)
+    return poligonizar_clases(clases, transform, buffers_config, limite_geom)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+🧹 espacio_trabajo.py - CARPETAS TEMPORALES AISLADAS POR TRABAJO (HIDROLOGÍA)
+- Cada trabajo recibe su propia carpeta (nunca se comparten archivos intermedios)
+- Si hay espacio suficiente en /dev/shm (tmpfs) se usa; si no, el disco temporal
+- Cuota de disco por trabajo y por usuario (suma de sus trabajos activos en todos los procesos,
+  según el usuario que registra la marca de cada carpeta)
+- Las carpetas se borran al terminar, y las de procesos muertos se limpian al crear una nueva
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# --- CONFIGURACIÓN ---
+USAR_TMPFS = True
+RUTA_TMPFS = "/dev/shm"
+RAIZ_TRABAJOS = os.environ.get("DASH_TMP", os.path.join(tempfile.gettempdir(), "dash_trabajos"))
+
+CUOTA_TRABAJO_MB = 4096   # Máximo que puede ocupar un solo trabajo
+CUOTA_USUARIO_MB = 8192   # Máximo entre todos los trabajos activos de un usuario
+HORAS_HUERFANOS = 6       # Carpetas sin proceso vivo más antiguas que esto se eliminan
+
+MARCA_TRABAJO = ".trabajo.json"
+
+_ACTIVOS = {}
+_BLOQUEO = threading.Lock()
+
+
+class CuotaDiscoExcedida(Exception):
+    """El trabajo (o el usuario) superó su cuota de disco temporal"""
+
+
+def _raices_disponibles():
+    raices = []
+    if USAR_TMPFS and os.path.isdir(RUTA_TMPFS):
+        raices.append(os.path.join(RUTA_TMPFS, "dash_trabajos"))
+    raices.append(RAIZ_TRABAJOS)
+    return raices
+
+
+def _nombre_seguro(texto):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(texto))
+
+
+def tamano_carpeta(carpeta):
+    """Bytes ocupados por una carpeta (recursivo)"""
+    total = 0
+    for root, _, files in os.walk(carpeta):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def limpiar_espacios_huerfanos(horas=HORAS_HUERFANOS):
+    """Elimina carpetas de trabajos cuyo proceso ya no existe (p. ej. tras un reinicio del servidor)"""
+    limite = time.time() - horas * 3600
+    eliminadas = 0
+    for raiz in _raices_disponibles():
+        if not os.path.isdir(raiz):
+            continue
+        for usuario in os.listdir(raiz):
+            carpeta_usuario = os.path.join(raiz, usuario)
+            if not os.path.isdir(carpeta_usuario):
+                continue
+            for trabajo in os.listdir(carpeta_usuario):
+                carpeta = os.path.join(carpeta_usuario, trabajo)
+                try:
+                    with open(os.path.join(carpeta, MARCA_TRABAJO), 'r', encoding='utf-8') as f:
+                        marca = json.load(f)
+                    huerfana = not _proceso_vivo(marca.get('pid', -1))
+                except (OSError, json.JSONDecodeError):
+                    huerfana = os.path.getmtime(carpeta) < limite
+                if huerfana:
+                    shutil.rmtree(carpeta, ignore_errors=True)
+                    eliminadas += 1
+    if eliminadas:
+        print(f"   🧹 Carpetas temporales huérfanas eliminadas: {eliminadas}")
+    return eliminadas
+
+
+def carpetas_usuario(nombre_usuario):
+    """Carpetas de los trabajos vivos de un usuario en todas las raíces, de cualquier proceso (por su marca)"""
+    nombre_usuario = _nombre_seguro(nombre_usuario or "anonimo")
+    carpetas = []
+    for raiz in _raices_disponibles():
+        carpeta_usuario = os.path.join(raiz, nombre_usuario)
+        if not os.path.isdir(carpeta_usuario):
+            continue
+        for trabajo in os.listdir(carpeta_usuario):
+            carpeta = os.path.join(carpeta_usuario, trabajo)
+            try:
+                with open(os.path.join(carpeta, MARCA_TRABAJO), 'r', encoding='utf-8') as f:
+                    marca = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if marca.get('usuario') == nombre_usuario and _proceso_vivo(marca.get('pid', -1)):
+                carpetas.append(carpeta)
+    return carpetas
+
+
+def uso_usuario(nombre_usuario):
+    """Bytes ocupados por todos los trabajos activos de un usuario (de este y de otros procesos)"""
+    return sum(tamano_carpeta(c) for c in carpetas_usuario(nombre_usuario))
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CREAR / LIBERAR
+# ════════════════════════════════════════════════════════════════════════
+def crear_espacio_trabajo(nombre_usuario, etiqueta="hidro", cuota_mb=None):
+    """
+    Crea una carpeta temporal exclusiva para un trabajo.
+
+    Retorna:
+    - ruta absoluta de la carpeta (liberar con liberar_espacio_trabajo)
+    """
+    limpiar_espacios_huerfanos()
+
+    cuota_mb = cuota_mb or CUOTA_TRABAJO_MB
+    nombre_usuario = _nombre_seguro(nombre_usuario or "anonimo")
+    nombre = f"{_nombre_seguro(etiqueta)}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+
+    carpeta = None
+    for raiz in _raices_disponibles():
+        try:
+            os.makedirs(raiz, exist_ok=True)
+            # tmpfs solo si cabe la cuota completa del trabajo (es memoria RAM)
+            if raiz.startswith(RUTA_TMPFS) and shutil.disk_usage(raiz).free < cuota_mb * 1024 * 1024:
+                continue
+            carpeta = os.path.join(raiz, nombre_usuario, nombre)
+            os.makedirs(carpeta)
+            break
+        except OSError:
+            carpeta = None
+    if carpeta is None:
+        raise OSError("No se pudo crear una carpeta temporal para el trabajo")
+
+    with open(os.path.join(carpeta, MARCA_TRABAJO), 'w', encoding='utf-8') as f:
+        json.dump({'pid': os.getpid(), 'usuario': nombre_usuario, 'etiqueta': etiqueta,
+                   'cuota_mb': cuota_mb, 'inicio': time.time()}, f)
+
+    with _BLOQUEO:
+        _ACTIVOS[carpeta] = {'usuario': nombre_usuario, 'cuota_mb': cuota_mb}
+
+    print(f"   📁 Carpeta de trabajo: {carpeta}")
+    return carpeta
+
+
+def liberar_espacio_trabajo(carpeta):
+    """Borra la carpeta del trabajo y la quita del registro"""
+    with _BLOQUEO:
+        _ACTIVOS.pop(carpeta, None)
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+
+@contextmanager
+def espacio_trabajo(nombre_usuario, etiqueta="hidro", cuota_mb=None):
+    """with espacio_trabajo(usuario) as carpeta: ...  (se borra siempre al salir)"""
+    carpeta = crear_espacio_trabajo(nombre_usuario, etiqueta, cuota_mb)
+    try:
+        yield carpeta
+    finally:
+        liberar_espacio_trabajo(carpeta)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CUOTAS
+# ════════════════════════════════════════════════════════════════════════
+def verificar_cuota(carpeta, bytes_adicionales=0):
+    """
+    Lanza CuotaDiscoExcedida si el trabajo (más lo que se va a escribir) supera su cuota,
+    si el usuario supera la suya o si el disco no tiene espacio libre suficiente.
+    Las carpetas que no fueron creadas con crear_espacio_trabajo no se controlan.
+    """
+    with _BLOQUEO:
+        info = _ACTIVOS.get(carpeta)
+    if info is None:
+        return
+
+    uso_trabajo = tamano_carpeta(carpeta) + bytes_adicionales
+    if uso_trabajo > info['cuota_mb'] * 1024 * 1024:
+        raise CuotaDiscoExcedida(
+            f"El trabajo necesita {uso_trabajo / 1024**2:.0f} MB y su cuota es {info['cuota_mb']} MB")
+
+    uso_total = uso_usuario(info['usuario']) + bytes_adicionales
+    if uso_total > CUOTA_USUARIO_MB * 1024 * 1024:
+        raise CuotaDiscoExcedida(
+            f"El usuario {info['usuario']} ocupa {uso_total / 1024**2:.0f} MB (cuota {CUOTA_USUARIO_MB} MB)")
+
+    if bytes_adicionales and shutil.disk_usage(carpeta).free < bytes_adicionales:
+        raise CuotaDiscoExcedida("No hay espacio libre suficiente en el disco temporal")
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+🧮 estimador.py - ESTIMACIÓN PREVIA (DRY-RUN) DEL COSTO DE CADA GENERADOR
+- Sin generar nada: usa la capa de distritos como índice y los metadatos de capas y rásters
+- Predice píxeles de DEM/ráster a procesar, entidades a recortar, polígonos del overlay de peligro
+  y teselas de la imagen satelital; con eso estima duración y memoria
+- El planificador la usa para elegir carril y el dashboard para advertir antes de lanzar mapas grandes
+- Los coeficientes son aproximados: ajustarlos con los tiempos reales del servidor
+
+Ejemplo:
+    python estimador.py --tipo inundacion --departamento CUSCO --provincia ANTA --distrito ANTA
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+
+from capas_cache import cargar_shapefile_cacheado, buscar_shapefile_cacheado, contar_entidades_bbox, indice_shapefiles
+from hidrologia_regional import buscar_acumulacion
+from pendientes_dem import RUTA_DEM_PENDIENTES
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_RIOS = f"{ruta_base}/DATA/MAPA DE UBICACION/RIOS/rios_lineal_idep_ign_100k_geogpsperu.shp"
+RUTAS_VIAS = [
+    f"{ruta_base}/DATA/MAPA DE UBICACION/VIAS/VIA NACIONAL/red_vial_nacional_dic18.shp",
+    f"{ruta_base}/DATA/MAPA DE UBICACION/VIAS/VIA DEPARTAMENTAL/red_vial_departamental_dic18.shp",
+    f"{ruta_base}/DATA/MAPA DE UBICACION/VIAS/VIA VECINAL/red_vial_vecinal_dic18.shp",
+]
+RUTA_CENTROS = f"{ruta_base}/DATA/CENTROS POBLADOS /Centros_Poblados_INEI_geogpsperu_SuyoPomalia.shp"
+RUTA_CLIMA = f"{ruta_base}/DATA/CLASIFICACION CLIMATICA/clasif_climática.shp"
+RUTA_PENDIENTES = f"{ruta_base}/DATA/PENDIENTES/pendientes.tif"
+RUTA_DEM_RIOS = f"{ruta_base}/DATA/PENDIENTES/DEM.tif"
+BUFFER_DEM_RIOS = 1000   # Mismo margen que generar_red_rios_desde_geotiff
+
+# Mismo encuadre que los generadores (buffer 0.15 y proporción 1.21)
+BUFFER_FACTOR = 0.15
+ASPECTO_MAPA = 1.21
+ZOOM_MAXIMO_BASEMAP = 18
+RADIO_TIERRA = 6378137.0
+
+# Coeficientes del modelo de costo (segundos y MB); calibrados a grandes rasgos con el servidor actual
+COEFICIENTES = {
+    's_base': 20.0,                 # Layout, ubicaciones, membrete y guardado a 300 dpi
+    's_por_tesela': 0.25,           # Descarga de cada tesela de Esri.WorldImagery
+    's_por_entidad': 4e-4,          # Recorte y dibujo de cada entidad vectorial
+    's_por_pixel_raster': 1.5e-6,   # Recorte y dibujo de un ráster ya calculado (pendientes)
+    's_por_pixel_hidro': 6e-5,      # WhiteboxTools: relleno, D8, acumulación, ríos y vectorizado
+    's_por_poligono_overlay': 2e-3, # Intersección encadenada de las capas de peligro
+    'fragmentacion_overlay': 1.5,   # Crecimiento de polígonos en cada intersección
+    'mb_base': 600.0,
+    'mb_por_tesela': 0.25,
+    'mb_por_entidad': 0.003,
+    'mb_por_pixel_raster': 12e-6,
+    'mb_por_pixel_hidro': 32e-6,
+    'mb_por_poligono_overlay': 0.005,
+}
+
+# Umbrales de advertencia para el usuario
+ADVERTENCIA_SEGUNDOS = 600
+ADVERTENCIA_MEMORIA_MB = 6144
+ADVERTENCIA_PIXELES_DEM = 10_000_000
+
+
+# ════════════════════════════════════════════════════════════════════════
+# GEOMETRÍA DEL ENCUADRE
+# ════════════════════════════════════════════════════════════════════════
+def buscar_distrito(departamento_sel, provincia_sel, distrito_sel):
+    """GeoDataFrame (EPSG:3857) del distrito, o None si no se encuentra"""
+    gdf_distritos = cargar_shapefile_cacheado("distrito", "Distritos del Perú")
+    if gdf_distritos is None:
+        return None
+    col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf_distritos.columns), None)
+    col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
+    if not col_prov or not col_distr:
+        return None
+    gdf_distrito = gdf_distritos[(gdf_distritos[col_distr] == distrito_sel) & (gdf_distritos[col_prov] == provincia_sel)]
+    return None if gdf_distrito.empty else gdf_distrito
+
+
+def bbox_mapa(gdf_distrito):
+    """Mismo bbox con proporción fija que calcula cada generador para el mapa principal"""
+    minx, miny, maxx, maxy = gdf_distrito.total_bounds
+    bx, by = (maxx - minx) * BUFFER_FACTOR, (maxy - miny) * BUFFER_FACTOR
+    minx, miny, maxx, maxy = minx - bx, miny - by, maxx + bx, maxy + by
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    ancho, alto = maxx - minx, maxy - miny
+    if ancho / alto > ASPECTO_MAPA:
+        alto = ancho / ASPECTO_MAPA
+    else:
+        ancho = alto * ASPECTO_MAPA
+    return (cx - ancho / 2, cy - alto / 2, cx + ancho / 2, cy + alto / 2)
+
+
+def _a_lonlat(x, y):
+    lon = math.degrees(x / RADIO_TIERRA)
+    lat = math.degrees(2 * math.atan(math.exp(y / RADIO_TIERRA)) - math.pi / 2)
+    return lon, lat
+
+
+def teselas_basemap(bbox):
+    """
+    Zoom y número de teselas que descargará ctx.add_basemap(zoom='auto') para el bbox (EPSG:3857).
+    Replica el cálculo de zoom automático de contextily.
+    """
+    oeste, sur = _a_lonlat(bbox[0], bbox[1])
+    este, norte = _a_lonlat(bbox[2], bbox[3])
+    zoom_lon = math.ceil(math.log2(360 * 2.0 / max(este - oeste, 1e-9)))
+    zoom_lat = math.ceil(math.log2(360 * 2.0 / max(norte - sur, 1e-9)))
+    zoom = int(min(zoom_lon, zoom_lat, ZOOM_MAXIMO_BASEMAP))
+
+    origen = math.pi * RADIO_TIERRA
+    tamano = 2 * origen / 2 ** zoom
+    x0, x1 = int((bbox[0] + origen) // tamano), int((bbox[2] + origen) // tamano)
+    y0, y1 = int((origen - bbox[3]) // tamano), int((origen - bbox[1]) // tamano)
+    return zoom, (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def pixeles_recorte(ruta_raster, gdf_distrito, margen=0):
+    """Píxeles de la ventana que recorta rasterio.mask(crop=True) alrededor del distrito (sin leer datos)"""
+    import rasterio
+    from rasterio.windows import from_bounds
+
+    with rasterio.open(ruta_raster) as src:
+        minx, miny, maxx, maxy = gdf_distrito.to_crs(src.crs).total_bounds
+        minx, miny = max(minx - margen, src.bounds.left), max(miny - margen, src.bounds.bottom)
+        maxx, maxy = min(maxx + margen, src.bounds.right), min(maxy + margen, src.bounds.top)
+        if minx >= maxx or miny >= maxy:
+            return 0
+        ventana = from_bounds(minx, miny, maxx, maxy, transform=src.transform)
+        return int(math.ceil(ventana.width)) * int(math.ceil(ventana.height))
+
+
+# ════════════════════════════════════════════════════════════════════════
+# FUENTES DE CADA TIPO DE MAPA
+# ════════════════════════════════════════════════════════════════════════
+def _buscar_en_carpeta(carpeta, *patrones):
+    """Como buscar_archivo_peligro de mapa_peligro, pero sobre el índice de capas_cache"""
+    for patron in patrones:
+        for ruta in indice_shapefiles():
+            if ruta.startswith(carpeta) and patron.lower() in os.path.basename(ruta).lower():
+                return ruta
+    return None
+
+
+def _capa_tabla(fuente, departamento):
+    """Capa base que se recorta si la fuente tiene tabla de pesos para el departamento"""
+    from tablas_pesos import ruta_tabla_pesos, ruta_capa_base
+    return ruta_capa_base(fuente, departamento) if ruta_tabla_pesos(fuente, departamento) else None
+
+
+def _capas_vectoriales(tipo, departamento_sel, provincia_sel):
+    """Lista [(alias, ruta)] de las capas que el generador recorta al encuadre del mapa"""
+    rios_vias = [("Ríos", RUTA_RIOS)] + [(f"Vías {os.path.basename(r).split('_')[2]}", r) for r in RUTAS_VIAS]
+    dep = departamento_sel.lower()
+    if tipo in ('geografico', 'vias'):
+        return rios_vias
+    if tipo == 'centros':
+        return [("Centros poblados", RUTA_CENTROS)] + rios_vias
+    if tipo == 'geomorfologia':
+        return [("Geomorfología", buscar_shapefile_cacheado(f"geomorfo_{dep}"))]
+    if tipo == 'climatica':
+        return [("Clasificación climática", RUTA_CLIMA if os.path.exists(RUTA_CLIMA) else buscar_shapefile_cacheado("clasif"))]
+    if tipo == 'geologia':
+        return [("Geología", buscar_shapefile_cacheado(f"geolo_{dep}") or buscar_shapefile_cacheado(f"geologia_{dep}"))]
+    if _fuentes_peligro(tipo):
+        import mapa_peligro as mp
+        capas = {
+            # Con DEM la pendiente son unos pocos polígonos por clase (pendientes_dem.py), no la capa vectorial
+            'pendiente': ("Pendiente", None if os.path.exists(RUTA_DEM_PENDIENTES)
+                          else _buscar_en_carpeta(mp.RUTA_BASE_PENDIENTE, provincia_sel, departamento_sel, "peso")),
+            # Con tabla de pesos (tablas_pesos.py) se recorta la capa base del departamento
+            'geomorfologia': ("Geomorfología", _capa_tabla('geomorfologia', departamento_sel)
+                              or _buscar_en_carpeta(mp.RUTA_BASE_GEOMORFOLOGIA, dep, "peso")),
+            'ppmax': ("PP máxima", _buscar_en_carpeta(mp.RUTA_BASE_PPMAX, "ppmax", "peso")),
+            'geologia': ("Geología", _capa_tabla('geologia', departamento_sel)
+                         or os.path.join(mp.RUTA_BASE_GEOLOGIA, "geolo_cusco_con_pesos.shp")),
+        }
+        # Ríos y altitud salen del DEM: no son capas que recortar
+        return [capas[f] for f in _fuentes_peligro(tipo) if f in capas]
+    return []
+
+
+def _fuentes_peligro(tipo):
+    """Fuentes del modelo de peligro del tipo de mapa (lista vacía si no es un mapa de peligro)"""
+    from modelos_peligro import MODELOS_PELIGRO
+    if tipo not in MODELOS_PELIGRO:
+        return []
+    return [f.fuente for f in MODELOS_PELIGRO[tipo].factores]
+
+
+def _hidrologia_en_cache(gdf_distrito, departamento_sel, provincia_sel, distrito_sel):
+    """True si mapa_peligro encontrará los buffers de ríos del distrito en la caché hidrológica"""
+    import mapa_peligro as mp
+    from capas_cache import ubigeo_de_distrito
+    from cache_hidrologia import clave_hidrologia, buscar_en_cache
+
+    ubigeo = ubigeo_de_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel)
+    umbral = mp.UMBRALES_RIOS[mp.INTENSIDAD_RIOS]
+    clave = clave_hidrologia(ubigeo, mp.RUTA_DEM, umbral, mp.BUFFERS_CONFIG)
+    return buscar_en_cache(ubigeo, clave) is not None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ESTIMACIÓN
+# ════════════════════════════════════════════════════════════════════════
+def estimar_trabajo(tipo, departamento_sel, provincia_sel, distrito_sel):
+    """
+    Estima el costo de generar un mapa sin generarlo.
+
+    Parámetros:
+    - tipo: clave del tipo de mapa ('geografico', 'vias', ..., 'rios', o un modelo de peligro:
+      'inundacion', 'deslizamiento', 'heladas')
+    - departamento_sel, provincia_sel, distrito_sel: ubicación (mismos valores que el generador)
+
+    Retorna:
+    - diccionario con los conteos, 'segundos', 'memoria_mb' y 'advertencias', o None si
+      no se encuentra el distrito
+    """
+    gdf_distrito = buscar_distrito(departamento_sel, provincia_sel, distrito_sel)
+    if gdf_distrito is None:
+        print(f"❌ Estimación: no se encontró el distrito '{distrito_sel}' ({provincia_sel})")
+        return None
+
+    c = COEFICIENTES
+    bbox = bbox_mapa(gdf_distrito)
+    zoom, teselas = teselas_basemap(bbox)
+
+    entidades = {}
+    for alias, ruta in _capas_vectoriales(tipo, departamento_sel, provincia_sel):
+        if not ruta or not os.path.exists(ruta):
+            entidades[alias] = None
+            continue
+        try:
+            entidades[alias] = contar_entidades_bbox(ruta, bbox)
+        except Exception as e:
+            print(f"   ⚠️ Estimación: no se pudo contar {alias}: {e}")
+            entidades[alias] = None
+    total_entidades = sum(n for n in entidades.values() if n)
+
+    pixeles_raster = 0
+    pixeles_dem = 0
+    hidrologia_en_cache = None
+    poligonos_overlay = 0
+    try:
+        if tipo == 'pendientes':
+            # Pendientes desde el DEM del distrito; el ráster nacional solo si no hay DEM
+            ruta_pendientes = RUTA_DEM_PENDIENTES if os.path.exists(RUTA_DEM_PENDIENTES) else RUTA_PENDIENTES
+            if os.path.exists(ruta_pendientes):
+                pixeles_raster = pixeles_recorte(ruta_pendientes, gdf_distrito)
+        elif tipo == 'rios' and os.path.exists(RUTA_DEM_RIOS):
+            # Con la acumulación ya calculada (región o caché del distrito) solo se lee una ventana
+            if buscar_acumulacion(RUTA_DEM_RIOS, gdf_distrito, margen_m=BUFFER_DEM_RIOS) is None:
+                pixeles_dem = pixeles_recorte(RUTA_DEM_RIOS, gdf_distrito, margen=BUFFER_DEM_RIOS)
+        elif 'rios' in _fuentes_peligro(tipo):
+            import mapa_peligro as mp
+            if os.path.exists(mp.RUTA_DEM):
+                hidrologia_en_cache = _hidrologia_en_cache(gdf_distrito, departamento_sel, provincia_sel, distrito_sel)
+                if not hidrologia_en_cache and buscar_acumulacion(mp.RUTA_DEM, gdf_distrito) is None:
+                    pixeles_dem = pixeles_recorte(mp.RUTA_DEM, gdf_distrito)
+    except Exception as e:
+        print(f"   ⚠️ Estimación: no se pudo leer el ráster: {e}")
+
+    if _fuentes_peligro(tipo):
+        import mapa_peligro as mp
+        # Intersección encadenada: cada paso agrega la nueva capa y fragmenta lo acumulado
+        conteos = [n for n in entidades.values() if n]
+        if 'rios' in _fuentes_peligro(tipo):
+            conteos.append(len(mp.BUFFERS_CONFIG))
+        if 'altitud' in _fuentes_peligro(tipo):
+            conteos.append(len(mp.CORTES_ALTITUD) + 1)
+        acumulado = conteos[0] if conteos else 0
+        for n in conteos[1:]:
+            acumulado = (acumulado + n) * c['fragmentacion_overlay']
+        poligonos_overlay = int(acumulado)
+
+    segundos = (c['s_base'] + teselas * c['s_por_tesela'] + total_entidades * c['s_por_entidad']
+                + pixeles_raster * c['s_por_pixel_raster'] + pixeles_dem * c['s_por_pixel_hidro']
+                + poligonos_overlay * (c['s_por_poligono_overlay'] + c['s_por_entidad']))
+    memoria_mb = (c['mb_base'] + teselas * c['mb_por_tesela'] + total_entidades * c['mb_por_entidad']
+                  + pixeles_raster * c['mb_por_pixel_raster'] + pixeles_dem * c['mb_por_pixel_hidro']
+                  + poligonos_overlay * c['mb_por_poligono_overlay'])
+
+    advertencias = []
+    if pixeles_dem > ADVERTENCIA_PIXELES_DEM:
+        advertencias.append(f"DEM muy grande ({pixeles_dem:,} píxeles): la hidrología puede tardar más de 10 minutos")
+    if segundos > ADVERTENCIA_SEGUNDOS:
+        advertencias.append(f"Duración estimada alta (~{segundos / 60:.0f} min)")
+    if memoria_mb > ADVERTENCIA_MEMORIA_MB:
+        advertencias.append(f"Memoria estimada alta (~{memoria_mb / 1024:.1f} GB)")
+    if any(n is None for n in entidades.values()):
+        advertencias.append("Faltan capas: " + ", ".join(a for a, n in entidades.items() if n is None))
+
+    return {
+        'tipo': tipo,
+        'distrito': distrito_sel,
+        'provincia': provincia_sel,
+        'departamento': departamento_sel,
+        'pixeles_dem': pixeles_dem,
+        'pixeles_raster': pixeles_raster,
+        'hidrologia_en_cache': hidrologia_en_cache,
+        'entidades': entidades,
+        'poligonos_overlay': poligonos_overlay,
+        'zoom_basemap': zoom,
+        'teselas_basemap': teselas,
+        'segundos': round(segundos, 1),
+        'memoria_mb': round(memoria_mb),
+        'advertencias': advertencias,
+    }
+
+
+def resumen_estimacion(est):
+    """Texto corto para la consola o el dashboard"""
+    if not est:
+        return "Sin estimación"
+    minutos = est['segundos'] / 60
+    duracion = f"~{est['segundos']:.0f} s" if minutos < 1 else f"~{minutos:.1f} min"
+    return f"{duracion}, ~{est['memoria_mb']:,} MB, {est['teselas_basemap']} teselas"
+
+
+# ════════════════════════════════════════════════════════════════════════
+# LÍNEA DE COMANDOS
+# ════════════════════════════════════════════════════════════════════════
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimación previa (dry-run) del costo de un mapa")
+    parser.add_argument("--tipo", required=True, help="Tipo de mapa (geografico, vias, centros, ..., rios, inundacion, deslizamiento, heladas)")
+    parser.add_argument("--departamento", required=True)
+    parser.add_argument("--provincia", required=True)
+    parser.add_argument("--distrito", required=True)
+    args = parser.parse_args(argv)
+
+    est = estimar_trabajo(args.tipo, args.departamento, args.provincia, args.distrito)
+    if est is None:
+        return 1
+    print(json.dumps(est, indent=2, ensure_ascii=False))
+    print(f"\n🧮 {resumen_estimacion(est)}")
+    for advertencia in est['advertencias']:
+        print(f"   ⚠️ {advertencia}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
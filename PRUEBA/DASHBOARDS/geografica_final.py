@@ -10,9 +10,12 @@ import matplotlib.patheffects as path_effects
 from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura
+from capas_tematicas import recortar_rios_vias, capa_geografico
 
 # --- RUTA BASE ORIGINAL (Respetando tu configuración) ---
 ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
@@ -29,10 +32,7 @@ def cargar_rios():
     if os.path.exists(ruta_directa):
         try:
             print(f"📂 Encontrado ríos en: {ruta_directa}")
-            gdf_rios = gpd.read_file(ruta_directa)
-            if gdf_rios.crs is None:
-                gdf_rios.set_crs(epsg=4326, inplace=True)
-            gdf_rios = gdf_rios.to_crs(epsg=3857)
+            gdf_rios = leer_capa(ruta_directa)
             print(f"✅ Ríos cargados: {len(gdf_rios)} registros")
             return gdf_rios
         except Exception as e:
@@ -63,10 +63,7 @@ def cargar_vias():
     for tipo, ruta in rutas.items():
         if os.path.exists(ruta):
             try:
-                gdf = gpd.read_file(ruta)
-                if gdf.crs is None:
-                    gdf.set_crs(epsg=4326, inplace=True)
-                vias[tipo] = gdf.to_crs(epsg=3857)
+                vias[tipo] = leer_capa(ruta)
                 print(f"✅ Vías {tipo}: {len(vias[tipo])} registros")
             except Exception as e:
                 print(f"⚠️ Error cargando vías {tipo}: {e}")
@@ -110,19 +107,13 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 1.0, "FECHA:", fontweight='bold', va='center', fontsize=8); ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
     if not path: return None
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326: gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"❌ Error cargando {alias} desde {path}: {e}")
         return None
@@ -252,12 +243,13 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
         print(f"❌ Error creando la estructura de carpetas para el usuario: {e}")
         return None
 
+    etapa("Cargando capas base...", 10)
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"❌ Error cargando shapefiles de Paises u Océano: {e}")
         return None
@@ -270,6 +262,7 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
     col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf_provincias.columns), None)
     col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
 
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n🔍 Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -280,10 +273,12 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
         print(f"❌ Error: No se pudo encontrar la geometría para el distrito '{distrito_sel}'.")
         return None
 
+    etapa("Cargando ríos y vías...", 30)
     print("\n🌊 Cargando ríos y vías...")
     gdf_rios = cargar_rios()
     vias = cargar_vias()
 
+    etapa("Armando el layout del mapa...", 45)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -325,63 +320,15 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
     ax_main.set_aspect('equal', adjustable='box')
     
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, attribution=False, zoom='auto')
     except Exception as e:
         print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
     
-    # Dibujar el distrito
-    gdf_distrito.plot(ax=ax_main, color="#a8dda8", edgecolor="black", linewidth=1.5, alpha=0.6, zorder=5)
-    
-    # ═══════════════════════════════════════════════════════════════════════════
-    # 🌊 DIBUJAR RÍOS (SIN ETIQUETAS)
-    # ═══════════════════════════════════════════════════════════════════════════
-    if gdf_rios is not None:
-        try:
-            gdf_rios_clip = gdf_rios.clip(box(*bbox_main))
-            if not gdf_rios_clip.empty:
-                print(f"   🌊 Dibujando ríos... ({len(gdf_rios_clip)} registros)")
-                gdf_rios_clip.plot(ax=ax_main, color='#00BFFF', linewidth=2.0, zorder=11)
-        except Exception as e:
-            print(f"   ⚠️ Error al recortar ríos: {e}")
-    else:
-        print("   ⚠️ No hay datos de ríos para mostrar")
-    
-    # ═══════════════════════════════════════════════════════════════════════════
-    # 🛣️ DIBUJAR VÍAS (SIN CLASIFICACIÓN)
-    # ═══════════════════════════════════════════════════════════════════════════
-    print("   🛣️ Dibujando vías...")
-    
-    # Vía Nacional
-    if vias['nacional'] is not None:
-        try:
-            gdf_via_nacional_clip = vias['nacional'].clip(box(*bbox_main))
-            if not gdf_via_nacional_clip.empty:
-                gdf_via_nacional_clip.plot(ax=ax_main, color='#FF0000', linewidth=2.2, zorder=12)
-                print(f"   ✅ Vías nacionales: {len(gdf_via_nacional_clip)} registros")
-        except Exception as e:
-            print(f"   ⚠️ Error al dibujar vías nacionales: {e}")
-    
-    # Vía Departamental
-    if vias['departamental'] is not None:
-        try:
-            gdf_via_departamental_clip = vias['departamental'].clip(box(*bbox_main))
-            if not gdf_via_departamental_clip.empty:
-                gdf_via_departamental_clip.plot(ax=ax_main, color='#32CD32', linewidth=1.8, zorder=13)
-                print(f"   ✅ Vías departamentales: {len(gdf_via_departamental_clip)} registros")
-        except Exception as e:
-            print(f"   ⚠️ Error al dibujar vías departamentales: {e}")
-    
-    # Vía Vecinal (sin clasificación)
-    if vias['vecinal'] is not None:
-        try:
-            gdf_via_vecinal_clip = vias['vecinal'].clip(box(*bbox_main))
-            if not gdf_via_vecinal_clip.empty:
-                gdf_via_vecinal_clip.plot(ax=ax_main, color='#FFFF00', linewidth=1.5, linestyle='--', zorder=15)
-                print(f"   ✅ Vías vecinales: {len(gdf_via_vecinal_clip)} registros")
-        except Exception as e:
-            print(f"   ⚠️ Error al dibujar vías vecinales: {e}")
-    else:
-        print("   ⚠️ No se cargaron datos de vías vecinales")
+    # Distrito, ríos y vías (el mismo dibujo que la página del paquete distrital)
+    print("   🛣️ Dibujando ríos y vías...")
+    rios_clip, vias_clip = recortar_rios_vias(gdf_rios, vias, box(*bbox_main))
+    legend_elements, ncols = capa_geografico(ax_main, gdf_distrito, rios_clip, vias_clip)
     
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
     add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
@@ -395,20 +342,10 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
     
-    legend_elements = [
-        Patch(facecolor='#a8dda8', edgecolor='black', label='Área del Distrito'),
-        Line2D([0], [0], color='#00BFFF', lw=2.5, label='Ríos'),
-        Line2D([0], [0], color='#FF0000', lw=2.5, label='Vía Nacional'),
-        Line2D([0], [0], color='#32CD32', lw=2.5, label='Vía Departamental'),
-        Line2D([0], [0], color='#FFFF00', lw=2.5, linestyle='--', label='Vía Vecinal'),
-        Line2D([0], [0], color='black', lw=2, label='Límite Distrital'),
-        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
-    ]
-    
     leg = ax_leyenda.legend(
         handles=legend_elements, 
         loc='center', 
-        ncol=2,  # 2 COLUMNAS
+        ncol=ncols,
         frameon=True, 
         fontsize=8,  # Reducido un poco para que quepa mejor
         title="LEYENDA", 
@@ -422,6 +359,7 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
     
+    etapa("Dibujando mapas de ubicación...", 75)
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
     ax_depto = fig.add_subplot(gs_ubicaciones[0])
     ax_prov = fig.add_subplot(gs_ubicaciones[1])
@@ -441,12 +379,13 @@ def generar_mapa_final(nombre_usuario, departamento_sel, provincia_sel, distrito
         spine.set_linewidth(2)
         spine.set_color('black')
 
+    etapa("Guardando el mapa...", 90)
     print("\n💾 Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_UBICACION_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
     
-    plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+    ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
     plt.close(fig)
     
     print(f"✅ Mapa guardado exitosamente en: {ruta_guardado_final}")
@@ -10,9 +10,12 @@ import matplotlib.patheffects as path_effects
 from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura, existe, tamano
+from capas_tematicas import capa_geologia
 import matplotlib.colors as mcolors
 
 # --- RUTA BASE ORIGINAL ---
@@ -71,10 +74,7 @@ def cargar_geologia(departamento):
         return None
     
     try:
-        gdf_geologia = gpd.read_file(ruta_geologia)
-        if gdf_geologia.crs is None:
-            gdf_geologia.set_crs(epsg=4326, inplace=True)
-        gdf_geologia = gdf_geologia.to_crs(epsg=3857)
+        gdf_geologia = leer_capa(ruta_geologia)
         print(f"   ✅ Geología cargada: {len(gdf_geologia)} polígonos")
         return gdf_geologia
     except Exception as e:
@@ -173,11 +173,7 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
@@ -186,10 +182,7 @@ def cargar_shapefile(nombre, alias):
         return None
     
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"   ❌ Error cargando {alias} desde {path}: {e}")
         return None
@@ -348,14 +341,15 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
         print(f"❌ Error creando la estructura de carpetas para el usuario: {e}")
         return None
     
+    etapa("Cargando capas base...", 10)
     print("\n📂 Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
     
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"⚠️ Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -373,6 +367,7 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
         print("❌ No se pudieron identificar las columnas de nombres en los shapefiles")
         return None
     
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n🗺️ Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -386,6 +381,7 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
     
     print(f"   ✅ Distrito encontrado con geometría válida")
     
+    etapa("Cargando geología...", 30)
     print("\n🪨 Cargando datos geológicos...")
     gdf_geologia = cargar_geologia(departamento_sel)
     
@@ -427,6 +423,7 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
         traceback.print_exc()
         return None
     
+    etapa("Armando el layout del mapa...", 45)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -467,6 +464,7 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
     
     print("   🛰️ Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, 
                        attribution=False, zoom='auto')
     except Exception as e:
@@ -474,13 +472,8 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
         ax_main.set_facecolor("#e8e8e8")
     
     print("   🎨 Dibujando unidades geológicas...")
-    for idx, unidad in enumerate(unidades_geologia):
-        gdf_unidad = gdf_geologia_clipped[gdf_geologia_clipped[col_geologia] == unidad]
-        gdf_unidad.plot(ax=ax_main, color=paleta_geologia[idx], edgecolor='black',
-                       linewidth=0.5, alpha=0.75, zorder=4)
-    
-    gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="red", linewidth=2,
-                     linestyle='--', alpha=0.9, zorder=15)
+    legend_elements, ncols = capa_geologia(ax_main, gdf_distrito, gdf_geologia_clipped, col_geologia,
+                                           unidades_geologia, paleta_geologia)
     
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
     add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
@@ -495,32 +488,6 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
     
-    legend_elements = []
-    
-    if len(unidades_geologia) > 0:
-        legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                     label='GEOLOGÍA:', linewidth=0))
-        
-        max_items_leyenda = min(5, len(unidades_geologia))
-        for idx in range(max_items_leyenda):
-            unidad = unidades_geologia[idx]
-            nombre_corto = str(unidad)[:25] + '...' if len(str(unidad)) > 25 else str(unidad)
-            legend_elements.append(Patch(facecolor=paleta_geologia[idx],
-                                         edgecolor='black', label=nombre_corto))
-        
-        if len(unidades_geologia) > max_items_leyenda:
-            legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                         label=f'(+{len(unidades_geologia)-max_items_leyenda} más)',
-                                         linewidth=0))
-    
-    legend_elements.extend([
-        Patch(facecolor='white', edgecolor='white', label='', linewidth=0),
-        Line2D([0], [0], color='red', lw=2, linestyle='--', label='Límite Distrital'),
-        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
-    ])
-    
-    ncols = 2 if len(legend_elements) > 8 else 1
-    
     leg = ax_leyenda.legend(
         handles=legend_elements,
         loc='center',
@@ -539,6 +506,7 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
     
+    etapa("Dibujando mapas de ubicación...", 75)
     print("   🗺️ Generando mapas de ubicación...")
     
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
@@ -574,17 +542,18 @@ def generar_mapa_geologia(nombre_usuario, departamento_sel, provincia_sel, distr
         spine.set_linewidth(2)
         spine.set_color('black')
     
+    etapa("Guardando el mapa...", 90)
     print("\n💾 Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_GEOLOGICO_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
     
     try:
-        plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+        ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
         plt.close(fig)
         
-        if os.path.exists(ruta_guardado_final):
-            file_size = os.path.getsize(ruta_guardado_final) / (1024 * 1024)
+        if existe(ruta_guardado_final):
+            file_size = tamano(ruta_guardado_final) / (1024 * 1024)
             print(f"✅ Mapa geológico guardado exitosamente")
             print(f"   📍 Ubicación: {ruta_guardado_final}")
             print(f"   📦 Tamaño: {file_size:.2f} MB")
@@ -10,9 +10,12 @@ import matplotlib.patheffects as path_effects
 from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura, existe, tamano
+from capas_tematicas import capa_geomorfologia
 import matplotlib.colors as mcolors
 
 # --- RUTA BASE ORIGINAL ---
@@ -67,10 +70,7 @@ def cargar_geomorfologia(departamento):
         return None
     
     try:
-        gdf_geomorfo = gpd.read_file(ruta_geomorfo)
-        if gdf_geomorfo.crs is None:
-            gdf_geomorfo.set_crs(epsg=4326, inplace=True)
-        gdf_geomorfo = gdf_geomorfo.to_crs(epsg=3857)
+        gdf_geomorfo = leer_capa(ruta_geomorfo)
         print(f"   ✅ Geomorfología cargada: {len(gdf_geomorfo)} polígonos")
         return gdf_geomorfo
     except Exception as e:
@@ -169,11 +169,7 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
@@ -182,10 +178,7 @@ def cargar_shapefile(nombre, alias):
         return None
     
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"   Error cargando {alias} desde {path}: {e}")
         return None
@@ -344,14 +337,15 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
         print(f"Error creando la estructura de carpetas para el usuario: {e}")
         return None
     
+    etapa("Cargando capas base...", 10)
     print("\n Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
     
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -369,6 +363,7 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
         print("No se pudieron identificar las columnas de nombres en los shapefiles")
         return None
     
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -382,6 +377,7 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
     
     print(f"   ✅ Distrito encontrado con geometría válida")
     
+    etapa("Cargando geomorfología...", 30)
     print("\n Cargando datos de geomorfología...")
     gdf_geomorfologia = cargar_geomorfologia(departamento_sel)
     
@@ -418,6 +414,7 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
         traceback.print_exc()
         return None
     
+    etapa("Armando el layout del mapa...", 45)
     print("\n Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -461,6 +458,7 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
     
     print("   Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, 
                        attribution=False, zoom='auto')
     except Exception as e:
@@ -468,13 +466,8 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
         ax_main.set_facecolor("#e8e8e8")
     
     print("   Dibujando unidades geomorfológicas...")
-    for idx, unidad in enumerate(unidades_geomorfo):
-        gdf_unidad = gdf_geomorfo_clipped[gdf_geomorfo_clipped[col_geomorfo] == unidad]
-        gdf_unidad.plot(ax=ax_main, color=paleta_geomorfo[idx], edgecolor='black',
-                       linewidth=0.5, alpha=0.7, zorder=4)
-    
-    gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="red", linewidth=2,
-                     linestyle='--', alpha=0.9, zorder=15)
+    legend_elements, ncols = capa_geomorfologia(ax_main, gdf_distrito, gdf_geomorfo_clipped, col_geomorfo,
+                                                unidades_geomorfo, paleta_geomorfo)
     
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
     add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
@@ -489,32 +482,6 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
     
-    legend_elements = []
-    
-    if len(unidades_geomorfo) > 0:
-        legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                     label='GEOMORFOLOGÍA:', linewidth=0))
-        
-        max_items_leyenda = min(5, len(unidades_geomorfo))
-        for idx in range(max_items_leyenda):
-            unidad = unidades_geomorfo[idx]
-            nombre_corto = str(unidad)[:25] + '...' if len(str(unidad)) > 25 else str(unidad)
-            legend_elements.append(Patch(facecolor=paleta_geomorfo[idx],
-                                         edgecolor='black', label=nombre_corto))
-        
-        if len(unidades_geomorfo) > max_items_leyenda:
-            legend_elements.append(Patch(facecolor='white', edgecolor='white',
-                                         label=f'(+{len(unidades_geomorfo)-max_items_leyenda} más)',
-                                         linewidth=0))
-    
-    legend_elements.extend([
-        Patch(facecolor='white', edgecolor='white', label='', linewidth=0),
-        Line2D([0], [0], color='red', lw=2, linestyle='--', label='Límite Distrital'),
-        Line2D([0], [0], color='black', ls='-', lw=1, label='Grillado UTM')
-    ])
-    
-    ncols = 2 if len(legend_elements) > 8 else 1
-    
     leg = ax_leyenda.legend(
         handles=legend_elements,
         loc='center',
@@ -533,6 +500,7 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
     
+    etapa("Dibujando mapas de ubicación...", 75)
     print("   Generando mapas de ubicación...")
     
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
@@ -568,17 +536,18 @@ def generar_mapa_geomorfologia(nombre_usuario, departamento_sel, provincia_sel,
         spine.set_linewidth(2)
         spine.set_color('black')
     
+    etapa("Guardando el mapa...", 90)
     print("\n Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_GEOMORFOLOGIA_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
     
     try:
-        plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+        ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
         plt.close(fig)
         
-        if os.path.exists(ruta_guardado_final):
-            file_size = os.path.getsize(ruta_guardado_final) / (1024 * 1024)
+        if existe(ruta_guardado_final):
+            file_size = tamano(ruta_guardado_final) / (1024 * 1024)
             print(f"Mapa de geomorfología guardado exitosamente")
             print(f"   Ubicación: {ruta_guardado_final}")
             print(f"   Tamaño: {file_size:.2f} MB")
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+💧 hidrologia_numpy.py - MOTOR HIDROLÓGICO D8 EN MEMORIA (NUMPY)
+- Alternativa a la cadena de WhiteboxTools (fill_depressions → d8_pointer → d8_flow_accumulation
+  → extract_streams → raster_streams_to_vector) sin escribir GeoTIFF intermedios a disco
+- Relleno de depresiones: Priority-Flood + ε (Barnes et al. 2014), así las zonas planas quedan
+  con pendiente mínima hacia la salida y todas las celdas tienen dirección de flujo
+- Direcciones D8 vectorizadas con los mismos códigos que WhiteboxTools:
+      64 128   1
+      32   0   2
+      16   8   4
+- Acumulación de flujo en orden topológico (Kahn por niveles, cada nivel vectorizado)
+- Vectorización: un segmento por tramo entre cabecera/confluencia y la siguiente confluencia
+
+Selección del motor: DASH_MOTOR_HIDROLOGIA=whitebox (por defecto) | numpy
+
+Comparación de motores sobre las mismas ventanas del DEM:
+    python hidrologia_numpy.py --benchmark --dem DEM.tif --ventana 1000 --ventana 2000 --umbral 500
+"""
+
+import os
+import sys
+import time
+import math
+import heapq
+import argparse
+
+import numpy as np
+
+from progreso import etapa, verificar_cancelacion
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+MOTORES_HIDROLOGIA = ("whitebox", "numpy")
+MOTOR_HIDROLOGIA = os.environ.get("DASH_MOTOR_HIDROLOGIA", "whitebox").lower()
+if MOTOR_HIDROLOGIA not in MOTORES_HIDROLOGIA:
+    print(f"⚠️ Motor hidrológico desconocido '{MOTOR_HIDROLOGIA}', se usa whitebox")
+    MOTOR_HIDROLOGIA = "whitebox"
+
+# Vecinos D8: (desplazamiento fila, desplazamiento columna, código WhiteboxTools)
+VECINOS_D8 = [
+    (-1, 1, 1), (0, 1, 2), (1, 1, 4), (1, 0, 8),
+    (1, -1, 16), (0, -1, 32), (-1, -1, 64), (-1, 0, 128),
+]
+CODIGOS_D8 = {codigo: (df, dc) for df, dc, codigo in VECINOS_D8}
+
+# Cada cuántas celdas del relleno se revisa si el trabajo fue cancelado
+CELDAS_POR_VERIFICACION = 200_000
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PREPARACIÓN DEL DEM
+# ════════════════════════════════════════════════════════════════════════
+def preparar_dem(elevacion, nodata=None):
+    """
+    Convierte el recorte del DEM en (elevación float64, máscara de celdas válidas).
+    Acepta un array enmascarado (rasterio mask filled=False) o un array con valor nodata.
+    """
+    if np.ma.isMaskedArray(elevacion):
+        valido = ~np.ma.getmaskarray(elevacion)
+        dem = np.asarray(elevacion.filled(0), dtype=np.float64)
+    else:
+        dem = np.asarray(elevacion, dtype=np.float64)
+        valido = np.isfinite(dem)
+        if nodata is not None and not np.isnan(nodata):
+            valido &= dem != nodata
+    dem = np.where(valido, dem, 0.0)
+    return dem, valido
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 1. RELLENO DE DEPRESIONES (PRIORITY-FLOOD + ε)
+# ════════════════════════════════════════════════════════════════════════
+def rellenar_depresiones(dem, valido):
+    """
+    Rellena las depresiones inundando desde el borde del área válida hacia adentro con una cola
+    de prioridad. Cada celda queda al menos un ε (siguiente flotante) por encima de la celda desde
+    la que se alcanzó, por eso no quedan planos sin salida.
+
+    Retorna:
+    - DEM rellenado (float64, mismas dimensiones; las celdas no válidas quedan en 0)
+    """
+    filas, columnas = dem.shape
+    # Se trabaja sobre listas planas con un marco de una celda: evita chequear los bordes
+    ancho = columnas + 2
+    valido_p = np.zeros((filas + 2, ancho), dtype=bool)
+    valido_p[1:-1, 1:-1] = valido
+    z_p = np.zeros((filas + 2, ancho), dtype=np.float64)
+    z_p[1:-1, 1:-1] = dem
+
+    # Semillas: celdas válidas con algún vecino fuera del área válida (borde o nodata)
+    vecino_invalido = np.zeros_like(valido_p)
+    for df, dc, _ in VECINOS_D8:
+        vecino_invalido |= ~np.roll(np.roll(valido_p, -df, axis=0), -dc, axis=1)
+    semillas = np.flatnonzero(valido_p & vecino_invalido)
+
+    z = z_p.ravel().tolist()
+    cerrado = bytearray((~valido_p).ravel().astype(np.uint8).tobytes())
+    desplazamientos = [df * ancho + dc for df, dc, _ in VECINOS_D8]
+
+    cola = [(z[i], i) for i in semillas.tolist()]
+    heapq.heapify(cola)
+    for i in semillas.tolist():
+        cerrado[i] = 1
+
+    siguiente = math.nextafter
+    procesadas = 0
+    heappop, heappush = heapq.heappop, heapq.heappush
+    while cola:
+        elev, i = heappop(cola)
+        for d in desplazamientos:
+            j = i + d
+            if cerrado[j]:
+                continue
+            cerrado[j] = 1
+            zj = z[j]
+            if zj <= elev:
+                zj = siguiente(elev, math.inf)
+                z[j] = zj
+            heappush(cola, (zj, j))
+        procesadas += 1
+        if procesadas % CELDAS_POR_VERIFICACION == 0:
+            verificar_cancelacion()
+
+    relleno = np.array(z, dtype=np.float64).reshape(filas + 2, ancho)[1:-1, 1:-1]
+    return np.where(valido, relleno, 0.0)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 2. DIRECCIONES D8
+# ════════════════════════════════════════════════════════════════════════
+def direcciones_d8(relleno, valido, res_x=1.0, res_y=1.0):
+    """
+    Dirección de máxima pendiente hacia los 8 vecinos (códigos de WhiteboxTools).
+    0 = sin vecino más bajo (salida en el borde del área válida).
+    """
+    filas, columnas = relleno.shape
+    z_p = np.full((filas + 2, columnas + 2), np.inf)
+    z_p[1:-1, 1:-1] = np.where(valido, relleno, np.inf)
+    diagonal = np.hypot(res_x, res_y)
+
+    mejor_pendiente = np.zeros((filas, columnas), dtype=np.float64)
+    punteros = np.zeros((filas, columnas), dtype=np.uint8)
+    for df, dc, codigo in VECINOS_D8:
+        distancia = diagonal if df and dc else (res_x if dc else res_y)
+        vecino = z_p[1 + df:1 + df + filas, 1 + dc:1 + dc + columnas]
+        with np.errstate(invalid='ignore'):
+            pendiente = (relleno - vecino) / distancia
+        pendiente = np.where(np.isfinite(vecino), pendiente, 0.0)
+        mejor = pendiente > mejor_pendiente
+        mejor_pendiente[mejor] = pendiente[mejor]
+        punteros[mejor] = codigo
+    punteros[~valido] = 0
+    return punteros
+
+
+def receptores_d8(punteros):
+    """Índice plano de la celda a la que drena cada celda (-1 si es salida)"""
+    filas, columnas = punteros.shape
+    fila, columna = np.indices(punteros.shape)
+    receptor = np.full(punteros.size, -1, dtype=np.int64)
+    for codigo, (df, dc) in CODIGOS_D8.items():
+        f2, c2 = fila + df, columna + dc
+        # Un puntero que sale de la ventana (recorte de un raster regional) se trata como salida
+        sel = ((punteros == codigo) & (f2 >= 0) & (f2 < filas) & (c2 >= 0) & (c2 < columnas)).ravel()
+        receptor[sel] = (f2 * columnas + c2).ravel()[sel]
+    return receptor
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 3. ACUMULACIÓN DE FLUJO (ORDEN TOPOLÓGICO)
+# ════════════════════════════════════════════════════════════════════════
+def acumulacion_flujo(punteros, valido):
+    """
+    Número de celdas que drenan a cada celda, incluida ella misma (out_type="cells" de WhiteboxTools).
+    Algoritmo de Kahn por niveles: en cada vuelta se propagan a la vez todas las celdas cuyos
+    aportantes ya terminaron.
+    """
+    receptor = receptores_d8(punteros)
+    acumulado = valido.ravel().astype(np.float64)
+    tiene_receptor = receptor >= 0
+    entradas = np.bincount(receptor[tiene_receptor], minlength=receptor.size)
+
+    frente = np.flatnonzero((entradas == 0) & valido.ravel())
+    niveles = 0
+    while frente.size:
+        frente = frente[tiene_receptor[frente]]
+        destinos = receptor[frente]
+        np.add.at(acumulado, destinos, acumulado[frente])
+        np.subtract.at(entradas, destinos, 1)
+        destinos = np.unique(destinos)
+        frente = destinos[entradas[destinos] == 0]
+        niveles += 1
+        if niveles % 500 == 0:
+            verificar_cancelacion()
+
+    return acumulado.reshape(punteros.shape)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 4-5. EXTRACCIÓN Y VECTORIZACIÓN DE RÍOS
+# ════════════════════════════════════════════════════════════════════════
+def extraer_rios(acumulado, umbral):
+    """Celdas de río: acumulación mayor al umbral (como extract_streams)"""
+    return acumulado > umbral
+
+
+def vectorizar_rios(rios, punteros, transform, crs=None):
+    """
+    Convierte el raster de ríos en líneas siguiendo las direcciones D8.
+    Cada segmento va desde una cabecera o confluencia hasta la siguiente confluencia (o la salida),
+    y comparte el vértice de la confluencia con el tramo que sigue.
+
+    Retorna:
+    - GeoDataFrame de LineString con STRM_VAL (como raster_streams_to_vector)
+    """
+    import geopandas as gpd
+    from shapely.geometry import LineString
+
+    filas, columnas = rios.shape
+    receptor = receptores_d8(punteros)
+    es_rio = rios.ravel()
+    # Solo se sigue aguas abajo si la celda receptora también es río
+    baja = receptor >= 0
+    baja[baja] = es_rio[receptor[baja]]
+    receptor = np.where(es_rio & baja, receptor, -1)
+    entradas = np.bincount(receptor[receptor >= 0], minlength=receptor.size)
+
+    inicios = np.flatnonzero(es_rio & (entradas != 1))
+    es_inicio = np.zeros(receptor.size, dtype=bool)
+    es_inicio[inicios] = True
+
+    a, b, c, d, e, f = transform.a, transform.b, transform.c, transform.d, transform.e, transform.f
+    receptor_l = receptor.tolist()
+
+    def coordenada(i):
+        fila, col = divmod(i, columnas)
+        x, y = col + 0.5, fila + 0.5
+        return (a * x + b * y + c, d * x + e * y + f)
+
+    lineas = []
+    for inicio in inicios.tolist():
+        vertices = [coordenada(inicio)]
+        i = receptor_l[inicio]
+        while i >= 0:
+            vertices.append(coordenada(i))
+            if es_inicio[i]:
+                break
+            i = receptor_l[i]
+        if len(vertices) >= 2:
+            lineas.append(LineString(vertices))
+
+    return gpd.GeoDataFrame({'STRM_VAL': np.ones(len(lineas), dtype=np.int32)}, geometry=lineas, crs=crs)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CADENA COMPLETA
+# ════════════════════════════════════════════════════════════════════════
+def red_rios_numpy(elevacion, transform, crs, umbral, nodata=None, progreso=(20, 55), tiempos=None):
+    """
+    Red de ríos vectorial desde el recorte del DEM, sin pasar por disco.
+
+    Parámetros:
+    - elevacion: array 2D (o enmascarado) del DEM recortado
+    - transform, crs: georreferencia del recorte
+    - umbral: acumulación mínima (celdas) para considerar río
+    - progreso: (porcentaje inicial, porcentaje final) que se reparte entre los 5 pasos
+    - tiempos: diccionario opcional donde se anotan los segundos de cada paso
+
+    Retorna:
+    - GeoDataFrame de ríos en el CRS del DEM
+    """
+    inicio_pct, fin_pct = progreso
+    pasos = [
+        ("Rellenando depresiones del DEM...", "relleno"),
+        ("Calculando dirección de flujo...", "d8"),
+        ("Calculando acumulación de flujo...", "acumulacion"),
+        ("Extrayendo red de ríos...", "extraccion"),
+        ("Vectorizando red de ríos...", "vectorizacion"),
+    ]
+    tiempos = {} if tiempos is None else tiempos
+    dem, valido = preparar_dem(elevacion, nodata)
+    resultado = None
+
+    for n, (texto, clave) in enumerate(pasos):
+        etapa(texto, round(inicio_pct + (fin_pct - inicio_pct) * n / len(pasos)))
+        print(f"   {n + 1}/5 {texto} (numpy)")
+        t0 = time.time()
+        if clave == "relleno":
+            resultado = rellenar_depresiones(dem, valido)
+        elif clave == "d8":
+            punteros = direcciones_d8(resultado, valido, abs(transform.a), abs(transform.e))
+        elif clave == "acumulacion":
+            resultado = acumulacion_flujo(punteros, valido)
+        elif clave == "extraccion":
+            resultado = extraer_rios(resultado, umbral)
+        else:
+            resultado = vectorizar_rios(resultado, punteros, transform, crs)
+        tiempos[clave] = time.time() - t0
+
+    verificar_cancelacion()
+    return resultado
+
+
+# ════════════════════════════════════════════════════════════════════════
+# BENCHMARK: NUMPY VS WHITEBOXTOOLS
+# ════════════════════════════════════════════════════════════════════════
+def _leer_ventana(ruta_dem, lado, fila0=None, col0=None):
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(ruta_dem) as src:
+        lado_f, lado_c = min(lado, src.height), min(lado, src.width)
+        fila0 = (src.height - lado_f) // 2 if fila0 is None else fila0
+        col0 = (src.width - lado_c) // 2 if col0 is None else col0
+        ventana = Window(col0, fila0, lado_c, lado_f)
+        elevacion = src.read(1, window=ventana, masked=True)
+        return elevacion, src.window_transform(ventana), src.crs, src.meta.copy()
+
+
+def _rios_whitebox(elevacion, transform, meta, umbral, carpeta, tiempos):
+    """Misma cadena con WhiteboxTools; devuelve el raster de ríos como booleano"""
+    import rasterio
+    from whitebox import WhiteboxTools
+
+    wbt = WhiteboxTools()
+    wbt.set_working_dir(carpeta)
+    wbt.set_verbose_mode(False)
+
+    meta.update({"driver": "GTiff", "height": elevacion.shape[0], "width": elevacion.shape[1],
+                 "transform": transform, "count": 1})
+    nodata = meta.get("nodata")
+    if nodata is None:
+        nodata = -9999.0
+        meta["nodata"] = nodata
+    rutas = {n: os.path.join(carpeta, f"{n}.tif") for n in ("dem", "filled", "flow_dir", "flow_acc", "streams")}
+    with rasterio.open(rutas["dem"], "w", **meta) as dst:
+        dst.write(elevacion.filled(nodata).astype(meta["dtype"]), 1)
+
+    t0 = time.time()
+    wbt.fill_depressions(rutas["dem"], rutas["filled"])
+    tiempos["relleno"] = time.time() - t0
+    t0 = time.time()
+    wbt.d8_pointer(rutas["filled"], rutas["flow_dir"])
+    tiempos["d8"] = time.time() - t0
+    t0 = time.time()
+    wbt.d8_flow_accumulation(rutas["filled"], rutas["flow_acc"], out_type="cells")
+    tiempos["acumulacion"] = time.time() - t0
+    t0 = time.time()
+    wbt.extract_streams(rutas["flow_acc"], rutas["streams"], umbral)
+    tiempos["extraccion"] = time.time() - t0
+    t0 = time.time()
+    wbt.raster_streams_to_vector(rutas["streams"], rutas["flow_dir"], os.path.join(carpeta, "streams.shp"))
+    tiempos["vectorizacion"] = time.time() - t0
+
+    with rasterio.open(rutas["streams"]) as src:
+        streams = src.read(1, masked=True)
+    return (streams.filled(0) > 0)
+
+
+def benchmark(ruta_dem, lados, umbral):
+    """Compara tiempos y coincidencia de celdas de río entre ambos motores"""
+    from espacio_trabajo import espacio_trabajo
+
+    print(f"\n{'='*80}")
+    print("💧 BENCHMARK HIDROLOGÍA: NUMPY VS WHITEBOXTOOLS".center(80))
+    print(f"{'='*80}")
+    print(f"   DEM: {ruta_dem}")
+    print(f"   Umbral: {umbral} celdas")
+
+    filas_resultado = []
+    for lado in lados:
+        elevacion, transform, crs, meta = _leer_ventana(ruta_dem, lado)
+        print(f"\n📐 Ventana {elevacion.shape[1]} x {elevacion.shape[0]} ({elevacion.size:,} píxeles)")
+
+        t_np = {}
+        dem, valido = preparar_dem(elevacion)
+        t0 = time.time()
+        relleno = rellenar_depresiones(dem, valido)
+        t_np["relleno"] = time.time() - t0
+        t0 = time.time()
+        punteros = direcciones_d8(relleno, valido, abs(transform.a), abs(transform.e))
+        t_np["d8"] = time.time() - t0
+        t0 = time.time()
+        acumulado = acumulacion_flujo(punteros, valido)
+        t_np["acumulacion"] = time.time() - t0
+        t0 = time.time()
+        rios_np = extraer_rios(acumulado, umbral)
+        t_np["extraccion"] = time.time() - t0
+        t0 = time.time()
+        lineas = vectorizar_rios(rios_np, punteros, transform, crs)
+        t_np["vectorizacion"] = time.time() - t0
+
+        t_wbt = {}
+        try:
+            with espacio_trabajo(None, "benchmark_hidro") as carpeta:
+                rios_wbt = _rios_whitebox(elevacion, transform, meta, umbral, carpeta, t_wbt)
+            union = np.count_nonzero(rios_np | rios_wbt)
+            coincidencia = np.count_nonzero(rios_np & rios_wbt) / union if union else 1.0
+        except Exception as e:
+            print(f"   ⚠️ WhiteboxTools no disponible para comparar: {e}")
+            coincidencia = None
+
+        print(f"   {'Paso':<15}{'numpy (s)':>12}{'whitebox (s)':>15}")
+        for paso in ("relleno", "d8", "acumulacion", "extraccion", "vectorizacion"):
+            wbt_txt = f"{t_wbt[paso]:.2f}" if paso in t_wbt else "-"
+            print(f"   {paso:<15}{t_np[paso]:>12.2f}{wbt_txt:>15}")
+        total_np, total_wbt = sum(t_np.values()), sum(t_wbt.values())
+        print(f"   {'TOTAL':<15}{total_np:>12.2f}{(f'{total_wbt:.2f}' if t_wbt else '-'):>15}")
+        print(f"   Segmentos numpy: {len(lineas)}  |  Celdas de río: {np.count_nonzero(rios_np):,}")
+        if coincidencia is not None:
+            print(f"   Coincidencia de celdas de río (IoU): {coincidencia:.3f}")
+
+        filas_resultado.append({'pixeles': int(elevacion.size), 'numpy_s': total_np,
+                                'whitebox_s': total_wbt if t_wbt else None, 'iou': coincidencia})
+    return filas_resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Motor hidrológico D8 en NumPy")
+    parser.add_argument("--benchmark", action="store_true", help="Comparar numpy y WhiteboxTools")
+    parser.add_argument("--dem", default=f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO/DEM.tif")
+    parser.add_argument("--ventana", type=int, action="append",
+                        help="Lado (px) de una ventana centrada en el DEM; se puede repetir")
+    parser.add_argument("--umbral", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    if not os.path.exists(args.dem):
+        print(f"❌ No se encontró el DEM: {args.dem}")
+        return 1
+    benchmark(args.dem, args.ventana or [500, 1000, 2000], args.umbral)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
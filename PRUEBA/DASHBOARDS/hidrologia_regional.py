@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+🗺️ hidrologia_regional.py - HIDROLOGÍA PRECALCULADA POR DEPARTAMENTO O CUENCA
+- Una sola vez por región: DEM rellenado, direcciones D8 y acumulación de flujo sobre toda la
+  región (más un margen), guardados como COG con teselas de 512 px
+- Cada distrito solo lee una ventana de la acumulación y de las direcciones, aplica el umbral y
+  vectoriza: segundos en lugar de minutos, y sin perder el área aportante aguas arriba que queda
+  fuera del distrito (el recorte por distrito la ignoraba)
+- Cada región guarda la huella del DEM de origen: solo se usa con ese mismo DEM
+- Sin región que lo cubra, la acumulación del distrito (más MARGEN_DISTRITO_M) se calcula una vez
+  con el mismo formato y queda en caché: cualquier intensidad de ríos sale de ella con un umbral
+
+Preparar una región (motor según DASH_MOTOR_HIDROLOGIA o --motor):
+    python hidrologia_regional.py --dem DEM.tif --departamento CUSCO
+    python hidrologia_regional.py --dem DEM.tif --limite cuenca_urubamba.shp --nombre URUBAMBA
+"""
+
+import os
+import sys
+import json
+import hashlib
+import math
+import shutil
+import argparse
+import datetime
+
+import numpy as np
+
+from cache_hidrologia import huella_dem
+from hidrologia_numpy import (MOTOR_HIDROLOGIA, preparar_dem, rellenar_depresiones, direcciones_d8,
+                              acumulacion_flujo, extraer_rios, vectorizar_rios)
+from espacio_trabajo import espacio_trabajo
+from progreso import etapa
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_HIDROLOGIA_REGIONAL = f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO/REGIONAL"
+RUTA_ACUMULACION_DISTRITOS = f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO/CACHE/ACUMULACION"
+MARGEN_REGION_M = 5000      # Margen alrededor del límite: cuencas que entran desde la región vecina
+MARGEN_DISTRITO_M = 1000    # Margen de la acumulación por distrito (el de generar_red_rios_desde_geotiff)
+TAMANO_TESELA = 512
+
+PRODUCTOS = {
+    'relleno': "dem_relleno.tif",
+    'direcciones': "direcciones_d8.tif",
+    'acumulacion': "acumulacion.tif",
+}
+NOMBRE_LIMITE = "limite.geojson"
+NOMBRE_META = "meta.json"
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ESCRITURA DE COG
+# ════════════════════════════════════════════════════════════════════════
+def _escribir_cog(ruta, datos, perfil, nodata):
+    """Escribe un raster de una banda como COG (o GeoTIFF con teselas si GDAL no tiene el driver COG)"""
+    import rasterio
+    from rasterio.shutil import copy as rio_copy
+
+    perfil = perfil.copy()
+    perfil.update(driver="GTiff", count=1, dtype=datos.dtype.name, nodata=nodata, tiled=True,
+                  blockxsize=TAMANO_TESELA, blockysize=TAMANO_TESELA, compress="deflate", BIGTIFF="IF_SAFER")
+    temporal = f"{ruta}.{os.getpid()}.tmp.tif"
+    with rasterio.open(temporal, "w", **perfil) as dst:
+        dst.write(datos, 1)
+    try:
+        rio_copy(temporal, ruta, driver="COG", compress="DEFLATE", blocksize=TAMANO_TESELA,
+                 overviews="NONE", BIGTIFF="IF_SAFER")
+        os.remove(temporal)
+    except Exception as e:
+        print(f"   ⚠️ Driver COG no disponible ({e}); se deja GeoTIFF con teselas")
+        os.replace(temporal, ruta)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PREPARACIÓN DE UNA REGIÓN (UNA SOLA VEZ)
+# ════════════════════════════════════════════════════════════════════════
+def _nombre_carpeta(nombre):
+    return "".join(c if c.isalnum() else "_" for c in nombre.upper())
+
+
+def _publicar_carpeta(temporal, carpeta):
+    """
+    Publica 'temporal' como 'carpeta' con dos renombres (la anterior se aparta y luego se borra):
+    quien lee la región nunca ve una carpeta a medio borrar, y si falla se restaura la anterior
+    """
+    os.makedirs(os.path.dirname(carpeta), exist_ok=True)
+    anterior = f"{carpeta}.{os.getpid()}.old"
+    shutil.rmtree(anterior, ignore_errors=True)
+    try:
+        os.replace(carpeta, anterior)
+    except FileNotFoundError:
+        anterior = None
+    try:
+        os.replace(temporal, carpeta)
+    except OSError:
+        if anterior:
+            os.replace(anterior, carpeta)
+        raise
+    if anterior:
+        shutil.rmtree(anterior, ignore_errors=True)
+
+
+def preparar_region(ruta_dem, limite_gdf, nombre, motor=None, margen_m=MARGEN_REGION_M, carpeta=None,
+                    nombre_usuario=None):
+    """
+    Calcula relleno, direcciones D8 y acumulación de flujo de una región y los publica como COG.
+
+    Parámetros:
+    - ruta_dem: DEM de origen
+    - limite_gdf: GeoDataFrame del departamento o cuenca
+    - nombre: nombre de la región (define la carpeta)
+    - motor: 'whitebox' o 'numpy' (por defecto MOTOR_HIDROLOGIA). Para regiones grandes conviene
+      whitebox: el relleno en numpy recorre celda por celda en Python
+    - carpeta: destino (por defecto la carpeta de la región en RUTA_HIDROLOGIA_REGIONAL).
+      Si se indica y ya existe al terminar, se conserva la existente (otro proceso la publicó)
+    - nombre_usuario: dueño del trabajo (cuota de la carpeta de trabajo de WhiteboxTools)
+
+    Retorna:
+    - carpeta de la región o None si falla
+    """
+    import rasterio
+    from shapely.geometry import mapping
+    from procesamiento_bloques import leer_recorte
+
+    motor = motor or MOTOR_HIDROLOGIA
+    reemplazar = carpeta is None
+    carpeta = carpeta or os.path.join(RUTA_HIDROLOGIA_REGIONAL, _nombre_carpeta(nombre))
+    print(f"\n{'='*80}")
+    print(f"🗺️ PREPARANDO HIDROLOGÍA: {nombre} (motor: {motor})".center(80))
+    print(f"{'='*80}")
+
+    with rasterio.open(ruta_dem) as src:
+        limite = limite_gdf.to_crs(src.crs).geometry.union_all()
+        region = limite.buffer(margen_m)
+        perfil = src.profile.copy()
+        crs = src.crs
+    # Recorte armado por bloques a resolución nativa (el relleno necesita la región completa)
+    datos, transform, _, _ = leer_recorte(ruta_dem, region, reducir=False)
+    elevacion = np.ma.masked_invalid(datos)
+    perfil.update(height=elevacion.shape[0], width=elevacion.shape[1], transform=transform)
+    print(f"   📐 Región: {elevacion.shape[1]} x {elevacion.shape[0]} ({elevacion.size:,} píxeles)")
+
+    temporal = f"{carpeta}.{os.getpid()}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    try:
+        if motor == "numpy":
+            dem, valido = preparar_dem(elevacion)
+            etapa("Rellenando depresiones (región)...", 10)
+            relleno = rellenar_depresiones(dem, valido)
+            etapa("Calculando direcciones D8 (región)...", 50)
+            punteros = direcciones_d8(relleno, valido, abs(transform.a), abs(transform.e))
+            etapa("Calculando acumulación de flujo (región)...", 65)
+            acumulado = acumulacion_flujo(punteros, valido)
+            relleno = np.where(valido, relleno, -9999.0).astype(np.float32)
+            acumulado = np.where(valido, acumulado, -1).astype(np.float32)
+        else:
+            relleno, punteros, acumulado = _region_whitebox(elevacion, perfil, nombre_usuario)
+
+        etapa("Guardando COG regionales...", 85)
+        _escribir_cog(os.path.join(temporal, PRODUCTOS['relleno']), relleno, perfil, -9999.0)
+        _escribir_cog(os.path.join(temporal, PRODUCTOS['direcciones']), punteros.astype(np.uint8), perfil, 0)
+        _escribir_cog(os.path.join(temporal, PRODUCTOS['acumulacion']), acumulado, perfil, -1)
+
+        with open(os.path.join(temporal, NOMBRE_LIMITE), "w", encoding="utf-8") as f:
+            json.dump(mapping(region), f)
+        meta = {
+            'nombre': nombre,
+            'dem': os.path.abspath(ruta_dem),
+            'huella_dem': huella_dem(ruta_dem),
+            'crs': crs.to_wkt(),
+            'motor': motor,
+            'margen_m': margen_m,
+            'forma': list(elevacion.shape),
+            'creado': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(temporal, NOMBRE_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        # Publicación: se reemplaza la región anterior de una vez
+        if not reemplazar and os.path.exists(carpeta):
+            print(f"   ♻️ Otro proceso ya publicó {carpeta}: se usa esa")
+            return carpeta
+        _publicar_carpeta(temporal, carpeta)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    print(f"   ✅ Región publicada en: {carpeta}")
+    return carpeta
+
+
+def _region_whitebox(elevacion, perfil, nombre_usuario=None):
+    """Relleno, D8 y acumulación con WhiteboxTools; devuelve los tres arrays"""
+    import rasterio
+    from whitebox import WhiteboxTools
+    from planificador import configurar_wbt
+
+    with espacio_trabajo(nombre_usuario, "hidro_regional") as carpeta:
+        wbt = WhiteboxTools()
+        wbt.set_working_dir(carpeta)
+        wbt.set_verbose_mode(True)
+        configurar_wbt(wbt)
+
+        nodata = perfil.get('nodata')
+        if nodata is None:
+            nodata = -9999.0
+        perfil = perfil.copy()
+        perfil.update(driver="GTiff", nodata=nodata, count=1)
+        rutas = {n: os.path.join(carpeta, f"{n}.tif") for n in ("dem", "relleno", "d8", "acumulacion")}
+        with rasterio.open(rutas["dem"], "w", **perfil) as dst:
+            dst.write(elevacion.filled(nodata).astype(perfil['dtype']), 1)
+
+        etapa("Rellenando depresiones (región)...", 10)
+        wbt.fill_depressions(rutas["dem"], rutas["relleno"])
+        etapa("Calculando direcciones D8 (región)...", 50)
+        wbt.d8_pointer(rutas["relleno"], rutas["d8"])
+        etapa("Calculando acumulación de flujo (región)...", 65)
+        wbt.d8_flow_accumulation(rutas["relleno"], rutas["acumulacion"], out_type="cells")
+
+        with rasterio.open(rutas["relleno"]) as src:
+            relleno = src.read(1, masked=True).filled(-9999.0).astype(np.float32)
+        with rasterio.open(rutas["d8"]) as src:
+            punteros = src.read(1, masked=True).filled(0).astype(np.uint8)
+        with rasterio.open(rutas["acumulacion"]) as src:
+            acumulado = src.read(1, masked=True).filled(-1).astype(np.float32)
+    return relleno, punteros, acumulado
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CONSULTA POR DISTRITO
+# ════════════════════════════════════════════════════════════════════════
+def listar_regiones():
+    """Metadatos de las regiones publicadas (con 'carpeta')"""
+    if not os.path.isdir(RUTA_HIDROLOGIA_REGIONAL):
+        return []
+    # Las carpetas con '.' son temporales o apartadas durante una publicación
+    regiones = (_cargar_region(os.path.join(RUTA_HIDROLOGIA_REGIONAL, n))
+                for n in sorted(os.listdir(RUTA_HIDROLOGIA_REGIONAL)) if "." not in n)
+    return [r for r in regiones if r is not None]
+
+
+def regiones_de_dem(ruta_dem):
+    """Regiones calculadas a partir de este DEM (misma huella)"""
+    if not os.path.isdir(RUTA_HIDROLOGIA_REGIONAL) or not os.path.exists(ruta_dem):
+        return []
+    huella = huella_dem(ruta_dem)
+    return [r for r in listar_regiones() if r.get('huella_dem') == huella]
+
+
+def buscar_region(ruta_dem, gdf_distrito, margen_m=0):
+    """
+    Región precalculada del mismo DEM que contiene al distrito (más el margen), o None.
+    """
+    from shapely.geometry import shape
+
+    for region in regiones_de_dem(ruta_dem):
+        try:
+            with open(os.path.join(region['carpeta'], NOMBRE_LIMITE), encoding="utf-8") as f:
+                limite = shape(json.load(f))
+            geom = gdf_distrito.to_crs(region['crs']).geometry.union_all()
+            if margen_m:
+                geom = geom.buffer(margen_m)
+            if limite.contains(geom):
+                return region
+        except Exception as e:
+            print(f"   ⚠️ Región {region.get('nombre')} no se pudo consultar: {e}")
+    return None
+
+
+def _cargar_region(carpeta):
+    """Metadatos de una carpeta publicada por preparar_region (con 'carpeta'), o None"""
+    ruta_meta = os.path.join(carpeta, NOMBRE_META)
+    if not os.path.exists(ruta_meta):
+        return None
+    try:
+        with open(ruta_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+    meta['carpeta'] = carpeta
+    return meta
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ACUMULACIÓN POR DISTRITO (UNA VEZ, TODAS LAS INTENSIDADES)
+# ════════════════════════════════════════════════════════════════════════
+def carpeta_acumulacion_distrito(ruta_dem, gdf_distrito, motor=None):
+    """Carpeta en caché de la acumulación del distrito (cambia con el DEM, el motor o la geometría)"""
+    entrada = {
+        'dem': huella_dem(ruta_dem),
+        'motor': motor or MOTOR_HIDROLOGIA,
+        'margen_m': MARGEN_DISTRITO_M,
+        'crs': str(gdf_distrito.crs),
+        'geometria': hashlib.sha1(gdf_distrito.geometry.union_all().wkb).hexdigest(),
+    }
+    clave = hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(RUTA_ACUMULACION_DISTRITOS, clave)
+
+
+def buscar_acumulacion(ruta_dem, gdf_distrito, margen_m=0):
+    """
+    Región precalculada o acumulación en caché del distrito que sirve para 'margen_m', o None.
+    No calcula nada (útil para estimar el costo).
+    """
+    region = buscar_region(ruta_dem, gdf_distrito, margen_m=margen_m)
+    if region is not None or margen_m > MARGEN_DISTRITO_M or not os.path.exists(ruta_dem):
+        return region
+    return _cargar_region(carpeta_acumulacion_distrito(ruta_dem, gdf_distrito))
+
+
+def acumulacion_distrito(ruta_dem, gdf_distrito, margen_m=0, nombre_usuario=None):
+    """
+    Región con la acumulación de flujo que cubre el distrito: la precalculada si existe, si no
+    la del distrito en caché, y si tampoco existe se calcula ahora (una sola vez).
+    Con ella red_rios_regional da la red de cualquier umbral en segundos.
+
+    Retorna:
+    - metadatos de la región (como listar_regiones) o None si falla
+    """
+    region = buscar_acumulacion(ruta_dem, gdf_distrito, margen_m=margen_m)
+    if region is not None:
+        print(f"   ⚡ Acumulación de flujo disponible: {region['nombre']}")
+        return region
+    if margen_m > MARGEN_DISTRITO_M or not os.path.exists(ruta_dem):
+        return None
+
+    carpeta = carpeta_acumulacion_distrito(ruta_dem, gdf_distrito)
+    print(f"   🆕 Sin acumulación de flujo en caché: se calcula una vez ({os.path.basename(carpeta)})")
+    try:
+        if not preparar_region(ruta_dem, gdf_distrito, f"DISTRITO_{os.path.basename(carpeta)}",
+                               margen_m=MARGEN_DISTRITO_M, carpeta=carpeta, nombre_usuario=nombre_usuario):
+            return None
+    except Exception as e:
+        print(f"   ⚠️ No se pudo calcular la acumulación del distrito: {e}")
+        return None
+    return _cargar_region(carpeta)
+
+
+def leer_ventana(region, producto, bounds):
+    """
+    Lee la ventana de un producto regional que cubre 'bounds' (en el CRS de la región).
+
+    Retorna:
+    - (array enmascarado, transform de la ventana)
+    """
+    import rasterio
+    from rasterio.windows import Window, from_bounds
+
+    with rasterio.open(os.path.join(region['carpeta'], PRODUCTOS[producto])) as src:
+        v = from_bounds(*bounds, transform=src.transform)
+        col0, fila0 = max(0, math.floor(v.col_off)), max(0, math.floor(v.row_off))
+        col1 = min(src.width, math.ceil(v.col_off + v.width))
+        fila1 = min(src.height, math.ceil(v.row_off + v.height))
+        ventana = Window(col0, fila0, col1 - col0, fila1 - fila0)
+        return src.read(1, window=ventana, masked=True), src.window_transform(ventana)
+
+
+def red_rios_regional(region, gdf_distrito, umbral, margen_m=0):
+    """
+    Red de ríos del distrito a partir de la acumulación regional: ventana + umbral + vectorización.
+
+    Retorna:
+    - GeoDataFrame de ríos en el CRS de la región
+    """
+    geom = gdf_distrito.to_crs(region['crs']).geometry.union_all()
+    if margen_m:
+        geom = geom.buffer(margen_m)
+    acumulado, transform = leer_ventana(region, 'acumulacion', geom.bounds)
+    punteros, _ = leer_ventana(region, 'direcciones', geom.bounds)
+    print(f"   📥 Ventana regional '{region['nombre']}': {acumulado.shape[1]} x {acumulado.shape[0]} píxeles")
+    rios = extraer_rios(acumulado.filled(0), umbral)
+    return vectorizar_rios(rios, punteros.filled(0), transform, region['crs'])
+
+
+# ════════════════════════════════════════════════════════════════════════
+# LÍNEA DE COMANDOS
+# ════════════════════════════════════════════════════════════════════════
+def _limite_departamento(departamento):
+    from capas_cache import cargar_shapefile_cacheado
+
+    gdf = cargar_shapefile_cacheado("departamento", "Departamentos")
+    if gdf is None:
+        return None
+    col = next((c for c in ['NOMBDEP', 'DEPARTAMEN'] if c in gdf.columns), None)
+    if col is None:
+        return None
+    sel = gdf[gdf[col].str.upper() == departamento.upper()]
+    return None if sel.empty else sel
+
+
+def main(argv=None):
+    import geopandas as gpd
+
+    parser = argparse.ArgumentParser(description="Hidrología regional precalculada (COG)")
+    parser.add_argument("--dem", default=f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO/DEM.tif")
+    parser.add_argument("--departamento", help="Departamento a preparar")
+    parser.add_argument("--limite", help="Shapefile/GeoPackage del límite (cuenca) a preparar")
+    parser.add_argument("--nombre", help="Nombre de la región (por defecto el departamento)")
+    parser.add_argument("--motor", choices=["whitebox", "numpy"])
+    parser.add_argument("--margen", type=float, default=MARGEN_REGION_M, help="Margen en metros")
+    parser.add_argument("--listar", action="store_true", help="Listar regiones publicadas")
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        for r in listar_regiones():
+            print(f"   🗺️ {r['nombre']:<20} {r['motor']:<9} {r['forma'][1]}x{r['forma'][0]}  {r['creado']}  {r['dem']}")
+        return 0
+
+    if args.limite:
+        limite = gpd.read_file(args.limite)
+        nombre = args.nombre or os.path.splitext(os.path.basename(args.limite))[0]
+    elif args.departamento:
+        limite = _limite_departamento(args.departamento)
+        nombre = args.nombre or args.departamento
+        if limite is None:
+            print(f"❌ No se encontró el departamento '{args.departamento}'")
+            return 1
+    else:
+        parser.error("Indique --departamento o --limite")
+
+    if not os.path.exists(args.dem):
+        print(f"❌ No se encontró el DEM: {args.dem}")
+        return 1
+    return 0 if preparar_region(args.dem, limite, nombre, motor=args.motor, margen_m=args.margen) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+🗺️ lote_mapas.py - GENERACIÓN MASIVA (ATLAS) DE MAPAS POR DISTRITO DESDE LA LÍNEA DE COMANDOS
+- Selecciona distritos por departamento, provincia o lista de ubigeos
+- Reparte los distritos entre un pool de procesos (cada proceso genera todos los tipos de un distrito
+  con paquete_distrito, que comparte recortes, imagen satelital y lienzo entre los mapas)
+- Las capas base se precargan en el proceso principal y se heredan en los procesos hijos
+- Guarda un archivo de control (checkpoint) para reanudar una corrida interrumpida
+- Reporta el rendimiento en mapas por minuto
+
+Ejemplos:
+    python lote_mapas.py --provincia ANTA --tipos geografico,vias --procesos 4
+    python lote_mapas.py --departamento CUSCO
+    python lote_mapas.py --ubigeos 080301,080302 --usuario ATLAS
+    python lote_mapas.py --ubigeos-archivo ubigeos.txt --checkpoint /tmp/atlas.jsonl
+    python lote_mapas.py --provincia ANTA --simular
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from capas_cache import cargar_shapefile_cacheado, precargar_capas_base, COLUMNAS_UBIGEO
+from almacenamiento import existe
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+# TIPOS DE MAPA DISPONIBLES: clave -> (módulo, función generadora)
+# (mismas claves que el dropdown 'map-type' de app.py)
+GENERADORES = {
+    'geografico': ('geografica_final', 'generar_mapa_final'),
+    'geomorfologia': ('geomorfologia_final', 'generar_mapa_geomorfologia'),
+    'climatica': ('climatica_final', 'generar_mapa_climatica'),
+    'pendientes': ('pendientes_final', 'generar_mapa_pendientes'),
+    'vias': ('vias_final', 'generar_mapa_vias'),
+    'centros': ('poblacion_final', 'generar_mapa_poblacion'),
+    'geologia': ('geologia_final', 'generar_mapa_geologia'),
+}
+
+
+# ════════════════════════════════════════════════════════════════════════
+# SELECCIÓN DE DISTRITOS
+# ════════════════════════════════════════════════════════════════════════
+def resolver_distritos(departamento=None, provincia=None, ubigeos=None):
+    """
+    Devuelve la lista de distritos a procesar como diccionarios
+    {ubigeo, departamento, provincia, distrito}, usando la capa de distritos como índice.
+    """
+    gdf_distritos = cargar_shapefile_cacheado("distrito", "Distritos del Perú")
+    if gdf_distritos is None:
+        print("❌ No se pudo cargar la capa de distritos")
+        return []
+
+    col_dpto = next((c for c in ['NOMBDEP', 'DEPARTAMEN'] if c in gdf_distritos.columns), None)
+    col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf_distritos.columns), None)
+    col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
+    col_ubigeo = next((c for c in COLUMNAS_UBIGEO if c in gdf_distritos.columns), None)
+
+    if not all([col_dpto, col_prov, col_distr]):
+        print("❌ No se pudieron identificar las columnas de nombres en la capa de distritos")
+        return []
+
+    seleccion = gdf_distritos
+    if ubigeos:
+        if col_ubigeo is None:
+            print("❌ La capa de distritos no tiene columna de ubigeo")
+            return []
+        seleccion = seleccion[seleccion[col_ubigeo].astype(str).str.zfill(6).isin([u.zfill(6) for u in ubigeos])]
+    if departamento:
+        seleccion = seleccion[seleccion[col_dpto].str.upper() == departamento.upper()]
+    if provincia:
+        seleccion = seleccion[seleccion[col_prov].str.upper() == provincia.upper()]
+
+    distritos = []
+    for _, fila in seleccion.iterrows():
+        ubigeo = str(fila[col_ubigeo]).zfill(6) if col_ubigeo else f"{fila[col_dpto]}|{fila[col_prov]}|{fila[col_distr]}"
+        distritos.append({
+            'ubigeo': ubigeo,
+            'departamento': fila[col_dpto],
+            'provincia': fila[col_prov],
+            'distrito': fila[col_distr],
+        })
+
+    distritos.sort(key=lambda d: d['ubigeo'])
+    return distritos
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CHECKPOINT (JSON LINES, SOLO LO ESCRIBE EL PROCESO PRINCIPAL)
+# ════════════════════════════════════════════════════════════════════════
+def clave_tarea(ubigeo, tipo):
+    return f"{ubigeo}:{tipo}"
+
+
+def leer_checkpoint(ruta_checkpoint):
+    """Retorna el conjunto de claves 'ubigeo:tipo' ya generadas con éxito"""
+    completadas = set()
+    if not os.path.exists(ruta_checkpoint):
+        return completadas
+    with open(ruta_checkpoint, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                # Última línea truncada por una interrupción: se ignora
+                continue
+            if registro.get('estado') == 'ok':
+                completadas.add(registro['clave'])
+    return completadas
+
+
+def cerrar_linea_truncada(ruta_checkpoint):
+    """Si la corrida anterior se cortó a mitad de una línea, los registros nuevos empiezan en otra"""
+    if not os.path.exists(ruta_checkpoint) or os.path.getsize(ruta_checkpoint) == 0:
+        return
+    with open(ruta_checkpoint, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def registrar_checkpoint(archivo, resultado):
+    archivo.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    archivo.flush()
+    os.fsync(archivo.fileno())
+
+
+# ════════════════════════════════════════════════════════════════════════
+# TRABAJO DE CADA PROCESO
+# ════════════════════════════════════════════════════════════════════════
+def _inicializar_trabajador():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _renderizar_paquete(nombre_usuario, info_distrito, tipos):
+    """Genera los tipos pedidos con paquete_distrito (contexto y lienzo compartidos)"""
+    from paquete_distrito import generar_paquete_distrito
+
+    inicio = time.time()
+    error_paquete = None
+    try:
+        paquete = generar_paquete_distrito(nombre_usuario, info_distrito['departamento'],
+                                           info_distrito['provincia'], info_distrito['distrito'],
+                                           tipos=tipos, formatos=("png",))
+    except Exception as e:
+        paquete, error_paquete = None, str(e)
+    paginas = paquete['paginas'] if paquete else {}
+    segundos = round((time.time() - inicio) / max(len(tipos), 1), 2)
+
+    resultados = []
+    for tipo in tipos:
+        ruta = paginas.get(tipo)
+        estado = 'ok' if existe(ruta) else 'error'
+        resultados.append({
+            'clave': clave_tarea(info_distrito['ubigeo'], tipo),
+            'ubigeo': info_distrito['ubigeo'],
+            'distrito': info_distrito['distrito'],
+            'tipo': tipo,
+            'estado': estado,
+            'ruta': ruta,
+            'error': None if estado == 'ok' else (error_paquete or 'El paquete no generó esta página'),
+            'segundos': segundos,
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        })
+    return resultados
+
+
+def renderizar_distrito(nombre_usuario, info_distrito, tipos, usar_paquete=True):
+    """Genera todos los tipos de mapa pedidos para un distrito (se ejecuta dentro del pool)"""
+    import importlib
+
+    if usar_paquete:
+        return _renderizar_paquete(nombre_usuario, info_distrito, tipos)
+
+    resultados = []
+    for tipo in tipos:
+        modulo, funcion = GENERADORES[tipo]
+        inicio = time.time()
+        try:
+            generador = getattr(importlib.import_module(modulo), funcion)
+            ruta = generador(nombre_usuario, info_distrito['departamento'],
+                             info_distrito['provincia'], info_distrito['distrito'])
+            estado = 'ok' if existe(ruta) else 'error'
+            error = None if estado == 'ok' else 'El generador no devolvió un archivo'
+        except Exception as e:
+            ruta, estado, error = None, 'error', str(e)
+        resultados.append({
+            'clave': clave_tarea(info_distrito['ubigeo'], tipo),
+            'ubigeo': info_distrito['ubigeo'],
+            'distrito': info_distrito['distrito'],
+            'tipo': tipo,
+            'estado': estado,
+            'ruta': ruta,
+            'error': error,
+            'segundos': round(time.time() - inicio, 2),
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        })
+    return resultados
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ORQUESTACIÓN
+# ════════════════════════════════════════════════════════════════════════
+def ejecutar_lote(distritos, tipos, nombre_usuario="LOTE", procesos=None, ruta_checkpoint=None, reiniciar=False,
+                 usar_paquete=True):
+    if ruta_checkpoint is None:
+        ruta_checkpoint = os.path.join(ruta_base, "USUARIOS", nombre_usuario, "lote_checkpoint.jsonl")
+    os.makedirs(os.path.dirname(ruta_checkpoint), exist_ok=True)
+
+    if reiniciar and os.path.exists(ruta_checkpoint):
+        os.remove(ruta_checkpoint)
+
+    completadas = leer_checkpoint(ruta_checkpoint)
+
+    # Solo se envían los tipos que faltan de cada distrito
+    pendientes = []
+    for info in distritos:
+        faltan = [t for t in tipos if clave_tarea(info['ubigeo'], t) not in completadas]
+        if faltan:
+            pendientes.append((info, faltan))
+
+    total_mapas = sum(len(faltan) for _, faltan in pendientes)
+    procesos = procesos or max(1, (os.cpu_count() or 2) - 1)
+
+    print("\n" + "="*80)
+    print("🗺️ GENERACIÓN POR LOTE")
+    print("="*80)
+    print(f"   - Distritos seleccionados: {len(distritos)}")
+    print(f"   - Tipos de mapa: {', '.join(tipos)}")
+    print(f"   - Mapas ya completados (checkpoint): {len(completadas)}")
+    print(f"   - Mapas pendientes: {total_mapas}")
+    print(f"   - Procesos: {procesos}")
+    print(f"   - Modo: {'paquete por distrito' if usar_paquete else 'generadores separados'}")
+    print(f"   - Checkpoint: {ruta_checkpoint}")
+
+    if not pendientes:
+        print("✅ No hay trabajo pendiente")
+        return {'ok': 0, 'error': 0, 'mapas_por_minuto': 0.0}
+
+    # Las capas base quedan en memoria del proceso principal y se heredan con fork
+    print("\n📦 Precargando capas base...")
+    precargar_capas_base()
+
+    if sys.platform.startswith("linux"):
+        contexto = multiprocessing.get_context("fork")
+    else:
+        contexto = multiprocessing.get_context()
+
+    inicio = time.time()
+    ok = errores = 0
+
+    cerrar_linea_truncada(ruta_checkpoint)
+    with open(ruta_checkpoint, 'a', encoding='utf-8') as archivo_checkpoint, \
+            ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                                initializer=_inicializar_trabajador) as pool:
+        futuros = {pool.submit(renderizar_distrito, nombre_usuario, info, faltan, usar_paquete): (info, faltan)
+                   for info, faltan in pendientes}
+
+        for futuro in as_completed(futuros):
+            info, faltan = futuros[futuro]
+            try:
+                resultados = futuro.result()
+            except Exception as e:
+                # El proceso murió (p. ej. memoria): se registra como error y se sigue
+                resultados = [{'clave': clave_tarea(info['ubigeo'], t), 'ubigeo': info['ubigeo'],
+                               'distrito': info['distrito'], 'tipo': t, 'estado': 'error',
+                               'ruta': None, 'error': str(e), 'segundos': None,
+                               'fecha': datetime.datetime.now().isoformat(timespec='seconds')}
+                              for t in faltan]
+
+            for resultado in resultados:
+                registrar_checkpoint(archivo_checkpoint, resultado)
+                if resultado['estado'] == 'ok':
+                    ok += 1
+                else:
+                    errores += 1
+                    print(f"   ❌ {resultado['distrito']} [{resultado['tipo']}]: {resultado['error']}")
+
+            minutos = (time.time() - inicio) / 60
+            ritmo = ok / minutos if minutos > 0 else 0.0
+            print(f"   ✅ {info['distrito']} ({info['ubigeo']}) | {ok + errores}/{total_mapas} mapas "
+                  f"| {ritmo:.1f} mapas/min")
+
+    minutos = (time.time() - inicio) / 60
+    ritmo = ok / minutos if minutos > 0 else 0.0
+
+    print("\n" + "="*80)
+    print("📊 RESUMEN DEL LOTE")
+    print("="*80)
+    print(f"   - Mapas generados: {ok}")
+    print(f"   - Mapas con error: {errores}")
+    print(f"   - Tiempo total: {minutos:.1f} min")
+    print(f"   - Rendimiento: {ritmo:.2f} mapas/min")
+    print("="*80 + "\n")
+
+    return {'ok': ok, 'error': errores, 'mapas_por_minuto': ritmo}
+
+
+def simular_lote(distritos, tipos):
+    """Dry-run: estima duración y memoria de cada mapa del lote sin generar nada"""
+    from estimador import estimar_trabajo, resumen_estimacion
+
+    total_segundos = 0.0
+    memoria_maxima = 0
+    for info in distritos:
+        for tipo in tipos:
+            est = estimar_trabajo(tipo, info['departamento'], info['provincia'], info['distrito'])
+            if est is None:
+                continue
+            total_segundos += est['segundos']
+            memoria_maxima = max(memoria_maxima, est['memoria_mb'])
+            print(f"   {info['ubigeo']} {info['distrito']:<25} {tipo:<14} {resumen_estimacion(est)}")
+            for advertencia in est['advertencias']:
+                print(f"      ⚠️ {advertencia}")
+
+    print(f"\n🧮 Total estimado (un proceso): {total_segundos / 60:.1f} min, pico de memoria ~{memoria_maxima:,} MB")
+    return {'segundos': round(total_segundos, 1), 'memoria_mb': memoria_maxima}
+
+
+def _leer_lista(valor):
+    return [v.strip() for v in valor.split(',') if v.strip()] if valor else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera mapas temáticos para muchos distritos en paralelo")
+    parser.add_argument("--departamento", help="Nombre del departamento (p. ej. CUSCO)")
+    parser.add_argument("--provincia", help="Nombre de la provincia (p. ej. ANTA)")
+    parser.add_argument("--ubigeos", help="Lista de ubigeos separados por coma")
+    parser.add_argument("--ubigeos-archivo", help="Archivo de texto con un ubigeo por línea")
+    parser.add_argument("--tipos", default=",".join(GENERADORES),
+                        help=f"Tipos de mapa separados por coma ({', '.join(GENERADORES)})")
+    parser.add_argument("--usuario", default="LOTE", help="Carpeta de usuario donde se guardan los mapas")
+    parser.add_argument("--procesos", type=int, default=None, help="Número de procesos (por defecto: núcleos - 1)")
+    parser.add_argument("--checkpoint", default=None, help="Ruta del archivo de control para reanudar")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora el checkpoint existente y empieza de cero")
+    parser.add_argument("--sin-paquete", action="store_true",
+                        help="Llama a cada generador por separado en lugar de usar paquete_distrito")
+    parser.add_argument("--simular", action="store_true",
+                        help="No genera mapas: muestra la estimación de tiempo y memoria de cada uno")
+    args = parser.parse_args(argv)
+
+    tipos = _leer_lista(args.tipos)
+    desconocidos = [t for t in tipos if t not in GENERADORES]
+    if desconocidos:
+        parser.error(f"Tipos de mapa desconocidos: {', '.join(desconocidos)}")
+
+    ubigeos = _leer_lista(args.ubigeos)
+    if args.ubigeos_archivo:
+        with open(args.ubigeos_archivo, 'r', encoding='utf-8') as f:
+            ubigeos.extend(linea.strip() for linea in f if linea.strip())
+
+    if not (args.departamento or args.provincia or ubigeos):
+        parser.error("Indique --departamento, --provincia o --ubigeos")
+
+    distritos = resolver_distritos(args.departamento, args.provincia, ubigeos)
+    if not distritos:
+        print("❌ Ningún distrito coincide con la selección")
+        return 1
+
+    if args.simular:
+        simular_lote(distritos, tipos)
+        return 0
+
+    resumen = ejecutar_lote(distritos, tipos, nombre_usuario=args.usuario, procesos=args.procesos,
+                            ruta_checkpoint=args.checkpoint, reiniciar=args.reiniciar,
+                            usar_paquete=not args.sin_paquete)
+    return 0 if resumen['error'] == 0 else 2
+
+
+if __name__ == '__main__':
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.exit(main())
@@ -1,9 +1,31 @@
 # -*- coding: utf-8 -*-
 """
-🎯 SCRIPT INTEGRADO: MAPA DE PELIGRO CON 5 PARÁMETROS + CENTROS POBLADOS
+🎯 SCRIPT INTEGRADO: MAPA DE PELIGRO MULTICRITERIO + CENTROS POBLADOS
 - Genera automáticamente el shapefile de distancia a ríos desde el DEM
-- Calcula el mapa de peligro combinando: Pendiente + Geomorfología + PP Máxima + Distancia a Ríos + Geología
+- Tipo de peligro por ejecución (argumento 'modelo', ver modelos_peligro.py): inundación combina
+  Pendiente + Geomorfología + PP Máxima + Distancia a Ríos + Geología; deslizamiento y heladas
+  declaran sus propios factores
+- Las fuentes (pendiente, ríos, geología, ...) se cargan y recortan una vez por distrito y las
+  reutilizan todos los modelos (capa_fuente)
+- Geología y geomorfología: capa base del departamento + tabla código -> peso (tablas_pesos.py);
+  sin tabla se usa la capa con pesos de DATA/PELIGRO/GEOLOGIA|GEOMORFOLOGIA
 - Muestra centros poblados como referencia
+- Motor de combinación por ejecución (argumento 'motor' o DASH_MOTOR_PELIGRO): 'overlay' intersecta
+  los polígonos, 'raster' superpone los pesos en una grilla común y poligoniza solo los niveles
+- Ponderación de los factores por ejecución (argumento 'pesos': un esquema del modelo o un valor por
+  factor); con el motor ráster el cubo de pesos queda en caché y cambiar la ponderación no vuelve a
+  leer las capas
+- El resultado se disuelve por nivel (DASH_DISOLVER_PELIGRO=condicion: por combinación de pesos) y se
+  guarda en GeoPackage/FlatGeobuf/GeoParquet (DASH_FORMATO_PELIGRO); el volcado sin disolver es opcional
+  (argumento 'depurar' o DASH_DEPURAR_PELIGRO=1)
+- Estadísticas por nivel (km² en ESRI:102033, % del distrito, centros poblados) en JSON/CSV junto al mapa
+- Escenario de PP máxima por periodo de retorno (argumento 'escenario': TR 2..500 años, capas
+  ..._TR_<años>_..._PPMAX.shp); cada escenario tiene su caché de capa, etapas y cubo de pesos, y
+  generar_serie_escenarios produce la serie completa de un distrito
+- Carga, recorte y combinación de las capas como etapas en caché en disco (dag_cache.py): un cambio
+  en una capa solo rehace las etapas que dependen de ella
+- Con una superficie regional del mismo modelo y ponderación (peligro_regional.py) el distrito solo
+  lee su ventana del COG de la provincia o el departamento
 """
 
 import geopandas as gpd
@@ -11,22 +33,46 @@ import matplotlib.pyplot as plt
 import contextily as ctx
 from matplotlib_scalebar.scalebar import ScaleBar
 import os
+import re
 import numpy as np
 import matplotlib.patheffects as path_effects
-from shapely.geometry import box, mapping
-from shapely.ops import unary_union
+from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
 from matplotlib.patches import Polygon, Rectangle, Patch
 from matplotlib.lines import Line2D
 import datetime
+import hashlib
+import threading
+from collections import OrderedDict
 import pandas as pd
+from capas_cache import buscar_shapefile_cacheado, leer_capa, ubigeo_de_distrito
+from progreso import etapa, verificar_cancelacion
+from almacenamiento import guardar_figura, guardar_archivo, asociado, existe, tamano
+from planificador import configurar_wbt
+from cache_hidrologia import obtener_buffers_rios, clave_hidrologia
+from hidrologia_numpy import MOTOR_HIDROLOGIA, red_rios_numpy
+from distancia_rios import anillos_distancia
+from hidrologia_regional import acumulacion_distrito, red_rios_regional
+from pendientes_dem import capa_peso_pendiente, capa_clases_altitud, PESOS_PENDIENTE
+from procesamiento_bloques import MEMORIA_BLOQUES_MB
+from dag_cache import Etapa, ejecutar_dag, podar_cache_dag
+from tablas_pesos import capa_con_pesos, entradas_tabla
+from peligro_raster import (MOTOR_PELIGRO, RESOLUCION_PELIGRO_M, TAMIZ_PELIGRO, combinar_capas, normalizar_pesos, firma_fuentes,
+                            ruta_cubo_peligro, peligro_en_cache, disolver_peligro, exportar_peligro,
+                            DEPURAR_PELIGRO, DISOLVER_PELIGRO, niveles_peligro, estadisticas_peligro,
+                            guardar_estadisticas)
+from peligro_regional import buscar_peligro_regional, peligro_distrito_regional
+from modelos_peligro import (obtener_modelo, columnas_modelo, pesos_modelo, firma_modelo,
+                             CORTES_ALTITUD, COLORES_NIVELES, ETIQUETAS_NIVELES, RANGOS_1_5)
+from espacio_trabajo import espacio_trabajo, verificar_cuota
 
 # Importaciones para procesamiento hidrológico
 try:
     import rasterio
-    from rasterio.mask import mask as rasterio_mask
-    from whitebox import WhiteboxTools
+    from procesamiento_bloques import recortar_a_archivo, leer_recorte, ventana_de_geometria
+    if MOTOR_HIDROLOGIA == "whitebox":
+        from whitebox import WhiteboxTools
     HYDRO_AVAILABLE = True
 except ImportError:
     HYDRO_AVAILABLE = False
@@ -43,6 +89,12 @@ RUTA_BASE_PPMAX = f"{ruta_base}/DATA/PELIGRO/PP_MAX"
 RUTA_BASE_RIOS = f"{ruta_base}/DATA/PELIGRO/DISTANCIA_RIO"
 RUTA_BASE_GEOLOGIA = f"{ruta_base}/DATA/PELIGRO/GEOLOGIA"
 RUTA_DEM = f"{RUTA_BASE_RIOS}/DEM.tif"
+
+# ESCENARIOS DE PRECIPITACIÓN MÁXIMA: PERIODO DE RETORNO EN AÑOS (capas ..._TR_<años>_..._PPMAX.shp)
+ESCENARIOS_PPMAX = [2, 5, 10, 25, 50, 100, 500]
+ESCENARIO_PPMAX = int(os.environ.get("DASH_ESCENARIO_PPMAX", "50"))
+
+RUTA_ETAPAS_PELIGRO = f"{ruta_base}/DATA/PELIGRO/ETAPAS"
 RUTA_CENTROS_POBLADOS = f"{ruta_base}/DATA/CENTROS POBLADOS /Centros_Poblados_INEI_geogpsperu_SuyoPomalia.shp"
 
 # CONFIGURACIÓN DE GENERACIÓN DE RÍOS
@@ -59,187 +111,220 @@ BUFFERS_CONFIG = [
 ]
 
 # PALETA DE COLORES PARA NIVELES DE PELIGRO
-COLORES_PELIGRO = ['#00FF00', '#FFFF00', '#FFA500', '#FF0000']
-ETIQUETAS_PELIGRO = ['Baja', 'Media', 'Alta', 'Muy Alta']
-RANGOS_PELIGRO = [1.00, 2.00, 3.00, 4.00, 5.00]
+# (los de cada tipo de peligro los declara su modelo en modelos_peligro.py)
+COLORES_PELIGRO = COLORES_NIVELES
+ETIQUETAS_PELIGRO = ETIQUETAS_NIVELES
+RANGOS_PELIGRO = RANGOS_1_5
 
 # ═══════════════════════════════════════════════════════════════════════════
 # 🌊 FUNCIONES PARA GENERAR RED DE RÍOS Y BUFFERS
 # ═══════════════════════════════════════════════════════════════════════════
 
-def generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_folder="/tmp/hydro_temp"):
+def generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_folder=None):
     """
     Genera el shapefile de buffers de distancia a ríos con pesos a partir del DEM.
     
     Parámetros:
     - distrito_shapefile: GeoDataFrame del distrito para recortar
     - output_folder: Carpeta donde se guardará el shapefile final
-    - temp_folder: Carpeta temporal para archivos intermedios
+    - temp_folder: Carpeta temporal exclusiva del trabajo (ver espacio_trabajo.py).
+      Si es None se crea una y se borra al terminar.
     
     Retorna:
     - ruta del shapefile generado o None si falla
     """
     
     if not HYDRO_AVAILABLE:
-        print("❌ WhiteboxTools no está disponible. No se puede generar el shapefile de ríos.")
+        print(f"❌ Faltan librerías para el motor hidrológico '{MOTOR_HIDROLOGIA}'. No se puede generar el shapefile de ríos.")
         return None
     
     print("\n" + "="*80)
     print("🌊 GENERANDO SHAPEFILE DE DISTANCIA A RÍOS CON PESOS")
     print("="*80)
     
+    if temp_folder is None:
+        with espacio_trabajo(None, "hidro_peligro") as carpeta_trabajo:
+            return generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_folder=carpeta_trabajo)
+
     # Crear carpetas
     os.makedirs(output_folder, exist_ok=True)
     os.makedirs(temp_folder, exist_ok=True)
     
-    # Inicializar WhiteboxTools
-    wbt = WhiteboxTools()
-    wbt.set_working_dir(temp_folder)
-    wbt.set_verbose_mode(True)
-    wbt.set_max_procs(4)
+    # Acumulación de flujo de una región precalculada o del distrito en caché (se calcula una vez);
+    # el umbral de INTENSIDAD_RIOS se aplica sobre ella. Si no se pudo obtener, cadena completa.
+    region = acumulacion_distrito(RUTA_DEM, distrito_shapefile)
+    
+    # Inicializar WhiteboxTools (ni el motor numpy ni la región precalculada lo necesitan)
+    if MOTOR_HIDROLOGIA == "whitebox" and region is None:
+        wbt = WhiteboxTools()
+        wbt.set_working_dir(temp_folder)
+        wbt.set_verbose_mode(True)
+        # Núcleos según el planificador y callback que corta la herramienta si se cancela el trabajo
+        configurar_wbt(wbt)
     
     # Verificar que existe el DEM
     if not os.path.exists(RUTA_DEM):
         print(f"❌ No se encontró el DEM en: {RUTA_DEM}")
         return None
     
-    print(f"[1/6] ✂️ Recortando DEM al distrito...")
-    
-    try:
-        # Cargar límite del distrito
+    threshold = UMBRALES_RIOS[INTENSIDAD_RIOS]
+    if region is not None:
+        # Pasos 1 y 2 resueltos de antemano: ventana de la acumulación en caché + umbral
+        etapa("Extrayendo ríos de la acumulación en caché...", 12)
+        print(f"[1-2/6] 🗺️ Acumulación de flujo en caché: {region['nombre']}")
         limit = distrito_shapefile.copy()
+        try:
+            rivers_regional = red_rios_regional(region, limit, threshold)
+        except Exception as e:
+            print(f"❌ Error leyendo la hidrología regional: {e}")
+            return None
+    else:
+        etapa("Recortando DEM al distrito...", 12)
+        print(f"[1/6] ✂️ Recortando DEM al distrito...")
+    
+        try:
+            # Cargar límite del distrito
+            limit = distrito_shapefile.copy()
         
-        with rasterio.open(RUTA_DEM) as dem:
-            if limit.crs != dem.crs:
-                limit_proj = limit.to_crs(dem.crs)
-            else:
-                limit_proj = limit.copy()
+            with rasterio.open(RUTA_DEM) as dem:
+                if limit.crs != dem.crs:
+                    limit_proj = limit.to_crs(dem.crs)
+                else:
+                    limit_proj = limit.copy()
             
-            # Mostrar información del DEM original
-            print(f"      📊 Info DEM original:")
-            print(f"         - Dimensiones: {dem.width} x {dem.height} píxeles")
-            print(f"         - Resolución: {dem.res[0]:.2f} x {dem.res[1]:.2f} metros")
-            total_pixels = dem.width * dem.height
-            print(f"         - Total píxeles: {total_pixels:,}")
+                # Mostrar información del DEM original
+                print(f"      📊 Info DEM original:")
+                print(f"         - Dimensiones: {dem.width} x {dem.height} píxeles")
+                print(f"         - Resolución: {dem.res[0]:.2f} x {dem.res[1]:.2f} metros")
+                total_pixels = dem.width * dem.height
+                print(f"         - Total píxeles: {total_pixels:,}")
         
-        # Recortar DEM
-        with rasterio.open(RUTA_DEM) as src:
-            geom = [mapping(limit_proj.geometry.unary_union)]
-            out_image, out_transform = rasterio_mask(src, geom, crop=True)
-            out_meta = src.meta.copy()
-            out_meta.update({
-                "driver": "GTiff",
-                "height": out_image.shape[1],
-                "width": out_image.shape[2],
-                "transform": out_transform
-            })
+            # Recortar DEM (ventana del distrito; el recorte se escribe/lee bloque a bloque)
+            with rasterio.open(RUTA_DEM) as src:
+                geom = limit_proj.geometry.unary_union
+                ventana = ventana_de_geometria(src, geom)
+                out_transform = src.window_transform(ventana)
+                forma_recorte = (int(ventana.height), int(ventana.width))
+                out_meta = src.meta.copy()
+                out_meta.update({
+                    "driver": "GTiff",
+                    "height": forma_recorte[0],
+                    "width": forma_recorte[1],
+                    "transform": out_transform
+                })
+                bytes_px = np.dtype(src.dtypes[0]).itemsize
             
-            # Mostrar información del DEM recortado
-            recorte_pixels = out_image.shape[1] * out_image.shape[2]
-            print(f"      📊 Info DEM recortado:")
-            print(f"         - Dimensiones: {out_image.shape[2]} x {out_image.shape[1]} píxeles")
-            print(f"         - Total píxeles: {recorte_pixels:,}")
+                # Mostrar información del DEM recortado
+                recorte_pixels = forma_recorte[0] * forma_recorte[1]
+                print(f"      📊 Info DEM recortado:")
+                print(f"         - Dimensiones: {forma_recorte[1]} x {forma_recorte[0]} píxeles")
+                print(f"         - Total píxeles: {recorte_pixels:,}")
             
-            # Advertencia si el DEM es muy grande
-            if recorte_pixels > 10_000_000:
-                print(f"      ⚠️ ADVERTENCIA: DEM muy grande ({recorte_pixels:,} píxeles)")
-                print(f"         El procesamiento puede tardar más de 10 minutos")
-                print(f"         💡 Sugerencia: Considera usar un umbral más alto en INTENSIDAD_RIOS")
-            elif recorte_pixels > 5_000_000:
-                print(f"      ⏳ DEM mediano ({recorte_pixels:,} píxeles)")
-                print(f"         Tiempo estimado: 5-10 minutos")
-            else:
-                print(f"      ✅ DEM pequeño ({recorte_pixels:,} píxeles)")
-                print(f"         Tiempo estimado: 1-5 minutos")
+                # Advertencia si el DEM es muy grande
+                if recorte_pixels > 10_000_000:
+                    print(f"      ⚠️ ADVERTENCIA: DEM muy grande ({recorte_pixels:,} píxeles)")
+                    print(f"         El procesamiento puede tardar más de 10 minutos")
+                    print(f"         💡 Sugerencia: Considera usar un umbral más alto en INTENSIDAD_RIOS")
+                elif recorte_pixels > 5_000_000:
+                    print(f"      ⏳ DEM mediano ({recorte_pixels:,} píxeles)")
+                    print(f"         Tiempo estimado: 5-10 minutos")
+                else:
+                    print(f"      ✅ DEM pequeño ({recorte_pixels:,} píxeles)")
+                    print(f"         Tiempo estimado: 1-5 minutos")
+            
+            if MOTOR_HIDROLOGIA == "whitebox":
+                # Intermedios previstos: DEM recortado, rellenado, dirección, acumulación y ríos
+                verificar_cuota(temp_folder, bytes_adicionales=recorte_pixels * bytes_px * 6)
             
-            dem_clipped = os.path.join(temp_folder, "dem_distrito.tif")
-            with rasterio.open(dem_clipped, "w", **out_meta) as dest:
-                dest.write(out_image)
+                # Recorte enmascarado escrito por bloques: nunca se carga entero en memoria
+                dem_clipped = os.path.join(temp_folder, "dem_distrito.tif")
+                recortar_a_archivo(RUTA_DEM, geom, dem_clipped)
+            else:
+                # El relleno de depresiones necesita el recorte completo: se arma por bloques a resolución nativa
+                dem_recorte, _, _, _ = leer_recorte(RUTA_DEM, geom, reducir=False)
         
-        print("      ✅ DEM recortado exitosamente")
+            print("      ✅ DEM recortado exitosamente")
         
-    except Exception as e:
-        print(f"❌ Error recortando DEM: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        except Exception as e:
+            print(f"❌ Error recortando DEM: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
     
-    # [2/6] Procesar hidrología
-    print(f"[2/6] 🌊 Procesando hidrología (intensidad: {INTENSIDAD_RIOS})...")
-    print(f"      ⏳ Este proceso puede tardar varios minutos dependiendo del tamaño del DEM...")
+        # [2/6] Procesar hidrología
+        print(f"[2/6] 🌊 Procesando hidrología (intensidad: {INTENSIDAD_RIOS})...")
+        print(f"      ⏳ Este proceso puede tardar varios minutos dependiendo del tamaño del DEM...")
     
-    try:
-        filled_dem = os.path.join(temp_folder, "filled.tif")
-        flow_dir = os.path.join(temp_folder, "flow_dir.tif")
-        flow_acc = os.path.join(temp_folder, "flow_acc.tif")
-        streams_raster = os.path.join(temp_folder, "streams.tif")
-        streams_vector = os.path.join(temp_folder, "streams.shp")
+        try:
+            if MOTOR_HIDROLOGIA == "numpy":
+                # Toda la cadena en memoria, sin GeoTIFF intermedios
+                rivers_numpy = red_rios_numpy(dem_recorte, out_transform, out_meta['crs'], threshold,
+                                              progreso=(15, 42))
+            else:
+                filled_dem = os.path.join(temp_folder, "filled.tif")
+                flow_dir = os.path.join(temp_folder, "flow_dir.tif")
+                flow_acc = os.path.join(temp_folder, "flow_acc.tif")
+                streams_raster = os.path.join(temp_folder, "streams.tif")
+                streams_vector = os.path.join(temp_folder, "streams.shp")
         
-        # Verificar si ya existen archivos intermedios
-        if os.path.exists(streams_vector):
-            print(f"      ⚡ Archivos intermedios encontrados, saltando procesamiento hidrológico")
-        else:
-            print(f"      [2.1/4] Rellenando depresiones del DEM...")
-            if not os.path.exists(filled_dem):
+                # La carpeta es exclusiva del trabajo: siempre se calcula desde cero
+                # (antes se reutilizaban intermedios de otra ejecución si existía streams.shp)
+                etapa("Rellenando depresiones del DEM...", 15)
+                print(f"      [2.1/4] Rellenando depresiones del DEM...")
                 wbt.fill_depressions(dem_clipped, filled_dem)
+                verificar_cuota(temp_folder)
                 print(f"      ✅ Depresiones rellenadas")
-            else:
-                print(f"      ⚡ Usando filled_dem existente")
-            
-            print(f"      [2.2/4] Calculando dirección de flujo (D8)...")
-            if not os.path.exists(flow_dir):
+        
+                etapa("Calculando dirección de flujo...", 22)
+                print(f"      [2.2/4] Calculando dirección de flujo (D8)...")
                 wbt.d8_pointer(filled_dem, flow_dir)
+                verificar_cuota(temp_folder)
                 print(f"      ✅ Dirección de flujo calculada")
-            else:
-                print(f"      ⚡ Usando flow_dir existente")
-            
-            print(f"      [2.3/4] Calculando acumulación de flujo (PUEDE TARDAR)...")
-            if not os.path.exists(flow_acc):
+        
+                etapa("Calculando acumulación de flujo...", 28)
+                print(f"      [2.3/4] Calculando acumulación de flujo (PUEDE TARDAR)...")
                 import time
                 start_time = time.time()
                 wbt.d8_flow_accumulation(filled_dem, flow_acc, out_type="cells")
+                verificar_cuota(temp_folder)
                 elapsed = time.time() - start_time
                 print(f"      ✅ Acumulación de flujo calculada ({elapsed:.1f}s)")
-            else:
-                print(f"      ⚡ Usando flow_acc existente")
-            
-            threshold = UMBRALES_RIOS[INTENSIDAD_RIOS]
-            print(f"      [2.4/4] Extrayendo red de ríos (umbral: {threshold} celdas)...")
-            if not os.path.exists(streams_raster):
+        
+                etapa("Extrayendo red de ríos...", 38)
+                print(f"      [2.4/4] Extrayendo red de ríos (umbral: {threshold} celdas)...")
                 wbt.extract_streams(flow_acc, streams_raster, threshold)
                 print(f"      ✅ Red de ríos extraída")
-            else:
-                print(f"      ⚡ Usando streams_raster existente")
-            
-            print(f"      [2.5/4] Vectorizando red de ríos...")
-            if not os.path.exists(streams_vector):
+        
+                etapa("Vectorizando red de ríos...", 42)
+                print(f"      [2.5/4] Vectorizando red de ríos...")
                 wbt.raster_streams_to_vector(streams_raster, flow_dir, streams_vector)
+                verificar_cuota(temp_folder)
                 print(f"      ✅ Red de ríos vectorizada")
-            else:
-                print(f"      ⚡ Usando streams_vector existente")
         
-        print(f"      ✅ Procesamiento hidrológico completado")
+            verificar_cancelacion()
+            print(f"      ✅ Procesamiento hidrológico completado")
         
-    except Exception as e:
-        print(f"❌ Error en procesamiento hidrológico: {e}")
-        print(f"   💡 Sugerencias:")
-        print(f"      - Verifica que el DEM sea válido")
-        print(f"      - Prueba con INTENSIDAD_RIOS = 'baja' o 'muy_baja' (más rápido)")
-        print(f"      - Los archivos temporales se guardan en: {temp_folder}")
-        print(f"      - Puedes volver a ejecutar y continuará desde el último paso")
-        import traceback
-        traceback.print_exc()
-        return None
+        except Exception as e:
+            print(f"❌ Error en procesamiento hidrológico: {e}")
+            print(f"   💡 Sugerencias:")
+            print(f"      - Verifica que el DEM sea válido")
+            print(f"      - Prueba con INTENSIDAD_RIOS = 'baja' o 'muy_baja' (más rápido)")
+            print(f"      - Si se superó la cuota de disco, revise CUOTA_TRABAJO_MB en espacio_trabajo.py")
+            import traceback
+            traceback.print_exc()
+            return None
     
     # [3/6] Cargar y recortar ríos
     print(f"[3/6] 📍 Cargando red de ríos...")
     
     try:
-        rivers = gpd.read_file(streams_vector)
+        if region is not None:
+            rivers = rivers_regional
+        else:
+            rivers = rivers_numpy if MOTOR_HIDROLOGIA == "numpy" else gpd.read_file(streams_vector)
         
         if rivers.crs is None:
-            with rasterio.open(dem_clipped) as dem_src:
-                rivers = rivers.set_crs(dem_src.crs)
+            rivers = rivers.set_crs(out_meta['crs'])
         
         if rivers.crs != limit.crs:
             limit_final = limit.to_crs(rivers.crs)
@@ -254,10 +339,15 @@ def generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_fol
         return None
     
     # [4/6] Generar buffers con pesos
+    etapa("Generando buffers con pesos...", 46)
     print(f"[4/6] 🎯 Generando buffers con pesos...")
     
     try:
-        rivers_union = unary_union(rivers_clip.geometry)
+        # Distancia euclidiana sobre la grilla del recorte del DEM, clasificada en una pasada
+        grilla_dem = {}
+        if region is None and rivers_clip.crs == out_meta['crs']:
+            grilla_dem = {'transform': out_transform, 'forma': forma_recorte}
+        anillos = anillos_distancia(rivers_clip, limit_final.geometry.union_all(), BUFFERS_CONFIG, **grilla_dem)
         buffer_list = []
         
         for config in BUFFERS_CONFIG:
@@ -265,16 +355,7 @@ def generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_fol
             inner = config["inner"]
             outer = config["outer"]
             peso = config["peso"]
-            
-            if outer is None:
-                outer_buffer = limit_final.geometry.union_all()
-                inner_buffer = rivers_union.buffer(inner)
-                buffer_ring = outer_buffer.difference(inner_buffer)
-            else:
-                outer_buffer = rivers_union.buffer(outer)
-                inner_buffer = rivers_union.buffer(inner)
-                buffer_ring = outer_buffer.difference(inner_buffer)
-                buffer_ring = buffer_ring.intersection(limit_final.geometry.union_all())
+            buffer_ring = anillos[name]
             
             area_km2 = buffer_ring.area / 1_000_000
             
@@ -310,6 +391,7 @@ def generar_shapefile_rios_con_pesos(distrito_shapefile, output_folder, temp_fol
         return None
     
     # [6/6] Guardar shapefile
+    etapa("Guardando buffers de ríos...", 52)
     print(f"[6/6] 💾 Guardando shapefile...")
     
     try:
@@ -384,10 +466,10 @@ def calculate_numeric_scale(ax, fig):
     scale_rounded = int(round(scale_denominator / rounding) * rounding)
     return f"1:{scale_rounded:,}"
 
-def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
+def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj, titulo="SUSCEPTIBILIDAD:"):
     escala_numerica = calculate_numeric_scale(main_map_ax, fig_obj)
     info = {
-        "MAPA": f"MAPA DE SUSCEPTIBILIDAD: DISTRITO DE {dist.upper()}",
+        "MAPA": f"MAPA DE {titulo} DISTRITO DE {dist.upper()}",
         "DPTO": dpto.upper(),
         "PROVINCIA": prov.upper(),
         "DISTRITO": dist.upper(),
@@ -424,11 +506,7 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
@@ -436,10 +514,7 @@ def cargar_shapefile(nombre, alias):
         print(f"   No se encontró shapefile: {alias}")
         return None
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"   Error cargando {alias}: {e}")
         return None
@@ -602,29 +677,351 @@ def buscar_archivo_peligro(ruta_base, patron_busqueda, tipo_capa):
     
     return archivos_encontrados[0]
 
-def asignar_color_peligro(valor):
-    """Asigna color según el nivel de peligro"""
-    if 1.00 <= valor < 2.00:
-        return COLORES_PELIGRO[0]  # Verde - BAJA
-    elif 2.00 <= valor < 3.00:
-        return COLORES_PELIGRO[1]  # Amarillo - MEDIA
-    elif 3.00 <= valor < 4.00:
-        return COLORES_PELIGRO[2]  # Naranja - ALTA
-    elif 4.00 <= valor <= 5.00:
-        return COLORES_PELIGRO[3]  # Rojo - MUY ALTA
-    else:
-        return COLORES_PELIGRO[0]
+# ═══════════════════════════════════════════════════════════════════════════
+# 🧱 FUENTES COMPARTIDAS DE LOS MODELOS DE PELIGRO
+# ═══════════════════════════════════════════════════════════════════════════
+# Cada fuente se carga y recorta una sola vez por distrito: un mapa de deslizamiento tras uno de
+# inundación reutiliza la pendiente, la geomorfología, etc. (ver modelos_peligro.py)
+MAX_FUENTES_MEMORIA = int(os.environ.get("DASH_MAX_FUENTES_PELIGRO", "12"))
+_FUENTES_EN_MEMORIA = OrderedDict()
+_BLOQUEO_FUENTES = threading.Lock()
+
+
+def clase_pendiente_vectorial(gdf):
+    """
+    La capa vectorial de PENDIENTE solo trae PESO_PENDI (escala de inundación): su CLASE de pendiente
+    (la del DEM, que piden los modelos con pesos por clase) sale de invertir PESOS_PENDIENTE.
+    """
+    if 'CLASE' in gdf.columns or 'PESO_PENDI' not in gdf.columns:
+        return gdf
+    clase_de_peso = {peso: clase for clase, peso in PESOS_PENDIENTE.items()}
+    return gdf.assign(CLASE=pd.to_numeric(gdf['PESO_PENDI'], errors='coerce').round().map(clase_de_peso))
+
+
+def _fuente_pendiente(ctx):
+    # Clases del DEM en caché por distrito (un polígono por clase); sin DEM, la capa vectorial
+    print(f"\n   ⛰️ Obteniendo PENDIENTE del DEM para {ctx['distrito']}...")
+    gdf_pendiente = capa_peso_pendiente(ctx['gdf_distrito'])
+    if gdf_pendiente is None:
+        print(f"      ℹ️ Sin DEM de pendientes: se busca la capa vectorial de PENDIENTE")
+        ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, ctx['provincia'], "PENDIENTE")
+        if not ruta_pendiente:
+            ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, ctx['departamento'], "PENDIENTE")
+        if not ruta_pendiente:
+            ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, "peso", "PENDIENTE")
+        if not ruta_pendiente:
+            raise FileNotFoundError(f"No se encontró archivo de PENDIENTE")
+        gdf_pendiente = clase_pendiente_vectorial(gpd.read_file(ruta_pendiente).to_crs(epsg=3857))
+    return gdf_pendiente
+
+
+def _fuente_geomorfologia(ctx):
+    print(f"\n   🔍 Buscando capa de GEOMORFOLOGÍA...")
+    # Capa base del departamento + tabla de pesos (tablas_pesos.py); si no hay tabla, la capa con pesos
+    gdf_geomorfo = capa_con_pesos('geomorfologia', ctx['departamento'])
+    if gdf_geomorfo is not None:
+        return gdf_geomorfo
+    ruta_geomorfo = buscar_archivo_peligro(RUTA_BASE_GEOMORFOLOGIA, ctx['departamento'].lower(), "GEOMORFOLOGÍA")
+    if not ruta_geomorfo:
+        ruta_geomorfo = buscar_archivo_peligro(RUTA_BASE_GEOMORFOLOGIA, "peso", "GEOMORFOLOGÍA")
+    if not ruta_geomorfo:
+        raise FileNotFoundError(f"No se encontró archivo de GEOMORFOLOGÍA")
+    return gpd.read_file(ruta_geomorfo).to_crs(epsg=3857)
+
+
+def escenario_ppmax(ctx):
+    """Periodo de retorno (años) de la PP máxima del contexto (por defecto DASH_ESCENARIO_PPMAX)"""
+    return int((ctx or {}).get('escenario') or ESCENARIO_PPMAX)
+
+
+def ruta_escenario_ppmax(escenario):
+    """Capa de PP máxima del periodo de retorno (nombre con TR_<años>), o None"""
+    patron = re.compile(rf"(^|[^0-9a-z])tr_?{int(escenario)}([^0-9]|$)", re.IGNORECASE)
+    if not os.path.isdir(RUTA_BASE_PPMAX):
+        return None
+    for raiz, _, archivos in sorted(os.walk(RUTA_BASE_PPMAX)):
+        for archivo in sorted(archivos):
+            if archivo.lower().endswith('.shp') and patron.search(archivo):
+                return os.path.join(raiz, archivo)
+    return None
+
+
+def escenarios_ppmax_disponibles():
+    """Periodos de retorno de ESCENARIOS_PPMAX que tienen capa en RUTA_BASE_PPMAX"""
+    return [tr for tr in ESCENARIOS_PPMAX if ruta_escenario_ppmax(tr)]
+
+
+def _ruta_ppmax(ctx):
+    tr = escenario_ppmax(ctx)
+    ruta_ppmax = ruta_escenario_ppmax(tr)
+    if not ruta_ppmax and tr == ESCENARIO_PPMAX:
+        # Capa única sin periodo de retorno en el nombre: vale para el escenario por defecto
+        ruta_ppmax = buscar_archivo_peligro(RUTA_BASE_PPMAX, "ppmax", "PP MÁXIMA")
+        if not ruta_ppmax:
+            ruta_ppmax = buscar_archivo_peligro(RUTA_BASE_PPMAX, "peso", "PP MÁXIMA")
+    return ruta_ppmax
+
+
+def _fuente_ppmax(ctx):
+    tr = escenario_ppmax(ctx)
+    print(f"\n   🔍 Buscando capa de PP MÁXIMA (TR {tr} años)...")
+    ruta_ppmax = _ruta_ppmax(ctx)
+    if not ruta_ppmax:
+        raise FileNotFoundError(f"No se encontró archivo de PP MÁXIMA para TR {tr} años "
+                                f"(disponibles: {', '.join(map(str, escenarios_ppmax_disponibles())) or 'ninguno'})")
+    return gpd.read_file(ruta_ppmax).to_crs(epsg=3857)
+
+
+def _entradas_ppmax(ctx):
+    # Solo la capa del escenario: cada periodo de retorno tiene su propia caché de fuente, etapas y cubo
+    return [_ruta_ppmax(ctx) or RUTA_BASE_PPMAX, f"ppmax:TR{escenario_ppmax(ctx)}"]
+
+
+def _fuente_rios(ctx):
+    # Caché por distrito: se reutiliza sin preguntar y solo se recalcula si cambia
+    # el distrito, el DEM, el umbral de intensidad o la configuración de buffers
+    print(f"\n   🌊 Obteniendo DISTANCIA A RÍOS (caché o motor hidrológico)...")
+    ruta_rios = obtener_buffers_rios(
+        ctx['gdf_distrito'],
+        ctx['ubigeo'],
+        RUTA_DEM,
+        UMBRALES_RIOS[INTENSIDAD_RIOS],
+        BUFFERS_CONFIG,
+        generar=generar_shapefile_rios_con_pesos,
+        nombre_usuario=ctx['nombre_usuario']
+    )
+    if not ruta_rios:
+        raise RuntimeError("No se pudo generar el shapefile de ríos")
+    gdf_rios = gpd.read_file(ruta_rios)
+    if gdf_rios.crs.to_epsg() != 3857:
+        gdf_rios = gdf_rios.to_crs(epsg=3857)
+    return gdf_rios
+
+
+def _fuente_geologia(ctx):
+    print(f"\n   🔍 Cargando capa de GEOLOGÍA...")
+    gdf_geologia = capa_con_pesos('geologia', ctx['departamento'])
+    if gdf_geologia is not None:
+        return gdf_geologia
+    ruta_geologia = os.path.join(RUTA_BASE_GEOLOGIA, "geolo_cusco_con_pesos.shp")
+    if not os.path.exists(ruta_geologia):
+        raise FileNotFoundError(f"No se encontró archivo de GEOLOGÍA en: {ruta_geologia}")
+    gdf_geologia = gpd.read_file(ruta_geologia)
+    if gdf_geologia.crs is None:
+        gdf_geologia.set_crs(epsg=4326, inplace=True)
+    if gdf_geologia.crs.to_epsg() != 3857:
+        gdf_geologia = gdf_geologia.to_crs(epsg=3857)
+    return gdf_geologia
+
+
+def _fuente_altitud(ctx):
+    print(f"\n   🏔️ Clasificando ALTITUD del DEM para {ctx['distrito']}...")
+    gdf_altitud = capa_clases_altitud(ctx['gdf_distrito'], CORTES_ALTITUD)
+    if gdf_altitud is None:
+        raise FileNotFoundError("No hay DEM para clasificar la altitud")
+    return gdf_altitud
+
+
+def _entradas_pendiente(ctx):
+    from pendientes_dem import RUTA_DEM_PENDIENTES, CORTES_PENDIENTE, PESOS_PENDIENTE
+    return [RUTA_DEM_PENDIENTES, f"pendiente:{CORTES_PENDIENTE}:{sorted(PESOS_PENDIENTE.items())}",
+            RUTA_BASE_PENDIENTE]
+
+
+def _entradas_tabla(fuente, ctx):
+    # Tabla de pesos y capa base del departamento, más la carpeta de la capa con pesos de respaldo
+    carpeta = RUTA_BASE_GEOLOGIA if fuente == 'geologia' else RUTA_BASE_GEOMORFOLOGIA
+    return entradas_tabla(fuente, (ctx or {}).get('departamento')) + [carpeta]
+
+
+def _entradas_altitud(ctx):
+    from pendientes_dem import RUTA_DEM_PENDIENTES
+    return [RUTA_DEM_PENDIENTES, f"altitud:{CORTES_ALTITUD}"]
+
+
+# fuente -> (nombre, cargar(ctx) -> GeoDataFrame en EPSG:3857, entradas(ctx) -> lo que la invalida)
+FUENTES_PELIGRO = {
+    'pendiente': ("Pendiente", _fuente_pendiente, _entradas_pendiente),
+    'geomorfologia': ("Geomorfología", _fuente_geomorfologia, lambda ctx: _entradas_tabla('geomorfologia', ctx)),
+    'ppmax': ("PP Máxima", _fuente_ppmax, _entradas_ppmax),
+    'rios': ("Distancia a Ríos", _fuente_rios, lambda ctx: [
+        clave_hidrologia(ctx['ubigeo'], RUTA_DEM, UMBRALES_RIOS[INTENSIDAD_RIOS], BUFFERS_CONFIG)]),
+    'geologia': ("Geología", _fuente_geologia, lambda ctx: _entradas_tabla('geologia', ctx)),
+    'altitud': ("Altitud", _fuente_altitud, _entradas_altitud),
+}
+
+
+def contexto_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, nombre_usuario=None,
+                      escenario=None):
+    return {
+        'gdf_distrito': gdf_distrito,
+        'departamento': departamento_sel,
+        'provincia': provincia_sel,
+        'distrito': distrito_sel,
+        'nombre_usuario': nombre_usuario,
+        'escenario': escenario or ESCENARIO_PPMAX,
+        'ubigeo': ubigeo_de_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel),
+    }
+
+
+def capa_fuente(fuente, ctx):
+    """
+    Fuente recortada al distrito (EPSG:3857). Se guarda en memoria por distrito y huella de sus
+    entradas, así la comparten los modelos que la usan.
+    """
+    nombre, cargar, entradas = FUENTES_PELIGRO[fuente]
+    clave = (ctx['ubigeo'], fuente, tuple(firma_fuentes(entradas(ctx))))
+    with _BLOQUEO_FUENTES:
+        if clave in _FUENTES_EN_MEMORIA:
+            _FUENTES_EN_MEMORIA.move_to_end(clave)
+            print(f"\n   ♻️ {nombre}: reutilizada de un mapa anterior del distrito")
+            return _FUENTES_EN_MEMORIA[clave]
+
+    gdf = gpd.clip(cargar(ctx), ctx['gdf_distrito'])
+    print(f"      ✅ {nombre} recortada: {len(gdf)} registros")
+    with _BLOQUEO_FUENTES:
+        _FUENTES_EN_MEMORIA[clave] = gdf
+        while len(_FUENTES_EN_MEMORIA) > MAX_FUENTES_MEMORIA:
+            _FUENTES_EN_MEMORIA.popitem(last=False)
+    return gdf
+
+
+def capa_factor(gdf, factor):
+    """La fuente reducida a la columna de peso del factor (traduciendo CLASE si el modelo lo pide)"""
+    if factor.clases:
+        if 'CLASE' not in gdf.columns:
+            raise ValueError(f"La fuente '{factor.fuente}' no trae CLASE para asignar {factor.columna}")
+        gdf = gdf.assign(**{factor.columna: gdf['CLASE'].map(factor.clases)})
+        gdf = gdf[gdf[factor.columna].notna()]
+    elif factor.columna not in gdf.columns:
+        raise ValueError(f"La columna '{factor.columna}' no existe en la capa de {FUENTES_PELIGRO[factor.fuente][0]}")
+    return gdf[[factor.columna, gdf.geometry.name]]
+
+
+def cargar_capas_peligro(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, nombre_usuario=None,
+                         modelo=None, escenario=None):
+    """
+    Capas de peso del modelo (por defecto inundación) recortadas al distrito; 'escenario' es el
+    periodo de retorno de la PP máxima.
+
+    Retorna:
+    - diccionario columna de peso -> GeoDataFrame en EPSG:3857 (en el orden de los factores), o None si falla
+    """
+    modelo = obtener_modelo(modelo)
+    ctx = contexto_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, nombre_usuario, escenario)
+    n = len(modelo.factores)
+
+    print("\n" + "="*80)
+    print(f"🌊 CARGANDO CAPAS DE PELIGRO: {modelo.nombre.upper()} ({n} PARÁMETROS)")
+    print("="*80)
+
+    capas = {}
+    try:
+        for i, factor in enumerate(modelo.factores):
+            etapa(f"Capa {i + 1}/{n}: {FUENTES_PELIGRO[factor.fuente][0]}...", 10 + 52 * i // n)
+            capas[factor.columna] = capa_factor(capa_fuente(factor.fuente, ctx), factor)
+    except Exception as e:
+        print(f"\n❌ Error cargando capas de peligro: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+    print(f"\n   ✅ Las {n} capas listas")
+    for columna, gdf in capas.items():
+        print(f"      - {columna}: {len(gdf)} registros")
+    return capas
+
+
+def ruta_cubo_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, modelo=None, escenario=None):
+    """Cubo de pesos del distrito, modelo y escenario: su clave sigue a las entradas de cada fuente del modelo"""
+    modelo = obtener_modelo(modelo)
+    ctx = contexto_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, escenario=escenario)
+    fuentes = [firma_modelo(modelo)]
+    for factor in modelo.factores:
+        fuentes.extend(FUENTES_PELIGRO[factor.fuente][2](ctx))
+    return ruta_cubo_peligro(ctx['ubigeo'], fuentes)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# 🔗 PROCESO POR ETAPAS CON CACHÉ EN DISCO (dag_cache.py)
+# ═══════════════════════════════════════════════════════════════════════════
+# fuente:* (cargar + recortar, en paralelo) -> factor:* (columna de peso) -> indice (combinación)
+# Si cambia una entrada (p. ej. la capa de PP máxima o los buffers de ríos) solo se rehacen su
+# fuente, su factor y el índice; las demás fuentes salen de la caché del distrito
+def etapas_peligro(ctx, modelo, motor, pesos, ruta_cubo=None):
+    """Etapas del índice de peligro del distrito para el modelo, motor y ponderación dados"""
+    geometria = hashlib.sha1(ctx['gdf_distrito'].geometry.union_all().wkb).hexdigest()
+    columnas = columnas_modelo(modelo)
+    etapas = []
+    for fuente in dict.fromkeys(f.fuente for f in modelo.factores):
+        etapas.append(Etapa(
+            f"fuente:{fuente}",
+            lambda fuente=fuente: capa_fuente(fuente, ctx),
+            [],
+            FUENTES_PELIGRO[fuente][2](ctx) + [f"distrito:{ctx['ubigeo']}:{geometria}"],
+        ))
+    for factor in modelo.factores:
+        etapas.append(Etapa(
+            f"factor:{factor.columna}",
+            lambda gdf, factor=factor: capa_factor(gdf, factor),
+            [f"fuente:{factor.fuente}"],
+            [f"clases:{sorted(factor.clases.items()) if factor.clases else ''}"],
+        ))
+
+    def _combinar(*capas):
+        return combinar_capas(dict(zip(columnas, capas)), ctx['gdf_distrito'], modelo.rangos, motor=motor,
+                              pesos=pesos, ruta_cubo=ruta_cubo)
+
+    parametros = [f"motor:{motor}", f"pesos:{[round(float(x), 4) for x in normalizar_pesos(pesos, columnas)]}",
+                  f"rangos:{modelo.rangos}"]
+    if motor == "raster":
+        parametros.append(f"grilla:{RESOLUCION_PELIGRO_M}:{TAMIZ_PELIGRO}:{MEMORIA_BLOQUES_MB}")
+    etapas.append(Etapa("indice", _combinar, [f"factor:{c}" for c in columnas], parametros))
+    return etapas
+
+
+def peligro_por_etapas(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, modelo, motor, pesos,
+                       ruta_cubo=None, nombre_usuario=None, escenario=None):
+    """Índice de peligro sin disolver; solo se calculan las etapas cuyas entradas cambiaron"""
+    ctx = contexto_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, nombre_usuario, escenario)
+    nombre_ubigeo = "".join(c if c.isalnum() else "_" for c in str(ctx['ubigeo']))
+    etapas = etapas_peligro(ctx, modelo, motor, pesos, ruta_cubo)
+    podar_cache_dag(RUTA_ETAPAS_PELIGRO)
+    return ejecutar_dag(etapas, os.path.join(RUTA_ETAPAS_PELIGRO, nombre_ubigeo), objetivos=["indice"])["indice"]
+
 
 # ═══════════════════════════════════════════════════════════════════════════
-# 🎯 FUNCIÓN PRINCIPAL CON 5 PARÁMETROS + CENTROS POBLADOS
+# 🎯 FUNCIÓN PRINCIPAL MULTICRITERIO + CENTROS POBLADOS
 # ═══════════════════════════════════════════════════════════════════════════
 
-def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distrito_sel):
+def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distrito_sel, motor=None, pesos=None,
+                         depurar=None, modelo=None, escenario=None):
+    try:
+        modelo = obtener_modelo(modelo)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+    columnas = columnas_modelo(modelo)
+    # Periodo de retorno de la PP máxima (solo cuenta si el modelo la usa)
+    usa_ppmax = any(f.fuente == 'ppmax' for f in modelo.factores)
+    escenario = int(escenario or ESCENARIO_PPMAX) if usa_ppmax else None
+    if usa_ppmax and not _ruta_ppmax({'escenario': escenario}):
+        print(f"❌ No hay capa de PP máxima para TR {escenario} años "
+              f"(disponibles: {', '.join(map(str, escenarios_ppmax_disponibles())) or 'ninguno'})")
+        return None
+    # Nombres de salida de siempre para inundación; los demás modelos llevan su clave (y el
+    # periodo de retorno si no es el de por defecto)
+    sufijo = "5param" if modelo.clave == 'inundacion' else modelo.clave
+    if escenario and escenario != ESCENARIO_PPMAX:
+        sufijo += f"_tr{escenario}"
+
     print("\n" + "="*80)
-    print("🗺️ INICIANDO PROCESO DE GENERACIÓN DE MAPA DE PELIGRO (5 PARÁMETROS)")
+    print(f"🗺️ INICIANDO PROCESO DE GENERACIÓN DE MAPA DE PELIGRO: {modelo.nombre.upper()} ({len(columnas)} PARÁMETROS)")
     print("="*80)
     print(f"   - Usuario: {nombre_usuario}")
     print(f"   - Ubicación: {distrito_sel}, {provincia_sel}, {departamento_sel}")
+    if escenario:
+        print(f"   - PP máxima: TR {escenario} años")
 
     # CREAR CARPETA DE SALIDA
     try:
@@ -636,6 +1033,7 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
         print(f"❌ Error creando la estructura de carpetas para el usuario: {e}")
         return None
 
+    etapa("Cargando capas base...", 4)
     print("\n📦 Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
@@ -645,10 +1043,7 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
     print("   🏘️ Cargando centros poblados...")
     try:
         if os.path.exists(RUTA_CENTROS_POBLADOS):
-            gdf_centros_pob = gpd.read_file(RUTA_CENTROS_POBLADOS)
-            if gdf_centros_pob.crs is None or gdf_centros_pob.crs.to_epsg() != 4326:
-                gdf_centros_pob.set_crs(epsg=4326, inplace=True)
-            gdf_centros_pob = gdf_centros_pob.to_crs(epsg=3857)
+            gdf_centros_pob = leer_capa(RUTA_CENTROS_POBLADOS, forzar_4326=True)
             print(f"   ✅ Centros poblados cargados: {len(gdf_centros_pob)} puntos")
         else:
             print(f"   ⚠️ No se encontró el shapefile de centros poblados")
@@ -658,8 +1053,8 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
         gdf_centros_pob = None
 
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"⚠️ Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -677,6 +1072,7 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
         print("❌ No se pudieron identificar las columnas de nombres")
         return None
 
+    etapa("Filtrando el área seleccionada...", 8)
     print("\n🔍 Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -690,262 +1086,100 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
 
     print(f"   ✅ Distrito encontrado con geometría válida")
 
-    # 🆕 GENERAR SHAPEFILE DE RÍOS AUTOMÁTICAMENTE
-    print("\n" + "="*80)
-    print("🌊 PASO 1: GENERANDO SHAPEFILE DE DISTANCIA A RÍOS")
-    print("="*80)
-    
-    ruta_rios = os.path.join(RUTA_BASE_RIOS, "buffers_distancia_rios_PESOS.shp")
-    
-    # Verificar si ya existe el shapefile
-    if os.path.exists(ruta_rios):
-        print(f"⚠️ El shapefile ya existe: {ruta_rios}")
-        print("   Opciones: [U]sar existente | [R]egenerar")
-        respuesta = input("   Seleccione (U/R) [por defecto: U]: ").strip().upper()
-        
-        if respuesta == 'R':
-            print("   🔄 Regenerando shapefile de ríos...")
-            ruta_rios = generar_shapefile_rios_con_pesos(
-                gdf_distrito, 
-                RUTA_BASE_RIOS,
-                temp_folder=os.path.join(carpeta_usuario, "temp_hydro")
-            )
-            if not ruta_rios:
-                print("❌ Error generando shapefile de ríos")
-                return None
-        else:
-            print("   ✅ Usando shapefile existente")
-    else:
-        print("   🆕 Generando shapefile de ríos por primera vez...")
-        ruta_rios = generar_shapefile_rios_con_pesos(
-            gdf_distrito, 
-            RUTA_BASE_RIOS,
-            temp_folder=os.path.join(carpeta_usuario, "temp_hydro")
-        )
-        if not ruta_rios:
-            print("❌ Error generando shapefile de ríos")
-            return None
-
-    # 🆕 CARGAR LAS CINCO CAPAS DE PELIGRO
-    print("\n" + "="*80)
-    print("🌊 PASO 2: CARGANDO CAPAS DE PELIGRO (5 PARÁMETROS)")
-    print("="*80)
-    
+    # 🆕 COMBINAR LAS CAPAS DEL MODELO (INTERSECCIÓN VECTORIAL O SUPERPOSICIÓN EN RÁSTER)
+    motor = (motor or MOTOR_PELIGRO).lower()
     try:
-        # 1️⃣ PENDIENTE
-        print(f"\n   🔍 Buscando capa de PENDIENTE para {provincia_sel}...")
-        ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, provincia_sel, "PENDIENTE")
-        if not ruta_pendiente:
-            ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, departamento_sel, "PENDIENTE")
-        if not ruta_pendiente:
-            ruta_pendiente = buscar_archivo_peligro(RUTA_BASE_PENDIENTE, "peso", "PENDIENTE")
-        
-        if not ruta_pendiente:
-            raise FileNotFoundError(f"No se encontró archivo de PENDIENTE")
-        
-        gdf_pendiente = gpd.read_file(ruta_pendiente).to_crs(epsg=3857)
-        print(f"      ✅ Pendiente cargada: {len(gdf_pendiente)} registros")
-        
-        # 2️⃣ GEOMORFOLOGÍA
-        print(f"\n   🔍 Buscando capa de GEOMORFOLOGÍA...")
-        ruta_geomorfo = buscar_archivo_peligro(RUTA_BASE_GEOMORFOLOGIA, departamento_sel.lower(), "GEOMORFOLOGÍA")
-        if not ruta_geomorfo:
-            ruta_geomorfo = buscar_archivo_peligro(RUTA_BASE_GEOMORFOLOGIA, "peso", "GEOMORFOLOGÍA")
-        
-        if not ruta_geomorfo:
-            raise FileNotFoundError(f"No se encontró archivo de GEOMORFOLOGÍA")
-        
-        gdf_geomorfo = gpd.read_file(ruta_geomorfo).to_crs(epsg=3857)
-        print(f"      ✅ Geomorfología cargada: {len(gdf_geomorfo)} registros")
-        
-        # 3️⃣ PP MÁXIMA
-        print(f"\n   🔍 Buscando capa de PP MÁXIMA...")
-        ruta_ppmax = buscar_archivo_peligro(RUTA_BASE_PPMAX, "ppmax", "PP MÁXIMA")
-        if not ruta_ppmax:
-            ruta_ppmax = buscar_archivo_peligro(RUTA_BASE_PPMAX, "peso", "PP MÁXIMA")
-        
-        if not ruta_ppmax:
-            raise FileNotFoundError(f"No se encontró archivo de PP MÁXIMA")
-        
-        gdf_ppmax = gpd.read_file(ruta_ppmax).to_crs(epsg=3857)
-        print(f"      ✅ PP Máxima cargada: {len(gdf_ppmax)} registros")
-        
-        # 4️⃣ 🆕 DISTANCIA A RÍOS (ya generado)
-        print(f"\n   🔍 Cargando capa de DISTANCIA A RÍOS...")
-        gdf_rios = gpd.read_file(ruta_rios)
-        
-        # Ya debería estar en 3857, pero verificar
-        if gdf_rios.crs.to_epsg() != 3857:
-            gdf_rios = gdf_rios.to_crs(epsg=3857)
-        
-        print(f"      ✅ Distancia a Ríos cargada: {len(gdf_rios)} registros")
-        print(f"      📋 Columnas: {list(gdf_rios.columns)}")
-        
-        # 5️⃣ 🆕 GEOLOGÍA
-        print(f"\n   🔍 Cargando capa de GEOLOGÍA...")
-        ruta_geologia = os.path.join(RUTA_BASE_GEOLOGIA, "geolo_cusco_con_pesos.shp")
-        
-        if not os.path.exists(ruta_geologia):
-            raise FileNotFoundError(f"No se encontró archivo de GEOLOGÍA en: {ruta_geologia}")
-        
-        gdf_geologia = gpd.read_file(ruta_geologia)
-        
-        # Convertir a EPSG:3857 si es necesario
-        if gdf_geologia.crs is None or gdf_geologia.crs.to_epsg() != 3857:
-            if gdf_geologia.crs is None:
-                gdf_geologia.set_crs(epsg=4326, inplace=True)
-            gdf_geologia = gdf_geologia.to_crs(epsg=3857)
-        
-        print(f"      ✅ Geología cargada: {len(gdf_geologia)} registros")
-        print(f"      📋 Columnas: {list(gdf_geologia.columns)}")
-        
-        # VERIFICAR COLUMNAS
-        if 'PESO_PENDI' not in gdf_pendiente.columns:
-            raise ValueError(f"La columna 'PESO_PENDI' no existe")
-        if 'PESO_GEOMO' not in gdf_geomorfo.columns:
-            raise ValueError(f"La columna 'PESO_GEOMO' no existe")
-        if 'PESO_PPMAX' not in gdf_ppmax.columns:
-            raise ValueError(f"La columna 'PESO_PPMAX' no existe")
-        if 'PESO_RIO' not in gdf_rios.columns:
-            raise ValueError(f"La columna 'PESO_RIO' no existe en el shapefile de ríos")
-        if 'PESO_GEOL' not in gdf_geologia.columns:
-            raise ValueError(f"La columna 'PESO_GEOL' no existe en el shapefile de geología")
-        
-        print(f"\n   ✅ Todas las 5 capas cargadas exitosamente")
-        
-    except Exception as e:
-        print(f"\n❌ Error cargando capas de peligro: {e}")
-        import traceback
-        traceback.print_exc()
+        pesos = pesos_modelo(modelo, pesos)
+        normalizar_pesos(pesos, columnas)
+    except ValueError as e:
+        print(f"❌ Pesos de los factores no válidos: {e}")
         return None
 
-    # RECORTAR CAPAS DE PELIGRO AL DISTRITO
-    print("\n✂️ Recortando capas de peligro al distrito...")
+    # Si la provincia o el departamento tiene la superficie de peligro precalculada (peligro_regional.py)
+    # solo se lee la ventana del distrito: no se cargan capas ni se extraen ríos
+    gdf_peligro = None
+    ruta_cubo = None
     try:
-        gdf_pendiente_clip = gpd.clip(gdf_pendiente, gdf_distrito)
-        gdf_geomorfo_clip = gpd.clip(gdf_geomorfo, gdf_distrito)
-        gdf_ppmax_clip = gpd.clip(gdf_ppmax, gdf_distrito)
-        gdf_rios_clip = gpd.clip(gdf_rios, gdf_distrito)
-        gdf_geologia_clip = gpd.clip(gdf_geologia, gdf_distrito)
-        
-        print(f"   ✅ Capas recortadas exitosamente")
-        print(f"      - Pendiente: {len(gdf_pendiente_clip)} registros")
-        print(f"      - Geomorfología: {len(gdf_geomorfo_clip)} registros")
-        print(f"      - PP Máxima: {len(gdf_ppmax_clip)} registros")
-        print(f"      - Distancia a Ríos: {len(gdf_rios_clip)} registros")
-        print(f"      - Geología: {len(gdf_geologia_clip)} registros")
-        
+        region = buscar_peligro_regional(gdf_distrito, modelo, pesos, escenario=escenario)
+        if region is not None:
+            gdf_peligro = peligro_distrito_regional(region, gdf_distrito)
     except Exception as e:
-        print(f"❌ Error recortando capas: {e}")
-        return None
+        print(f"   ⚠️ No se pudo usar la superficie de peligro regional: {e}")
+        gdf_peligro = None
+
+    # Con el motor ráster, si el cubo de pesos del distrito ya existe solo se rehace la suma
+    # ponderada: no se leen ni se recortan las capas
+    if gdf_peligro is None and motor == "raster":
+        try:
+            ruta_cubo = ruta_cubo_distrito(gdf_distrito, departamento_sel, provincia_sel, distrito_sel, modelo.clave,
+                                           escenario=escenario)
+            gdf_peligro = peligro_en_cache(ruta_cubo, gdf_distrito, modelo.rangos, pesos=pesos, columnas=columnas)
+        except Exception as e:
+            print(f"   ⚠️ No se pudo usar el cubo de pesos en caché: {e}")
+            gdf_peligro = None
 
-    # 🆕 COMBINAR LAS CINCO CAPAS MEDIANTE INTERSECCIÓN
-    print("\n🔄 Combinando capas de peligro (5 parámetros)...")
     try:
-        # Intersección de las cinco capas
-        print("   [1/5] Intersectando Pendiente ∩ Geomorfología...")
-        gdf_intersect1 = gpd.overlay(gdf_pendiente_clip, gdf_geomorfo_clip, how='intersection')
-        
-        print("   [2/5] Intersectando con PP Máxima...")
-        gdf_intersect2 = gpd.overlay(gdf_intersect1, gdf_ppmax_clip, how='intersection')
-        
-        print("   [3/5] Intersectando con Distancia a Ríos...")
-        gdf_intersect3 = gpd.overlay(gdf_intersect2, gdf_rios_clip, how='intersection')
-        
-        print("   [4/5] Intersectando con Geología...")
-        gdf_peligro = gpd.overlay(gdf_intersect3, gdf_geologia_clip, how='intersection')
-        
-        # 🆕 VERIFICAR Y LIMPIAR NOMBRES DE COLUMNAS
-        print("\n   📋 Verificando columnas después de intersección...")
-        print(f"      Columnas disponibles: {list(gdf_peligro.columns)}")
-        
-        # Buscar las columnas de peso (pueden tener sufijos _1, _2, etc.)
-        col_pendi = None
-        col_geomo = None
-        col_ppmax = None
-        col_rio = None
-        col_geol = None
-        
-        for col in gdf_peligro.columns:
-            if 'PESO_PENDI' in col:
-                col_pendi = col
-            elif 'PESO_GEOMO' in col:
-                col_geomo = col
-            elif 'PESO_PPMAX' in col:
-                col_ppmax = col
-            elif 'PESO_RIO' in col:
-                col_rio = col
-            elif 'PESO_GEOL' in col:
-                col_geol = col
-        
-        print(f"\n   📊 Columnas identificadas:")
-        print(f"      - Pendiente: {col_pendi}")
-        print(f"      - Geomorfología: {col_geomo}")
-        print(f"      - PP Máxima: {col_ppmax}")
-        print(f"      - Distancia Ríos: {col_rio}")
-        print(f"      - Geología: {col_geol}")
-        
-        # Verificar que todas las columnas existen
-        if not all([col_pendi, col_geomo, col_ppmax, col_rio, col_geol]):
-            raise ValueError(f"No se encontraron todas las columnas de peso necesarias")
-        
-        # 🆕 CALCULAR EL ÍNDICE DE PELIGRO CON 5 PARÁMETROS
-        print("\n   [5/5] Calculando índice de peligro...")
-        gdf_peligro['PELIGRO'] = (
-            gdf_peligro[col_pendi] + 
-            gdf_peligro[col_geomo] + 
-            gdf_peligro[col_ppmax] +
-            gdf_peligro[col_rio] +
-            gdf_peligro[col_geol]
-        ) / 5.0
-        
-        # 🆕 MOSTRAR ESTADÍSTICAS DETALLADAS DE CADA PARÁMETRO
-        print(f"\n   📊 Estadísticas ANTES del promedio:")
-        print(f"      - {col_pendi}: min={gdf_peligro[col_pendi].min():.2f}, max={gdf_peligro[col_pendi].max():.2f}, media={gdf_peligro[col_pendi].mean():.2f}")
-        print(f"      - {col_geomo}: min={gdf_peligro[col_geomo].min():.2f}, max={gdf_peligro[col_geomo].max():.2f}, media={gdf_peligro[col_geomo].mean():.2f}")
-        print(f"      - {col_ppmax}: min={gdf_peligro[col_ppmax].min():.2f}, max={gdf_peligro[col_ppmax].max():.2f}, media={gdf_peligro[col_ppmax].mean():.2f}")
-        print(f"      - {col_rio}: min={gdf_peligro[col_rio].min():.2f}, max={gdf_peligro[col_rio].max():.2f}, media={gdf_peligro[col_rio].mean():.2f}")
-        print(f"      - {col_geol}: min={gdf_peligro[col_geol].min():.2f}, max={gdf_peligro[col_geol].max():.2f}, media={gdf_peligro[col_geol].mean():.2f}")
-        
+        if gdf_peligro is None:
+            etapa(f"Cargando capas y combinando ({motor}, etapas en caché)...", 10)
+            gdf_peligro = peligro_por_etapas(gdf_distrito, departamento_sel, provincia_sel, distrito_sel,
+                                             modelo, motor, pesos, ruta_cubo=ruta_cubo,
+                                             nombre_usuario=nombre_usuario, escenario=escenario)
+            etapa("Capas combinadas", 66)
+        if gdf_peligro.empty:
+            raise ValueError("Las capas no tienen área en común dentro del distrito")
+
+        # 🆕 MOSTRAR ESTADÍSTICAS DETALLADAS DE CADA PARÁMETRO (solo el motor overlay conserva los pesos)
+        columnas_peso = [c for c in columnas if c in gdf_peligro.columns]
+        if columnas_peso:
+            print(f"\n   📊 Estadísticas ANTES del promedio:")
+            for col in columnas_peso:
+                print(f"      - {col}: min={gdf_peligro[col].min():.2f}, max={gdf_peligro[col].max():.2f}, media={gdf_peligro[col].mean():.2f}")
+
         print(f"\n   📊 Estadísticas DESPUÉS del promedio (PELIGRO):")
         print(f"      - Peligro: min={gdf_peligro['PELIGRO'].min():.3f}, max={gdf_peligro['PELIGRO'].max():.3f}, media={gdf_peligro['PELIGRO'].mean():.3f}")
-        
-        # 🆕 MOSTRAR DISTRIBUCIÓN POR NIVEL DE PELIGRO
-        print(f"\n   📊 Distribución por nivel de peligro:")
-        nivel_baja = len(gdf_peligro[(gdf_peligro['PELIGRO'] >= 1.0) & (gdf_peligro['PELIGRO'] < 2.0)])
-        nivel_media = len(gdf_peligro[(gdf_peligro['PELIGRO'] >= 2.0) & (gdf_peligro['PELIGRO'] < 3.0)])
-        nivel_alta = len(gdf_peligro[(gdf_peligro['PELIGRO'] >= 3.0) & (gdf_peligro['PELIGRO'] < 4.0)])
-        nivel_muy_alta = len(gdf_peligro[(gdf_peligro['PELIGRO'] >= 4.0) & (gdf_peligro['PELIGRO'] <= 5.0)])
-        
-        total = len(gdf_peligro)
-        print(f"      - Baja (1.0-2.0):      {nivel_baja:5d} polígonos ({100*nivel_baja/total:5.1f}%)")
-        print(f"      - Media (2.0-3.0):     {nivel_media:5d} polígonos ({100*nivel_media/total:5.1f}%)")
-        print(f"      - Alta (3.0-4.0):      {nivel_alta:5d} polígonos ({100*nivel_alta/total:5.1f}%)")
-        print(f"      - Muy Alta (4.0-5.0):  {nivel_muy_alta:5d} polígonos ({100*nivel_muy_alta/total:5.1f}%)")
-        
-        # Asignar colores según el nivel de peligro
-        gdf_peligro['COLOR'] = gdf_peligro['PELIGRO'].apply(asignar_color_peligro)
-        
+
         print(f"\n   ✅ Capas combinadas exitosamente: {len(gdf_peligro)} polígonos")
-        
-        # 🆕 GUARDAR SHAPEFILE CON RESULTADOS PARA DEBUG
-        debug_shp = os.path.join(carpeta_salida, "peligro_debug_5param.shp")
-        gdf_peligro.to_file(debug_shp)
-        print(f"   💾 Shapefile de debug guardado: {debug_shp}")
-        
+
+        # Volcado crudo (cada fragmento con todos sus pesos) solo si se pide
+        if DEPURAR_PELIGRO if depurar is None else depurar:
+            ruta_debug = exportar_peligro(gdf_peligro, os.path.join(carpeta_salida, f"peligro_debug_{sufijo}"))
+            print(f"   💾 Resultado sin disolver guardado: {ruta_debug}")
+
+        # 🆕 DISOLVER POR NIVEL (O POR CONDICIÓN ÚNICA) ANTES DE DIBUJAR Y EXPORTAR
+        n_crudo = len(gdf_peligro)
+        gdf_peligro = disolver_peligro(gdf_peligro, modelo.rangos, por_condicion=DISOLVER_PELIGRO == "condicion")
+        print(f"   🧱 Disuelto por {'condición' if DISOLVER_PELIGRO == 'condicion' else 'nivel'}: "
+              f"{n_crudo} -> {len(gdf_peligro)} polígonos")
+
+        # Asignar colores según el nivel de peligro (límites de los rangos del modelo, como clasificar_peligro)
+        gdf_peligro['COLOR'] = np.asarray(modelo.colores)[niveles_peligro(gdf_peligro['PELIGRO'], modelo.rangos) - 1]
+
+        # 🆕 DISTRIBUCIÓN POR NIVEL: ÁREA EN PROYECCIÓN DE ÁREAS IGUALES Y CENTROS POBLADOS EXPUESTOS
+        estadisticas = estadisticas_peligro(gdf_peligro, gdf_distrito, modelo.rangos, modelo.etiquetas,
+                                            gdf_centros=gdf_centros_pob)
+        print(f"\n   📊 Distribución por nivel de peligro ({estadisticas['area_distrito_km2']:.2f} km² de distrito):")
+        for fila in estadisticas['niveles']:
+            print(f"      - {fila['peligro'] + ':':<10} {fila['area_km2']:10.3f} km² ({fila['porcentaje_distrito']:5.1f}%), "
+                  f"{fila['centros_poblados']:4d} centros poblados")
+
+        ruta_resultado = exportar_peligro(gdf_peligro.drop(columns='COLOR'),
+                                          os.path.join(carpeta_salida, f"peligro_{sufijo}"))
+        print(f"   💾 Resultado guardado: {ruta_resultado}")
+
     except Exception as e:
         print(f"❌ Error combinando capas: {e}")
         import traceback
         traceback.print_exc()
         return None
 
+    etapa("Armando el layout del mapa...", 80)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
     gs_izquierda = grid[0, 0].subgridspec(3, 1, height_ratios=[0.08, 3.5, 0.42], hspace=0.08)
 
     ax_titulo = fig.add_subplot(gs_izquierda[0])
-    ax_titulo.text(0.5, 0.5, f"MAPA DE SUSCEPTIBILIDAD ANTE DESLIZAMIENTOS - DISTRITO DE {distrito_sel.upper()}",
+    ax_titulo.text(0.5, 0.5, f"{modelo.titulo} - DISTRITO DE {distrito_sel.upper()}",
                    ha='center', va='center', fontsize=11, fontweight="normal",
                    bbox=dict(boxstyle='square,pad=0.5', facecolor='white', 
                             edgecolor='black', linewidth=1.5, alpha=0.95))
@@ -978,6 +1212,7 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
 
     print("   🛰️ Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 84)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, attribution=False, zoom='auto')
     except Exception as e:
         print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
@@ -1046,28 +1281,28 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
     gs_memb_ley = gs_izquierda[2].subgridspec(1, 2, wspace=0.1)
     ax_membrete = fig.add_subplot(gs_memb_ley[0])
     fig.canvas.draw()
-    add_membrete(ax_membrete, departamento_sel, provincia_sel, distrito_sel, ax_main, fig)
+    add_membrete(ax_membrete, departamento_sel, provincia_sel, distrito_sel, ax_main, fig, titulo=modelo.leyenda)
 
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
 
-    legend_elements = [Patch(facecolor='white', edgecolor='white', label='SUSCEPTIBILIDAD:', linewidth=0)]
+    legend_elements = [Patch(facecolor='white', edgecolor='white', label=modelo.leyenda, linewidth=0)]
     
     legend_elements.extend([
-        Patch(facecolor=COLORES_PELIGRO[0], edgecolor='black', label='Baja (1.00 - 2.00)'),
-        Patch(facecolor=COLORES_PELIGRO[1], edgecolor='black', label='Media (2.00 - 3.00)'),
-        Patch(facecolor=COLORES_PELIGRO[2], edgecolor='black', label='Alta (3.00 - 4.00)'),
-        Patch(facecolor=COLORES_PELIGRO[3], edgecolor='black', label='Muy Alta (4.00 - 5.00)')
+        Patch(facecolor=color, edgecolor='black', label=f'{etiqueta} ({desde:.2f} - {hasta:.2f})')
+        for color, etiqueta, desde, hasta in zip(modelo.colores, modelo.etiquetas, modelo.rangos, modelo.rangos[1:])
     ])
 
     legend_elements.extend([
         Patch(facecolor='white', edgecolor='white', label='', linewidth=0),
         Patch(facecolor='white', edgecolor='white', label='PARÁMETROS:', linewidth=0),
-        Patch(facecolor='white', edgecolor='white', label='• Pendiente', linewidth=0),
-        Patch(facecolor='white', edgecolor='white', label='• Geomorfología', linewidth=0),
-        Patch(facecolor='white', edgecolor='white', label='• PP Máxima', linewidth=0),
-        Patch(facecolor='white', edgecolor='white', label='• Distancia a Ríos', linewidth=0),
-        Patch(facecolor='white', edgecolor='white', label='• Geología', linewidth=0),
+    ])
+    legend_elements.extend([
+        Patch(facecolor='white', edgecolor='white', linewidth=0,
+              label=f'• {FUENTES_PELIGRO[f.fuente][0]}' + (f' (TR {escenario} años)' if f.fuente == 'ppmax' else ''))
+        for f in modelo.factores
+    ])
+    legend_elements.extend([
         Patch(facecolor='white', edgecolor='white', label='', linewidth=0),
         Line2D([0], [0], color='black', lw=1.5, linestyle='-', label='Límite Distrital'),
         Line2D([0], [0], marker='o', color='w', markerfacecolor='#006400',  # Verde oscuro
@@ -1082,6 +1317,7 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
 
+    etapa("Dibujando mapas de ubicación...", 90)
     print("   🗺️ Generando mapas de ubicación...")
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
     ax_depto = fig.add_subplot(gs_ubicaciones[0])
@@ -1116,21 +1352,33 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
         spine.set_linewidth(2)
         spine.set_color('black')
 
+    etapa("Guardando el mapa...", 95)
     print("\n💾 Guardando mapa final...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombre_base = f"MAPA_PELIGRO_5PARAM_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
+    nombre_base = f"MAPA_PELIGRO_{sufijo.upper()}_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
 
     try:
-        plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+        ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
         plt.close(fig)
 
-        if os.path.exists(ruta_guardado_final):
-            file_size = os.path.getsize(ruta_guardado_final) / (1024 * 1024)
+        if existe(ruta_guardado_final):
+            file_size = tamano(ruta_guardado_final) / (1024 * 1024)
+            # Estadísticas y GeoPackage junto al mapa, en el mismo almacenamiento (local o S3): el
+            # trabajador de render los publica con él y el resumen del dashboard los lee de ahí
+            try:
+                ruta_mapa = os.path.join(carpeta_salida, nombre_base)
+                ruta_json, ruta_csv = guardar_estadisticas(estadisticas, asociado(ruta_mapa, "_estadisticas"))
+                archivos = [(ruta_json, ruta_json), (ruta_csv, ruta_csv),
+                            (ruta_resultado, asociado(ruta_mapa, "_peligro" + os.path.splitext(ruta_resultado)[1]))]
+                publicados = [guardar_archivo(origen, destino) for origen, destino in archivos]
+                print(f"   📊 Estadísticas por nivel y capa: {', '.join(os.path.basename(r) for r in publicados)}")
+            except Exception as e:
+                print(f"   ⚠️ No se pudieron guardar las estadísticas o la capa: {e}")
             print(f"✅ Mapa de peligro guardado exitosamente")
             print(f"   📂 Ubicación: {ruta_guardado_final}")
             print(f"   📊 Tamaño: {file_size:.2f} MB")
-            print(f"   🎯 Parámetros: 5 (Pendiente + Geomorfología + PP Máxima + Distancia a Ríos + Geología)")
+            print(f"   🎯 Parámetros: {len(columnas)} ({' + '.join(FUENTES_PELIGRO[f.fuente][0] for f in modelo.factores)})")
             print(f"   🏘️ Centros poblados: Incluidos")
             print("="*80 + "\n")
             return ruta_guardado_final
@@ -1144,3 +1392,63 @@ def generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distri
         traceback.print_exc()
         plt.close(fig)
         return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# 🌧️ SERIE DE ESCENARIOS DE PP MÁXIMA (TR 2..500 AÑOS)
+# ═══════════════════════════════════════════════════════════════════════════
+def generar_serie_escenarios(nombre_usuario, departamento_sel, provincia_sel, distrito_sel, modelo=None,
+                             escenarios=None, **opciones):
+    """
+    Un mapa por periodo de retorno de la PP máxima. Entre escenarios solo cambian la capa de PP
+    máxima y el índice: las demás fuentes y factores salen de la caché de etapas del distrito.
+
+    Retorna:
+    - diccionario periodo de retorno -> ruta del mapa (None si ese escenario falló)
+    """
+    escenarios = escenarios or escenarios_ppmax_disponibles()
+    opciones.setdefault('motor', 'raster')
+    print(f"\n🌧️ Serie de escenarios de PP máxima: TR {', '.join(map(str, escenarios))} años")
+    rutas = {}
+    for tr in escenarios:
+        inicio = datetime.datetime.now()
+        rutas[tr] = generar_mapa_peligro(nombre_usuario, departamento_sel, provincia_sel, distrito_sel,
+                                         modelo=modelo, escenario=tr, **opciones)
+        segundos = (datetime.datetime.now() - inicio).total_seconds()
+        print(f"   {'✅' if rutas[tr] else '❌'} TR {tr} años: {segundos:.1f} s")
+    return rutas
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mapa de peligro de un distrito (o su serie de escenarios de PP máxima)")
+    parser.add_argument("--departamento", required=True)
+    parser.add_argument("--provincia", required=True)
+    parser.add_argument("--distrito", required=True)
+    parser.add_argument("--modelo", default=None, help="inundacion, deslizamiento o heladas")
+    parser.add_argument("--motor", default=None, choices=["overlay", "raster"],
+                        help="overlay o raster (por defecto DASH_MOTOR_PELIGRO)")
+    parser.add_argument("--escenario", type=int, default=None, help="Periodo de retorno de la PP máxima (años)")
+    parser.add_argument("--serie", action="store_true", help="Un mapa por cada escenario de PP máxima")
+    parser.add_argument("--escenarios", default=None,
+                        help=f"Periodos de retorno de la serie separados por coma (por defecto los disponibles de "
+                             f"{', '.join(map(str, ESCENARIOS_PPMAX))})")
+    parser.add_argument("--usuario", default="LOTE", help="Carpeta de usuario donde se guardan los mapas")
+    args = parser.parse_args(argv)
+
+    if args.serie or args.escenarios:
+        escenarios = [int(v) for v in args.escenarios.split(',') if v.strip()] if args.escenarios else None
+        rutas = generar_serie_escenarios(args.usuario, args.departamento, args.provincia, args.distrito,
+                                         modelo=args.modelo, escenarios=escenarios, motor=args.motor or 'raster')
+        return 0 if rutas and all(rutas.values()) else 2
+
+    ruta = generar_mapa_peligro(args.usuario, args.departamento, args.provincia, args.distrito, motor=args.motor,
+                                modelo=args.modelo, escenario=args.escenario)
+    return 0 if ruta else 2
+
+
+if __name__ == '__main__':
+    import sys
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.exit(main())
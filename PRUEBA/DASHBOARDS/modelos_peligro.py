@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+🧭 modelos_peligro.py - REGISTRO DE MODELOS DE PELIGRO MULTICRITERIO
+- Cada tipo de peligro (inundación, deslizamiento, heladas) se declara como un ModeloPeligro:
+  factores, ponderación, límites de clase, etiquetas, colores y textos del mapa
+- Un factor nombra una fuente compartida ('pendiente', 'rios', ...) y la columna de peso que aporta.
+  Si la fuente entrega clases (CLASE), el modelo declara el peso de cada clase: la misma pendiente
+  pesa distinto para una inundación que para un deslizamiento
+- Las fuentes las carga una sola vez por distrito el pipeline común (mapa_peligro.capa_fuente), así
+  que la pendiente o la distancia a ríos se reutilizan entre tipos de peligro
+- Agregar un peligro es declarar un modelo aquí (y, si hace falta, una fuente nueva en mapa_peligro)
+"""
+
+from collections import namedtuple
+
+from peligro_raster import COLUMNAS_PESO, MATRIZ_AHP, pesos_ahp
+
+# fuente: clave de la fuente compartida; columna: columna de peso que entra al índice;
+# clases: {CLASE: peso} para fuentes clasificadas (None si la fuente ya trae la columna de peso)
+Factor = namedtuple("Factor", ["fuente", "columna", "clases"])
+
+ModeloPeligro = namedtuple("ModeloPeligro", [
+    "clave", "nombre", "titulo", "leyenda", "factores", "esquemas", "rangos", "etiquetas", "colores",
+])
+
+RANGOS_1_5 = [1.00, 2.00, 3.00, 4.00, 5.00]
+ETIQUETAS_NIVELES = ['Baja', 'Media', 'Alta', 'Muy Alta']
+COLORES_NIVELES = ['#00FF00', '#FFFF00', '#FFA500', '#FF0000']
+
+# Límites (m s.n.m.) entre las clases de altitud de la fuente 'altitud'
+CORTES_ALTITUD = [3000, 3500, 4000, 4500]
+
+
+def _esquemas(columnas, matriz_ahp=None, **propios):
+    """Promedio simple, AHP (si hay matriz de comparación) y esquemas propios del modelo"""
+    esquemas = {'igual': ("Promedio simple", {c: 1.0 / len(columnas) for c in columnas})}
+    if matriz_ahp is not None:
+        pesos, rc = pesos_ahp(matriz_ahp, columnas)
+        esquemas['ahp'] = (f"AHP (RC = {rc:.2f})", pesos)
+    for clave, (etiqueta, pesos) in propios.items():
+        esquemas[clave] = (etiqueta, pesos)
+    return esquemas
+
+
+MODELOS_PELIGRO = {
+    'inundacion': ModeloPeligro(
+        clave='inundacion',
+        nombre="Inundación",
+        titulo="MAPA DE SUSCEPTIBILIDAD ANTE INUNDACIONES",
+        leyenda="SUSCEPTIBILIDAD:",
+        factores=[
+            Factor('pendiente', 'PESO_PENDI', None),
+            Factor('geomorfologia', 'PESO_GEOMO', None),
+            Factor('ppmax', 'PESO_PPMAX', None),
+            Factor('rios', 'PESO_RIO', None),
+            Factor('geologia', 'PESO_GEOL', None),
+        ],
+        esquemas=_esquemas(COLUMNAS_PESO, MATRIZ_AHP),
+        rangos=RANGOS_1_5,
+        etiquetas=ETIQUETAS_NIVELES,
+        colores=COLORES_NIVELES,
+    ),
+    # Deslizamientos: a más pendiente más peso; la cercanía a ríos no interviene
+    'deslizamiento': ModeloPeligro(
+        clave='deslizamiento',
+        nombre="Deslizamiento",
+        titulo="MAPA DE SUSCEPTIBILIDAD ANTE DESLIZAMIENTOS",
+        leyenda="SUSCEPTIBILIDAD:",
+        factores=[
+            Factor('pendiente', 'PESO_PENDI', {1: 1, 2: 2, 3: 3, 4: 4, 5: 5}),
+            Factor('geomorfologia', 'PESO_GEOMO', None),
+            Factor('geologia', 'PESO_GEOL', None),
+            Factor('ppmax', 'PESO_PPMAX', None),
+        ],
+        esquemas=_esquemas(
+            ['PESO_PENDI', 'PESO_GEOMO', 'PESO_GEOL', 'PESO_PPMAX'],
+            [
+                [1,   2,   2,   3],
+                [1/2, 1,   1,   2],
+                [1/2, 1,   1,   2],
+                [1/3, 1/2, 1/2, 1],
+            ]),
+        rangos=RANGOS_1_5,
+        etiquetas=ETIQUETAS_NIVELES,
+        colores=COLORES_NIVELES,
+    ),
+    # Heladas: domina la altitud; en terreno plano (fondos de valle) se estanca el aire frío
+    'heladas': ModeloPeligro(
+        clave='heladas',
+        nombre="Heladas",
+        titulo="MAPA DE SUSCEPTIBILIDAD ANTE HELADAS",
+        leyenda="SUSCEPTIBILIDAD:",
+        factores=[
+            Factor('altitud', 'PESO_ALTIT', {1: 1, 2: 2, 3: 3, 4: 4, 5: 5}),
+            Factor('pendiente', 'PESO_PENDI', {1: 5, 2: 4, 3: 3, 4: 2, 5: 1}),
+        ],
+        esquemas=_esquemas(
+            ['PESO_ALTIT', 'PESO_PENDI'], None,
+            altitud=("Altitud 3:1", {'PESO_ALTIT': 0.75, 'PESO_PENDI': 0.25})),
+        rangos=RANGOS_1_5,
+        etiquetas=ETIQUETAS_NIVELES,
+        colores=COLORES_NIVELES,
+    ),
+}
+
+MODELO_POR_DEFECTO = 'inundacion'
+
+
+def obtener_modelo(clave=None):
+    """Modelo registrado (por defecto inundación; un ModeloPeligro pasa tal cual); ValueError si la clave no existe"""
+    if isinstance(clave, ModeloPeligro):
+        return clave
+    clave = clave or MODELO_POR_DEFECTO
+    if clave not in MODELOS_PELIGRO:
+        raise ValueError(f"Modelo de peligro desconocido: {clave} (opciones: {', '.join(MODELOS_PELIGRO)})")
+    return MODELOS_PELIGRO[clave]
+
+
+def columnas_modelo(modelo):
+    return [f.columna for f in modelo.factores]
+
+
+def pesos_modelo(modelo, pesos=None):
+    """
+    Ponderación del modelo: None usa el primer esquema propio del modelo (o el promedio simple),
+    un texto nombra un esquema del modelo, y un diccionario o lista se usa tal cual.
+    """
+    if pesos is None:
+        propios = [c for c in modelo.esquemas if c not in ('igual', 'ahp')]
+        pesos = propios[0] if propios else 'igual'
+    if isinstance(pesos, str):
+        if pesos not in modelo.esquemas:
+            raise ValueError(f"El modelo {modelo.nombre} no tiene el esquema de pesos '{pesos}'")
+        return modelo.esquemas[pesos][1]
+    return pesos
+
+
+def firma_modelo(modelo):
+    """Texto estable con lo que cambia el cubo de pesos del modelo (factores y pesos por clase)"""
+    partes = [f"{f.fuente}:{f.columna}:{sorted(f.clases.items()) if f.clases else ''}" for f in modelo.factores]
+    if any(f.fuente == 'altitud' for f in modelo.factores):
+        partes.append(f"altitud:{CORTES_ALTITUD}")
+    return f"{modelo.clave}|" + "|".join(partes)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+🧩 overlay_paralelo.py - INTERSECCIÓN ENCADENADA DE CAPAS DE PESO, PARTICIONADA Y EN VARIOS NÚCLEOS
+- Antes de intersectar, cada capa se reduce a su columna PESO_* y la geometría: los nombres no se
+  repiten entre capas y el resultado no lleva sufijos _1/_2
+- El distrito se divide en una grilla de teselas; para cada tesela se toman de cada capa solo los
+  polígonos que la tocan (consulta al STRtree de la capa) y se recortan a la tesela
+- La cadena de gpd.overlay de cada tesela corre en un pool de procesos; las capas viajan una sola
+  vez a cada proceso (initargs) y a cada tarea solo se le mandan índices
+- Los procesos se crean con forkserver (spawn donde no existe), nunca con fork: el dashboard, el
+  trabajador de render y el DAG tienen varios hilos y un hijo de fork puede heredar un lock tomado
+- Al unir las teselas, los pedazos cortados por una costura se disuelven por atributos iguales
+- Con un solo proceso (o capas pequeñas) se hace la cadena secuencial de siempre
+
+Configuración:
+    DASH_PROCESOS_OVERLAY=0      (0 = núcleos asignados por el planificador al trabajo)
+    DASH_TESELAS_POR_PROCESO=4   (más teselas que procesos para repartir bien la carga)
+    DASH_MIN_POLIGONOS_PARALELO=2000
+"""
+
+import os
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from progreso import verificar_cancelacion
+
+PROCESOS_OVERLAY = int(os.environ.get("DASH_PROCESOS_OVERLAY", "0"))
+TESELAS_POR_PROCESO = int(os.environ.get("DASH_TESELAS_POR_PROCESO", "4"))
+MIN_POLIGONOS_PARALELO = int(os.environ.get("DASH_MIN_POLIGONOS_PARALELO", "2000"))
+TOLERANCIA_COSTURA = 1e-3   # en unidades del CRS (metros en EPSG:3857)
+
+# Capas del proceso hijo (las deja _inicializar_trabajador)
+_CAPAS_TRABAJADOR = None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PREPARACIÓN
+# ════════════════════════════════════════════════════════════════════════
+def podar_columnas(capas, columnas):
+    """Cada capa reducida a su columna de peso y la geometría, en el orden de 'columnas'"""
+    return [capas[c][[c, capas[c].geometry.name]] for c in columnas]
+
+
+def teselas_distrito(limite, n_teselas):
+    """Cajas de una grilla regular sobre el límite (solo las que lo tocan)"""
+    from shapely.geometry import box
+
+    minx, miny, maxx, maxy = limite.bounds
+    ancho, alto = maxx - minx, maxy - miny
+    lado = math.sqrt(ancho * alto / max(1, n_teselas)) or max(ancho, alto) or 1.0
+    columnas = max(1, math.ceil(ancho / lado))
+    filas = max(1, math.ceil(alto / lado))
+    paso_x, paso_y = ancho / columnas, alto / filas
+    cajas = []
+    for i in range(filas):
+        for j in range(columnas):
+            caja = box(minx + j * paso_x, miny + i * paso_y,
+                       minx + (j + 1) * paso_x, miny + (i + 1) * paso_y)
+            if caja.intersects(limite):
+                cajas.append(caja)
+    return cajas
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CADENA DE INTERSECCIONES
+# ════════════════════════════════════════════════════════════════════════
+def cadena_vacia(capas):
+    """Resultado vacío de la cadena: con las columnas de todas las capas, como si se hubiera intersectado"""
+    import geopandas as gpd
+
+    columnas = []
+    for capa in capas:
+        columnas += [c for c in capa.columns if c != capa.geometry.name and c not in columnas]
+    return gpd.GeoDataFrame(columns=columnas + ['geometry'], geometry='geometry', crs=capas[0].crs)
+
+
+def cadena_overlay(capas, avisar=False):
+    """gpd.overlay encadenado sobre una lista de GeoDataFrames (se corta en cuanto queda vacío)"""
+    import geopandas as gpd
+
+    resultado = capas[0]
+    for i, capa in enumerate(capas[1:], start=1):
+        if resultado.empty or capa.empty:
+            return cadena_vacia(capas)
+        if avisar:
+            print(f"   [{i}/{len(capas)}] Intersectando con {capa.columns[0]}...")
+        resultado = gpd.overlay(resultado, capa, how='intersection')
+    return resultado
+
+
+def _inicializar_trabajador(capas):
+    global _CAPAS_TRABAJADOR
+    _CAPAS_TRABAJADOR = capas
+    for capa in capas:
+        capa.sindex   # el STRtree no viaja con la capa: se construye una vez por proceso
+
+
+def _superponer_tesela(caja, indices):
+    """Recorta a la tesela los polígonos preseleccionados de cada capa y los intersecta"""
+    import geopandas as gpd
+
+    partes = [gpd.clip(capa.iloc[idx], caja, keep_geom_type=True) for capa, idx in zip(_CAPAS_TRABAJADOR, indices)]
+    return cadena_overlay(partes)
+
+
+def _disolver_costuras(gdf, cajas, columnas):
+    """Une los pedazos que una costura entre teselas separó (mismos pesos y en contacto con la costura)"""
+    import pandas as pd
+    import geopandas as gpd
+    from shapely.ops import unary_union
+
+    costuras = unary_union([c.boundary for c in cajas]).buffer(TOLERANCIA_COSTURA)
+    en_costura = np.zeros(len(gdf), dtype=bool)
+    en_costura[gdf.sindex.query(costuras, predicate='intersects')] = True
+    if not en_costura.any():
+        return gdf
+    unidos = gdf[en_costura].dissolve(by=columnas, as_index=False).explode(index_parts=False)
+    return gpd.GeoDataFrame(pd.concat([gdf[~en_costura], unidos], ignore_index=True),
+                            geometry='geometry', crs=gdf.crs)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# OVERLAY PARALELO
+# ════════════════════════════════════════════════════════════════════════
+def contexto_procesos(precargar=()):
+    """
+    Contexto de multiprocessing para los pools de este módulo y de peligro_regional: forkserver
+    (o spawn) en lugar de fork, porque los procesos que los crean tienen varios hilos.
+    `precargar`: módulos que el servidor de procesos importa una vez (los hijos los heredan listos).
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context("forkserver")
+        contexto.set_forkserver_preload(list(precargar))
+        return contexto
+    return multiprocessing.get_context("spawn")
+
+
+def procesos_por_defecto():
+    if PROCESOS_OVERLAY > 0:
+        return PROCESOS_OVERLAY
+    from planificador import nucleos_asignados
+    return max(1, nucleos_asignados())
+
+
+def superponer_capas(capas, columnas, limite=None, procesos=None):
+    """
+    Intersección de las capas de peso, en paralelo por teselas si vale la pena.
+
+    Parámetros:
+    - capas: diccionario columna de peso -> GeoDataFrame (mismo CRS)
+    - columnas: columnas de peso en el orden de la cadena
+    - limite: geometría que cubre las capas (por defecto la extensión conjunta)
+    - procesos: procesos del pool (por defecto DASH_PROCESOS_OVERLAY o los núcleos asignados)
+
+    Retorna:
+    - GeoDataFrame con una columna por peso y la geometría
+    """
+    import pandas as pd
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    podadas = podar_columnas(capas, columnas)
+    procesos = procesos or procesos_por_defecto()
+    total = sum(len(c) for c in podadas)
+    if procesos <= 1 or total < MIN_POLIGONOS_PARALELO:
+        return cadena_overlay(podadas, avisar=True)
+
+    if limite is None:
+        extension = podadas[0].total_bounds
+        limite = box(*extension)
+    cajas = teselas_distrito(limite, procesos * TESELAS_POR_PROCESO)
+    print(f"   🧩 Overlay en {len(cajas)} teselas con {procesos} procesos ({total:,} polígonos de entrada)")
+
+    # Preselección con el STRtree de cada capa (se construye una vez por capa)
+    tareas = []
+    for caja in cajas:
+        indices = [capa.sindex.query(caja, predicate='intersects') for capa in podadas]
+        if all(len(idx) for idx in indices):
+            tareas.append((caja, indices))
+
+    resultados = []
+    contexto = contexto_procesos(["geopandas", "overlay_paralelo"])
+    with ProcessPoolExecutor(max_workers=min(procesos, max(1, len(tareas))), mp_context=contexto,
+                             initializer=_inicializar_trabajador, initargs=(podadas,)) as pool:
+        futuros = [pool.submit(_superponer_tesela, caja, indices) for caja, indices in tareas]
+        for i, futuro in enumerate(as_completed(futuros), start=1):
+            parcial = futuro.result()
+            if not parcial.empty:
+                resultados.append(parcial)
+            if i % max(1, len(futuros) // 10) == 0:
+                print(f"      {i}/{len(futuros)} teselas")
+            try:
+                verificar_cancelacion()
+            except BaseException:
+                for f in futuros:
+                    f.cancel()
+                raise
+
+    if not resultados:
+        return cadena_vacia(podadas)
+    unido = gpd.GeoDataFrame(pd.concat(resultados, ignore_index=True), geometry='geometry', crs=podadas[0].crs)
+    return _disolver_costuras(unido, cajas, columnas).reset_index(drop=True)
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+"""
+📚 paquete_distrito.py - PAQUETE COMPLETO DE MAPAS DE UN DISTRITO EN UNA SOLA PASADA
+- Prepara UNA sola vez el contexto del distrito: capas base, recortes de ríos y vías,
+  bbox_main, imagen satelital, mapas de ubicación y membrete
+- Sobre ese mismo lienzo dibuja cada capa temática con las funciones de capas_tematicas (las
+  mismas de los generadores), guarda la página y la retira
+- Salida: PDF de varias páginas y/o ZIP con un PNG por mapa, publicados con almacenamiento.guardar_archivo
+  (local o S3) desde una carpeta de trabajo del usuario
+- Opción --comparar: mide el paquete contra las 7 ejecuciones separadas de los generadores,
+  cada medición en un proceso nuevo (caché fría)
+
+Ejemplo:
+    python paquete_distrito.py CUSCO ANTA LIMATAMBO --usuario DEMO --formatos pdf,zip --comparar
+"""
+
+import os
+import sys
+import time
+import zipfile
+import argparse
+import datetime
+
+import geopandas as gpd
+import matplotlib
+import matplotlib.pyplot as plt
+import contextily as ctx
+from matplotlib_scalebar.scalebar import ScaleBar
+from matplotlib.backends.backend_pdf import PdfPages
+from shapely.geometry import box
+from matplotlib.patches import Rectangle
+
+import capas_tematicas as ct
+from capas_cache import cargar_shapefile_cacheado, leer_capa
+from almacenamiento import guardar_archivo
+from espacio_trabajo import espacio_trabajo
+from geografica_final import (add_north_arrow_blanco_completo, calculate_numeric_scale,
+                              grillado_utm_proyectado, mapa_ubicacion, cargar_rios, cargar_vias)
+from geomorfologia_final import cargar_geomorfologia, generar_paleta_geomorfologia
+from climatica_final import cargar_clasificacion_climatica, generar_paleta_climatica
+from geologia_final import cargar_geologia, generar_paleta_geologia
+from pendientes_final import cargar_y_recortar_raster
+from pendientes_dem import raster_pendientes
+from poblacion_final import cargar_centros_poblados
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 📦 CONTEXTO DEL DISTRITO (SE PREPARA UNA SOLA VEZ)
+# ════════════════════════════════════════════════════════════════════════
+def calcular_bbox_main(gdf_distrito, buffer_factor=0.15, aspect_ratio_objetivo=1.21):
+    """Mismo bbox con proporción fija que usan todos los generadores"""
+    minx, miny, maxx, maxy = gdf_distrito.total_bounds
+    buffer_x = (maxx - minx) * buffer_factor
+    buffer_y = (maxy - miny) * buffer_factor
+    bbox_temp = (minx - buffer_x, miny - buffer_y, maxx + buffer_x, maxy + buffer_y)
+
+    cx = (bbox_temp[0] + bbox_temp[2]) / 2
+    cy = (bbox_temp[1] + bbox_temp[3]) / 2
+    ancho_actual = bbox_temp[2] - bbox_temp[0]
+    alto_actual = bbox_temp[3] - bbox_temp[1]
+
+    if (ancho_actual / alto_actual) > aspect_ratio_objetivo:
+        nuevo_alto = ancho_actual / aspect_ratio_objetivo
+        return (bbox_temp[0], cy - nuevo_alto/2, bbox_temp[2], cy + nuevo_alto/2)
+    nuevo_ancho = alto_actual * aspect_ratio_objetivo
+    return (cx - nuevo_ancho/2, bbox_temp[1], cx + nuevo_ancho/2, bbox_temp[3])
+
+
+def preparar_contexto_distrito(departamento_sel, provincia_sel, distrito_sel):
+    """
+    Carga y recorta todo lo que comparten los mapas temáticos.
+    Retorna un diccionario con las capas, el bbox y la imagen satelital, o None si falla.
+    """
+    print("\n📦 Preparando contexto del distrito...")
+    gdf_departamentos = cargar_shapefile_cacheado("departamento", "Departamentos")
+    gdf_provincias = cargar_shapefile_cacheado("provincia", "Provincias")
+    gdf_distritos = cargar_shapefile_cacheado("distrito", "Distritos del Perú")
+
+    if gdf_departamentos is None or gdf_provincias is None or gdf_distritos is None:
+        print("❌ Faltan capas base (departamento, provincia o distrito). Abortando.")
+        return None
+
+    try:
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
+    except Exception as e:
+        print(f"❌ Error cargando shapefiles de Países u Océano: {e}")
+        gdf_paises = None
+        gdf_oceano = None
+
+    col_dpto = next((c for c in ['NOMBDEP', 'DEPARTAMEN'] if c in gdf_departamentos.columns), None)
+    col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf_provincias.columns), None)
+    col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
+
+    if not all([col_dpto, col_prov, col_distr]):
+        print("❌ No se pudieron identificar las columnas de nombres en los shapefiles")
+        return None
+
+    gdf_distrito = gdf_distritos[(gdf_distritos[col_distr] == distrito_sel) & (gdf_distritos[col_prov] == provincia_sel)]
+    if gdf_distrito.empty:
+        print(f"❌ Error: No se pudo encontrar la geometría para el distrito '{distrito_sel}'.")
+        return None
+
+    bbox_main = calcular_bbox_main(gdf_distrito)
+    area_mapa = box(*bbox_main)
+
+    # Ríos y vías se recortan una vez y los usan ubicación, vías y centros poblados
+    gdf_rios_clip, vias_clip = ct.recortar_rios_vias(cargar_rios(), cargar_vias(), area_mapa)
+
+    # Imagen satelital: se descarga una vez y se reutiliza en todas las páginas
+    print("   📡 Descargando imagen satelital (una sola vez)...")
+    basemap = None
+    try:
+        basemap = ctx.bounds2img(*bbox_main, zoom='auto', source=ctx.providers.Esri.WorldImagery)
+    except Exception as e:
+        print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
+
+    return {
+        'departamento': departamento_sel,
+        'provincia': provincia_sel,
+        'distrito': distrito_sel,
+        'gdf_departamentos': gdf_departamentos,
+        'gdf_provincias': gdf_provincias,
+        'gdf_paises': gdf_paises,
+        'gdf_oceano': gdf_oceano,
+        'gdf_dpto_sel': gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel],
+        'gdf_prov_sel': gdf_provincias[gdf_provincias[col_prov] == provincia_sel],
+        'gdf_distrito': gdf_distrito,
+        'gdf_distritos_en_provincia': gdf_distritos[gdf_distritos[col_prov] == provincia_sel],
+        'col_dpto': col_dpto,
+        'col_prov': col_prov,
+        'bbox_main': bbox_main,
+        'rios': gdf_rios_clip,
+        'vias': vias_clip,
+        'basemap': basemap,
+    }
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 🎨 LIENZO COMPARTIDO (TÍTULO, MAPA PRINCIPAL, MEMBRETE, LEYENDA, UBICACIÓN)
+# ════════════════════════════════════════════════════════════════════════
+def dibujar_membrete(ax, titulo_mapa, contexto, escala_numerica):
+    """Mismo membrete de los generadores; solo cambia el texto de 'MAPA:'"""
+    dist = contexto['distrito']
+    ax.cla()
+    ax.set_xlim(0, 10); ax.set_ylim(0, 4); ax.axis('off')
+    ax.add_patch(Rectangle((0, 0), 10, 4, fill=False, edgecolor='black', lw=1.2))
+    ax.plot([0, 10], [3, 3], color='black', lw=1.2); ax.plot([0, 7.5], [1.5, 1.5], color='black', lw=1.2)
+    ax.plot([2.5, 2.5], [1.5, 3], color='black', lw=1.2); ax.plot([5, 5], [0, 3], color='black', lw=1.2)
+    ax.plot([7.5, 7.5], [0, 3], color='black', lw=1.2)
+    padding = 0.15
+    ax.text(0 + padding, 3.5, "MAPA:", fontweight='bold', va='center', fontsize=8)
+    ax.text(1.8 + padding, 3.5, f"{titulo_mapa}: DISTRITO DE {dist.upper()}", va='center', fontsize=8)
+    ax.text(0 + padding, 2.6, "DPTO:", fontweight='bold', va='center', fontsize=8)
+    ax.text(0 + padding, 2.0, contexto['departamento'].upper(), va='center', fontsize=8)
+    ax.text(2.5 + padding, 2.6, "PROVINCIA:", fontweight='bold', va='center', fontsize=8)
+    ax.text(2.5 + padding, 2.0, contexto['provincia'].upper(), va='center', fontsize=8)
+    ax.text(5 + padding, 2.6, "DISTRITO:", fontweight='bold', va='center', fontsize=8)
+    ax.text(5 + padding, 2.0, dist.upper(), va='center', fontsize=8)
+    ax.text(7.5 + padding, 2.5, "MAPA N°", fontweight='bold', ha='left', va='center', fontsize=8)
+    ax.text(7.5 + padding, 0.8, "001-2025", ha='left', va='center', fontsize=10)
+    ax.text(0 + padding, 1.0, "ESCALA:", fontweight='bold', va='center', fontsize=8)
+    ax.text(0 + padding, 0.5, escala_numerica, va='center', fontsize=8)
+    ax.text(5 + padding, 1.0, "FECHA:", fontweight='bold', va='center', fontsize=8)
+    ax.text(5 + padding, 0.5, datetime.date.today().strftime("%d / %m / %Y"), va='center', fontsize=8)
+
+
+def crear_lienzo(contexto):
+    """Arma la figura con todo lo que no cambia entre mapas temáticos"""
+    bbox_main = contexto['bbox_main']
+
+    fig = plt.figure(figsize=(14, 9.9))
+    grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
+    gs_izquierda = grid[0, 0].subgridspec(3, 1, height_ratios=[0.08, 3.5, 0.42], hspace=0.08)
+
+    ax_titulo = fig.add_subplot(gs_izquierda[0])
+    texto_titulo = ax_titulo.text(0.5, 0.5, "", ha='center', va='center', fontsize=12, fontweight="normal",
+                                  bbox=dict(boxstyle='square,pad=0.5', facecolor='white', edgecolor='black',
+                                            linewidth=1.5, alpha=0.95))
+    ax_titulo.axis('off')
+
+    ax_main = fig.add_subplot(gs_izquierda[1])
+    ax_main.set_xlim(bbox_main[0], bbox_main[2])
+    ax_main.set_ylim(bbox_main[1], bbox_main[3])
+    ax_main.set_aspect('equal', adjustable='box')
+
+    if contexto['basemap'] is not None:
+        imagen, extension = contexto['basemap']
+        ax_main.imshow(imagen, extent=extension, interpolation='bilinear', zorder=0)
+        ax_main.set_xlim(bbox_main[0], bbox_main[2])
+        ax_main.set_ylim(bbox_main[1], bbox_main[3])
+    else:
+        ax_main.set_facecolor("#e8e8e8")
+
+    grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
+    add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
+    ax_main.add_artist(ScaleBar(1, units="m", location="lower left", box_alpha=0.6, border_pad=0.5, scale_loc='bottom'))
+
+    gs_memb_ley = gs_izquierda[2].subgridspec(1, 2, wspace=0.1)
+    ax_membrete = fig.add_subplot(gs_memb_ley[0])
+    ax_leyenda = fig.add_subplot(gs_memb_ley[1])
+    ax_leyenda.axis('off')
+
+    print("   🗺️ Generando mapas de ubicación (una sola vez)...")
+    gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
+    ax_depto = fig.add_subplot(gs_ubicaciones[0])
+    ax_prov = fig.add_subplot(gs_ubicaciones[1])
+    ax_dist = fig.add_subplot(gs_ubicaciones[2])
+
+    dep, prov, dist = contexto['departamento'], contexto['provincia'], contexto['distrito']
+    mapa_ubicacion(ax_depto, contexto['gdf_paises'], contexto['gdf_departamentos'], contexto['gdf_dpto_sel'],
+                   f"DEPARTAMENTO DE\n{dep.upper()}", dep,
+                   tipo_mapa="pais", gdf_departamentos=contexto['gdf_departamentos'], gdf_oceano=contexto['gdf_oceano'])
+    mapa_ubicacion(ax_prov, contexto['gdf_departamentos'], contexto['gdf_dpto_sel'], contexto['gdf_prov_sel'],
+                   f"PROVINCIA DE\n{prov.upper()}", prov,
+                   tipo_mapa="provincia", gdf_dpto_sel=contexto['gdf_dpto_sel'], departamento_sel=dep,
+                   col_dpto=contexto['col_dpto'], gdf_departamentos=contexto['gdf_departamentos'],
+                   gdf_oceano=contexto['gdf_oceano'])
+    mapa_ubicacion(ax_dist, contexto['gdf_prov_sel'], contexto['gdf_distritos_en_provincia'], contexto['gdf_distrito'],
+                   f"DISTRITO DE\n{dist.upper()}", dist,
+                   tipo_mapa="distrito", gdf_prov_sel=contexto['gdf_prov_sel'], provincia_sel=prov,
+                   col_prov=contexto['col_prov'], gdf_provincias=contexto['gdf_provincias'],
+                   gdf_oceano=contexto['gdf_oceano'])
+
+    plt.subplots_adjust(top=0.98, bottom=0.02, left=0.02, right=0.98, hspace=0.2, wspace=0.05)
+    rect_frame = fig.add_axes([0, 0, 1, 1], frameon=False)
+    rect_frame.set_xticks([])
+    rect_frame.set_yticks([])
+    rect_frame.patch.set_visible(False)
+    for spine in rect_frame.spines.values():
+        spine.set_visible(True)
+        spine.set_linewidth(2)
+        spine.set_color('black')
+
+    # La escala numérica depende solo del bbox y del tamaño del eje: se calcula una vez
+    fig.canvas.draw()
+    escala_numerica = calculate_numeric_scale(ax_main, fig)
+
+    return {
+        'fig': fig,
+        'ax_main': ax_main,
+        'ax_membrete': ax_membrete,
+        'ax_leyenda': ax_leyenda,
+        'texto_titulo': texto_titulo,
+        'escala': escala_numerica,
+    }
+
+
+def _poner_leyenda(ax_leyenda, legend_elements, ncols, fontsize=7.5):
+    ax_leyenda.cla()
+    ax_leyenda.axis('off')
+    leg = ax_leyenda.legend(handles=legend_elements, loc='center', ncol=ncols, frameon=True, fontsize=fontsize,
+                            title="LEYENDA", title_fontproperties={'size': 10, 'weight': 'bold'},
+                            handletextpad=0.5, columnspacing=1.0, borderpad=0.7, handlelength=1.5)
+    leg.get_title().set_ha('center')
+    leg.get_frame().set_edgecolor('black')
+    leg.get_frame().set_linewidth(1.2)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 🧩 CAPAS TEMÁTICAS (EL DIBUJO ES EL DE capas_tematicas, EL MISMO DE CADA GENERADOR)
+# ════════════════════════════════════════════════════════════════════════
+def capa_geografico(contexto, ax_main):
+    return ct.capa_geografico(ax_main, contexto['gdf_distrito'], contexto['rios'], contexto['vias'])
+
+
+def capa_vias(contexto, ax_main):
+    return ct.capa_vias(ax_main, contexto['gdf_distrito'], contexto['rios'], contexto['vias'])
+
+
+def capa_centros(contexto, ax_main):
+    gdf_centros = cargar_centros_poblados()
+    gdf_centros_clip, col_cp_name = None, None
+    if gdf_centros is not None:
+        col_cp_name = next((c for c in ['NOMB_CCPP', 'NOMBCP', 'NOMB_CP', 'NOMBRE_CP', 'CENTRO_POB', 'NOMBRE']
+                            if c in gdf_centros.columns), None)
+        try:
+            gdf_centros_clip = gpd.clip(gdf_centros, contexto['gdf_distrito'])
+        except Exception as e:
+            print(f"   ❌ Error al recortar centros poblados: {e}")
+    return ct.capa_centros(ax_main, contexto['gdf_distrito'], contexto['rios'], contexto['vias'],
+                           gdf_centros_clip, col_cp_name)
+
+
+def _capa_categorica(contexto, ax_main, gdf_tema, columnas, paleta_fn, nombre_leyenda, dibujar):
+    """Geomorfología, geología y clima: recorte al distrito y dibujo compartido con su generador"""
+    tema = ct.recortar_tema(gdf_tema, contexto['gdf_distrito'], columnas)
+    if tema is None:
+        print(f"   ⚠️ No hay unidades de {nombre_leyenda.lower()} en el área del distrito")
+        return None
+    gdf_clip, columna, unidades = tema
+    return dibujar(ax_main, contexto['gdf_distrito'], gdf_clip, columna, unidades, paleta_fn(len(unidades)))
+
+
+def capa_geomorfologia(contexto, ax_main):
+    return _capa_categorica(contexto, ax_main, cargar_geomorfologia(contexto['departamento']),
+                            ['UNIDAD', 'TIPO', 'GEOMORFOLO', 'DESCRIPCI', 'SIMB', 'NOMBRE'],
+                            generar_paleta_geomorfologia, 'GEOMORFOLOGÍA', ct.capa_geomorfologia)
+
+
+def capa_geologia(contexto, ax_main):
+    return _capa_categorica(contexto, ax_main, cargar_geologia(contexto['departamento']),
+                            ['UNIDAD', 'FORMACION', 'LITOLOGIA', 'EDAD', 'SIMBOLO', 'NOMBRE',
+                             'DESCRIPCI', 'SIMB', 'ERA', 'PERIODO', 'GEOLOGIA'],
+                            generar_paleta_geologia, 'GEOLOGÍA', ct.capa_geologia)
+
+
+def capa_climatica(contexto, ax_main):
+    return _capa_categorica(contexto, ax_main, cargar_clasificacion_climatica(),
+                            ['CLIMA', 'NOMBRE_CLI', 'DESCRIP', 'TIPO', 'CLASIF', 'SIMB', 'NOMBRE'],
+                            generar_paleta_climatica, 'CLASIFICACIÓN CLIMÁTICA', ct.capa_climatica)
+
+
+def capa_pendientes(contexto, ax_main):
+    gdf_distrito = contexto['gdf_distrito']
+    ruta_pendientes = raster_pendientes(gdf_distrito)
+    if ruta_pendientes is None:
+        print("   ❌ No hay DEM ni ráster nacional de pendientes")
+        return None
+    raster_data, _, src_crs, raster_bounds = cargar_y_recortar_raster(ruta_pendientes, gdf_distrito)
+    if raster_data is None:
+        return None
+    return ct.capa_pendientes(ax_main, gdf_distrito, raster_data, src_crs, raster_bounds)
+
+
+# Misma clave que el dropdown 'map-type' de app.py -> (título, texto del membrete, prefijo, función)
+TEMAS_PAQUETE = {
+    'geografico': ("MAPA DE UBICACIÓN GEOGRÁFICA", "PLANO DE UBICACIÓN", "MAPA_UBICACION", capa_geografico),
+    'geomorfologia': ("MAPA DE GEOMORFOLOGÍA", "MAPA DE GEOMORFOLOGÍA", "MAPA_GEOMORFOLOGIA", capa_geomorfologia),
+    'climatica': ("MAPA DE CLASIFICACIÓN CLIMÁTICA", "MAPA DE CLASIFICACIÓN CLIMÁTICA", "MAPA_CLIMATICO", capa_climatica),
+    'pendientes': ("MAPA DE PENDIENTES", "MAPA DE PENDIENTES", "MAPA_PENDIENTES", capa_pendientes),
+    'vias': ("MAPA DE VÍAS", "MAPA DE VÍAS", "MAPA_VIAS", capa_vias),
+    'centros': ("MAPA DE CENTROS POBLADOS", "MAPA DE CENTROS POBLADOS", "MAPA_CENTROS_POBLADOS", capa_centros),
+    'geologia': ("MAPA GEOLÓGICO", "MAPA GEOLÓGICO", "MAPA_GEOLOGICO", capa_geologia),
+}
+
+
+# ════════════════════════════════════════════════════════════════════════
+# 🗺️ FUNCIÓN PRINCIPAL DEL PAQUETE
+# ════════════════════════════════════════════════════════════════════════
+def generar_paquete_distrito(nombre_usuario, departamento_sel, provincia_sel, distrito_sel,
+                             tipos=None, formatos=("pdf",), dpi=300):
+    """
+    Genera varios mapas temáticos de un distrito reutilizando el mismo contexto y lienzo.
+
+    Parámetros:
+    - tipos: claves de TEMAS_PAQUETE (por defecto, todas)
+    - formatos: 'pdf' (un PDF de varias páginas), 'zip' (PNG comprimidos) y/o 'png' (PNG sueltos)
+
+    Retorna:
+    - diccionario {'pdf': ref|None, 'zip': ref|None, 'paginas': {tipo: ref_png|None}, 'segundos': float}
+      (ref: ruta local o 's3://...', según el almacenamiento) o None si no se pudo preparar o publicar
+    """
+    print("\n" + "="*80)
+    print("📚 INICIANDO PAQUETE DE MAPAS DEL DISTRITO...")
+    print(f"   - Usuario: {nombre_usuario}")
+    print(f"   - Ubicación: {distrito_sel}, {provincia_sel}, {departamento_sel}")
+
+    inicio = time.time()
+    tipos = list(tipos or TEMAS_PAQUETE)
+    formatos = set(formatos)
+    carpeta_salida = os.path.join(ruta_base, "USUARIOS", nombre_usuario, "PAQUETE DISTRITAL")
+
+    contexto = preparar_contexto_distrito(departamento_sel, provincia_sel, distrito_sel)
+    if contexto is None:
+        return None
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    nombre_distrito = distrito_sel.replace(' ', '_')
+    nombre_paquete = f"PAQUETE_{nombre_distrito}_{timestamp}"
+    carpeta_png = os.path.join(carpeta_salida, nombre_paquete)
+
+    # Las páginas se escriben en una carpeta de trabajo del usuario y al final se publican en el
+    # almacenamiento configurado (local o S3), igual que los mapas de los generadores
+    with espacio_trabajo(nombre_usuario, "paquete") as carpeta_trabajo:
+        print("\n🎨 Generando lienzo compartido...")
+        lienzo = crear_lienzo(contexto)
+        fig, ax_main = lienzo['fig'], lienzo['ax_main']
+
+        # Todo lo que exista ahora en ax_main es común; lo que se agregue después es de la capa temática
+        artistas_base = set(ax_main.get_children())
+
+        ruta_pdf = os.path.join(carpeta_trabajo, f"{nombre_paquete}.pdf") if "pdf" in formatos else None
+        pdf = PdfPages(ruta_pdf) if ruta_pdf else None
+        pngs = {}
+        generadas = []
+
+        try:
+            for tipo in tipos:
+                titulo, titulo_membrete, prefijo, dibujar = TEMAS_PAQUETE[tipo]
+                print(f"\n🧩 Dibujando capa temática: {tipo}")
+                try:
+                    resultado = dibujar(contexto, ax_main)
+                except Exception as e:
+                    print(f"   ❌ Error dibujando {tipo}: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    resultado = None
+
+                if resultado is not None:
+                    legend_elements, ncols = resultado
+                    lienzo['texto_titulo'].set_text(f"{titulo} - DISTRITO DE {distrito_sel.upper()}")
+                    dibujar_membrete(lienzo['ax_membrete'], titulo_membrete, contexto, lienzo['escala'])
+                    _poner_leyenda(lienzo['ax_leyenda'], legend_elements, ncols)
+
+                    if pdf is not None:
+                        pdf.savefig(fig, bbox_inches='tight', pad_inches=0.01)
+                    if formatos & {"png", "zip"}:
+                        pngs[tipo] = os.path.join(carpeta_trabajo, f"{prefijo}_{nombre_distrito}_{timestamp}.png")
+                        fig.savefig(pngs[tipo], dpi=dpi, bbox_inches='tight', pad_inches=0.01)
+                    generadas.append(tipo)
+                    print(f"   ✅ Página lista: {titulo}")
+                else:
+                    print(f"   ⚠️ Se omite {tipo}: sin datos para este distrito")
+
+                # Retirar la capa temática y dejar el lienzo como estaba
+                for artista in set(ax_main.get_children()) - artistas_base:
+                    artista.remove()
+        finally:
+            if pdf is not None:
+                pdf.close()
+            plt.close(fig)
+
+        ruta_zip = None
+        if "zip" in formatos:
+            ruta_zip = os.path.join(carpeta_trabajo, f"{nombre_paquete}.zip")
+            with zipfile.ZipFile(ruta_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for ruta_png in pngs.values():
+                    zf.write(ruta_png, arcname=os.path.basename(ruta_png))
+
+        print("\n📦 Publicando el paquete...")
+        try:
+            ref_pdf = guardar_archivo(ruta_pdf, os.path.join(carpeta_salida, os.path.basename(ruta_pdf))) if ruta_pdf else None
+            ref_zip = guardar_archivo(ruta_zip, os.path.join(carpeta_salida, os.path.basename(ruta_zip))) if ruta_zip else None
+            paginas = {tipo: None for tipo in tipos}
+            for tipo in generadas:
+                if tipo in pngs:
+                    paginas[tipo] = guardar_archivo(pngs[tipo], os.path.join(carpeta_png, os.path.basename(pngs[tipo])))
+                else:
+                    paginas[tipo] = ref_pdf
+        except Exception as e:
+            print(f"❌ Error publicando el paquete: {e}")
+            return None
+
+    segundos = time.time() - inicio
+    print("\n" + "="*80)
+    print(f"✅ Paquete listo: {len(generadas)}/{len(tipos)} mapas en {segundos:.1f} s")
+    if ref_pdf:
+        print(f"   📄 PDF: {ref_pdf}")
+    if ref_zip:
+        print(f"   🗜️ ZIP: {ref_zip}")
+    print("="*80 + "\n")
+
+    return {'pdf': ref_pdf, 'zip': ref_zip, 'paginas': paginas, 'segundos': segundos}
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ⏱️ COMPARACIÓN CONTRA LAS EJECUCIONES SEPARADAS
+# ════════════════════════════════════════════════════════════════════════
+def _cronometrar(modulo, funcion, *args, **kwargs):
+    """Importa y ejecuta modulo.funcion en el proceso actual; retorna los segundos empleados"""
+    import importlib
+    matplotlib.use('Agg')
+    inicio = time.time()
+    getattr(importlib.import_module(modulo), funcion)(*args, **kwargs)
+    return time.time() - inicio
+
+
+def _cronometrar_en_proceso_nuevo(modulo, funcion, *args, **kwargs):
+    """
+    Mide modulo.funcion en un intérprete recién creado (spawn): sin capas en memoria ni
+    módulos importados, como una ejecución independiente desde la aplicación o la consola.
+    El tiempo incluye la importación de las librerías y la lectura de capas (caché fría).
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_cronometrar, modulo, funcion, *args, **kwargs).result()
+
+
+def comparar_tiempos(nombre_usuario, departamento_sel, provincia_sel, distrito_sel, tipos=None):
+    """Mide el paquete contra una ejecución independiente de cada generador, cada uno en su propio proceso"""
+    from lote_mapas import GENERADORES
+
+    tipos = list(tipos or TEMAS_PAQUETE)
+    argumentos = (nombre_usuario, departamento_sel, provincia_sel, distrito_sel)
+
+    tiempo_paquete = _cronometrar_en_proceso_nuevo("paquete_distrito", "generar_paquete_distrito",
+                                                   *argumentos, tipos=tipos, formatos=("png",))
+
+    tiempos_separados = {}
+    for tipo in tipos:
+        modulo, funcion = GENERADORES[tipo]
+        tiempos_separados[tipo] = _cronometrar_en_proceso_nuevo(modulo, funcion, *argumentos)
+    tiempo_separado = sum(tiempos_separados.values())
+
+    print("\n" + "="*80)
+    print("⏱️ COMPARACIÓN DE TIEMPOS")
+    print("="*80)
+    for tipo, segundos in tiempos_separados.items():
+        print(f"   - {tipo:<15} {segundos:8.1f} s")
+    print(f"   - {'TOTAL separado':<15} {tiempo_separado:8.1f} s")
+    print(f"   - {'PAQUETE':<15} {tiempo_paquete:8.1f} s")
+    if tiempo_paquete > 0:
+        print(f"   - Aceleración: x{tiempo_separado / tiempo_paquete:.2f}")
+    print("="*80 + "\n")
+
+    return {'paquete': tiempo_paquete, 'separado': tiempo_separado, 'por_tipo': tiempos_separados}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera el paquete completo de mapas de un distrito")
+    parser.add_argument("departamento")
+    parser.add_argument("provincia")
+    parser.add_argument("distrito")
+    parser.add_argument("--usuario", default="PAQUETE")
+    parser.add_argument("--tipos", default=",".join(TEMAS_PAQUETE),
+                        help=f"Tipos separados por coma ({', '.join(TEMAS_PAQUETE)})")
+    parser.add_argument("--formatos", default="pdf,zip", help="pdf, zip y/o png separados por coma")
+    parser.add_argument("--comparar", action="store_true", help="Mide el paquete contra los 7 generadores por separado")
+    args = parser.parse_args(argv)
+
+    tipos = [t.strip() for t in args.tipos.split(',') if t.strip()]
+    desconocidos = [t for t in tipos if t not in TEMAS_PAQUETE]
+    if desconocidos:
+        parser.error(f"Tipos de mapa desconocidos: {', '.join(desconocidos)}")
+
+    if args.comparar:
+        comparar_tiempos(args.usuario, args.departamento, args.provincia, args.distrito, tipos)
+        return 0
+
+    formatos = [f.strip() for f in args.formatos.split(',') if f.strip()]
+    resultado = generar_paquete_distrito(args.usuario, args.departamento, args.provincia, args.distrito,
+                                         tipos=tipos, formatos=formatos)
+    return 0 if resultado else 1
+
+
+if __name__ == '__main__':
+    matplotlib.use("Agg")
+    sys.exit(main())
@@ -0,0 +1,621 @@
+# -*- coding: utf-8 -*-
+"""
+🧮 peligro_raster.py - ÍNDICE DE PELIGRO (5 PARÁMETROS) POR SUPERPOSICIÓN PONDERADA EN RÁSTER
+- Motor 'overlay': cuatro gpd.overlay encadenados (el de siempre), repartidos por teselas en varios
+  procesos con overlay_paralelo. El número de polígonos crece multiplicativamente con cada capa
+- Motor 'raster': cada columna de peso se rasteriza sobre una grilla común del distrito (UTM),
+  PELIGRO es una suma ponderada NumPy sobre las cinco grillas, se clasifica con RANGOS_PELIGRO y
+  solo se poligonizan las clases finales (con tamizado opcional de manchas pequeñas)
+- En ambos motores una celda sin alguno de los cinco pesos queda fuera, como en la intersección
+- Ponderación configurable por factor (igual, AHP o manual); por defecto el promedio simple
+- Cubo de pesos: las cinco grillas del distrito se guardan apiladas (uint8, .npz) en caché. Con el
+  cubo en disco, cambiar la ponderación es una sola suma ponderada, sin volver a leer las capas
+
+Selección (por ejecución: argumentos 'motor' y 'pesos' de generar_mapa_peligro o variables de entorno):
+    DASH_MOTOR_PELIGRO=overlay (por defecto) | raster
+    DASH_RESOLUCION_PELIGRO_M=10      (se agranda si la grilla no cabe en DASH_MEMORIA_BLOQUES_MB)
+    DASH_TAMIZ_PELIGRO=0              (píxeles; manchas menores se absorben en la clase vecina)
+
+Comparar ambos motores en un distrito:
+    python peligro_raster.py --benchmark --departamento CUSCO --provincia ANTA --distrito ANTA
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from procesamiento_bloques import MEMORIA_BLOQUES_MB, mascara_bloque
+from progreso import etapa, verificar_cancelacion
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+MOTOR_PELIGRO = os.environ.get("DASH_MOTOR_PELIGRO", "overlay").lower()
+RESOLUCION_PELIGRO_M = float(os.environ.get("DASH_RESOLUCION_PELIGRO_M", "10"))
+TAMIZ_PELIGRO = int(os.environ.get("DASH_TAMIZ_PELIGRO", "0"))
+RUTA_CUBOS_PELIGRO = f"{ruta_base}/DATA/PELIGRO/CUBOS"
+
+# Columnas de peso en el orden de la intersección encadenada (y de las bandas del cubo)
+COLUMNAS_PESO = ['PESO_PENDI', 'PESO_GEOMO', 'PESO_PPMAX', 'PESO_RIO', 'PESO_GEOL']
+NOMBRES_PESO = {
+    'PESO_PENDI': "Pendiente",
+    'PESO_GEOMO': "Geomorfología",
+    'PESO_PPMAX': "PP Máxima",
+    'PESO_RIO': "Distancia a Ríos",
+    'PESO_GEOL': "Geología",
+    'PESO_ALTIT': "Altitud",
+}
+
+BYTES_POR_CELDA = 18      # cubo uint8 x5 + suma float32 + peso float32 + clases + temporales
+SIN_CLASE = 0
+ESCALA_CUBO = 50          # el cubo guarda round(peso * 50): 1..5 -> 50..250, precisión de 0.02
+MAX_CUBOS_MEMORIA = 4
+
+# Comparación por pares (escala de Saaty) en el orden de COLUMNAS_PESO: para inundación pesan
+# más la precipitación y la cercanía a ríos, luego la pendiente, la geomorfología y la geología
+MATRIZ_AHP = [
+    [1,   2,   1/2, 1/2, 3],
+    [1/2, 1,   1/3, 1/3, 2],
+    [2,   3,   1,   1,   4],
+    [2,   3,   1,   1,   4],
+    [1/3, 1/2, 1/4, 1/4, 1],
+]
+# Índice aleatorio de Saaty por tamaño de matriz (para la razón de consistencia)
+INDICE_ALEATORIO = {1: 0.0, 2: 0.0, 3: 0.58, 4: 0.90, 5: 1.12, 6: 1.24, 7: 1.32, 8: 1.41, 9: 1.45}
+
+_CUBOS = OrderedDict()
+_BLOQUEO = threading.Lock()
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PONDERACIÓN DE LOS FACTORES
+# ════════════════════════════════════════════════════════════════════════
+def pesos_ahp(matriz, columnas=None):
+    """
+    Pesos AHP: vector propio principal de la matriz de comparación por pares (filas en el orden de
+    'columnas', por defecto COLUMNAS_PESO).
+
+    Retorna:
+    - (diccionario columna -> peso que suma 1, razón de consistencia; aceptable si < 0.10)
+    """
+    a = np.asarray(matriz, dtype=float)
+    n = a.shape[0]
+    valores, vectores = np.linalg.eig(a)
+    i = int(np.argmax(valores.real))
+    w = np.abs(vectores[:, i].real)
+    w = w / w.sum()
+    ic = (valores[i].real - n) / (n - 1) if n > 1 else 0.0
+    rc = ic / INDICE_ALEATORIO[n] if INDICE_ALEATORIO.get(n) else 0.0
+    return dict(zip(columnas or COLUMNAS_PESO, (float(x) for x in w))), float(rc)
+
+
+PESOS_IGUALES = {c: 1.0 / len(COLUMNAS_PESO) for c in COLUMNAS_PESO}
+PESOS_AHP, CONSISTENCIA_AHP = pesos_ahp(MATRIZ_AHP)
+ESQUEMAS_PESOS = {
+    'igual': ("Promedio simple (1/5 cada factor)", PESOS_IGUALES),
+    'ahp': (f"AHP inundación (RC = {CONSISTENCIA_AHP:.2f})", PESOS_AHP),
+}
+
+
+def normalizar_pesos(pesos=None, columnas=None):
+    """
+    Vector de pesos en el orden de 'columnas' (por defecto COLUMNAS_PESO) que suma 1.
+
+    Parámetros:
+    - pesos: None (promedio simple), nombre de ESQUEMAS_PESOS (solo con COLUMNAS_PESO), diccionario
+      columna -> peso o lista con un peso por columna
+
+    Lanza ValueError si hay pesos negativos o todos son cero.
+    """
+    columnas = list(columnas or COLUMNAS_PESO)
+    if pesos is None:
+        pesos = [1.0] * len(columnas)
+    if isinstance(pesos, str):
+        if pesos not in ESQUEMAS_PESOS or columnas != COLUMNAS_PESO:
+            raise ValueError(f"Esquema de pesos desconocido: {pesos}")
+        pesos = ESQUEMAS_PESOS[pesos][1]
+    if isinstance(pesos, dict):
+        pesos = [pesos.get(c, 0) for c in columnas]
+    w = np.asarray([float(p or 0) for p in pesos], dtype=np.float64)
+    if w.shape != (len(columnas),):
+        raise ValueError(f"Se esperaban {len(columnas)} pesos, llegaron {w.size}")
+    if (w < 0).any() or w.sum() <= 0:
+        raise ValueError("Los pesos deben ser no negativos y no todos cero")
+    return w / w.sum()
+
+
+def describir_pesos(w, columnas=None):
+    return ", ".join(f"{NOMBRES_PESO.get(c, c)} {p:.2f}" for c, p in zip(columnas or COLUMNAS_PESO, w))
+
+
+# ════════════════════════════════════════════════════════════════════════
+# MOTOR OVERLAY (INTERSECCIÓN ENCADENADA)
+# ════════════════════════════════════════════════════════════════════════
+def peligro_overlay(capas, pesos=None, limite=None, procesos=None):
+    """
+    Intersección encadenada de las capas y PELIGRO = suma ponderada de los cinco pesos.
+
+    Parámetros:
+    - capas: diccionario columna de peso -> GeoDataFrame recortado al distrito (mismo CRS), en el
+      orden de los factores
+    - pesos: ponderación de los factores (ver normalizar_pesos); por defecto el promedio simple
+    - limite, procesos: partición y pool del overlay paralelo (ver overlay_paralelo.superponer_capas)
+
+    Retorna:
+    - GeoDataFrame con las columnas de peso y PELIGRO
+    """
+    from overlay_paralelo import superponer_capas
+
+    # Las capas llegan podadas a su columna PESO_*: no hay sufijos que buscar tras la intersección
+    columnas = list(capas)
+    gdf = superponer_capas(capas, columnas, limite=limite, procesos=procesos)
+    verificar_cancelacion()
+
+    print(f"   [{len(columnas)}/{len(columnas)}] Calculando índice de peligro...")
+    w = normalizar_pesos(pesos, columnas)
+    gdf['PELIGRO'] = sum(p * gdf[c] for c, p in zip(columnas, w))
+    return gdf
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CUBO DE PESOS (5 BANDAS UINT8 SOBRE LA GRILLA DEL DISTRITO)
+# ════════════════════════════════════════════════════════════════════════
+def grilla_peligro(limite_geom, resolucion=None, memoria_mb=None):
+    """Grilla sobre el límite; la resolución se agranda lo necesario para respetar el techo de memoria"""
+    from distancia_rios import grilla_limite
+
+    resolucion = resolucion or RESOLUCION_PELIGRO_M
+    techo = (memoria_mb or MEMORIA_BLOQUES_MB) * 1024 * 1024
+    minx, miny, maxx, maxy = limite_geom.bounds
+    celdas = (maxx - minx) * (maxy - miny) / resolucion ** 2
+    if celdas * BYTES_POR_CELDA > techo:
+        nueva = math.ceil(math.sqrt((maxx - minx) * (maxy - miny) * BYTES_POR_CELDA / techo))
+        print(f"   🧮 Grilla de {resolucion:g} m no cabe en {techo / 1024**2:.0f} MB: se usa {nueva:g} m")
+        resolucion = nueva
+    return grilla_limite(limite_geom, resolucion)
+
+
+def cubo_pesos(capas, gdf_distrito, resolucion=None):
+    """
+    Rasteriza los pesos del distrito (una banda por capa, en el orden de 'capas') sobre una grilla
+    común en su zona UTM.
+
+    Retorna:
+    - (cubo uint8 de forma (factores, filas, columnas) con SIN_CLASE fuera del límite o sin dato,
+      transform, crs, columnas de peso de las bandas)
+    """
+    from rasterio.features import rasterize
+
+    crs_local = gdf_distrito.estimate_utm_crs()
+    limite = gdf_distrito.to_crs(crs_local).geometry.union_all()
+    transform, forma = grilla_peligro(limite, resolucion)
+    print(f"   🧮 Grilla común: {forma[1]} x {forma[0]} celdas de {abs(transform.a):g} m")
+
+    fuera = ~mascara_bloque(limite, forma, transform)
+    columnas = list(capas)
+    cubo = np.zeros((len(columnas),) + tuple(forma), dtype=np.uint8)
+    for k, columna in enumerate(columnas):
+        gdf = capas[columna].to_crs(crs_local)
+        formas = [(g, int(np.clip(round(float(v) * ESCALA_CUBO), 1, 255)))
+                  for g, v in zip(gdf.geometry, gdf[columna])
+                  if g is not None and not g.is_empty and v is not None and np.isfinite(v)]
+        if formas:
+            rasterize(formas, out=cubo[k], transform=transform, fill=SIN_CLASE, dtype='uint8')
+        cubo[k][fuera] = SIN_CLASE
+        print(f"   [{k + 1}/{len(columnas)}] {NOMBRES_PESO.get(columna, columna)} rasterizado")
+        verificar_cancelacion()
+    return cubo, transform, crs_local, columnas
+
+
+def peligro_desde_cubo(cubo, pesos=None, columnas=None):
+    """
+    PELIGRO por celda = suma ponderada de las bandas (NaN si falta algún factor o fuera del límite).
+    Se acumula banda por banda en float32: no se crea una copia en coma flotante del cubo entero.
+    """
+    w = normalizar_pesos(pesos, columnas).astype(np.float32) / np.float32(ESCALA_CUBO)
+    suma = np.zeros(cubo.shape[1:], dtype=np.float32)
+    valido = np.ones(cubo.shape[1:], dtype=bool)
+    for k in range(cubo.shape[0]):
+        suma += w[k] * cubo[k]
+        valido &= cubo[k] != SIN_CLASE
+    suma[~valido] = np.nan
+    return suma
+
+
+def firma_fuentes(fuentes):
+    """
+    Firma de las entradas del cubo: para archivos y carpetas, ruta + tamaño + fecha de cada archivo;
+    cualquier otro texto (p. ej. la clave de la caché hidrológica) se toma tal cual.
+    """
+    firma = []
+    for fuente in fuentes:
+        fuente = str(fuente)
+        if os.path.isdir(fuente):
+            for raiz, _, archivos in sorted(os.walk(fuente)):
+                for archivo in sorted(archivos):
+                    st = os.stat(os.path.join(raiz, archivo))
+                    firma.append(f"{os.path.join(raiz, archivo)}|{st.st_size}|{st.st_mtime_ns}")
+        elif os.path.isfile(fuente):
+            st = os.stat(fuente)
+            firma.append(f"{os.path.abspath(fuente)}|{st.st_size}|{st.st_mtime_ns}")
+        else:
+            firma.append(fuente)
+    return firma
+
+
+def ruta_cubo_peligro(ubigeo, fuentes, resolucion=None):
+    """Archivo .npz del cubo del distrito (la clave cambia con cualquier fuente o con la grilla)"""
+    entrada = {
+        'ubigeo': str(ubigeo),
+        'fuentes': firma_fuentes(fuentes),
+        'resolucion': resolucion or RESOLUCION_PELIGRO_M,
+        'memoria_mb': MEMORIA_BLOQUES_MB,
+        'escala': ESCALA_CUBO,
+    }
+    clave = hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    nombre_ubigeo = "".join(c if c.isalnum() else "_" for c in str(ubigeo))
+    return os.path.join(RUTA_CUBOS_PELIGRO, nombre_ubigeo, f"cubo_{clave}.npz")
+
+
+def guardar_cubo(ruta, cubo, transform, crs, columnas):
+    """Publica el cubo de forma atómica (un cálculo interrumpido no deja un .npz a medias)"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as f:
+        np.savez_compressed(f, cubo=cubo, transform=np.asarray(tuple(transform)[:6], dtype=np.float64),
+                            crs=np.asarray(crs.to_wkt()), columnas=np.asarray(columnas))
+    os.replace(temporal, ruta)
+    with _BLOQUEO:
+        _CUBOS[ruta] = (cubo, transform, crs, list(columnas))
+        while len(_CUBOS) > MAX_CUBOS_MEMORIA:
+            _CUBOS.popitem(last=False)
+    print(f"   💾 Cubo de pesos guardado: {ruta} ({os.path.getsize(ruta) / 1024:.0f} KB)")
+
+
+def cargar_cubo(ruta):
+    """(cubo, transform, crs, columnas) desde la memoria del proceso o desde el .npz; None si no existe"""
+    from affine import Affine
+    from pyproj import CRS
+
+    with _BLOQUEO:
+        if ruta in _CUBOS:
+            _CUBOS.move_to_end(ruta)
+            return _CUBOS[ruta]
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as datos:
+        resultado = (datos['cubo'], Affine(*datos['transform']), CRS.from_wkt(str(datos['crs'])),
+                     [str(c) for c in datos['columnas']])
+    with _BLOQUEO:
+        _CUBOS[ruta] = resultado
+        while len(_CUBOS) > MAX_CUBOS_MEMORIA:
+            _CUBOS.popitem(last=False)
+    return resultado
+
+
+# ════════════════════════════════════════════════════════════════════════
+# MOTOR RÁSTER
+# ════════════════════════════════════════════════════════════════════════
+def clasificar_peligro(peligro, rangos):
+    """Nivel 1..len(rangos)-1 con los límites de 'rangos' (RANGOS_PELIGRO); SIN_CLASE sin datos"""
+    niveles = (np.digitize(peligro, rangos[1:-1]) + 1).astype(np.uint8)
+    niveles[np.isnan(peligro)] = SIN_CLASE
+    return niveles
+
+
+def poligonizar_niveles(niveles, peligro, transform, crs, tamiz=0):
+    """
+    Un multipolígono por nivel con el PELIGRO medio de sus celdas y su área.
+    Con tamiz > 0 las manchas de menos píxeles se absorben en el nivel vecino antes de poligonizar.
+    """
+    import geopandas as gpd
+    from rasterio.features import shapes, sieve
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+
+    if tamiz and tamiz > 1:
+        niveles = sieve(niveles, size=int(tamiz), mask=niveles != SIN_CLASE, connectivity=8)
+
+    partes = {}
+    for geom, valor in shapes(niveles, mask=niveles != SIN_CLASE, transform=transform, connectivity=8):
+        partes.setdefault(int(valor), []).append(shape(geom))
+
+    area_celda = abs(transform.a * transform.e)
+    filas = []
+    for nivel, geoms in sorted(partes.items()):
+        celdas = niveles == nivel
+        filas.append({
+            'NIVEL': nivel,
+            'PELIGRO': float(np.nanmean(peligro[celdas])),
+            'AREA_KM2': float(celdas.sum() * area_celda / 1e6),
+            'geometry': unary_union(geoms),
+        })
+    return gpd.GeoDataFrame(filas, columns=['NIVEL', 'PELIGRO', 'AREA_KM2', 'geometry'], geometry='geometry', crs=crs)
+
+
+def peligro_de_cubo(cubo, transform, crs, columnas, crs_salida, rangos, pesos=None, tamiz=None):
+    """Suma ponderada, clasificación y polígonos de los niveles; GeoDataFrame en crs_salida"""
+    peligro = peligro_desde_cubo(cubo, pesos, columnas)
+    niveles = clasificar_peligro(peligro, rangos)
+    gdf = poligonizar_niveles(niveles, peligro, transform, crs, tamiz=TAMIZ_PELIGRO if tamiz is None else tamiz)
+    return gdf.to_crs(crs_salida)
+
+
+def peligro_raster(capas, gdf_distrito, rangos, resolucion=None, tamiz=None, pesos=None, ruta_cubo=None):
+    """
+    Índice de peligro en ráster y polígonos de las clases finales.
+
+    Parámetros:
+    - capas: diccionario columna de peso -> GeoDataFrame recortado al distrito
+    - gdf_distrito: límite del distrito
+    - rangos: límites de los niveles (RANGOS_PELIGRO)
+    - pesos: ponderación de los factores (ver normalizar_pesos)
+    - ruta_cubo: si se indica, el cubo de pesos se guarda ahí para recalcular sin las capas
+
+    Retorna:
+    - GeoDataFrame (NIVEL, PELIGRO, AREA_KM2, geometry) en el CRS de gdf_distrito
+    """
+    cubo, transform, crs, columnas = cubo_pesos(capas, gdf_distrito, resolucion)
+    if ruta_cubo:
+        try:
+            guardar_cubo(ruta_cubo, cubo, transform, crs, columnas)
+        except OSError as e:
+            print(f"   ⚠️ No se pudo guardar el cubo de pesos: {e}")
+    return peligro_de_cubo(cubo, transform, crs, columnas, gdf_distrito.crs, rangos, pesos, tamiz)
+
+
+def peligro_en_cache(ruta_cubo, gdf_distrito, rangos, pesos=None, tamiz=None, columnas=None):
+    """Recalcula el índice desde el cubo en caché (sin leer capas); None si no existe o no son sus factores"""
+    cubo = cargar_cubo(ruta_cubo)
+    if cubo is None or (columnas is not None and cubo[3] != list(columnas)):
+        return None
+    print(f"   ⚡ Cubo de pesos en caché: {os.path.basename(ruta_cubo)} "
+          f"({describir_pesos(normalizar_pesos(pesos, cubo[3]), cubo[3])})")
+    return peligro_de_cubo(*cubo, gdf_distrito.crs, rangos, pesos, tamiz)
+
+
+def combinar_capas(capas, gdf_distrito, rangos, motor=None, pesos=None, ruta_cubo=None):
+    """Índice de peligro con el motor elegido ('overlay' o 'raster'; por defecto MOTOR_PELIGRO)"""
+    motor = (motor or MOTOR_PELIGRO).lower()
+    columnas = list(capas)
+    descripcion = f"{len(columnas)} parámetros: {describir_pesos(normalizar_pesos(pesos, columnas), columnas)}"
+    if motor == "raster":
+        print(f"\n🧮 Combinando capas de peligro en ráster ({descripcion})...")
+        return peligro_raster(capas, gdf_distrito, rangos, pesos=pesos, ruta_cubo=ruta_cubo)
+    print(f"\n🔄 Combinando capas de peligro ({descripcion})...")
+    return peligro_overlay(capas, pesos, limite=gdf_distrito.geometry.union_all())
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RESULTADO: DISUELTO POR NIVEL Y EXPORTADO EN UN FORMATO COMPACTO
+# ════════════════════════════════════════════════════════════════════════
+def disolver_peligro(gdf, rangos, por_condicion=False):
+    """
+    Une los polígonos de cada nivel de peligro (o de cada condición única de pesos dentro del nivel).
+
+    Retorna:
+    - GeoDataFrame (NIVEL, [PESO_*], PELIGRO medio ponderado por área, AREA_KM2, geometry)
+    """
+    import geopandas as gpd
+
+    pesos = [c for c in gdf.columns if c.startswith('PESO_')]
+    gdf = gdf[pesos + ['PELIGRO', gdf.geometry.name]].copy()
+    gdf['NIVEL'] = niveles_peligro(gdf['PELIGRO'].to_numpy(), rangos).astype('int16')
+    # Área en la zona UTM del distrito (en EPSG:3857 el área se infla con la latitud)
+    gdf['AREA_KM2'] = gdf.to_crs(gdf.estimate_utm_crs()).geometry.area.to_numpy() / 1e6
+    gdf['_PONDERADO'] = gdf['PELIGRO'] * gdf['AREA_KM2']
+
+    grupos = ['NIVEL'] + (pesos if por_condicion else [])
+    disuelto = gdf.dissolve(by=grupos, aggfunc={'AREA_KM2': 'sum', '_PONDERADO': 'sum', 'PELIGRO': 'mean'},
+                            as_index=False)
+    con_area = disuelto['AREA_KM2'] > 0
+    disuelto.loc[con_area, 'PELIGRO'] = disuelto.loc[con_area, '_PONDERADO'] / disuelto.loc[con_area, 'AREA_KM2']
+    columnas = grupos + ['PELIGRO', 'AREA_KM2', disuelto.geometry.name]
+    return gpd.GeoDataFrame(disuelto[columnas], geometry=disuelto.geometry.name, crs=gdf.crs)
+
+
+FORMATOS_PELIGRO = {
+    'gpkg': ('.gpkg', 'GPKG'),
+    'fgb': ('.fgb', 'FlatGeobuf'),
+    'parquet': ('.parquet', None),
+}
+FORMATO_PELIGRO = os.environ.get("DASH_FORMATO_PELIGRO", "gpkg").lower()
+DEPURAR_PELIGRO = os.environ.get("DASH_DEPURAR_PELIGRO", "0") == "1"
+DISOLVER_PELIGRO = os.environ.get("DASH_DISOLVER_PELIGRO", "nivel").lower()   # nivel | condicion
+
+
+def exportar_peligro(gdf, ruta_sin_extension, formato=None):
+    """
+    Guarda el resultado en GeoPackage, FlatGeobuf o GeoParquet (sin los límites del shapefile:
+    nombres de 10 caracteres, 2 GB y cinco archivos por capa).
+
+    Retorna:
+    - ruta del archivo escrito
+    """
+    formato = (formato or FORMATO_PELIGRO).lower()
+    if formato not in FORMATOS_PELIGRO:
+        raise ValueError(f"Formato de salida desconocido: {formato} (opciones: {', '.join(FORMATOS_PELIGRO)})")
+    extension, driver = FORMATOS_PELIGRO[formato]
+    ruta = ruta_sin_extension + extension
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    if driver is None:
+        gdf.to_parquet(ruta)
+    else:
+        gdf.to_file(ruta, driver=driver)
+    return ruta
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ESTADÍSTICAS POR NIVEL Y EXPOSICIÓN DE CENTROS POBLADOS
+# ════════════════════════════════════════════════════════════════════════
+CRS_AREA_IGUAL = "ESRI:102033"   # Albers cónica de áreas iguales para Sudamérica
+
+
+def niveles_peligro(valores, rangos):
+    """Nivel 1..len(rangos)-1 de cada valor, con los límites de clasificar_peligro (fuera de rango va al nivel extremo)"""
+    n = len(rangos) - 1
+    return np.clip(np.digitize(np.asarray(valores, dtype=float), rangos[1:-1]), 0, n - 1) + 1
+
+
+def estadisticas_peligro(gdf_peligro, gdf_distrito, rangos, etiquetas, gdf_centros=None):
+    """
+    Área (km², en CRS_AREA_IGUAL) y porcentaje del distrito por nivel, y centros poblados en cada nivel.
+
+    Retorna:
+    - diccionario con los totales y una fila por nivel (nivel, peligro, area_km2, porcentaje_distrito,
+      centros_poblados)
+    """
+    import geopandas as gpd
+
+    n = len(rangos) - 1
+    niveles = niveles_peligro(gdf_peligro['PELIGRO'].to_numpy(), rangos)
+    areas = gdf_peligro.geometry.to_crs(CRS_AREA_IGUAL).area.to_numpy() / 1e6
+    area_nivel = np.bincount(niveles, weights=areas, minlength=n + 1)[1:]
+    area_distrito = float(gdf_distrito.geometry.to_crs(CRS_AREA_IGUAL).area.sum() / 1e6)
+
+    centros_nivel = np.zeros(n, dtype=np.int64)
+    total_centros = 0
+    if gdf_centros is not None and not gdf_centros.empty:
+        zonas = gpd.GeoDataFrame({'NIVEL': niveles}, geometry=gdf_peligro.geometry.values, crs=gdf_peligro.crs)
+        puntos = gdf_centros[[gdf_centros.geometry.name]].to_crs(gdf_peligro.crs)
+        # El join usa el índice espacial de las zonas; un centro en un borde se cuenta una sola vez
+        unidos = gpd.sjoin(puntos, zonas, how='inner', predicate='intersects')
+        unidos = unidos[~unidos.index.duplicated(keep='first')]
+        centros_nivel = np.bincount(unidos['NIVEL'].to_numpy(dtype=np.int64), minlength=n + 1)[1:]
+        total_centros = int(centros_nivel.sum())
+
+    filas = [{
+        'nivel': i + 1,
+        'peligro': etiquetas[i],
+        'area_km2': round(float(area_nivel[i]), 4),
+        'porcentaje_distrito': round(100 * float(area_nivel[i]) / area_distrito, 2) if area_distrito else 0.0,
+        'centros_poblados': int(centros_nivel[i]),
+    } for i in range(n)]
+    return {
+        'crs_area': CRS_AREA_IGUAL,
+        'area_distrito_km2': round(area_distrito, 4),
+        'area_evaluada_km2': round(float(area_nivel.sum()), 4),
+        'centros_poblados': total_centros,
+        'niveles': filas,
+    }
+
+
+def guardar_estadisticas(estadisticas, ruta_sin_extension):
+    """Escribe las estadísticas en JSON (completas) y CSV (una fila por nivel); retorna ambas rutas"""
+    import csv
+
+    os.makedirs(os.path.dirname(ruta_sin_extension), exist_ok=True)
+    ruta_json = ruta_sin_extension + ".json"
+    ruta_csv = ruta_sin_extension + ".csv"
+    with open(ruta_json, 'w', encoding='utf-8') as f:
+        json.dump(estadisticas, f, indent=2, ensure_ascii=False)
+    with open(ruta_csv, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.DictWriter(f, fieldnames=list(estadisticas['niveles'][0]))
+        escritor.writeheader()
+        escritor.writerows(estadisticas['niveles'])
+    return ruta_json, ruta_csv
+
+
+def leer_estadisticas(ruta_mapa):
+    """Estadísticas guardadas junto a un mapa, en disco o en S3 (None si no hay)"""
+    from almacenamiento import asociado, leer_bytes
+
+    contenido = leer_bytes(asociado(ruta_mapa, "_estadisticas.json"))
+    if contenido is None:
+        return None
+    try:
+        return json.loads(contenido.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# BENCHMARK OVERLAY VS RÁSTER
+# ════════════════════════════════════════════════════════════════════════
+def _area_por_nivel(gdf, rangos):
+    """km² por nivel (en proyección UTM del conjunto)"""
+    if gdf.empty:
+        return {}
+    proyectado = gdf.to_crs(gdf.estimate_utm_crs())
+    niveles = np.digitize(proyectado['PELIGRO'].to_numpy(), rangos[1:-1]) + 1
+    areas = proyectado.geometry.area.to_numpy() / 1e6
+    return {int(n): float(areas[niveles == n].sum()) for n in np.unique(niveles)}
+
+
+def benchmark(capas, gdf_distrito, rangos, resolucion=None, pesos=None):
+    """Tiempo, polígonos y área por nivel de ambos motores (y del recálculo desde el cubo)"""
+    resultados = {}
+    cubo = None
+    for motor in ("overlay", "raster", "cubo"):
+        inicio = time.perf_counter()
+        if motor == "raster":
+            cubo = cubo_pesos(capas, gdf_distrito, resolucion)
+            gdf = peligro_de_cubo(*cubo, gdf_distrito.crs, rangos, pesos)
+        elif motor == "cubo":
+            gdf = peligro_de_cubo(*cubo, gdf_distrito.crs, rangos, pesos)
+        else:
+            gdf = peligro_overlay(capas, pesos, limite=gdf_distrito.geometry.union_all())
+        resultados[motor] = {
+            'segundos': time.perf_counter() - inicio,
+            'poligonos': len(gdf),
+            'area_km2': _area_por_nivel(gdf, rangos),
+        }
+
+    print(f"\n{'='*70}")
+    print(f"{'Motor':<10}{'Tiempo (s)':>12}{'Polígonos':>12}   Área por nivel (km²)")
+    print(f"{'='*70}")
+    for motor, r in resultados.items():
+        areas = "  ".join(f"{n}:{a:.3f}" for n, a in sorted(r['area_km2'].items()))
+        print(f"{motor:<10}{r['segundos']:>12.2f}{r['poligonos']:>12}   {areas}")
+    if resultados['raster']['segundos'] > 0:
+        print(f"\n   ⚡ Aceleración: x{resultados['overlay']['segundos'] / resultados['raster']['segundos']:.1f}")
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice de peligro: overlay vs ráster")
+    parser.add_argument("--benchmark", action="store_true", help="Comparar ambos motores")
+    parser.add_argument("--departamento", required=True)
+    parser.add_argument("--provincia", required=True)
+    parser.add_argument("--distrito", required=True)
+    parser.add_argument("--modelo", default="inundacion", help="Modelo de peligro (modelos_peligro.MODELOS_PELIGRO)")
+    parser.add_argument("--resolucion", type=float, help="Metros por celda del motor ráster")
+    parser.add_argument("--pesos", help="Esquema del modelo (igual, ahp, ...) o un peso por factor separados por comas")
+    args = parser.parse_args(argv)
+
+    import mapa_peligro as mp
+    from estimador import buscar_distrito
+    from modelos_peligro import obtener_modelo, pesos_modelo
+
+    modelo = obtener_modelo(args.modelo)
+    pesos = args.pesos
+    if pesos and pesos not in modelo.esquemas:
+        pesos = [float(p) for p in pesos.split(",")]
+    pesos = pesos_modelo(modelo, pesos)
+    gdf_distrito = buscar_distrito(args.departamento, args.provincia, args.distrito)
+    if gdf_distrito is None:
+        print(f"❌ No se encontró el distrito '{args.distrito}' ({args.provincia})")
+        return 1
+    etapa("Cargando capas de peligro...", 10)
+    capas = mp.cargar_capas_peligro(gdf_distrito, args.departamento, args.provincia, args.distrito, modelo=modelo)
+    if capas is None:
+        return 1
+    if args.benchmark:
+        benchmark(capas, gdf_distrito, modelo.rangos, resolucion=args.resolucion, pesos=pesos)
+    else:
+        gdf = peligro_raster(capas, gdf_distrito, modelo.rangos, resolucion=args.resolucion, pesos=pesos)
+        print(gdf.drop(columns='geometry').to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,574 @@
+# -*- coding: utf-8 -*-
+"""
+🗺️ peligro_regional.py - SUPERFICIE DE PELIGRO PRECALCULADA POR PROVINCIA O DEPARTAMENTO
+- Una sola corrida por región y modelo: las fuentes (ríos, pendiente, geología, ...) se cargan una
+  vez para toda la región y los pesos se superponen en ráster sobre una grilla común (UTM)
+- La grilla se recorre en bloques repartidos en un pool de procesos; cada bloque rasteriza solo los
+  polígonos que lo tocan (STRtree de cada capa), clasifica y poligoniza sus niveles
+- Se publica como COG: niveles.tif (nivel 1..n, 0 sin dato) e indice.tif (PELIGRO x ESCALA_CUBO),
+  más los niveles disueltos de toda la región (GeoPackage/FlatGeobuf/GeoParquet) y meta.json
+- Cada distrito solo lee la ventana que lo cubre, la recorta a su límite y poligoniza: el mapa de
+  peligro de un distrito (mapa_peligro) la usa sin cargar capas ni extraer ríos
+- La región solo se usa con el mismo modelo, ponderación, límites de clase, resolución y fuentes
+  (incluido el escenario de PP máxima, TR en años)
+
+Preparar una región y extraer sus distritos:
+    python peligro_regional.py --departamento CUSCO --provincia ANTA --modelo inundacion --distritos
+    python peligro_regional.py --departamento CUSCO --procesos 8
+    python peligro_regional.py --departamento CUSCO --provincia ANTA --escenario 100
+    python peligro_regional.py --departamento CUSCO --provincia ANTA --mapas --usuario ATLAS
+    python peligro_regional.py --listar
+
+Configuración:
+    DASH_RESOLUCION_REGIONAL_M=30
+"""
+
+import os
+import sys
+import json
+import math
+import shutil
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from procesamiento_bloques import lado_bloque, ventanas_bloques, mascara_bloque
+from peligro_raster import (BYTES_POR_CELDA, ESCALA_CUBO, SIN_CLASE, TAMIZ_PELIGRO, normalizar_pesos, firma_fuentes,
+                            clasificar_peligro, poligonizar_niveles, exportar_peligro)
+from modelos_peligro import obtener_modelo, columnas_modelo, pesos_modelo, firma_modelo
+from progreso import etapa, verificar_cancelacion
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_PELIGRO_REGIONAL = f"{ruta_base}/DATA/PELIGRO/REGIONAL"
+RESOLUCION_REGIONAL_M = float(os.environ.get("DASH_RESOLUCION_REGIONAL_M", "30"))
+TAMANO_TESELA = 512
+
+PRODUCTOS = {
+    'niveles': "niveles.tif",
+    'indice': "indice.tif",
+}
+NOMBRE_VECTORES = "niveles_disueltos"
+NOMBRE_LIMITE = "limite.geojson"
+NOMBRE_META = "meta.json"
+
+# Trabajo del proceso hijo (lo deja _inicializar_trabajador)
+_TRABAJO = None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# HUELLA DE LA REGIÓN
+# ════════════════════════════════════════════════════════════════════════
+def _nombre_carpeta(nombre):
+    return "".join(c if c.isalnum() else "_" for c in nombre.upper())
+
+
+def _publicar_carpeta(temporal, carpeta):
+    """
+    Publica 'temporal' como 'carpeta' con dos renombres (la anterior se aparta y luego se borra):
+    quien lee la región nunca ve una carpeta a medio borrar, y si falla se restaura la anterior
+    """
+    os.makedirs(os.path.dirname(carpeta), exist_ok=True)
+    anterior = f"{carpeta}.{os.getpid()}.old"
+    shutil.rmtree(anterior, ignore_errors=True)
+    try:
+        os.replace(carpeta, anterior)
+    except FileNotFoundError:
+        anterior = None
+    try:
+        os.replace(temporal, carpeta)
+    except OSError:
+        if anterior:
+            os.replace(anterior, carpeta)
+        raise
+    if anterior:
+        shutil.rmtree(anterior, ignore_errors=True)
+
+
+def _entradas_fuente(fuente, escenario=None):
+    """Lo que invalida una fuente a escala regional (los ríos dependen del DEM, no de un ubigeo)"""
+    import mapa_peligro as mp
+
+    if fuente == 'rios':
+        return [mp.RUTA_DEM, f"rios:{mp.UMBRALES_RIOS[mp.INTENSIDAD_RIOS]}:{mp.BUFFERS_CONFIG}"]
+    return mp.FUENTES_PELIGRO[fuente][2]({'escenario': escenario})
+
+
+def firma_region(modelo, pesos=None, resolucion=None, escenario=None):
+    """Clave de la superficie regional: modelo, ponderación, límites de clase, resolución y fuentes
+    (con el escenario de PP máxima)"""
+    modelo = obtener_modelo(modelo)
+    columnas = columnas_modelo(modelo)
+    fuentes = []
+    for fuente in dict.fromkeys(f.fuente for f in modelo.factores):
+        fuentes.extend(_entradas_fuente(fuente, escenario))
+    entrada = {
+        'modelo': firma_modelo(modelo),
+        'pesos': [round(float(x), 4) for x in normalizar_pesos(pesos_modelo(modelo, pesos), columnas)],
+        'rangos': list(modelo.rangos),
+        'resolucion': resolucion or RESOLUCION_REGIONAL_M,
+        'escala': ESCALA_CUBO,
+        'fuentes': firma_fuentes(fuentes),
+    }
+    return hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+
+
+# ════════════════════════════════════════════════════════════════════════
+# BLOQUES (EN LOS PROCESOS DEL POOL)
+# ════════════════════════════════════════════════════════════════════════
+def _codificar(gdf, columna):
+    """Capa reducida a su peso codificado como en el cubo (round(peso * ESCALA_CUBO), 1..255)"""
+    gdf = gdf[gdf[columna].notna() & gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    codigo = np.clip(np.round(gdf[columna].to_numpy(dtype=float) * ESCALA_CUBO), 1, 255).astype(np.uint8)
+    return gdf[[gdf.geometry.name]].assign(CODIGO=codigo)
+
+
+def _inicializar_trabajador(trabajo):
+    global _TRABAJO
+    _TRABAJO = trabajo
+    for capa in trabajo[0]:
+        capa.sindex   # el STRtree no viaja con la capa: se construye una vez por proceso
+
+
+def _bloque_peligro(nucleo):
+    """
+    Nivel e índice de un bloque de la grilla regional y las piezas de cada nivel.
+
+    Retorna:
+    - (ventana, niveles uint8, índice uint8, {nivel: (geometrías, celdas, suma del índice)}) o
+      (ventana, None, None, {}) si el bloque no tiene celdas con todos los factores
+    """
+    from rasterio.features import rasterize, shapes
+    from rasterio.transform import array_bounds
+    from rasterio.windows import transform as transform_ventana
+    from shapely.geometry import box, shape
+
+    capas, w, rangos, transform, limite = _TRABAJO
+    t = transform_ventana(nucleo, transform)
+    forma = (int(nucleo.height), int(nucleo.width))
+    caja = box(*array_bounds(forma[0], forma[1], t))
+
+    valido = mascara_bloque(limite, forma, t)
+    suma = np.zeros(forma, dtype=np.float32)
+    for k, capa in enumerate(capas):
+        if not valido.any():
+            return nucleo, None, None, {}
+        idx = capa.sindex.query(caja, predicate='intersects')
+        banda = np.zeros(forma, dtype=np.uint8)
+        if len(idx):
+            sub = capa.iloc[idx]
+            rasterize(zip(sub.geometry, sub['CODIGO'].astype(int)), out=banda, transform=t,
+                      fill=SIN_CLASE, dtype='uint8')
+        valido &= banda != SIN_CLASE
+        suma += w[k] * banda
+    if not valido.any():
+        return nucleo, None, None, {}
+
+    suma[~valido] = np.nan
+    niveles = clasificar_peligro(suma, rangos)
+    indice = np.where(valido, np.clip(np.round(suma * ESCALA_CUBO), 1, 255), 0).astype(np.uint8)
+
+    partes = {}
+    for geom, valor in shapes(niveles, mask=niveles != SIN_CLASE, transform=t, connectivity=8):
+        partes.setdefault(int(valor), []).append(shape(geom))
+    resumen = {}
+    for nivel, geoms in partes.items():
+        celdas = niveles == nivel
+        resumen[nivel] = (geoms, int(celdas.sum()), int(indice[celdas].sum(dtype=np.int64)))
+    return nucleo, niveles, indice, resumen
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PREPARACIÓN DE UNA REGIÓN (UNA SOLA VEZ)
+# ════════════════════════════════════════════════════════════════════════
+def _abrir_tiff_teselas(ruta, perfil):
+    import rasterio
+
+    perfil = perfil.copy()
+    perfil.update(driver="GTiff", count=1, dtype="uint8", nodata=SIN_CLASE, tiled=True,
+                  blockxsize=TAMANO_TESELA, blockysize=TAMANO_TESELA, compress="deflate", BIGTIFF="IF_SAFER")
+    return rasterio.open(ruta, "w", **perfil)
+
+
+def _publicar_cog(temporal, ruta):
+    """Convierte el GeoTIFF con teselas en COG (o lo deja tal cual si GDAL no tiene el driver COG)"""
+    from rasterio.shutil import copy as rio_copy
+
+    try:
+        rio_copy(temporal, ruta, driver="COG", compress="DEFLATE", blocksize=TAMANO_TESELA,
+                 overviews="AUTO", resampling="NEAREST", BIGTIFF="IF_SAFER")
+        os.remove(temporal)
+    except Exception as e:
+        print(f"   ⚠️ Driver COG no disponible ({e}); se deja GeoTIFF con teselas")
+        os.replace(temporal, ruta)
+
+
+def preparar_peligro_regional(limite_gdf, nombre, departamento_sel, provincia_sel=None, modelo=None, pesos=None,
+                              resolucion=None, procesos=None, nombre_usuario=None, escenario=None):
+    """
+    Calcula la superficie de peligro de una provincia o departamento y la publica como COG.
+
+    Parámetros:
+    - limite_gdf: GeoDataFrame de la región (se disuelve)
+    - nombre: nombre de la región (define la carpeta)
+    - departamento_sel, provincia_sel: para buscar las capas de la región (como en mapa_peligro)
+    - modelo, pesos: modelo de peligro y ponderación (ver modelos_peligro.pesos_modelo)
+    - resolucion: metros por celda (por defecto DASH_RESOLUCION_REGIONAL_M)
+    - escenario: periodo de retorno de la PP máxima (por defecto DASH_ESCENARIO_PPMAX)
+    - procesos: procesos del pool (por defecto los de overlay_paralelo)
+    - nombre_usuario: dueño del trabajo (carpeta de trabajo de la hidrología)
+
+    Retorna:
+    - carpeta de la región o None si falla
+    """
+    import geopandas as gpd
+    from rasterio.windows import Window
+    from shapely.geometry import mapping
+    from shapely.ops import unary_union
+    from distancia_rios import grilla_limite
+    from overlay_paralelo import contexto_procesos, procesos_por_defecto
+    import mapa_peligro as mp
+
+    modelo = obtener_modelo(modelo)
+    columnas = columnas_modelo(modelo)
+    pesos = pesos_modelo(modelo, pesos)
+    w = normalizar_pesos(pesos, columnas).astype(np.float32) / np.float32(ESCALA_CUBO)
+    resolucion = resolucion or RESOLUCION_REGIONAL_M
+    procesos = procesos or procesos_por_defecto()
+    escenario = int(escenario or mp.ESCENARIO_PPMAX)
+    firma = firma_region(modelo, pesos, resolucion, escenario)
+    # Cada escenario de PP máxima que no es el de por defecto tiene su propia carpeta
+    usa_ppmax = any(f.fuente == 'ppmax' for f in modelo.factores)
+    sufijo = f"_TR{escenario}" if usa_ppmax and escenario != mp.ESCENARIO_PPMAX else ""
+    carpeta = os.path.join(RUTA_PELIGRO_REGIONAL, modelo.clave, _nombre_carpeta(nombre) + sufijo)
+
+    print(f"\n{'='*80}")
+    print(f"🗺️ PELIGRO REGIONAL: {modelo.nombre.upper()} - {nombre}".center(80))
+    print(f"{'='*80}")
+
+    # Las fuentes se cargan una sola vez para toda la región (los ríos, con una sola extracción)
+    ctx = {
+        'gdf_distrito': limite_gdf,
+        'departamento': departamento_sel,
+        'provincia': provincia_sel or departamento_sel,
+        'distrito': nombre,
+        'nombre_usuario': nombre_usuario,
+        'ubigeo': f"REGION_{_nombre_carpeta(nombre)}",
+        'escenario': escenario,
+    }
+    crs_local = limite_gdf.estimate_utm_crs()
+    limite = limite_gdf.to_crs(crs_local).geometry.union_all()
+    capas = []
+    try:
+        for i, factor in enumerate(modelo.factores):
+            etapa(f"Capa regional {i + 1}/{len(columnas)}: {mp.FUENTES_PELIGRO[factor.fuente][0]}...",
+                  5 + 40 * i // len(columnas))
+            gdf = mp.capa_factor(mp.capa_fuente(factor.fuente, ctx), factor).to_crs(crs_local)
+            capas.append(_codificar(gdf, factor.columna))
+    except Exception as e:
+        print(f"❌ Error cargando las capas de la región: {e}")
+        return None
+
+    transform, forma = grilla_limite(limite, resolucion)
+    bloques = [b.nucleo for b in ventanas_bloques(Window(0, 0, forma[1], forma[0]), lado_bloque(BYTES_POR_CELDA))]
+    print(f"   🧮 Grilla regional: {forma[1]} x {forma[0]} celdas de {resolucion:g} m, "
+          f"{len(bloques)} bloques en {min(procesos, len(bloques))} procesos")
+
+    perfil = {'height': forma[0], 'width': forma[1], 'transform': transform, 'crs': crs_local}
+    temporal = f"{carpeta}.{os.getpid()}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    try:
+        rutas_tmp = {p: os.path.join(temporal, f"{p}.tmp.tif") for p in PRODUCTOS}
+        partes = {}
+        trabajo = (capas, w, list(modelo.rangos), transform, limite)
+
+        def _guardar(resultado, destinos):
+            nucleo, niveles, indice, resumen = resultado
+            if niveles is None:
+                return
+            destinos['niveles'].write(niveles, 1, window=nucleo)
+            destinos['indice'].write(indice, 1, window=nucleo)
+            for nivel, (geoms, celdas, suma) in resumen.items():
+                acumulado = partes.setdefault(nivel, [[], 0, 0])
+                acumulado[0].extend(geoms)
+                acumulado[1] += celdas
+                acumulado[2] += suma
+
+        with _abrir_tiff_teselas(rutas_tmp['niveles'], perfil) as dst_niveles, \
+                _abrir_tiff_teselas(rutas_tmp['indice'], perfil) as dst_indice:
+            destinos = {'niveles': dst_niveles, 'indice': dst_indice}
+            if procesos <= 1 or len(bloques) == 1:
+                _inicializar_trabajador(trabajo)
+                for i, nucleo in enumerate(bloques, start=1):
+                    _guardar(_bloque_peligro(nucleo), destinos)
+                    etapa(f"Bloque {i}/{len(bloques)}...", 45 + 40 * i // len(bloques))
+                    verificar_cancelacion()
+            else:
+                # forkserver, no fork: quien llama puede tener hilos (Dash, trabajador_render, DAG)
+                contexto = contexto_procesos(["geopandas", "rasterio", "peligro_regional"])
+                with ProcessPoolExecutor(max_workers=min(procesos, len(bloques)), mp_context=contexto,
+                                         initializer=_inicializar_trabajador, initargs=(trabajo,)) as pool:
+                    futuros = [pool.submit(_bloque_peligro, nucleo) for nucleo in bloques]
+                    for i, futuro in enumerate(as_completed(futuros), start=1):
+                        _guardar(futuro.result(), destinos)
+                        etapa(f"Bloque {i}/{len(bloques)}...", 45 + 40 * i // len(bloques))
+                        try:
+                            verificar_cancelacion()
+                        except BaseException:
+                            for f in futuros:
+                                f.cancel()
+                            raise
+
+        if not partes:
+            print("❌ Las capas no tienen área en común dentro de la región")
+            return None
+
+        etapa("Publicando COG y niveles disueltos...", 88)
+        for producto, archivo in PRODUCTOS.items():
+            _publicar_cog(rutas_tmp[producto], os.path.join(temporal, archivo))
+
+        # Niveles disueltos de toda la región (las piezas de cada bloque se unen en las costuras)
+        area_celda = resolucion * resolucion
+        filas = [{
+            'NIVEL': nivel,
+            'PELIGRO': suma / celdas / ESCALA_CUBO,
+            'AREA_KM2': celdas * area_celda / 1e6,
+            'geometry': unary_union(geoms),
+        } for nivel, (geoms, celdas, suma) in sorted(partes.items())]
+        gdf_niveles = gpd.GeoDataFrame(filas, columns=['NIVEL', 'PELIGRO', 'AREA_KM2', 'geometry'],
+                                       geometry='geometry', crs=crs_local)
+        ruta_vectores = exportar_peligro(gdf_niveles, os.path.join(temporal, NOMBRE_VECTORES))
+
+        with open(os.path.join(temporal, NOMBRE_LIMITE), "w", encoding="utf-8") as f:
+            json.dump(mapping(limite), f)
+        meta = {
+            'nombre': nombre,
+            'modelo': modelo.clave,
+            'firma': firma,
+            'pesos': dict(zip(columnas, (round(float(x), 4) for x in normalizar_pesos(pesos, columnas)))),
+            'rangos': list(modelo.rangos),
+            'escenario': escenario if usa_ppmax else None,
+            'resolucion': resolucion,
+            'crs': crs_local.to_wkt(),
+            'forma': list(forma),
+            'vectores': os.path.basename(ruta_vectores),
+            'creado': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(temporal, NOMBRE_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        # Publicación: se reemplaza la región anterior de una vez
+        _publicar_carpeta(temporal, carpeta)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    for fila in filas:
+        print(f"   - Nivel {fila['NIVEL']}: {fila['AREA_KM2']:10.2f} km² (PELIGRO medio {fila['PELIGRO']:.2f})")
+    print(f"   ✅ Peligro regional publicado en: {carpeta}")
+    return carpeta
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CONSULTA POR DISTRITO
+# ════════════════════════════════════════════════════════════════════════
+def _cargar_region(carpeta):
+    """Metadatos de una carpeta publicada por preparar_peligro_regional (con 'carpeta'), o None"""
+    ruta_meta = os.path.join(carpeta, NOMBRE_META)
+    if not os.path.exists(ruta_meta):
+        return None
+    try:
+        with open(ruta_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+    meta['carpeta'] = carpeta
+    return meta
+
+
+def listar_regiones(modelo=None):
+    """Metadatos de las regiones publicadas (de un modelo o de todos)"""
+    if not os.path.isdir(RUTA_PELIGRO_REGIONAL):
+        return []
+    claves = [modelo] if modelo else sorted(os.listdir(RUTA_PELIGRO_REGIONAL))
+    regiones = []
+    for clave in claves:
+        carpeta_modelo = os.path.join(RUTA_PELIGRO_REGIONAL, clave)
+        if os.path.isdir(carpeta_modelo):
+            # Las carpetas con '.' son temporales o apartadas durante una publicación
+            regiones.extend(_cargar_region(os.path.join(carpeta_modelo, n))
+                            for n in sorted(os.listdir(carpeta_modelo)) if "." not in n)
+    return [r for r in regiones if r is not None]
+
+
+def buscar_peligro_regional(gdf_distrito, modelo=None, pesos=None, escenario=None):
+    """Región precalculada del mismo modelo, ponderación, fuentes y escenario que contiene al distrito, o None"""
+    from shapely.geometry import shape
+
+    modelo = obtener_modelo(modelo)
+    regiones = listar_regiones(modelo.clave)
+    if not regiones:
+        return None
+    firmas = {}
+    for region in regiones:
+        resolucion = region.get('resolucion')
+        if resolucion not in firmas:
+            firmas[resolucion] = firma_region(modelo, pesos, resolucion, escenario)
+        if region.get('firma') != firmas[resolucion]:
+            continue
+        try:
+            with open(os.path.join(region['carpeta'], NOMBRE_LIMITE), encoding="utf-8") as f:
+                limite = shape(json.load(f))
+            # Tolerancia de media celda: los límites de la región y del distrito vienen de capas distintas
+            geom = gdf_distrito.to_crs(region['crs']).geometry.union_all()
+            if limite.buffer(region['resolucion'] / 2).contains(geom):
+                return region
+        except Exception as e:
+            print(f"   ⚠️ Región {region.get('nombre')} no se pudo consultar: {e}")
+    return None
+
+
+def _leer_ventana(ruta, bounds):
+    """Ventana del COG que cubre 'bounds' (en su CRS): (array, transform de la ventana)"""
+    import rasterio
+    from rasterio.windows import Window, from_bounds
+
+    with rasterio.open(ruta) as src:
+        v = from_bounds(*bounds, transform=src.transform)
+        col0, fila0 = max(0, math.floor(v.col_off)), max(0, math.floor(v.row_off))
+        col1 = min(src.width, math.ceil(v.col_off + v.width))
+        fila1 = min(src.height, math.ceil(v.row_off + v.height))
+        ventana = Window(col0, fila0, col1 - col0, fila1 - fila0)
+        return src.read(1, window=ventana), src.window_transform(ventana)
+
+
+def peligro_distrito_regional(region, gdf_distrito, tamiz=None):
+    """
+    Niveles de peligro del distrito leídos de la superficie regional (ventana + recorte al límite).
+
+    Retorna:
+    - GeoDataFrame (NIVEL, PELIGRO, AREA_KM2, geometry) en el CRS de gdf_distrito
+    """
+    geom = gdf_distrito.to_crs(region['crs']).geometry.union_all()
+    niveles, transform = _leer_ventana(os.path.join(region['carpeta'], PRODUCTOS['niveles']), geom.bounds)
+    indice, _ = _leer_ventana(os.path.join(region['carpeta'], PRODUCTOS['indice']), geom.bounds)
+    print(f"   📥 Ventana de peligro regional '{region['nombre']}': {niveles.shape[1]} x {niveles.shape[0]} celdas")
+
+    fuera = ~mascara_bloque(geom, niveles.shape, transform)
+    niveles[fuera] = SIN_CLASE
+    peligro = np.where(niveles != SIN_CLASE, indice.astype(np.float32) / ESCALA_CUBO, np.nan)
+    gdf = poligonizar_niveles(niveles, peligro, transform, region['crs'],
+                              tamiz=TAMIZ_PELIGRO if tamiz is None else tamiz)
+    return gdf.to_crs(gdf_distrito.crs)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# DISTRITOS DE LA REGIÓN
+# ════════════════════════════════════════════════════════════════════════
+def _distritos_region(departamento_sel, provincia_sel=None):
+    """(GeoDataFrame de los distritos de la región, columnas de departamento, provincia y distrito)"""
+    from capas_cache import cargar_shapefile_cacheado
+
+    gdf = cargar_shapefile_cacheado("distrito", "Distritos del Perú")
+    if gdf is None:
+        return None, None
+    col_dpto = next((c for c in ['NOMBDEP', 'DEPARTAMEN'] if c in gdf.columns), None)
+    col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf.columns), None)
+    col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf.columns), None)
+    if not all([col_dpto, col_prov, col_distr]):
+        return None, None
+    sel = gdf[gdf[col_dpto].str.upper() == departamento_sel.upper()]
+    if provincia_sel:
+        sel = sel[sel[col_prov].str.upper() == provincia_sel.upper()]
+    return (None, None) if sel.empty else (sel, (col_dpto, col_prov, col_distr))
+
+
+def _nombre_distrito(fila, columnas):
+    """Nombre de archivo único del distrito: UBIGEO_PROVINCIA_DISTRITO (sin ubigeo, PROVINCIA_DISTRITO)"""
+    from capas_cache import COLUMNAS_UBIGEO
+
+    _, col_prov, col_distr = columnas
+    partes = [fila[col_prov], fila[col_distr]]
+    col_ubigeo = next((c for c in COLUMNAS_UBIGEO if c in fila.index), None)
+    if col_ubigeo:
+        partes.insert(0, str(fila[col_ubigeo]))
+    return _nombre_carpeta("_".join(str(p) for p in partes))
+
+
+def extraer_distritos(region, gdf_distritos, columnas):
+    """Niveles de cada distrito (ventana de la región) en la carpeta DISTRITOS de la región"""
+    col_dpto, col_prov, col_distr = columnas
+    carpeta = os.path.join(region['carpeta'], "DISTRITOS")
+    os.makedirs(carpeta, exist_ok=True)
+    rutas = []
+    for _, fila in gdf_distritos.iterrows():
+        gdf_distrito = gdf_distritos.loc[[fila.name]]
+        gdf = peligro_distrito_regional(region, gdf_distrito)
+        # Hay distritos homónimos en provincias distintas: el nombre lleva ubigeo y provincia
+        ruta = exportar_peligro(gdf, os.path.join(carpeta, _nombre_distrito(fila, columnas)))
+        print(f"   💾 {fila[col_distr]}: {ruta}")
+        rutas.append(ruta)
+    return rutas
+
+
+# ════════════════════════════════════════════════════════════════════════
+# LÍNEA DE COMANDOS
+# ════════════════════════════════════════════════════════════════════════
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Superficie de peligro precalculada por provincia o departamento")
+    parser.add_argument("--departamento", help="Departamento (región, o el de la provincia)")
+    parser.add_argument("--provincia", help="Provincia a preparar (por defecto todo el departamento)")
+    parser.add_argument("--modelo", default="inundacion", help="Modelo de peligro (modelos_peligro.MODELOS_PELIGRO)")
+    parser.add_argument("--pesos", help="Esquema del modelo (igual, ahp, ...) o un peso por factor separados por comas")
+    parser.add_argument("--escenario", type=int, help="Periodo de retorno de la PP máxima (años)")
+    parser.add_argument("--resolucion", type=float, default=RESOLUCION_REGIONAL_M, help="Metros por celda")
+    parser.add_argument("--procesos", type=int, help="Procesos del pool")
+    parser.add_argument("--distritos", action="store_true", help="Guardar los niveles de cada distrito")
+    parser.add_argument("--mapas", action="store_true", help="Generar el mapa de peligro de cada distrito")
+    parser.add_argument("--usuario", default="REGIONAL", help="Usuario dueño de los mapas (--mapas)")
+    parser.add_argument("--listar", action="store_true", help="Listar regiones publicadas")
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        for r in listar_regiones():
+            print(f"   🗺️ {r['modelo']:<14} {r['nombre']:<20} {r['forma'][1]}x{r['forma'][0]} "
+                  f"@ {r['resolucion']:g} m  {r['creado']}")
+        return 0
+    if not args.departamento:
+        parser.error("Indique --departamento (y opcionalmente --provincia)")
+
+    pesos = args.pesos
+    if pesos and "," in pesos:
+        pesos = [float(p) for p in pesos.split(",")]
+
+    gdf_distritos, columnas = _distritos_region(args.departamento, args.provincia)
+    if gdf_distritos is None:
+        print(f"❌ No se encontraron distritos para {args.provincia or ''} {args.departamento}")
+        return 1
+    limite = gdf_distritos.dissolve()
+    nombre = args.provincia or args.departamento
+    carpeta = preparar_peligro_regional(limite, nombre, args.departamento, args.provincia, modelo=args.modelo,
+                                        pesos=pesos, resolucion=args.resolucion, procesos=args.procesos,
+                                        nombre_usuario=args.usuario, escenario=args.escenario)
+    if not carpeta:
+        return 1
+
+    region = _cargar_region(carpeta)
+    if args.distritos:
+        extraer_distritos(region, gdf_distritos, columnas)
+    if args.mapas:
+        # Cada mapa encuentra la superficie regional y solo lee su ventana
+        import mapa_peligro as mp
+        col_dpto, col_prov, col_distr = columnas
+        for _, fila in gdf_distritos.iterrows():
+            mp.generar_mapa_peligro(args.usuario, fila[col_dpto], fila[col_prov], fila[col_distr],
+                                    motor="raster", pesos=pesos, modelo=args.modelo, escenario=args.escenario)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+⛰️ pendientes_dem.py - PENDIENTES AL VUELO DESDE EL DEM, EN CACHÉ POR DISTRITO
+- Lee solo la ventana del DEM que cubre el distrito (más dos píxeles para los vecinos del borde)
+- Si el DEM está en grados se reproyecta la ventana a la zona UTM del distrito: la pendiente
+  siempre se calcula en metros
+- Pendiente en grados con el operador de Horn (NumPy vectorizado, sin recorrer celdas)
+- Reclasifica con los cortes de capas_tematicas.ETIQUETAS_PENDIENTE: clases 1..5, 0 = fuera del distrito
+- Guarda un GeoTIFF uint8 por distrito (clave: huella del DEM, geometría y cortes). El mapa de
+  pendientes lo dibuja tal cual y el mapa de peligro traduce cada clase a PESO_PENDI
+- La misma ventana del DEM da las clases de altitud del modelo de heladas (capa_clases_altitud)
+- Sin DEM se sigue usando el ráster nacional pendientes.tif (y en peligro, PENDIENTE_PESO.shp)
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from cache_hidrologia import huella_dem
+from procesamiento_bloques import leer_recorte, mascara_bloque, gradientes_horn
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_DEM_PENDIENTES = os.environ.get("DASH_DEM_PENDIENTES", f"{ruta_base}/DATA/PENDIENTES/DEM.tif")
+RUTA_PENDIENTES_NACIONAL = f"{ruta_base}/DATA/PENDIENTES/pendientes.tif"
+RUTA_CACHE_PENDIENTES = f"{ruta_base}/DATA/PENDIENTES/CACHE"
+
+# Límites (grados) entre las clases de ETIQUETAS_PENDIENTE: '< 5°', '5° - 15°', ..., '> 45°'
+CORTES_PENDIENTE = [5, 15, 25, 45]
+
+# Peso de peligro de cada clase (PESO_PENDI, escala 1-5 como las demás capas):
+# en terreno plano el agua se acumula y escurre lento, así que a menor pendiente mayor peso
+PESOS_PENDIENTE = {1: 5, 2: 4, 3: 3, 4: 2, 5: 1}
+
+SIN_DATOS = 0
+MARGEN_PIXELES = 2
+
+
+# ════════════════════════════════════════════════════════════════════════
+# PENDIENTE Y CLASES
+# ════════════════════════════════════════════════════════════════════════
+def pendiente_grados(dem, res_x, res_y):
+    """Pendiente en grados (Horn 3×3); el borde y las celdas sin datos quedan enmascarados"""
+    dzdx, dzdy = gradientes_horn(np.ma.masked_invalid(dem), res_x, res_y)
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+
+def clasificar_pendiente(pendiente, dentro=None, cortes=None):
+    """Clase 1..len(cortes)+1 por celda (uint8); SIN_DATOS donde no hay pendiente o fuera del límite"""
+    cortes = CORTES_PENDIENTE if cortes is None else cortes
+    clases = (np.digitize(np.ma.filled(pendiente, np.nan), cortes) + 1).astype(np.uint8)
+    invalido = np.ma.getmaskarray(pendiente) | np.isnan(np.ma.filled(pendiente, np.nan))
+    if dentro is not None:
+        invalido |= ~dentro
+    clases[invalido] = SIN_DATOS
+    return clases
+
+
+def dem_metrico(ruta_dem, gdf_distrito):
+    """
+    Ventana del DEM que cubre el distrito, en un CRS métrico.
+
+    Retorna:
+    - (elevación float32 con NaN, transform, crs, límite del distrito en ese crs)
+    """
+    import rasterio
+    from rasterio.transform import array_bounds
+    from rasterio.warp import calculate_default_transform, reproject, Resampling
+
+    with rasterio.open(ruta_dem) as src:
+        crs_dem = src.crs
+        paso = max(abs(src.res[0]), abs(src.res[1]))
+
+    limite_dem = gdf_distrito.to_crs(crs_dem).geometry.union_all()
+    datos, transform, _, _ = leer_recorte(ruta_dem, limite_dem.buffer(MARGEN_PIXELES * paso), reducir=False)
+    if crs_dem.is_projected:
+        return datos, transform, crs_dem, limite_dem
+
+    # DEM geográfico: la ventana (no el DEM entero) se lleva a la zona UTM del distrito
+    crs_local = gdf_distrito.estimate_utm_crs()
+    alto, ancho = datos.shape
+    transform_local, ancho_local, alto_local = calculate_default_transform(
+        crs_dem, crs_local, ancho, alto, *array_bounds(alto, ancho, transform))
+    local = np.full((alto_local, ancho_local), np.nan, dtype=np.float32)
+    reproject(datos, local, src_transform=transform, src_crs=crs_dem, src_nodata=np.nan,
+              dst_transform=transform_local, dst_crs=crs_local, dst_nodata=np.nan,
+              resampling=Resampling.bilinear)
+    return local, transform_local, crs_local, gdf_distrito.to_crs(crs_local).geometry.union_all()
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CACHÉ POR DISTRITO
+# ════════════════════════════════════════════════════════════════════════
+def ruta_cache_pendientes(gdf_distrito, ruta_dem=None):
+    """GeoTIFF en caché del distrito (la clave cambia con el DEM, la geometría o los cortes)"""
+    ruta_dem = ruta_dem or RUTA_DEM_PENDIENTES
+    entrada = {
+        'dem': huella_dem(ruta_dem),
+        'crs': str(gdf_distrito.crs),
+        'geometria': hashlib.sha1(gdf_distrito.geometry.union_all().wkb).hexdigest(),
+        'cortes': CORTES_PENDIENTE,
+    }
+    clave = hashlib.sha1(json.dumps(entrada, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(RUTA_CACHE_PENDIENTES, f"pendientes_{clave}.tif")
+
+
+def pendientes_distrito(gdf_distrito, ruta_dem=None):
+    """
+    Clases de pendiente del distrito como GeoTIFF uint8 (se calcula una vez y queda en caché).
+
+    Retorna:
+    - ruta del GeoTIFF o None si no hay DEM o falla
+    """
+    import rasterio
+
+    ruta_dem = ruta_dem or RUTA_DEM_PENDIENTES
+    if not os.path.exists(ruta_dem):
+        return None
+
+    ruta = ruta_cache_pendientes(gdf_distrito, ruta_dem)
+    if os.path.exists(ruta):
+        print(f"   ⚡ Pendientes en caché: {os.path.basename(ruta)}")
+        return ruta
+
+    print(f"   ⛰️ Calculando pendientes desde el DEM: {ruta_dem}")
+    try:
+        dem, transform, crs, limite = dem_metrico(ruta_dem, gdf_distrito)
+        pendiente = pendiente_grados(dem, abs(transform.a), abs(transform.e))
+        clases = clasificar_pendiente(pendiente, mascara_bloque(limite, dem.shape, transform))
+        print(f"   📐 Grilla {clases.shape[1]} x {clases.shape[0]} ({abs(transform.a):.1f} m), "
+              f"{np.count_nonzero(clases):,} celdas en el distrito")
+
+        os.makedirs(RUTA_CACHE_PENDIENTES, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp.tif"
+        perfil = {
+            'driver': 'GTiff', 'count': 1, 'dtype': 'uint8', 'nodata': SIN_DATOS, 'crs': crs,
+            'transform': transform, 'height': clases.shape[0], 'width': clases.shape[1],
+            'compress': 'deflate', 'tiled': clases.shape[0] >= 256 and clases.shape[1] >= 256,
+        }
+        with rasterio.open(temporal, "w", **perfil) as dst:
+            dst.write(clases, 1)
+        os.replace(temporal, ruta)
+        return ruta
+    except Exception as e:
+        print(f"   ⚠️ No se pudieron calcular las pendientes desde el DEM: {e}")
+        return None
+
+
+def raster_pendientes(gdf_distrito):
+    """Ráster de clases de pendiente para el mapa: el del distrito desde el DEM o el nacional"""
+    ruta = pendientes_distrito(gdf_distrito)
+    if ruta:
+        return ruta
+    if os.path.exists(RUTA_PENDIENTES_NACIONAL):
+        print(f"   ℹ️ Sin DEM para pendientes: se usa el ráster nacional")
+        return RUTA_PENDIENTES_NACIONAL
+    return None
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CAPAS DE CLASES PARA LOS MAPAS DE PELIGRO
+# ════════════════════════════════════════════════════════════════════════
+def _poligonos_por_clase(clases, transform, crs):
+    """Un multipolígono por clase distinta de SIN_DATOS: GeoDataFrame (CLASE, geometry)"""
+    import geopandas as gpd
+    from rasterio.features import shapes
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+
+    partes = {}
+    for geom, valor in shapes(clases, mask=clases != SIN_DATOS, transform=transform, connectivity=8):
+        partes.setdefault(int(valor), []).append(shape(geom))
+    filas = [{'CLASE': c, 'geometry': unary_union(g)} for c, g in sorted(partes.items())]
+    return gpd.GeoDataFrame(filas, columns=['CLASE', 'geometry'], geometry='geometry', crs=crs)
+
+
+def capa_peso_pendiente(gdf_distrito, crs_salida=3857, ruta_dem=None):
+    """
+    Un polígono por clase de pendiente del distrito con su PESO_PENDI (reemplaza a PENDIENTE_PESO.shp).
+
+    Retorna:
+    - GeoDataFrame (CLASE, PESO_PENDI, geometry) en crs_salida, o None si no hay DEM
+    """
+    import rasterio
+
+    ruta = pendientes_distrito(gdf_distrito, ruta_dem)
+    if ruta is None:
+        return None
+
+    with rasterio.open(ruta) as src:
+        gdf = _poligonos_por_clase(src.read(1), src.transform, src.crs)
+    gdf.insert(1, 'PESO_PENDI', gdf['CLASE'].map(PESOS_PENDIENTE))
+    return gdf.to_crs(crs_salida)
+
+
+def capa_clases_altitud(gdf_distrito, cortes, crs_salida=3857, ruta_dem=None):
+    """
+    Un polígono por clase de altitud del distrito (clase 1..len(cortes)+1, cortes en m s.n.m.).
+
+    Retorna:
+    - GeoDataFrame (CLASE, geometry) en crs_salida, o None si no hay DEM
+    """
+    ruta_dem = ruta_dem or RUTA_DEM_PENDIENTES
+    if not os.path.exists(ruta_dem):
+        return None
+    dem, transform, crs, limite = dem_metrico(ruta_dem, gdf_distrito)
+    clases = (np.digitize(dem, cortes) + 1).astype(np.uint8)
+    clases[np.isnan(dem) | ~mascara_bloque(limite, dem.shape, transform)] = SIN_DATOS
+    return _poligonos_por_clase(clases, transform, crs).to_crs(crs_salida)
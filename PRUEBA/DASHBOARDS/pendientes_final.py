@@ -8,25 +8,23 @@ from matplotlib_scalebar.scalebar import ScaleBar
 import os
 import numpy as np
 import matplotlib.patheffects as path_effects
-from shapely.geometry import box, mapping
+from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch, PathPatch
-from matplotlib.path import Path
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura, existe, tamano
 import rasterio
-from rasterio.mask import mask as rio_mask
-from matplotlib.colors import BoundaryNorm, ListedColormap
+from procesamiento_bloques import leer_recorte
+from pendientes_dem import raster_pendientes
+from capas_tematicas import capa_pendientes
 
 # --- RUTA BASE ---
 ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
 AMARILLO_CLARO = "#FFEE58"
 
-# PALETA DE COLORES PARA PENDIENTES
-COLORES_PENDIENTE = ['#7FBF3F', '#BFDF3F', '#FFFF00', '#FF9F00', '#FF0000']
-ETIQUETAS_PENDIENTE = ['< 5°', '5° - 15°', '15° - 25°', '25° - 45°', '> 45°']
-
 # ════════════════════════════════════════════════════════════════════════
 # FUNCIÓN PARA CARGAR Y RECORTAR RASTER SOLO AL DISTRITO
 # ════════════════════════════════════════════════════════════════════════
@@ -39,35 +37,24 @@ def cargar_y_recortar_raster(ruta_pendientes, gdf_distrito):
             
             # Reproyectar distrito al CRS del raster
             gdf_reproj = gdf_distrito.to_crs(src.crs)
-            
-            # Recortar raster a la geometría EXACTA del distrito
-            geoms = [mapping(geom) for geom in gdf_reproj.geometry]
-            
-            # CRÍTICO: No usar nodata=np.nan para dtype entero
-            original_nodata = src.nodata if src.nodata is not None else 0
-            out_image, out_transform = rio_mask(src, geoms, crop=True, filled=True, nodata=original_nodata)
-            
-            raster_data = out_image[0]
-            
-            # Convertir a float para poder usar NaN
-            raster_data = raster_data.astype(np.float32)
-            
-            # Reemplazar valores nodata con NaN
-            if original_nodata is not None:
-                raster_data = np.where(raster_data == original_nodata, np.nan, raster_data)
-            
-            # También convertir valores 0 a NaN si no son pendientes válidas
-            raster_data = np.where(raster_data == 0, np.nan, raster_data)
-            
-            # Obtener el bbox del área recortada
-            bounds = gdf_reproj.total_bounds
-            
-            print(f"   Raster recortado: {raster_data.shape}")
-            print(f"   Valores válidos: {np.count_nonzero(~np.isnan(raster_data))}")
-            print(f"   Valores NaN (fuera del distrito): {np.count_nonzero(np.isnan(raster_data))}")
-            print(f"   Rango de valores: {np.nanmin(raster_data):.2f} - {np.nanmax(raster_data):.2f}")
-            
-            return raster_data, out_transform, src.crs, bounds
+        
+        # Recortar raster a la geometría EXACTA del distrito, bloque a bloque y con techo de memoria
+        # (nodata y celdas fuera del distrito quedan en NaN; si no cabe se lee reducido para el mapa)
+        raster_data, out_transform, crs_raster, factor = leer_recorte(
+            ruta_pendientes, gdf_reproj.geometry.unary_union)
+        
+        # También convertir valores 0 a NaN si no son pendientes válidas
+        raster_data = np.where(raster_data == 0, np.nan, raster_data)
+        
+        # Obtener el bbox del área recortada
+        bounds = gdf_reproj.total_bounds
+        
+        print(f"   Raster recortado: {raster_data.shape}" + (f" (reducido x{factor})" if factor > 1 else ""))
+        print(f"   Valores válidos: {np.count_nonzero(~np.isnan(raster_data))}")
+        print(f"   Valores NaN (fuera del distrito): {np.count_nonzero(np.isnan(raster_data))}")
+        print(f"   Rango de valores: {np.nanmin(raster_data):.2f} - {np.nanmax(raster_data):.2f}")
+        
+        return raster_data, out_transform, crs_raster, bounds
             
     except Exception as e:
         print(f"   ERROR: {e}")
@@ -157,11 +144,7 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
@@ -169,10 +152,7 @@ def cargar_shapefile(nombre, alias):
         print(f"   No se encontró shapefile: {alias}")
         return None
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"   Error cargando {alias}: {e}")
         return None
@@ -322,12 +302,6 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
     print(f"   - Usuario: {nombre_usuario}")
     print(f"   - Ubicación: {distrito_sel}, {provincia_sel}, {departamento_sel}")
 
-    ruta_pendientes = "/workspaces/AUTOMATIZACION_DASH/PRUEBA/DATA/PENDIENTES/pendientes.tif"
-    
-    if not os.path.exists(ruta_pendientes):
-        print(f"❌ ERROR: El archivo de pendientes no existe: {ruta_pendientes}")
-        return None
-    
     # CREAR CARPETA DE SALIDA
     try:
         carpeta_usuario = os.path.join(ruta_base, "USUARIOS", nombre_usuario)
@@ -338,6 +312,7 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
         print(f"❌ Error creando la estructura de carpetas para el usuario: {e}")
         return None
 
+    etapa("Cargando capas base...", 10)
     print("\n📦 Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
@@ -345,8 +320,8 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
 
     # CARGAR PAÍSES Y OCÉANO
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"❌ Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -364,6 +339,7 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
         print("❌ No se pudieron identificar las columnas de nombres en los shapefiles")
         return None
 
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n🔍 Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -377,6 +353,14 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
 
     print(f"   ✅ Distrito encontrado con geometría válida")
 
+    etapa("Calculando pendientes del distrito...", 25)
+    # Clases de pendiente del distrito desde el DEM (en caché tras la primera vez) o el ráster nacional
+    ruta_pendientes = raster_pendientes(gdf_distrito)
+    if ruta_pendientes is None:
+        print(f"❌ ERROR: No hay DEM ni ráster nacional de pendientes")
+        return None
+
+    etapa("Recortando raster de pendientes...", 30)
     print("\n✂️ Recortando raster AL DISTRITO (no rectangular)...")
     raster_data, out_transform, src_crs, raster_bounds = cargar_y_recortar_raster(ruta_pendientes, gdf_distrito)
 
@@ -384,6 +368,7 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
         print("❌ ERROR: No se pudo recortar el raster")
         return None
 
+    etapa("Armando el layout del mapa...", 45)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -423,66 +408,14 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
 
     print("   📡 Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, attribution=False, zoom='auto')
     except Exception as e:
         print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
         ax_main.set_facecolor("#e8e8e8")
 
-    # TRANSFORMAR BOUNDS DEL RASTER AL CRS DE VISUALIZACIÓN (3857)
-    transformer_raster_to_viz = pyproj.Transformer.from_crs(src_crs, 3857, always_xy=True)
-    x0_viz, y0_viz = transformer_raster_to_viz.transform(raster_bounds[0], raster_bounds[1])
-    x1_viz, y1_viz = transformer_raster_to_viz.transform(raster_bounds[2], raster_bounds[3])
-    extent_viz = [x0_viz, x1_viz, y0_viz, y1_viz]
-
-    # CREAR COLORMAP Y NORMALIZADOR
-    cmap = ListedColormap(COLORES_PENDIENTE)
-    cmap.set_bad(color='none', alpha=0)
-    norm = BoundaryNorm([0.5, 1.5, 2.5, 3.5, 4.5, 5.5], cmap.N)
-
-    # VISUALIZAR RASTER
-    print("   🎨 Renderizando raster de pendientes...")
-    masked_raster = np.ma.masked_invalid(raster_data)
-    
-    im = ax_main.imshow(
-        masked_raster, 
-        extent=extent_viz, 
-        cmap=cmap, 
-        norm=norm, 
-        aspect='auto', 
-        alpha=0.8, 
-        zorder=4, 
-        origin='upper', 
-        interpolation='nearest'
-    )
-    
-    print(f"   ✅ Raster renderizado - Píxeles válidos: {np.count_nonzero(~masked_raster.mask)}")
-    print(f"   🔲 Píxeles enmascarados (fuera del distrito): {np.count_nonzero(masked_raster.mask)}")
-
-    # RECORTAR VISUALMENTE EL RASTER A LA GEOMETRÍA DEL DISTRITO
-    geom_distrito = gdf_distrito.geometry.iloc[0]
-    
-    if geom_distrito.geom_type == 'Polygon':
-        exterior_coords = list(geom_distrito.exterior.coords)
-        vertices = exterior_coords
-        codes = [Path.MOVETO] + [Path.LINETO] * (len(exterior_coords) - 1)
-        path = Path(vertices, codes)
-    elif geom_distrito.geom_type == 'MultiPolygon':
-        vertices = []
-        codes = []
-        for poly in geom_distrito.geoms:
-            exterior_coords = list(poly.exterior.coords)
-            vertices.extend(exterior_coords)
-            codes.extend([Path.MOVETO] + [Path.LINETO] * (len(exterior_coords) - 1))
-        path = Path(vertices, codes)
-    
-    # Aplicar el clip path al raster
-    patch = PathPatch(path, facecolor='none', edgecolor='none', transform=ax_main.transData)
-    ax_main.add_patch(patch)
-    im.set_clip_path(patch)
-    
-    # LÍMITE DISTRITAL
-    gdf_distrito.plot(ax=ax_main, facecolor="none", edgecolor="black", 
-                     linewidth=1.0, linestyle=':', alpha=1.0, zorder=15)
+    # RASTER RECORTADO VISUALMENTE AL DISTRITO Y LÍMITE (MISMO DIBUJO QUE EL PAQUETE DISTRITAL)
+    legend_elements, ncols = capa_pendientes(ax_main, gdf_distrito, raster_data, src_crs, raster_bounds)
 
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
     add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
@@ -498,22 +431,14 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
 
-    legend_elements = [Patch(facecolor='white', edgecolor='white', label='PENDIENTES (°):', linewidth=0)]
-    for idx, etiqueta in enumerate(ETIQUETAS_PENDIENTE):
-        legend_elements.append(Patch(facecolor=COLORES_PENDIENTE[idx], edgecolor='black', label=etiqueta))
-
-    legend_elements.extend([
-        Patch(facecolor='white', edgecolor='white', label='', linewidth=0),
-        Line2D([0], [0], color='black', lw=1, linestyle=':', label='Límite Distrital')
-    ])
-
-    leg = ax_leyenda.legend(handles=legend_elements, loc='center', ncol=1, frameon=True, fontsize=8,
+    leg = ax_leyenda.legend(handles=legend_elements, loc='center', ncol=ncols, frameon=True, fontsize=8,
                            title="LEYENDA", title_fontproperties={'size': 10, 'weight': 'bold'},
                            handletextpad=0.5, columnspacing=1.0, borderpad=0.7, handlelength=1.5)
     leg.get_title().set_ha('center')
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
 
+    etapa("Dibujando mapas de ubicación...", 75)
     print("   🗺️ Generando mapas de ubicación...")
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
     ax_depto = fig.add_subplot(gs_ubicaciones[0])
@@ -548,17 +473,18 @@ def generar_mapa_pendientes(nombre_usuario, departamento_sel, provincia_sel, dis
         spine.set_linewidth(2)
         spine.set_color('black')
 
+    etapa("Guardando el mapa...", 90)
     print("\n💾 Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_PENDIENTES_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
 
     try:
-        plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+        ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
         plt.close(fig)
 
-        if os.path.exists(ruta_guardado_final):
-            file_size = os.path.getsize(ruta_guardado_final) / (1024 * 1024)
+        if existe(ruta_guardado_final):
+            file_size = tamano(ruta_guardado_final) / (1024 * 1024)
             print(f"✅ Mapa de pendientes guardado exitosamente")
             print(f"   📂 Ubicación: {ruta_guardado_final}")
             print(f"   📊 Tamaño: {file_size:.2f} MB")
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+🚦 planificador.py - ADMISIÓN DE TRABAJOS DE MAPAS POR CARRILES
+- Carril "ligero" (vías, ubicación, temáticos vectoriales) con cupos propios: nunca espera a los pesados
+- Carril "pesado" (pendientes, ríos, peligro) limitado por un presupuesto global de núcleos y memoria
+- Límite de trabajos simultáneos por usuario y tiempo límite por tipo de mapa
+- Los núcleos asignados al trabajo se leen con nucleos_asignados() (p. ej. para wbt.set_max_procs)
+- La cancelación y el tiempo límite se aplican de forma cooperativa a través de progreso.py
+- Con una estimación previa (estimador.py) un mapa "ligero" muy grande pasa al carril pesado
+  y la memoria reservada se ajusta a lo estimado
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from progreso import etapa, fijar_limite, verificar_cancelacion, motivo_cancelacion, contexto_trabajo, en_contexto
+from progreso import TrabajoCancelado  # noqa: F401  (los dashboards la importan desde aquí)
+
+
+def _memoria_total_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 8192
+
+
+# --- CONFIGURACIÓN ---
+NUCLEOS_POR_DEFECTO = 4   # Fuera del planificador (lotes, consola) se mantiene el valor histórico
+
+CARRILES = {
+    'ligero': {'max_trabajos': 4, 'nucleos': 1, 'memoria_mb': 1024, 'usa_presupuesto': False},
+    'pesado': {'max_trabajos': 2, 'nucleos': 4, 'memoria_mb': 6144, 'usa_presupuesto': True},
+}
+
+CARRIL_POR_TIPO = {
+    'geografico': 'ligero',
+    'vias': 'ligero',
+    'centros': 'ligero',
+    'geomorfologia': 'ligero',
+    'climatica': 'ligero',
+    'geologia': 'ligero',
+    'pendientes': 'pesado',
+    'rios': 'pesado',
+    'inundacion': 'pesado',
+    'deslizamiento': 'pesado',
+    'heladas': 'pesado',
+}
+
+# Tiempo límite de ejecución (segundos, sin contar la espera en cola)
+TIMEOUTS_S = {
+    'geografico': 300,
+    'vias': 300,
+    'centros': 300,
+    'geomorfologia': 420,
+    'climatica': 420,
+    'geologia': 420,
+    'pendientes': 900,
+    'rios': 1800,
+    'inundacion': 3600,
+    'deslizamiento': 3600,
+    'heladas': 3600,
+}
+
+MAX_TRABAJOS_USUARIO = 2
+LIGERO_MAX_SEGUNDOS = 180   # Estimaciones por encima de esto no van al carril ligero
+ESPERA_MAXIMA_S = 900
+
+# Presupuesto global del carril pesado (lo que queda tras la reserva del carril ligero)
+PRESUPUESTO_NUCLEOS = int(os.environ.get("DASH_NUCLEOS", os.cpu_count() or 4))
+PRESUPUESTO_MEMORIA_MB = int(os.environ.get("DASH_MEMORIA_MB", _memoria_total_mb() * 3 // 4))
+
+
+class TrabajoRechazado(Exception):
+    """El trabajo no consiguió turno dentro del tiempo máximo de espera"""
+
+
+_CONDICION = threading.Condition()
+_ACTIVOS = {}   # id_trab -> {'usuario', 'carril', 'nucleos', 'memoria_mb', 'inicio'}
+_LOCAL = threading.local()
+
+
+def carril_de(tipo, estimacion=None):
+    carril = CARRIL_POR_TIPO.get(tipo, 'pesado')
+    if carril == 'ligero' and estimacion:
+        if (estimacion['segundos'] > LIGERO_MAX_SEGUNDOS
+                or estimacion['memoria_mb'] > CARRILES['ligero']['memoria_mb']):
+            return 'pesado'
+    return carril
+
+
+def nucleos_asignados():
+    """Núcleos del trabajo en curso en este hilo (NUCLEOS_POR_DEFECTO si no pasó por el planificador)"""
+    return getattr(_LOCAL, 'nucleos', None) or NUCLEOS_POR_DEFECTO
+
+
+def _reserva_ligero():
+    c = CARRILES['ligero']
+    return c['max_trabajos'] * c['nucleos'], c['max_trabajos'] * c['memoria_mb']
+
+
+def _asignacion(carril, estimacion=None):
+    """Núcleos y memoria que recibe un trabajo del carril (acotados por el presupuesto)"""
+    conf = CARRILES[carril]
+    if not conf['usa_presupuesto']:
+        return conf['nucleos'], conf['memoria_mb']
+    nucleos_ligero, memoria_ligero = _reserva_ligero()
+    memoria = estimacion['memoria_mb'] if estimacion else conf['memoria_mb']
+    nucleos = max(1, min(conf['nucleos'], PRESUPUESTO_NUCLEOS - nucleos_ligero))
+    memoria = max(512, min(memoria, PRESUPUESTO_MEMORIA_MB - memoria_ligero))
+    return nucleos, memoria
+
+
+def _motivo_espera(nombre_usuario, carril, nucleos, memoria):
+    """None si el trabajo puede empezar ya; si no, el motivo de la espera (se llama con _CONDICION tomada)"""
+    conf = CARRILES[carril]
+    activos = list(_ACTIVOS.values())
+
+    if sum(1 for a in activos if a['usuario'] == nombre_usuario) >= MAX_TRABAJOS_USUARIO:
+        return f"ya tiene {MAX_TRABAJOS_USUARIO} mapas en proceso"
+
+    del_carril = [a for a in activos if a['carril'] == carril]
+    if len(del_carril) >= conf['max_trabajos']:
+        return f"{len(del_carril)} mapas {carril}s en proceso"
+
+    if conf['usa_presupuesto']:
+        nucleos_ligero, memoria_ligero = _reserva_ligero()
+        usados = [a for a in activos if CARRILES[a['carril']]['usa_presupuesto']]
+        if sum(a['nucleos'] for a in usados) + nucleos > max(nucleos, PRESUPUESTO_NUCLEOS - nucleos_ligero):
+            return "sin núcleos libres"
+        if sum(a['memoria_mb'] for a in usados) + memoria > max(memoria, PRESUPUESTO_MEMORIA_MB - memoria_ligero):
+            return "sin memoria libre"
+    return None
+
+
+@contextmanager
+def turno(id_trab, nombre_usuario, tipo, estimacion=None):
+    """
+    Espera turno en el carril del tipo de mapa y reserva sus recursos mientras dura el bloque.
+    Debe usarse dentro de progreso.trabajo_en_curso para que la espera se vea en el dashboard
+    y pueda cancelarse:
+
+        with trabajo_en_curso(id_trab, "Mapa de peligro"):
+            with turno(id_trab, usuario, 'inundacion'):
+                ruta = generar_mapa_peligro(...)
+
+    `estimacion` es el resultado opcional de estimador.estimar_trabajo.
+    """
+    carril = carril_de(tipo, estimacion)
+    nucleos, memoria = _asignacion(carril, estimacion)
+    if estimacion and estimacion['memoria_mb'] > PRESUPUESTO_MEMORIA_MB:
+        raise TrabajoRechazado(f"El mapa necesita ~{estimacion['memoria_mb']:,} MB y el servidor "
+                               f"admite {PRESUPUESTO_MEMORIA_MB:,} MB por trabajo")
+    inicio_espera = time.time()
+    ultimo_motivo = None
+
+    with _CONDICION:
+        while True:
+            motivo = _motivo_espera(nombre_usuario, carril, nucleos, memoria)
+            if motivo is None:
+                break
+            verificar_cancelacion()
+            if time.time() - inicio_espera > ESPERA_MAXIMA_S:
+                raise TrabajoRechazado(f"Sin turno tras {ESPERA_MAXIMA_S} s en cola ({motivo})")
+            if motivo != ultimo_motivo:
+                print(f"   ⏸️ {id_trab} en cola ({carril}): {motivo}")
+                etapa(f"En cola: {motivo}...", 0)
+                ultimo_motivo = motivo
+            _CONDICION.wait(timeout=1.0)
+
+        _ACTIVOS[id_trab] = {'usuario': nombre_usuario, 'carril': carril, 'nucleos': nucleos,
+                             'memoria_mb': memoria, 'inicio': time.time()}
+
+    anterior = getattr(_LOCAL, 'nucleos', None)
+    _LOCAL.nucleos = nucleos
+    fijar_limite(TIMEOUTS_S.get(tipo))
+    print(f"   ▶️ {id_trab} en carril {carril}: {nucleos} núcleos, {memoria} MB")
+    try:
+        yield {'carril': carril, 'nucleos': nucleos, 'memoria_mb': memoria}
+    finally:
+        fijar_limite(None)
+        _LOCAL.nucleos = anterior
+        with _CONDICION:
+            _ACTIVOS.pop(id_trab, None)
+            _CONDICION.notify_all()
+
+
+def contexto_hilo():
+    """Trabajo en curso y núcleos de este hilo, para reinstalarlos en los hilos de un pool (en_hilo)"""
+    return {'trabajo': contexto_trabajo(), 'nucleos': getattr(_LOCAL, 'nucleos', None)}
+
+
+@contextmanager
+def en_hilo(contexto, nucleos=None):
+    """
+    Ejecuta el bloque en un hilo auxiliar con el trabajo, el tiempo límite y los núcleos del hilo
+    que capturó el contexto. `nucleos` reparte la asignación entre hilos que corren a la vez.
+    """
+    anterior = getattr(_LOCAL, 'nucleos', None)
+    _LOCAL.nucleos = nucleos or contexto['nucleos']
+    try:
+        with en_contexto(contexto['trabajo']):
+            yield
+    finally:
+        _LOCAL.nucleos = anterior
+
+
+def trabajos_activos():
+    """Copia del registro de trabajos en ejecución (para diagnóstico)"""
+    with _CONDICION:
+        return {k: dict(v) for k, v in _ACTIVOS.items()}
+
+
+# ════════════════════════════════════════════════════════════════════════
+# WHITEBOXTOOLS
+# ════════════════════════════════════════════════════════════════════════
+def configurar_wbt(wbt, imprimir=True):
+    """
+    Aplica al objeto WhiteboxTools los núcleos asignados y un callback que detiene la herramienta
+    en curso (wbt.cancel_op) cuando el trabajo se cancela o vence su tiempo límite.
+    El callback solo se invoca por cada línea que imprime la herramienta, así que requiere modo verbose.
+    """
+    wbt.set_max_procs(nucleos_asignados())
+
+    def _callback(linea):
+        if imprimir:
+            print(linea)
+        if motivo_cancelacion():
+            wbt.cancel_op = True
+
+    wbt.set_default_callback(_callback)
+    return wbt
+
@@ -11,9 +11,12 @@ import matplotlib.patheffects as path_effects
 from shapely.geometry import box
 import pyproj
 from matplotlib.ticker import FuncFormatter
-from matplotlib.patches import Polygon, Rectangle, Patch
-from matplotlib.lines import Line2D
+from matplotlib.patches import Polygon, Rectangle
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa
+from almacenamiento import guardar_figura
+from capas_tematicas import recortar_rios_vias, capa_centros
 
 # --- RUTA BASE ---
 ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
@@ -29,10 +32,7 @@ def cargar_centros_poblados():
     if os.path.exists(ruta_directa):
         try:
             print(f"📂 Encontrado en: {ruta_directa}")
-            gdf_cp = gpd.read_file(ruta_directa)
-            if gdf_cp.crs is None:
-                gdf_cp.set_crs(epsg=4326, inplace=True)
-            gdf_cp = gdf_cp.to_crs(epsg=3857)
+            gdf_cp = leer_capa(ruta_directa)
             print(f"✅ Centros Poblados cargados: {len(gdf_cp)} registros")
             return gdf_cp
         except Exception as e:
@@ -51,10 +51,7 @@ def cargar_rios():
     if os.path.exists(ruta_directa):
         try:
             print(f"📂 Ríos encontrado en: {ruta_directa}")
-            gdf_rios = gpd.read_file(ruta_directa)
-            if gdf_rios.crs is None:
-                gdf_rios.set_crs(epsg=4326, inplace=True)
-            gdf_rios = gdf_rios.to_crs(epsg=3857)
+            gdf_rios = leer_capa(ruta_directa)
             print(f"✅ Ríos cargados y proyectados: {len(gdf_rios)} registros")
             return gdf_rios
         except Exception as e:
@@ -85,10 +82,7 @@ def cargar_vias():
         if os.path.exists(ruta):
             try:
                 print(f"📂 Vía {tipo} encontrada en: {ruta}")
-                gdf = gpd.read_file(ruta)
-                if gdf.crs is None:
-                    gdf.set_crs(epsg=4326, inplace=True)
-                vias[tipo] = gdf.to_crs(epsg=3857)
+                vias[tipo] = leer_capa(ruta)
                 print(f"✅ Vías {tipo}: {len(vias[tipo])} registros")
             except Exception as e:
                 print(f"❌ Error cargando vías {tipo}: {e}")
@@ -172,21 +166,14 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
     if not path:
         return None
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"❌ Error cargando {alias} desde {path}: {e}")
         return None
@@ -369,14 +356,15 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
         print(f"❌ Error creando la estructura de carpetas para el usuario: {e}")
         return None
 
+    etapa("Cargando capas base...", 10)
     print("\n📦 Cargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
 
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamérica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Océano.shp")
     except Exception as e:
         print(f"❌ Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -390,6 +378,7 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
     col_prov = next((c for c in ['NOMBPROV', 'PROVINCIA'] if c in gdf_provincias.columns), None)
     col_distr = next((c for c in ['NOMBDIST', 'DISTRITO'] if c in gdf_distritos.columns), None)
 
+    etapa("Filtrando el área seleccionada...", 20)
     print("\n🔍 Filtrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -400,6 +389,7 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
         print(f"❌ Error: No se pudo encontrar la geometría para el distrito '{distrito_sel}'.")
         return None
 
+    etapa("Cargando centros poblados, ríos y vías...", 30)
     print("\n📦 Cargando centros poblados, ríos y vías...")
     gdf_centros_poblados = cargar_centros_poblados()
     gdf_rios = cargar_rios()
@@ -426,14 +416,9 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
     buffer_x = (maxx - minx) * buffer_factor
     buffer_y = (maxy - miny) * buffer_factor
     bbox_temp = (minx - buffer_x, miny - buffer_y, maxx + buffer_x, maxy + buffer_y)
-    bbox_clip = box(*bbox_temp)
-    
-    gdf_rios_clip = gpd.clip(gdf_rios, bbox_clip) if gdf_rios is not None else None
-    
-    vias_clip = {}
-    for tipo in ['nacional', 'departamental', 'vecinal']:
-        vias_clip[tipo] = gpd.clip(vias[tipo], bbox_clip) if vias[tipo] is not None else None
+    gdf_rios_clip, vias_clip = recortar_rios_vias(gdf_rios, vias, box(*bbox_temp))
 
+    etapa("Armando el layout del mapa...", 45)
     print("\n🎨 Generando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     grid = plt.GridSpec(1, 2, width_ratios=[3.0, 1], wspace=0.05)
@@ -463,43 +448,15 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
 
     print("   📡 Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 55)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, attribution=False, zoom='auto')
     except Exception as e:
         print(f"   ⚠️ No se pudo cargar el mapa base: {e}")
         ax_main.set_facecolor("#e8e8e8")
 
-    # --- INICIO DE MODIFICACIÓN: COLORES UNIFICADOS ---
-    if not gdf_distrito.empty:
-        gdf_distrito.plot(ax=ax_main, facecolor="#a8dda8", edgecolor="black", linewidth=1.5, 
-                         linestyle='-', alpha=0.6, zorder=5)
-
-    if gdf_rios_clip is not None and not gdf_rios_clip.empty:
-        gdf_rios_clip.plot(ax=ax_main, color='#00BFFF', linewidth=2.0, zorder=6)
-
-    if vias_clip['nacional'] is not None and not vias_clip['nacional'].empty:
-        vias_clip['nacional'].plot(ax=ax_main, color='#FF0000', linewidth=2.2, zorder=7)
-
-    if vias_clip['departamental'] is not None and not vias_clip['departamental'].empty:
-        vias_clip['departamental'].plot(ax=ax_main, color='#32CD32', linewidth=1.8, zorder=8)
-
-    if vias_clip['vecinal'] is not None and not vias_clip['vecinal'].empty:
-         vias_clip['vecinal'].plot(ax=ax_main, color='#FFFF00', linewidth=1.5, linestyle='--', zorder=9)
-    # --- FIN DE MODIFICACIÓN ---
-
-    if gdf_centros_clip is not None and not gdf_centros_clip.empty and col_cp_name:
-        print(f"   😀 Dibujando centros poblados ({len(gdf_centros_clip)} puntos)...")
-        gdf_centros_clip.plot(ax=ax_main, color='yellow', markersize=35, marker='o',
-                             edgecolor='black', linewidth=1, zorder=15)
-
-        for _, row in gdf_centros_clip.iterrows():
-            try:
-                nombre_cp = row[col_cp_name]
-                ax_main.text(row.geometry.x, row.geometry.y, nombre_cp.title(),
-                           fontsize=6, fontweight='bold', color='white',
-                           ha='center', va='bottom', zorder=16,
-                           path_effects=[path_effects.withStroke(linewidth=2, foreground='black')])
-            except Exception:
-                pass
+    # Distrito, ríos, vías y centros poblados (el mismo dibujo que el paquete distrital)
+    legend_elements, ncols = capa_centros(ax_main, gdf_distrito, gdf_rios_clip, vias_clip,
+                                          gdf_centros_clip, col_cp_name)
 
     grillado_utm_proyectado(ax_main, bbox_main, ndiv=8)
     add_north_arrow_blanco_completo(ax_main, xy_pos=(0.93, 0.08), size=0.06)
@@ -513,20 +470,6 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
     ax_leyenda = fig.add_subplot(gs_memb_ley[1])
     ax_leyenda.axis('off')
     
-    # --- INICIO DE MODIFICACIÓN: LEYENDA UNIFICADA Y LIMPIA ---
-    legend_elements = [
-        Patch(facecolor='#a8dda8', edgecolor='black', alpha=0.6, label='Área del Distrito'),
-        Line2D([0], [0], marker='o', color='w', markerfacecolor='yellow', markeredgecolor='black', markersize=7, label='Centros Poblados'),
-        Line2D([0], [0], color='#00BFFF', lw=2.5, label='Ríos'),
-        Line2D([0], [0], color='#FF0000', lw=2.5, label='Vía Nacional'),
-        Line2D([0], [0], color='#32CD32', lw=2.5, label='Vía Departamental'),
-        Line2D([0], [0], color='#FFFF00', lw=2.5, linestyle='--', label='Vía Vecinal'),
-        Line2D([0], [0], color='black', lw=2, label='Límite Distrital')
-    ]
-    # Se eliminó la línea de 'Grillado UTM'
-    # --- FIN DE MODIFICACIÓN ---
-
-    ncols = 2 if len(legend_elements) <= 8 else 3
     leg = ax_leyenda.legend(
         handles=legend_elements, loc='center', ncol=ncols, frameon=True, fontsize=7.5,
         title="LEYENDA", title_fontproperties={'size': 10, 'weight': 'bold'},
@@ -536,6 +479,7 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
 
+    etapa("Dibujando mapas de ubicación...", 75)
     print("   🗺️ Generando mapas de ubicación...")
     gs_ubicaciones = grid[0, 1].subgridspec(3, 1, height_ratios=[1, 1, 1], hspace=0.15)
     ax_depto = fig.add_subplot(gs_ubicaciones[0])
@@ -563,12 +507,13 @@ def generar_mapa_poblacion(nombre_usuario, departamento_sel, provincia_sel, dist
         spine.set_linewidth(2)
         spine.set_color('black')
 
+    etapa("Guardando el mapa...", 90)
     print("\n💾 Guardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     nombre_base = f"MAPA_CENTROS_POBLADOS_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
 
-    plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+    ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
     plt.close(fig)
 
     print(f"✅ Mapa de centros poblados guardado exitosamente en: {ruta_guardado_final}")
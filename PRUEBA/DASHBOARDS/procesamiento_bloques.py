@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+🧱 procesamiento_bloques.py - PROCESAMIENTO RASTER POR BLOQUES CON MEMORIA ACOTADA
+- Divide la ventana de trabajo en bloques cuadrados cuyo tamaño sale del techo de memoria
+  (DASH_MEMORIA_BLOQUES_MB) y del número de hilos (DASH_HILOS_BLOQUES)
+- Cada bloque se lee con un halo de solapamiento para operaciones focales (pendiente, sombreado,
+  distancias acotadas) y solo se escribe su núcleo: el resultado no tiene costuras
+- El recorte por geometría también es por bloque (geometry_mask sobre la ventana del bloque)
+- Operaciones: recorte a archivo, recorte a memoria (reducido si no cabe), operación focal a
+  archivo, reclasificación y estadísticas zonales, todas a memoria constante
+- Hilos opcionales: cada hilo abre su propio dataset (rasterio no comparte handles entre hilos)
+"""
+
+import os
+import math
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from progreso import verificar_cancelacion
+
+MEMORIA_BLOQUES_MB = float(os.environ.get("DASH_MEMORIA_BLOQUES_MB", "256"))
+HILOS_BLOQUES = int(os.environ.get("DASH_HILOS_BLOQUES", "1"))
+LADO_MINIMO = 256         # Múltiplo de las teselas habituales de los GeoTIFF
+
+Bloque = namedtuple("Bloque", ["nucleo", "lectura", "interior"])
+
+
+# ════════════════════════════════════════════════════════════════════════
+# GEOMETRÍA DE LOS BLOQUES
+# ════════════════════════════════════════════════════════════════════════
+def lado_bloque(bytes_por_pixel, halo=0, memoria_mb=None, hilos=None):
+    """Lado (px) del núcleo de bloque que respeta el techo de memoria repartido entre los hilos"""
+    presupuesto = (memoria_mb or MEMORIA_BLOQUES_MB) * 1024 * 1024 / max(1, hilos or HILOS_BLOQUES)
+    lado = int(math.sqrt(presupuesto / max(1, bytes_por_pixel))) - 2 * halo
+    return max(LADO_MINIMO, lado // LADO_MINIMO * LADO_MINIMO)
+
+
+def ventanas_bloques(ventana, lado, halo=0):
+    """
+    Bloques que cubren 'ventana' (Window de rasterio).
+    - nucleo: parte del resultado que produce el bloque
+    - lectura: núcleo + halo (puede salirse del raster: se lee con boundless)
+    - interior: slices del núcleo dentro del array leído
+    """
+    from rasterio.windows import Window
+
+    col0, fila0 = int(ventana.col_off), int(ventana.row_off)
+    ancho, alto = int(ventana.width), int(ventana.height)
+    for f in range(0, alto, lado):
+        for c in range(0, ancho, lado):
+            h, w = min(lado, alto - f), min(lado, ancho - c)
+            nucleo = Window(col0 + c, fila0 + f, w, h)
+            lectura = Window(col0 + c - halo, fila0 + f - halo, w + 2 * halo, h + 2 * halo)
+            yield Bloque(nucleo, lectura, (slice(halo, halo + h), slice(halo, halo + w)))
+
+
+def ventana_de_geometria(src, geometria):
+    """Ventana entera del raster que cubre la geometría (en el CRS del raster)"""
+    from rasterio.windows import Window, from_bounds
+
+    v = from_bounds(*geometria.bounds, transform=src.transform)
+    col0, fila0 = max(0, math.floor(v.col_off)), max(0, math.floor(v.row_off))
+    col1 = min(src.width, math.ceil(v.col_off + v.width))
+    fila1 = min(src.height, math.ceil(v.row_off + v.height))
+    return Window(col0, fila0, max(0, col1 - col0), max(0, fila1 - fila0))
+
+
+def mascara_bloque(geometria, forma, transform):
+    """True dentro de la geometría (píxeles cuyo centro cae adentro, como rasterio.mask)"""
+    from rasterio.features import geometry_mask
+
+    return geometry_mask([geometria], out_shape=forma, transform=transform, invert=True)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RECORRIDO (SECUENCIAL O CON HILOS)
+# ════════════════════════════════════════════════════════════════════════
+def recorrer_bloques(ruta, bloques, funcion, hilos=None):
+    """
+    Aplica funcion(src, bloque) a cada bloque y entrega (bloque, resultado) a medida que terminan.
+    Con varios hilos cada uno abre su propio dataset; se mantienen a lo sumo 2×hilos bloques en vuelo
+    para no acumular resultados en memoria.
+    """
+    import rasterio
+
+    hilos = max(1, hilos or HILOS_BLOQUES)
+    if hilos == 1:
+        with rasterio.open(ruta) as src:
+            for bloque in bloques:
+                verificar_cancelacion()
+                yield bloque, funcion(src, bloque)
+        return
+
+    local = threading.local()
+    abiertos = []
+    bloqueo = threading.Lock()
+
+    def _tarea(bloque):
+        src = getattr(local, 'src', None)
+        if src is None:
+            src = local.src = rasterio.open(ruta)
+            with bloqueo:
+                abiertos.append(src)
+        return bloque, funcion(src, bloque)
+
+    try:
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            pendientes = []
+            for bloque in bloques:
+                pendientes.append(ejecutor.submit(_tarea, bloque))
+                if len(pendientes) >= 2 * hilos:
+                    verificar_cancelacion()
+                    yield pendientes.pop(0).result()
+            for futuro in pendientes:
+                yield futuro.result()
+    finally:
+        for src in abiertos:
+            src.close()
+
+
+def _leer(src, ventana, banda=1, nodata=None):
+    """Lectura enmascarada que admite ventanas fuera del raster (halo en el borde)"""
+    relleno = nodata if nodata is not None else (src.nodata if src.nodata is not None else 0)
+    return src.read(banda, window=ventana, boundless=True, fill_value=relleno, masked=True)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RECORTE POR GEOMETRÍA
+# ════════════════════════════════════════════════════════════════════════
+def recortar_a_archivo(ruta, geometria, ruta_salida, nodata=None, memoria_mb=None, hilos=None):
+    """
+    Equivalente a rasterio.mask(crop=True) escrito bloque a bloque a un GeoTIFF con teselas.
+
+    Parámetros:
+    - geometria: shapely en el CRS del raster
+
+    Retorna:
+    - perfil del raster escrito (transform, width, height, crs, nodata, ...)
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(ruta) as src:
+        ventana = ventana_de_geometria(src, geometria)
+        perfil = src.profile.copy()
+        nodata = nodata if nodata is not None else (src.nodata if src.nodata is not None else -9999)
+        perfil.update(driver="GTiff", count=1, width=int(ventana.width), height=int(ventana.height),
+                      transform=src.window_transform(ventana), nodata=nodata, tiled=True,
+                      blockxsize=LADO_MINIMO, blockysize=LADO_MINIMO, compress="deflate", BIGTIFF="IF_SAFER")
+        bytes_px = np.dtype(src.dtypes[0]).itemsize + 1
+        col0, fila0 = int(ventana.col_off), int(ventana.row_off)
+
+    def _bloque(src, bloque):
+        datos = _leer(src, bloque.lectura)
+        dentro = mascara_bloque(geometria, datos.shape, src.window_transform(bloque.lectura))
+        return np.where(dentro & ~np.ma.getmaskarray(datos), datos.filled(nodata), nodata).astype(perfil['dtype'])
+
+    lado = lado_bloque(bytes_px, memoria_mb=memoria_mb, hilos=hilos)
+    with rasterio.open(ruta_salida, "w", **perfil) as dst:
+        for bloque, datos in recorrer_bloques(ruta, ventanas_bloques(ventana, lado), _bloque, hilos):
+            n = bloque.nucleo
+            dst.write(datos, 1, window=Window(n.col_off - col0, n.row_off - fila0, n.width, n.height))
+    return perfil
+
+
+def leer_recorte(ruta, geometria, memoria_mb=None, reducir=True, hilos=None):
+    """
+    Recorte enmascarado a memoria (float32 con NaN fuera de la geometría o en nodata).
+    Si el recorte completo no cabe en el techo de memoria y reducir=True, se lee con un factor
+    entero de reducción (vecino más cercano): suficiente para dibujar el mapa.
+
+    Retorna:
+    - (datos, transform, crs, factor)
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+
+    techo = (memoria_mb or MEMORIA_BLOQUES_MB) * 1024 * 1024
+    with rasterio.open(ruta) as src:
+        ventana = ventana_de_geometria(src, geometria)
+        crs = src.crs
+        alto, ancho = int(ventana.height), int(ventana.width)
+        factor = 1
+        if reducir and alto * ancho * 4 > techo:
+            factor = math.ceil(math.sqrt(alto * ancho * 4 / techo))
+            print(f"   🧱 Recorte de {ancho} x {alto} px supera {techo / 1024**2:.0f} MB: se lee reducido x{factor}")
+        transform = src.window_transform(ventana) * rasterio.Affine.scale(factor)
+        nodata = src.nodata
+
+    salida = np.full((math.ceil(alto / factor), math.ceil(ancho / factor)), np.nan, dtype=np.float32)
+    col0, fila0 = int(ventana.col_off), int(ventana.row_off)
+    # El bloque se lee ya reducido: el techo se aplica al tamaño reducido
+    lado = lado_bloque(5, memoria_mb=memoria_mb, hilos=hilos) * factor
+
+    def _bloque(src, bloque):
+        n = bloque.nucleo
+        forma = (math.ceil(n.height / factor), math.ceil(n.width / factor))
+        datos = src.read(1, window=n, out_shape=forma, resampling=Resampling.nearest, masked=True)
+        t = src.window_transform(n) * rasterio.Affine.scale(n.width / forma[1], n.height / forma[0])
+        dentro = mascara_bloque(geometria, forma, t) & ~np.ma.getmaskarray(datos)
+        if nodata is not None:
+            dentro &= datos.filled(nodata) != nodata
+        return np.where(dentro, datos.filled(0).astype(np.float32), np.nan)
+
+    for bloque, datos in recorrer_bloques(ruta, ventanas_bloques(Window(col0, fila0, ancho, alto), lado), _bloque, hilos):
+        f, c = (int(bloque.nucleo.row_off) - fila0) // factor, (int(bloque.nucleo.col_off) - col0) // factor
+        salida[f:f + datos.shape[0], c:c + datos.shape[1]] = datos
+    return salida, transform, crs, factor
+
+
+# ════════════════════════════════════════════════════════════════════════
+# OPERACIONES FOCALES Y RECLASIFICACIÓN A ARCHIVO
+# ════════════════════════════════════════════════════════════════════════
+def aplicar_por_bloques(ruta, ruta_salida, funcion, halo=0, geometria=None, dtype="float32",
+                        nodata=-9999.0, memoria_mb=None, hilos=None):
+    """
+    Escribe funcion(datos_con_halo, transform_con_halo) bloque a bloque (solo el núcleo).
+    Si se da geometría, la salida se limita a su ventana y lo de afuera queda en nodata.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(ruta) as src:
+        ventana = ventana_de_geometria(src, geometria) if geometria is not None else Window(0, 0, src.width, src.height)
+        perfil = src.profile.copy()
+        perfil.update(driver="GTiff", count=1, dtype=dtype, nodata=nodata, width=int(ventana.width),
+                      height=int(ventana.height), transform=src.window_transform(ventana), tiled=True,
+                      blockxsize=LADO_MINIMO, blockysize=LADO_MINIMO, compress="deflate", BIGTIFF="IF_SAFER")
+        # Entrada con halo + salida + intermedios de la función (holgura ×4)
+        bytes_px = (np.dtype(src.dtypes[0]).itemsize + np.dtype(dtype).itemsize) * 4
+        col0, fila0 = int(ventana.col_off), int(ventana.row_off)
+
+    def _bloque(src, bloque):
+        datos = _leer(src, bloque.lectura).astype(np.float64)
+        t = src.window_transform(bloque.lectura)
+        resultado = np.ma.filled(funcion(datos, t), nodata)[bloque.interior]
+        if geometria is not None:
+            dentro = mascara_bloque(geometria, resultado.shape, src.window_transform(bloque.nucleo))
+            resultado = np.where(dentro, resultado, nodata)
+        return resultado.astype(dtype)
+
+    lado = lado_bloque(bytes_px, halo=halo, memoria_mb=memoria_mb, hilos=hilos)
+    with rasterio.open(ruta_salida, "w", **perfil) as dst:
+        for bloque, datos in recorrer_bloques(ruta, ventanas_bloques(ventana, lado, halo), _bloque, hilos):
+            n = bloque.nucleo
+            dst.write(datos, 1, window=Window(n.col_off - col0, n.row_off - fila0, n.width, n.height))
+    return perfil
+
+
+def reclasificar_por_bloques(ruta, ruta_salida, cortes, geometria=None, memoria_mb=None, hilos=None):
+    """Clase 1..len(cortes)+1 según np.digitize(cortes); 0 = nodata"""
+    cortes = np.asarray(cortes, dtype=np.float64)
+
+    def _reclasificar(datos, _t):
+        clases = (np.digitize(datos.filled(np.nan), cortes) + 1).astype(np.uint8)
+        return np.ma.array(clases, mask=np.ma.getmaskarray(datos) | np.isnan(datos.filled(np.nan)))
+
+    return aplicar_por_bloques(ruta, ruta_salida, _reclasificar, geometria=geometria, dtype="uint8",
+                               nodata=0, memoria_mb=memoria_mb, hilos=hilos)
+
+
+def gradientes_horn(datos, res_x, res_y):
+    """dz/dx, dz/dy con el operador de Horn (3×3); el borde de un píxel queda enmascarado"""
+    z = np.ma.filled(datos.astype(np.float64), np.nan)
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+    dzdx = np.full(z.shape, np.nan)
+    dzdy = np.full(z.shape, np.nan)
+    dzdx[1:-1, 1:-1] = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * res_x)
+    dzdy[1:-1, 1:-1] = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * res_y)
+    return np.ma.masked_invalid(dzdx), np.ma.masked_invalid(dzdy)
+
+
+def sombreado(datos, transform, azimut=315.0, altitud=45.0):
+    """Sombreado (hillshade 0-255) de un bloque leído con halo de 1 píxel"""
+    dzdx, dzdy = gradientes_horn(datos, abs(transform.a), abs(transform.e))
+    pendiente = np.arctan(np.hypot(dzdx, dzdy))
+    aspecto = np.arctan2(dzdy, -dzdx)
+    zenit, az = np.radians(90.0 - altitud), np.radians(360.0 - azimut + 90.0)
+    valor = np.cos(zenit) * np.cos(pendiente) + np.sin(zenit) * np.sin(pendiente) * np.cos(az - aspecto)
+    return np.ma.clip(valor * 255.0, 0, 255)
+
+
+def sombreado_por_bloques(ruta_dem, ruta_salida, geometria=None, azimut=315.0, altitud=45.0, memoria_mb=None, hilos=None):
+    return aplicar_por_bloques(ruta_dem, ruta_salida, lambda d, t: sombreado(d, t, azimut, altitud), halo=1,
+                               geometria=geometria, dtype="uint8", nodata=0, memoria_mb=memoria_mb, hilos=hilos)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# ESTADÍSTICAS ZONALES
+# ════════════════════════════════════════════════════════════════════════
+def estadisticas_zonales(ruta, geometria, cortes=None, memoria_mb=None, hilos=None):
+    """
+    Conteo, mínimo, máximo, media y (opcional) histograma por cortes de los píxeles válidos
+    dentro de la geometría, acumulados bloque a bloque.
+
+    Retorna:
+    - diccionario {'conteo', 'minimo', 'maximo', 'media', 'histograma', 'area_pixel'}
+    """
+    import rasterio
+
+    with rasterio.open(ruta) as src:
+        ventana = ventana_de_geometria(src, geometria)
+        bytes_px = np.dtype(src.dtypes[0]).itemsize + 9
+        area_pixel = abs(src.transform.a * src.transform.e)
+        nodata = src.nodata
+
+    def _bloque(src, bloque):
+        datos = _leer(src, bloque.nucleo)
+        dentro = mascara_bloque(geometria, datos.shape, src.window_transform(bloque.nucleo)) & ~np.ma.getmaskarray(datos)
+        valores = datos.data[dentro].astype(np.float64)
+        if nodata is not None:
+            valores = valores[valores != nodata]
+        valores = valores[np.isfinite(valores)]
+        if valores.size == 0:
+            return None
+        hist = np.bincount(np.digitize(valores, cortes), minlength=len(cortes) + 1) if cortes is not None else None
+        return valores.size, valores.min(), valores.max(), valores.sum(), hist
+
+    conteo, minimo, maximo, suma = 0, np.inf, -np.inf, 0.0
+    histograma = np.zeros(len(cortes) + 1, dtype=np.int64) if cortes is not None else None
+    lado = lado_bloque(bytes_px, memoria_mb=memoria_mb, hilos=hilos)
+    for _, parcial in recorrer_bloques(ruta, ventanas_bloques(ventana, lado), _bloque, hilos):
+        if parcial is None:
+            continue
+        n, mn, mx, s, hist = parcial
+        conteo += n
+        minimo, maximo, suma = min(minimo, mn), max(maximo, mx), suma + s
+        if histograma is not None:
+            histograma += hist
+    return {
+        'conteo': conteo,
+        'minimo': minimo if conteo else None,
+        'maximo': maximo if conteo else None,
+        'media': suma / conteo if conteo else None,
+        'histograma': histograma.tolist() if histograma is not None else None,
+        'area_pixel': area_pixel,
+    }
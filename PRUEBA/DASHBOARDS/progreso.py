@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+⏳ progreso.py - EVENTOS DE PROGRESO DE LOS GENERADORES HACIA EL DASHBOARD
+- Cada trabajo tiene un id determinístico (usuario + tipo + n_clicks + token de la página) que también
+  conoce el navegador; el token (uno por pestaña y por recarga) evita que dos pestañas del mismo
+  usuario compartan progreso, marca de cancelación o turno
+- Los generadores llaman a etapa("Descargando imagen satelital...", 60) en puntos clave
+- Fuera de un trabajo registrado, etapa() no hace nada (costo despreciable)
+- El estado se guarda como un pequeño JSON por trabajo; el dashboard lo consulta con dcc.Interval
+- Cancelación cooperativa: el dashboard deja una marca y el siguiente etapa() lanza TrabajoCancelado
+  (también al vencer el tiempo límite del trabajo)
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Carpeta compartida entre el servidor Dash y los procesos que generan mapas
+# (en modo distribuido, dentro de DASH_COMPARTIDO para que todos los hosts la vean)
+if os.environ.get("DASH_COMPARTIDO"):
+    _RUTA_PROGRESO_DEFECTO = os.path.join(os.environ["DASH_COMPARTIDO"], "progreso")
+else:
+    _RUTA_PROGRESO_DEFECTO = os.path.join(tempfile.gettempdir(), "dash_progreso")
+RUTA_PROGRESO = os.environ.get("DASH_PROGRESO", _RUTA_PROGRESO_DEFECTO)
+HORAS_RETENCION = 12
+
+_LOCAL = threading.local()
+
+
+class TrabajoCancelado(BaseException):
+    """
+    El usuario canceló el trabajo o se venció su tiempo límite.
+    Hereda de BaseException para que los `except Exception` de los generadores no la oculten.
+    """
+
+
+def _nombre_seguro(texto):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(texto))
+
+
+def id_trabajo(nombre_usuario, tipo, n_clicks, token=None):
+    """
+    Id estable: lo calcula igual el callback que genera y el que consulta el progreso.
+    `token` identifica la pestaña (dcc.Store 'token-pagina', ver TOKEN_PAGINA_JS).
+    """
+    id_trab = f"{_nombre_seguro(nombre_usuario)}__{_nombre_seguro(tipo)}__{n_clicks}"
+    return f"{id_trab}__{_nombre_seguro(token)[:36]}" if token else id_trab
+
+
+# Callback de cliente que da a cada carga de página un token propio (la Store es de memoria:
+# se renueva al recargar y no se comparte entre pestañas)
+TOKEN_PAGINA_JS = """
+function(_, actual) {
+    if (actual) { return actual; }
+    if (window.crypto && window.crypto.randomUUID) { return window.crypto.randomUUID(); }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+"""
+
+
+def ruta_estado(id_trab):
+    return os.path.join(RUTA_PROGRESO, f"{id_trab}.json")
+
+
+def ruta_cancelacion(id_trab):
+    return os.path.join(RUTA_PROGRESO, f"{id_trab}.cancelar")
+
+
+def _escribir_estado(id_trab, estado):
+    os.makedirs(RUTA_PROGRESO, exist_ok=True)
+    ruta = ruta_estado(id_trab)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def leer_progreso(id_trab):
+    """Último estado del trabajo o None si todavía no existe"""
+    try:
+        with open(ruta_estado(id_trab), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def limpiar_progresos_antiguos(horas=HORAS_RETENCION):
+    if not os.path.isdir(RUTA_PROGRESO):
+        return
+    limite = time.time() - horas * 3600
+    for archivo in os.listdir(RUTA_PROGRESO):
+        ruta = os.path.join(RUTA_PROGRESO, archivo)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+# ════════════════════════════════════════════════════════════════════════
+# REGISTRO DEL TRABAJO EN CURSO (POR HILO)
+# ════════════════════════════════════════════════════════════════════════
+def trabajo_actual():
+    """Id del trabajo que corre en este hilo (o None)"""
+    return getattr(_LOCAL, 'id', None)
+
+
+@contextmanager
+def trabajo_en_curso(id_trab, descripcion=""):
+    """
+    Registra el trabajo en el hilo actual mientras dura el bloque:
+
+        with trabajo_en_curso(id_trab, "Mapa de vías"):
+            ruta = generar_mapa_vias(...)
+    """
+    anterior = (getattr(_LOCAL, 'id', None), getattr(_LOCAL, 'inicio', None),
+                getattr(_LOCAL, 'pct', 0), getattr(_LOCAL, 'limite', None))
+    _LOCAL.id = id_trab
+    _LOCAL.inicio = time.time()
+    _LOCAL.pct = 0
+    _LOCAL.limite = None
+    _LOCAL.descripcion = descripcion
+    limpiar_progresos_antiguos()
+    _borrar_marca_cancelacion(id_trab)
+    etapa("Iniciando...", 0)
+    try:
+        yield id_trab
+        _finalizar('terminado', "Completado")
+    except TrabajoCancelado as e:
+        _finalizar('cancelado', str(e) or "Cancelado")
+        raise
+    except BaseException as e:
+        _finalizar('error', f"Error: {e}")
+        raise
+    finally:
+        _borrar_marca_cancelacion(id_trab)
+        _LOCAL.id, _LOCAL.inicio, _LOCAL.pct, _LOCAL.limite = anterior
+
+
+_ATRIBUTOS_TRABAJO = ('id', 'inicio', 'pct', 'limite', 'descripcion')
+
+
+def contexto_trabajo():
+    """Trabajo, avance y tiempo límite de este hilo, para reinstalarlos en otro (en_contexto)"""
+    return {a: getattr(_LOCAL, a, None) for a in _ATRIBUTOS_TRABAJO}
+
+
+@contextmanager
+def en_contexto(contexto):
+    """
+    Ejecuta el bloque, en un hilo auxiliar (p. ej. de un ThreadPoolExecutor), como parte del
+    trabajo del hilo que capturó el contexto: etapa() reporta y la cancelación y el tiempo
+    límite se aplican igual que en el hilo original.
+    """
+    anterior = contexto_trabajo()
+    for atributo, valor in contexto.items():
+        setattr(_LOCAL, atributo, valor)
+    try:
+        yield
+    finally:
+        for atributo, valor in anterior.items():
+            setattr(_LOCAL, atributo, valor)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CANCELACIÓN Y TIEMPO LÍMITE
+# ════════════════════════════════════════════════════════════════════════
+def cancelar_trabajo(id_trab):
+    """Pide la cancelación de un trabajo (la llama el dashboard; funciona entre procesos)"""
+    os.makedirs(RUTA_PROGRESO, exist_ok=True)
+    with open(ruta_cancelacion(id_trab), 'w', encoding='utf-8') as f:
+        f.write(str(time.time()))
+
+
+def _borrar_marca_cancelacion(id_trab):
+    try:
+        os.remove(ruta_cancelacion(id_trab))
+    except OSError:
+        pass
+
+
+def fijar_limite(segundos):
+    """Tiempo límite del trabajo en curso, contado desde ahora (None = sin límite)"""
+    _LOCAL.limite = time.time() + segundos if segundos else None
+
+
+def motivo_cancelacion():
+    """Texto con el motivo si el trabajo en curso debe detenerse, o None"""
+    id_trab = getattr(_LOCAL, 'id', None)
+    if id_trab is None:
+        return None
+    if os.path.exists(ruta_cancelacion(id_trab)):
+        return "Cancelado por el usuario"
+    limite = getattr(_LOCAL, 'limite', None)
+    if limite is not None and time.time() > limite:
+        return "Se superó el tiempo límite del trabajo"
+    return None
+
+
+def verificar_cancelacion():
+    """Lanza TrabajoCancelado si el trabajo en curso fue cancelado o se venció su tiempo"""
+    motivo = motivo_cancelacion()
+    if motivo:
+        raise TrabajoCancelado(motivo)
+
+
+def etapa(nombre, pct):
+    """
+    Reporta la etapa actual del trabajo en curso.
+
+    Parámetros:
+    - nombre: texto corto para el usuario ("Recortando DEM al distrito...")
+    - pct: porcentaje aproximado completado (0-100)
+
+    Es también el punto de control de la cancelación: lanza TrabajoCancelado si corresponde.
+    """
+    id_trab = getattr(_LOCAL, 'id', None)
+    if id_trab is None:
+        return
+    verificar_cancelacion()
+    pct = max(getattr(_LOCAL, 'pct', 0), min(float(pct), 100.0))
+    _LOCAL.pct = pct
+    transcurrido = time.time() - _LOCAL.inicio
+    eta = transcurrido * (100.0 - pct) / pct if pct > 0 else None
+    try:
+        _escribir_estado(id_trab, {
+            'id': id_trab,
+            'descripcion': getattr(_LOCAL, 'descripcion', ''),
+            'estado': 'en_curso',
+            'etapa': nombre,
+            'pct': round(pct, 1),
+            'transcurrido_s': round(transcurrido, 1),
+            'eta_s': round(eta, 1) if eta is not None else None,
+            'actualizado': time.time(),
+        })
+    except OSError:
+        # El progreso es informativo: nunca debe romper la generación del mapa
+        pass
+
+
+def _finalizar(estado, texto):
+    id_trab = getattr(_LOCAL, 'id', None)
+    if id_trab is None:
+        return
+    try:
+        _escribir_estado(id_trab, {
+            'id': id_trab,
+            'descripcion': getattr(_LOCAL, 'descripcion', ''),
+            'estado': estado,
+            'etapa': texto,
+            'pct': 100.0 if estado == 'terminado' else getattr(_LOCAL, 'pct', 0),
+            'transcurrido_s': round(time.time() - _LOCAL.inicio, 1),
+            'eta_s': 0,
+            'actualizado': time.time(),
+        })
+    except OSError:
+        pass
+
+
+def formatear_segundos(segundos):
+    if segundos is None:
+        return "calculando..."
+    segundos = int(segundos)
+    if segundos < 60:
+        return f"{segundos} s"
+    return f"{segundos // 60} min {segundos % 60:02d} s"
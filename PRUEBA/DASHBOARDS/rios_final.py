@@ -13,12 +13,17 @@ from matplotlib.ticker import FuncFormatter
 from matplotlib.patches import Polygon, Rectangle, Patch
 from matplotlib.lines import Line2D
 import datetime
+from capas_cache import buscar_shapefile_cacheado, leer_capa
+from progreso import etapa, verificar_cancelacion
+from almacenamiento import guardar_figura, existe, tamano
+from planificador import configurar_wbt
+from hidrologia_numpy import MOTOR_HIDROLOGIA, red_rios_numpy
+from distancia_rios import anillos_distancia
+from hidrologia_regional import acumulacion_distrito, red_rios_regional
+from procesamiento_bloques import recortar_a_archivo, leer_recorte, ventana_de_geometria
 import rasterio
-from rasterio.mask import mask as rio_mask
 from whitebox import WhiteboxTools
-from shapely.ops import unary_union
-import tempfile
-import shutil
+from espacio_trabajo import crear_espacio_trabajo, liberar_espacio_trabajo, verificar_cuota
 import pandas as pd
 
 # --- RUTA BASE ORIGINAL ---
@@ -37,8 +42,18 @@ BUFFERS_CONFIG = [
     {"name": ">200m", "inner": 200, "outer": None, "color": "#0080FF"}
 ]
 
+# UMBRALES DE ACUMULACIÓN (CELDAS) POR INTENSIDAD DE RED
+# Todas salen de la misma acumulación de flujo en caché: cambiar de intensidad no recalcula el DEM
+UMBRALES = {
+    "muy_alta": 50,
+    "alta": 200,
+    "media": 500,
+    "baja": 1000,
+    "muy_baja": 2000
+}
+
 # FUNCIÓN PARA GENERAR RED DE RÍOS DESDE GEOTIFF
-def generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad="media"):
+def generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad="media", nombre_usuario=None):
     """Genera red hidrográfica desde un archivo DEM GeoTIFF"""
     print("   Generando red hidrográfica desde DEM...")
     
@@ -49,83 +64,91 @@ def generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad="media"):
         
         print(f"   Archivo DEM encontrado: {ruta_dem}")
         
-        temp_dir = tempfile.mkdtemp()
-        print(f"   Directorio temporal: {temp_dir}")
+        threshold = UMBRALES.get(intensidad, 500)
+        print(f"   Umbral de acumulación: {threshold} celdas (intensidad: {intensidad})")
+        
+        # La acumulación de flujo se calcula una vez por distrito (o viene de una región precalculada):
+        # cada intensidad es solo un umbral sobre ella más la vectorización
+        region = acumulacion_distrito(ruta_dem, gdf_distrito, margen_m=1000, nombre_usuario=nombre_usuario)
+        
+        # Carpeta exclusiva del trabajo (tmpfs si hay espacio) con cuota de disco
+        temp_dir = crear_espacio_trabajo(nombre_usuario, "rios")
         
         try:
-            wbt = WhiteboxTools()
-            wbt.set_working_dir(temp_dir)
-            wbt.set_verbose_mode(False)
+            if region is not None:
+                etapa("Extrayendo ríos de la acumulación en caché...", 20)
+                print(f"   Acumulación de flujo en caché: {region['nombre']}")
+                rivers = red_rios_regional(region, gdf_distrito, threshold, margen_m=1000)
+                crs_dem = region['crs']
+            else:
+                if MOTOR_HIDROLOGIA == "whitebox":
+                    wbt = WhiteboxTools()
+                    wbt.set_working_dir(temp_dir)
+                    # El modo verbose es necesario para que el callback pueda cortar la herramienta al cancelar
+                    wbt.set_verbose_mode(True)
+                    configurar_wbt(wbt, imprimir=False)
             
-            with rasterio.open(ruta_dem) as src:
-                print(f"   CRS del DEM: {src.crs}")
-                print(f"   Dimensiones: {src.width} x {src.height}")
-                
-                gdf_distrito_reproj = gdf_distrito.to_crs(src.crs)
+                with rasterio.open(ruta_dem) as src:
+                    print(f"   CRS del DEM: {src.crs}")
+                    print(f"   Dimensiones: {src.width} x {src.height}")
                 
-                from shapely.geometry import mapping
+                    gdf_distrito_reproj = gdf_distrito.to_crs(src.crs)
                 
-                buffer_dist = 1000
-                gdf_buffer = gdf_distrito_reproj.copy()
-                gdf_buffer['geometry'] = gdf_buffer.geometry.buffer(buffer_dist)
+                    buffer_dist = 1000
+                    limite_buffer = gdf_distrito_reproj.geometry.buffer(buffer_dist).unary_union
                 
-                geoms = [mapping(geom) for geom in gdf_buffer.geometry]
-                
-                out_image, out_transform = rio_mask(src, geoms, crop=True, filled=False)
-                elevation = out_image[0]
-                
-                dem_clipped = os.path.join(temp_dir, "dem_clipped.tif")
-                
-                out_meta = src.meta.copy()
-                out_meta.update({
-                    "driver": "GTiff",
-                    "height": elevation.shape[0],
-                    "width": elevation.shape[1],
-                    "transform": out_transform
-                })
+                    ventana = ventana_de_geometria(src, limite_buffer)
+                    bytes_px = np.dtype(src.dtypes[0]).itemsize
+                    crs_dem = src.crs
+            
+                if MOTOR_HIDROLOGIA == "whitebox":
+                    verificar_cuota(temp_dir, bytes_adicionales=int(ventana.width * ventana.height) * bytes_px * 6)
                 
-                with rasterio.open(dem_clipped, "w", **out_meta) as dest:
-                    dest.write(elevation, 1)
+                    # Recorte bloque a bloque: el DEM recortado nunca se carga entero en memoria
+                    dem_clipped = os.path.join(temp_dir, "dem_clipped.tif")
+                    recortar_a_archivo(ruta_dem, limite_buffer, dem_clipped)
                 
-                print(f"   DEM recortado guardado")
+                    print(f"   DEM recortado guardado")
+                else:
+                    # El relleno de depresiones necesita el recorte completo: se arma por bloques a resolución nativa
+                    elevation, out_transform, _, _ = leer_recorte(ruta_dem, limite_buffer, reducir=False)
             
-            filled_dem = os.path.join(temp_dir, "filled.tif")
-            flow_dir = os.path.join(temp_dir, "flow_dir.tif")
-            flow_acc = os.path.join(temp_dir, "flow_acc.tif")
-            streams_raster = os.path.join(temp_dir, "streams.tif")
-            streams_vector = os.path.join(temp_dir, "streams.shp")
+                if MOTOR_HIDROLOGIA == "numpy":
+                    # Toda la cadena en memoria, sin GeoTIFF intermedios
+                    rivers = red_rios_numpy(elevation, out_transform, crs_dem, threshold, progreso=(20, 55))
+                else:
+                    filled_dem = os.path.join(temp_dir, "filled.tif")
+                    flow_dir = os.path.join(temp_dir, "flow_dir.tif")
+                    flow_acc = os.path.join(temp_dir, "flow_acc.tif")
+                    streams_raster = os.path.join(temp_dir, "streams.tif")
+                    streams_vector = os.path.join(temp_dir, "streams.shp")
             
-            print("   1/5 Rellenando depresiones...")
-            wbt.fill_depressions(dem_clipped, filled_dem)
+                    etapa("Rellenando depresiones del DEM...", 20)
+                    print("   1/5 Rellenando depresiones...")
+                    wbt.fill_depressions(dem_clipped, filled_dem)
             
-            print("   2/5 Calculando dirección de flujo...")
-            wbt.d8_pointer(filled_dem, flow_dir)
+                    etapa("Calculando dirección de flujo...", 28)
+                    print("   2/5 Calculando dirección de flujo...")
+                    wbt.d8_pointer(filled_dem, flow_dir)
             
-            print("   3/5 Calculando acumulación de flujo...")
-            wbt.d8_flow_accumulation(filled_dem, flow_acc, out_type="cells")
-            
-            UMBRALES = {
-                "muy_alta": 50,
-                "alta": 200,
-                "media": 500,
-                "baja": 1000,
-                "muy_baja": 2000
-            }
-            
-            threshold = UMBRALES.get(intensidad, 500)
-            print(f"   Umbral de acumulación: {threshold} celdas (intensidad: {intensidad})")
-            
-            print("   4/5 Extrayendo red de ríos...")
-            wbt.extract_streams(flow_acc, streams_raster, threshold)
+                    etapa("Calculando acumulación de flujo...", 35)
+                    print("   3/5 Calculando acumulación de flujo...")
+                    wbt.d8_flow_accumulation(filled_dem, flow_acc, out_type="cells")
+                    verificar_cuota(temp_dir)
+                
+                    etapa("Extrayendo red de ríos...", 50)
+                    print("   4/5 Extrayendo red de ríos...")
+                    wbt.extract_streams(flow_acc, streams_raster, threshold)
             
-            print("   5/5 Convirtiendo a vector...")
-            wbt.raster_streams_to_vector(streams_raster, flow_dir, streams_vector)
+                    etapa("Vectorizando red de ríos...", 55)
+                    print("   5/5 Convirtiendo a vector...")
+                    wbt.raster_streams_to_vector(streams_raster, flow_dir, streams_vector)
+                    verificar_cancelacion()
             
-            rivers = gpd.read_file(streams_vector)
+                    rivers = gpd.read_file(streams_vector)
             
             if rivers.crs is None:
-                with rasterio.open(dem_clipped) as dem_src:
-                    rivers = rivers.set_crs(dem_src.crs)
+                rivers = rivers.set_crs(crs_dem)
             
             rivers_3857 = rivers.to_crs(3857)
             
@@ -150,11 +173,8 @@ def generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad="media"):
             return rivers_clipped, stats
             
         finally:
-            try:
-                shutil.rmtree(temp_dir)
-                print("   Archivos temporales eliminados")
-            except:
-                pass
+            liberar_espacio_trabajo(temp_dir)
+            print("   Archivos temporales eliminados")
                 
     except Exception as e:
         print(f"   ERROR generando red de ríos: {e}")
@@ -168,7 +188,8 @@ def generar_buffers_distancia(rivers_gdf, gdf_distrito):
     print("   Generando buffers de distancia...")
     
     try:
-        rivers_union = unary_union(rivers_gdf.geometry)
+        # Transformada de distancia sobre una grilla del distrito (o buffers de shapely, ver distancia_rios.py)
+        anillos = anillos_distancia(rivers_gdf, gdf_distrito.geometry.union_all(), BUFFERS_CONFIG)
         
         buffer_list = []
         
@@ -176,17 +197,7 @@ def generar_buffers_distancia(rivers_gdf, gdf_distrito):
             name = config["name"]
             inner = config["inner"]
             outer = config["outer"]
-            
-            if outer is None:
-                outer_buffer = gdf_distrito.geometry.union_all()
-                inner_buffer = rivers_union.buffer(inner)
-                buffer_ring = outer_buffer.difference(inner_buffer)
-            else:
-                outer_buffer = rivers_union.buffer(outer)
-                inner_buffer = rivers_union.buffer(inner)
-                buffer_ring = outer_buffer.difference(inner_buffer)
-                
-                buffer_ring = buffer_ring.intersection(gdf_distrito.geometry.union_all())
+            buffer_ring = anillos[name]
             
             area_km2 = buffer_ring.area / 1_000_000
             
@@ -303,11 +314,7 @@ def add_membrete(ax, dpto, prov, dist, main_map_ax, fig_obj):
     ax.text(5 + padding, 0.5, info["FECHA"], va='center', fontsize=8)
 
 def buscar_shapefile(nombre_busqueda):
-    for root, _, files in os.walk(ruta_base):
-        for file in files:
-            if file.lower().endswith(".shp") and nombre_busqueda.lower() in file.lower():
-                return os.path.join(root, file)
-    return None
+    return buscar_shapefile_cacheado(nombre_busqueda)
 
 def cargar_shapefile(nombre, alias):
     path = buscar_shapefile(nombre)
@@ -316,10 +323,7 @@ def cargar_shapefile(nombre, alias):
         return None
     
     try:
-        gdf = gpd.read_file(path)
-        if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-            gdf.set_crs(epsg=4326, inplace=True)
-        return gdf.to_crs(epsg=3857)
+        return leer_capa(path, forzar_4326=True)
     except Exception as e:
         print(f"   Error cargando {alias} desde {path}: {e}")
         return None
@@ -487,14 +491,15 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
         print(f"Error creando la estructura de carpetas para el usuario: {e}")
         return None
     
+    etapa("Cargando capas base...", 5)
     print("\nCargando capas base...")
     gdf_departamentos = cargar_shapefile("departamento", "Departamentos")
     gdf_provincias = cargar_shapefile("provincia", "Provincias")
     gdf_distritos = cargar_shapefile("distrito", "Distritos del Perú")
     
     try:
-        gdf_paises = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamerica.shp").to_crs(3857)
-        gdf_oceano = gpd.read_file(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Oceano.shp").to_crs(3857)
+        gdf_paises = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/PAISES DE SUDAMERICA/Sudamerica.shp")
+        gdf_oceano = leer_capa(f"{ruta_base}/DATA/MAPA DE UBICACION/OCEANO/Oceano.shp")
     except Exception as e:
         print(f"Error cargando shapefiles de Países u Océano: {e}")
         gdf_paises = None
@@ -512,6 +517,7 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
         print("No se pudieron identificar las columnas de nombres en los shapefiles")
         return None
     
+    etapa("Filtrando el área seleccionada...", 10)
     print("\nFiltrando datos del área seleccionada...")
     gdf_dpto_sel = gdf_departamentos[gdf_departamentos[col_dpto] == departamento_sel]
     gdf_prov_sel = gdf_provincias[gdf_provincias[col_prov] == provincia_sel]
@@ -525,8 +531,9 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
     
     print(f"   Distrito encontrado con geometría válida")
     
+    etapa("Generando red hidrográfica desde el DEM...", 15)
     print("\nGenerando red hidrográfica desde DEM...")
-    resultado = generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad)
+    resultado = generar_red_rios_desde_geotiff(ruta_dem, gdf_distrito, intensidad, nombre_usuario=nombre_usuario)
     
     if resultado is None:
         print("ERROR: generar_red_rios_desde_geotiff retornó None")
@@ -548,12 +555,14 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
     
     buffers_gdf = None
     if not rivers_gdf.empty:
+        etapa("Generando buffers de distancia a ríos...", 62)
         print("\nGenerando buffers de distancia a ríos...")
         buffers_gdf = generar_buffers_distancia(rivers_gdf, gdf_distrito.to_crs(3857))
         
         if buffers_gdf is not None:
             print("   Buffers generados correctamente")
     
+    etapa("Armando el layout del mapa...", 70)
     print("\nGenerando layout del mapa...")
     fig = plt.figure(figsize=(14, 9.9))
     
@@ -597,6 +606,7 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
     
     print("   Descargando imagen satelital...")
     try:
+        etapa("Descargando imagen satelital...", 75)
         ctx.add_basemap(ax_main, source=ctx.providers.Esri.WorldImagery, 
                        attribution=False, zoom='auto')
     except Exception as e:
@@ -677,6 +687,7 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
     leg.get_frame().set_edgecolor('black')
     leg.get_frame().set_linewidth(1.2)
     
+    etapa("Dibujando mapas de ubicación...", 85)
     print("   Generando mapas de ubicación...")
     
     # MAPAS DE UBICACIÓN LATERAL
@@ -714,17 +725,18 @@ def generar_mapa_rios(nombre_usuario, departamento_sel, provincia_sel, distrito_
         spine.set_linewidth(2)
         spine.set_color('black')
     
+    etapa("Guardando el mapa...", 92)
     print("\nGuardando mapa final en carpeta de usuario...")
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombre_base = f"MAPA_RIOS_{distrito_sel.replace(' ', '_')}_{timestamp}.png"
+    nombre_base = f"MAPA_RIOS_{distrito_sel.replace(' ', '_')}_{intensidad.upper()}_{timestamp}.png"
     ruta_guardado_final = os.path.join(carpeta_salida, nombre_base)
     
     try:
-        plt.savefig(ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
+        ruta_guardado_final = guardar_figura(fig, ruta_guardado_final, dpi=300, bbox_inches='tight', pad_inches=0.01)
         plt.close(fig)
         
-        if os.path.exists(ruta_guardado_final):
-            file_size = os.path.getsize(ruta_guardado_final) / (1024 * 1024)
+        if existe(ruta_guardado_final):
+            file_size = tamano(ruta_guardado_final) / (1024 * 1024)
             print(f"✅ Mapa de red hidrográfica guardado exitosamente")
             print(f"   📍 Ubicación: {ruta_guardado_final}")
             print(f"   💾 Tamaño: {file_size:.2f} MB")
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+⚖️ tablas_pesos.py - PESOS DE GEOLOGÍA Y GEOMORFOLOGÍA EN TABLAS (CÓDIGO DE UNIDAD -> PESO)
+- Los pesos se guardan en tablas CSV pequeñas en DATA/PELIGRO/PESOS en lugar de copias de toda la
+  capa con una columna PESO (geolo_cusco_con_pesos.shp, geomorfo_cusco_pesos.shp)
+- Se aplican al vuelo sobre las capas base en caché (DATA/GEOLOGIA/<DEP>/geolo_<dep>.shp,
+  DATA/GEOMORFOLOGIA/geomorfo_<dep>.shp) con un mapeo vectorizado por posición en la tabla
+- Cualquier departamento con capa base y tabla queda disponible; cambiar un peso es editar la tabla
+- Tabla por departamento (<fuente>_<dep>.csv) o nacional (<fuente>.csv). La primera columna se llama
+  como el campo de la capa base que trae el código de la unidad; la columna PESO trae el peso y las
+  demás (p. ej. DESCRIPCION) se ignoran. Separador ',' o ';'
+
+Crear la tabla a partir de una capa con pesos ya asignados:
+    python tablas_pesos.py --fuente geologia --desde ../DATA/PELIGRO/GEOLOGIA/geolo_cusco_con_pesos.shp --campo GEOLOGIA --departamento CUSCO
+    python tablas_pesos.py --listar
+"""
+
+import os
+import sys
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- RUTA BASE ---
+ruta_base = "/workspaces/AUTOMATIZACION_DASH/PRUEBA"
+
+RUTA_PESOS = f"{ruta_base}/DATA/PELIGRO/PESOS"
+
+# fuente -> (columna de peso que entrega, carpeta de las capas base, rutas posibles por departamento)
+CAPAS_TABLA = {
+    'geologia': ('PESO_GEOL', f"{ruta_base}/DATA/GEOLOGIA", [
+        "{DEP}/geolo_{dep}.shp",
+        "{dep}/geolo_{dep}.shp",
+        "geolo_{dep}.shp",
+        "{DEP}/geologia_{dep}.shp",
+    ]),
+    'geomorfologia': ('PESO_GEOMO', f"{ruta_base}/DATA/GEOMORFOLOGIA", [
+        "geomorfo_{dep}.shp",
+        "{dep}/geomorfo_{dep}.shp",
+        "geomorfo_{DEP}.shp",
+    ]),
+}
+
+_TABLAS = {}
+_BLOQUEO = threading.Lock()
+
+
+# ════════════════════════════════════════════════════════════════════════
+# RUTAS
+# ════════════════════════════════════════════════════════════════════════
+def ruta_tabla_pesos(fuente, departamento=None):
+    """Tabla del departamento o, si no hay, la nacional; None si no existe ninguna"""
+    candidatas = []
+    if departamento:
+        candidatas.append(os.path.join(RUTA_PESOS, f"{fuente}_{departamento.lower()}.csv"))
+    candidatas.append(os.path.join(RUTA_PESOS, f"{fuente}.csv"))
+    return next((r for r in candidatas if os.path.exists(r)), None)
+
+
+def ruta_capa_base(fuente, departamento):
+    """Capa base (sin pesos) de la fuente para el departamento, o None"""
+    if not departamento:
+        return None
+    _, carpeta, patrones = CAPAS_TABLA[fuente]
+    for patron in patrones:
+        ruta = os.path.join(carpeta, patron.format(DEP=departamento.upper(), dep=departamento.lower()))
+        if os.path.exists(ruta):
+            return ruta
+    return None
+
+
+def entradas_tabla(fuente, departamento=None):
+    """Lo que invalida la capa con pesos: la tabla y la capa base (sin departamento, sus carpetas)"""
+    tabla = ruta_tabla_pesos(fuente, departamento)
+    capa = ruta_capa_base(fuente, departamento)
+    if tabla and capa:
+        return [tabla, capa]
+    return [RUTA_PESOS, CAPAS_TABLA[fuente][1]]
+
+
+# ════════════════════════════════════════════════════════════════════════
+# TABLAS
+# ════════════════════════════════════════════════════════════════════════
+def _normalizar_codigos(serie):
+    """Códigos comparables entre la capa y la tabla: texto sin espacios, en mayúsculas y sin '.0'"""
+    return (serie.astype(str).str.strip().str.upper()
+            .str.replace(r"\.0+$", "", regex=True))
+
+
+def leer_tabla_pesos(ruta):
+    """
+    Tabla de pesos (en memoria mientras el archivo no cambie).
+
+    Retorna:
+    - (campo de la capa con el código, Serie código normalizado -> peso)
+    """
+    st = os.stat(ruta)
+    clave = (os.path.abspath(ruta), st.st_mtime_ns, st.st_size)
+    with _BLOQUEO:
+        if clave in _TABLAS:
+            return _TABLAS[clave]
+
+    df = pd.read_csv(ruta, sep=None, engine='python', dtype=str, encoding='utf-8-sig')
+    columnas = {c.strip().upper(): c for c in df.columns}
+    if len(df.columns) < 2 or 'PESO' not in columnas:
+        raise ValueError(f"La tabla {os.path.basename(ruta)} debe tener el campo del código y la columna PESO")
+    campo = df.columns[0].strip()
+    codigos = _normalizar_codigos(df[df.columns[0]])
+    pesos = pd.to_numeric(df[columnas['PESO']].str.replace(',', '.'), errors='coerce')
+    if pesos.isna().any():
+        malos = ', '.join(codigos[pesos.isna()].head(5))
+        raise ValueError(f"La tabla {os.path.basename(ruta)} tiene pesos vacíos o no numéricos ({malos})")
+    repetidos = codigos[codigos.duplicated()]
+    if not repetidos.empty:
+        raise ValueError(f"La tabla {os.path.basename(ruta)} repite códigos: {', '.join(repetidos.unique()[:5])}")
+
+    tabla = (campo, pd.Series(pesos.to_numpy(dtype=float), index=codigos.to_numpy()))
+    with _BLOQUEO:
+        _TABLAS[clave] = tabla
+    return tabla
+
+
+def aplicar_tabla_pesos(gdf, campo, tabla, columna_peso):
+    """
+    Agrega columna_peso a la capa traduciendo el código de cada unidad con la tabla.
+
+    El peso de cada polígono sale de indexar el vector de pesos con la posición de su código
+    en la tabla (sin bucles ni merge).
+    Las unidades sin peso en la tabla se informan y se descartan.
+
+    Retorna:
+    - GeoDataFrame con [campo, columna_peso, geometría]
+    """
+    columnas = {c.upper(): c for c in gdf.columns}
+    if campo.upper() not in columnas:
+        raise ValueError(f"La capa no tiene el campo '{campo}' que usa la tabla de pesos")
+    campo = columnas[campo.upper()]
+
+    posiciones = tabla.index.get_indexer(_normalizar_codigos(gdf[campo]))
+    # La posición -1 (unidad fuera de la tabla) cae en el NaN agregado al final
+    pesos = np.append(tabla.to_numpy(dtype=float), np.nan)[posiciones]
+
+    sin_peso = np.isnan(pesos)
+    if sin_peso.any():
+        faltan = pd.unique(gdf.loc[sin_peso, campo].astype(str))
+        print(f"      ⚠️ {sin_peso.sum()} polígonos sin peso en la tabla ({len(faltan)} unidades: "
+              f"{', '.join(faltan[:8])}{'...' if len(faltan) > 8 else ''})")
+
+    gdf = gdf.loc[~sin_peso, [campo, gdf.geometry.name]].copy()
+    gdf[columna_peso] = pesos[~sin_peso]
+    return gdf
+
+
+def capa_con_pesos(fuente, departamento):
+    """
+    Capa base del departamento (en caché, EPSG:3857) con los pesos de su tabla.
+
+    Retorna:
+    - GeoDataFrame con la columna de peso de la fuente, o None si faltan la tabla o la capa base
+    """
+    from capas_cache import leer_capa
+
+    ruta_tabla = ruta_tabla_pesos(fuente, departamento)
+    ruta_capa = ruta_capa_base(fuente, departamento)
+    if not ruta_tabla or not ruta_capa:
+        return None
+    campo, tabla = leer_tabla_pesos(ruta_tabla)
+    print(f"      ⚖️ Pesos de {os.path.basename(ruta_tabla)} ({len(tabla)} unidades) sobre {os.path.basename(ruta_capa)}")
+    return aplicar_tabla_pesos(leer_capa(ruta_capa), campo, tabla, CAPAS_TABLA[fuente][0])
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CREAR TABLAS DESDE CAPAS CON PESOS
+# ════════════════════════════════════════════════════════════════════════
+def tabla_desde_capa(ruta_capa, campo, columna_peso, ruta_salida):
+    """
+    Escribe la tabla código -> peso de una capa que ya trae los pesos (p. ej. *_con_pesos.shp).
+    Si un código tiene varios pesos se usa el más frecuente y se avisa.
+
+    Retorna:
+    - ruta de la tabla o None si falla
+    """
+    import geopandas as gpd
+
+    try:
+        df = gpd.read_file(ruta_capa, ignore_geometry=True)
+    except Exception as e:
+        print(f"❌ No se pudo leer {ruta_capa}: {e}")
+        return None
+    if campo not in df.columns or columna_peso not in df.columns:
+        print(f"❌ La capa no tiene '{campo}' y '{columna_peso}' (campos: {', '.join(df.columns)})")
+        return None
+
+    pares = df[[campo, columna_peso]].dropna()
+    pares = pares.assign(**{campo: _normalizar_codigos(pares[campo])})
+    conteo = pares.groupby([campo, columna_peso]).size().reset_index(name='n')
+    ambiguos = conteo[conteo.duplicated(campo, keep=False)][campo].unique()
+    if len(ambiguos):
+        print(f"   ⚠️ {len(ambiguos)} unidades con más de un peso (se usa el más frecuente): {', '.join(ambiguos[:8])}")
+    tabla = (conteo.sort_values('n', ascending=False).drop_duplicates(campo)
+             .sort_values(campo)[[campo, columna_peso]].rename(columns={columna_peso: 'PESO'}))
+
+    os.makedirs(os.path.dirname(ruta_salida) or ".", exist_ok=True)
+    temporal = f"{ruta_salida}.{os.getpid()}.tmp"
+    tabla.to_csv(temporal, index=False, encoding='utf-8')
+    os.replace(temporal, ruta_salida)
+    print(f"✅ Tabla de pesos: {ruta_salida} ({len(tabla)} unidades)")
+    return ruta_salida
+
+
+def listar_tablas():
+    """[(archivo, campo, unidades)] de las tablas de RUTA_PESOS"""
+    if not os.path.isdir(RUTA_PESOS):
+        return []
+    tablas = []
+    for archivo in sorted(os.listdir(RUTA_PESOS)):
+        if archivo.lower().endswith('.csv'):
+            try:
+                campo, tabla = leer_tabla_pesos(os.path.join(RUTA_PESOS, archivo))
+                tablas.append((archivo, campo, len(tabla)))
+            except (OSError, ValueError) as e:
+                print(f"   ⚠️ {archivo}: {e}")
+    return tablas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tablas de pesos de geología y geomorfología")
+    parser.add_argument("--fuente", choices=list(CAPAS_TABLA), help="Fuente de la tabla")
+    parser.add_argument("--desde", help="Capa con los pesos ya asignados")
+    parser.add_argument("--campo", help="Campo con el código de la unidad (el mismo de la capa base)")
+    parser.add_argument("--departamento", help="Tabla propia del departamento (por defecto la nacional)")
+    parser.add_argument("--salida", help="Ruta de la tabla (por defecto en DATA/PELIGRO/PESOS)")
+    parser.add_argument("--listar", action="store_true", help="Listar las tablas existentes")
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        for archivo, campo, unidades in listar_tablas():
+            print(f"   {archivo:<30} {campo:<15} {unidades} unidades")
+        return 0
+
+    if not (args.fuente and args.desde and args.campo):
+        parser.error("Indique --fuente, --desde y --campo (o --listar)")
+    nombre = f"{args.fuente}_{args.departamento.lower()}.csv" if args.departamento else f"{args.fuente}.csv"
+    salida = args.salida or os.path.join(RUTA_PESOS, nombre)
+    return 0 if tabla_desde_capa(args.desde, args.campo, CAPAS_TABLA[args.fuente][0], salida) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Los módulos de DASHBOARDS se importan por nombre, como lo hacen entre ellos"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""🌊 Clave de la caché hidrológica: estable con las mismas entradas, distinta si cambia cualquiera"""
+
+import json
+import os
+
+import pytest
+
+import cache_hidrologia
+from cache_hidrologia import ARCHIVO_HUELLAS_DEM, clave_hidrologia, carpeta_entrada, huella_dem
+
+BUFFERS = [
+    {"name": "0-50m", "inner": 0, "outer": 50, "peso": 5},
+    {"name": "50-100m", "inner": 50, "outer": 100, "peso": 4},
+    {"name": ">100m", "inner": 100, "outer": None, "peso": 1},
+]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_hidrologia, 'RUTA_CACHE_HIDROLOGIA', str(tmp_path / "CACHE"))
+    monkeypatch.setattr(cache_hidrologia, '_HUELLAS', {})
+    ruta_dem = tmp_path / "dem.tif"
+    ruta_dem.write_bytes(b"dem original")
+    return str(ruta_dem)
+
+
+def test_clave_es_estable(cache):
+    assert clave_hidrologia("080101", cache, 1000, BUFFERS) == clave_hidrologia("080101", cache, 1000, BUFFERS)
+
+
+def test_clave_no_depende_de_la_memoria_del_proceso(cache):
+    antes = clave_hidrologia("080101", cache, 1000, BUFFERS)
+    # Otro proceso: sin huellas en memoria, la lee del archivo de huellas
+    cache_hidrologia._HUELLAS.clear()
+    assert clave_hidrologia("080101", cache, 1000, BUFFERS) == antes
+    with open(os.path.join(cache_hidrologia.RUTA_CACHE_HIDROLOGIA, ARCHIVO_HUELLAS_DEM), encoding='utf-8') as f:
+        assert huella_dem(cache) in json.load(f).values()
+
+
+def test_clave_cambia_con_cada_entrada(cache):
+    base = clave_hidrologia("080101", cache, 1000, BUFFERS)
+    otro_peso = [dict(b, peso=b['peso'] + 1) if i == 0 else b for i, b in enumerate(BUFFERS)]
+    claves = {
+        clave_hidrologia("080102", cache, 1000, BUFFERS),
+        clave_hidrologia("080101", cache, 2000, BUFFERS),
+        clave_hidrologia("080101", cache, 1000, otro_peso),
+        clave_hidrologia("080101", cache, 1000, BUFFERS[:2]),
+    }
+    assert base not in claves and len(claves) == 4
+
+
+def test_clave_cambia_si_cambia_el_dem(cache):
+    antes = clave_hidrologia("080101", cache, 1000, BUFFERS)
+    with open(cache, 'wb') as f:
+        f.write(b"dem corregido con otras cotas")
+    assert clave_hidrologia("080101", cache, 1000, BUFFERS) != antes
+
+
+def test_carpetas_separadas_por_distrito(cache):
+    clave = clave_hidrologia("080101", cache, 1000, BUFFERS)
+    assert carpeta_entrada("080101", clave) != carpeta_entrada("080102", clave)
+    assert carpeta_entrada("08/01", clave).startswith(cache_hidrologia.RUTA_CACHE_HIDROLOGIA)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""🔗 Niveles del grafo, claves encadenadas y recálculo parcial de dag_cache"""
+
+import os
+from collections import Counter
+
+import pytest
+
+from dag_cache import Etapa, niveles_dag, claves_dag, ejecutar_dag, ruta_resultado
+
+
+def _sin_funcion(*_):
+    return None
+
+
+def _etapas(ruta_dem, ruta_geologia):
+    return [
+        Etapa("peligro", _sin_funcion, ["pendientes", "geologia"], []),
+        Etapa("dem", _sin_funcion, [], [ruta_dem]),
+        Etapa("pendientes", _sin_funcion, ["dem"], []),
+        Etapa("geologia", _sin_funcion, [], [ruta_geologia]),
+    ]
+
+
+@pytest.fixture
+def entradas(tmp_path):
+    ruta_dem, ruta_geologia = tmp_path / "dem.tif", tmp_path / "geologia.shp"
+    ruta_dem.write_bytes(b"dem")
+    ruta_geologia.write_bytes(b"geologia")
+    return ruta_dem, ruta_geologia
+
+
+def test_niveles_agrupan_etapas_independientes(entradas):
+    niveles = niveles_dag(_etapas(*entradas))
+    assert [[e.nombre for e in nivel] for nivel in niveles] == [["dem", "geologia"], ["pendientes"], ["peligro"]]
+
+
+def test_niveles_sin_etapas():
+    assert niveles_dag([]) == []
+
+
+def test_niveles_rechazan_dependencias_inexistentes():
+    with pytest.raises(ValueError, match="inexistentes"):
+        niveles_dag([Etapa("a", _sin_funcion, ["b"], [])])
+
+
+def test_niveles_rechazan_ciclos():
+    with pytest.raises(ValueError, match="Ciclo"):
+        niveles_dag([Etapa("a", _sin_funcion, ["b"], []), Etapa("b", _sin_funcion, ["a"], [])])
+
+
+def test_claves_son_estables(entradas):
+    assert claves_dag(_etapas(*entradas)) == claves_dag(_etapas(*entradas))
+
+
+def test_cambiar_una_entrada_invalida_solo_su_rama(entradas):
+    ruta_dem, ruta_geologia = entradas
+    antes = claves_dag(_etapas(ruta_dem, ruta_geologia))
+    ruta_dem.write_bytes(b"dem corregido")
+    despues = claves_dag(_etapas(ruta_dem, ruta_geologia))
+
+    cambiaron = {n for n in antes if antes[n] != despues[n]}
+    assert cambiaron == {"dem", "pendientes", "peligro"}
+
+
+class Contador:
+    """Etapas de prueba que cuentan cuántas veces se calculan"""
+
+    def __init__(self):
+        self.calculadas = Counter()
+
+    def etapa(self, nombre, dependencias, entradas, funcion):
+        def calcular(*args):
+            self.calculadas[nombre] += 1
+            return funcion(*args)
+        return Etapa(nombre, calcular, dependencias, entradas)
+
+    def etapas(self, ruta_dem, ruta_geologia):
+        return [
+            self.etapa("peligro", ["pendientes", "geologia"], [], lambda p, g: p + g),
+            self.etapa("dem", [], [ruta_dem], lambda: 1),
+            self.etapa("pendientes", ["dem"], [], lambda d: d + 1),
+            self.etapa("geologia", [], [ruta_geologia], lambda: 10),
+        ]
+
+
+def test_ejecutar_dag_recalcula_solo_la_rama_que_cambio(entradas, tmp_path):
+    ruta_dem, ruta_geologia = entradas
+    carpeta = str(tmp_path / "dag")
+    contador = Contador()
+
+    assert ejecutar_dag(contador.etapas(ruta_dem, ruta_geologia), carpeta, hilos=1) == {"peligro": 12}
+    assert ejecutar_dag(contador.etapas(ruta_dem, ruta_geologia), carpeta, hilos=1) == {"peligro": 12}
+    assert contador.calculadas == Counter(peligro=1, dem=1, pendientes=1, geologia=1)
+
+    ruta_dem.write_bytes(b"dem corregido")
+    ejecutar_dag(contador.etapas(ruta_dem, ruta_geologia), carpeta, hilos=1)
+    assert contador.calculadas == Counter(peligro=2, dem=2, pendientes=2, geologia=1)
+
+
+def test_resultado_que_desaparece_tras_planificar_se_recalcula(entradas, tmp_path):
+    ruta_dem, ruta_geologia = entradas
+    carpeta = str(tmp_path / "dag")
+    contador = Contador()
+    ejecutar_dag(contador.etapas(ruta_dem, ruta_geologia), carpeta, hilos=1)
+
+    # Una etapa nueva del primer nivel borra el resultado de 'peligro' ya planificado como en caché
+    ruta_peligro = ruta_resultado(carpeta, "peligro", claves_dag(contador.etapas(ruta_dem, ruta_geologia))["peligro"])
+    borrar = contador.etapa("borrar", [], ["nueva"], lambda: os.remove(ruta_peligro))
+    etapas = contador.etapas(ruta_dem, ruta_geologia) + [borrar]
+
+    assert ejecutar_dag(etapas, carpeta, objetivos=["borrar", "peligro"], hilos=1)["peligro"] == 12
+    # Se recalcula 'peligro' con sus dependencias leídas de la caché
+    assert contador.calculadas == Counter(peligro=2, dem=1, pendientes=1, geologia=1, borrar=1)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""📏 Transformada de distancia y clases de BUFFERS_CONFIG de distancia_rios"""
+
+import numpy as np
+import pytest
+
+from distancia_rios import SIN_CLASE, _distancia_acotada, clasificar_distancia
+
+BUFFERS = [
+    {"name": "0-50m", "inner": 0, "outer": 50},
+    {"name": "50-100m", "inner": 50, "outer": 100},
+    {"name": "100-150m", "inner": 100, "outer": 150},
+    {"name": "150-200m", "inner": 150, "outer": 200},
+    {"name": ">200m", "inner": 200, "outer": None},
+]
+
+
+def _rios_sinteticos():
+    rios = np.zeros((40, 30), dtype=bool)
+    rios[5, :] = True          # río recto
+    rios[30, 20] = True        # celda suelta
+    return rios
+
+
+def test_distancia_acotada_coincide_con_scipy_hasta_el_maximo():
+    ndimage = pytest.importorskip("scipy.ndimage")
+    rios = _rios_sinteticos()
+    paso_y, paso_x, maximo = 10.0, 5.0, 120.0
+
+    acotada = _distancia_acotada(rios, paso_y, paso_x, maximo)
+    exacta = ndimage.distance_transform_edt(~rios, sampling=(paso_y, paso_x))
+
+    cerca = exacta <= maximo
+    np.testing.assert_allclose(acotada[cerca], exacta[cerca], rtol=1e-6)
+    # Más allá del máximo nunca subestima
+    assert (acotada[~cerca] >= exacta[~cerca] - 1e-3).all()
+
+
+def test_distancia_en_celdas_de_rio_es_cero():
+    rios = _rios_sinteticos()
+    assert (_distancia_acotada(rios, 10.0, 10.0, 50.0)[rios] == 0).all()
+
+
+def test_clases_respetan_los_limites_de_buffers_config():
+    distancia = np.array([[0.0, 49.9, 50.0, 99.0, 150.0, 199.9, 200.0, np.inf]])
+    dentro = np.ones(distancia.shape, dtype=bool)
+    clases = clasificar_distancia(distancia, dentro, BUFFERS)
+    # El límite superior de cada clase pertenece a la siguiente (como los anillos inner <= d < outer)
+    assert clases.tolist() == [[0, 0, 1, 1, 3, 3, 4, 4]]
+
+
+def test_clases_fuera_del_limite_quedan_sin_clase():
+    distancia = np.array([[10.0, 10.0], [300.0, 300.0]])
+    dentro = np.array([[True, False], [False, True]])
+    clases = clasificar_distancia(distancia, dentro, BUFFERS)
+    assert clases.tolist() == [[0, SIN_CLASE], [SIN_CLASE, 4]]
+
+
+def test_clases_sobre_una_grilla_con_un_rio():
+    ndimage = pytest.importorskip("scipy.ndimage")
+    rios = np.zeros((1, 30), dtype=bool)
+    rios[0, 0] = True
+    distancia = ndimage.distance_transform_edt(~rios, sampling=(10.0, 10.0))
+    clases = clasificar_distancia(distancia, np.ones(rios.shape, dtype=bool), BUFFERS)
+    # Celdas de 10 m: 5 celdas por clase finita y el resto en '>200m'
+    assert clases[0].tolist() == [0] * 5 + [1] * 5 + [2] * 5 + [3] * 5 + [4] * 10
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""🧹 Carpetas de trabajo: cuotas por trabajo y por usuario, y limpieza de carpetas huérfanas"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import espacio_trabajo as et
+from espacio_trabajo import (CuotaDiscoExcedida, MARCA_TRABAJO, crear_espacio_trabajo, espacio_trabajo,
+                             limpiar_espacios_huerfanos, liberar_espacio_trabajo, verificar_cuota)
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def raiz(tmp_path, monkeypatch):
+    monkeypatch.setattr(et, 'USAR_TMPFS', False)
+    monkeypatch.setattr(et, 'RAIZ_TRABAJOS', str(tmp_path))
+    return tmp_path
+
+
+def _llenar(carpeta, mb):
+    with open(os.path.join(carpeta, "datos.bin"), 'wb') as f:
+        f.write(b"\0" * int(mb * MB))
+
+
+def _pid_muerto():
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    return proceso.pid
+
+
+def _carpeta_con_marca(raiz, nombre, pid):
+    carpeta = raiz / "usuario" / nombre
+    carpeta.mkdir(parents=True)
+    (carpeta / MARCA_TRABAJO).write_text(json.dumps({'pid': pid, 'usuario': "usuario"}), encoding='utf-8')
+    return carpeta
+
+
+def test_espacio_trabajo_se_borra_al_salir():
+    with espacio_trabajo("ana", "prueba") as carpeta:
+        assert os.path.isfile(os.path.join(carpeta, MARCA_TRABAJO))
+    assert not os.path.exists(carpeta)
+
+
+def test_cuota_del_trabajo():
+    carpeta = crear_espacio_trabajo("ana", "prueba", cuota_mb=1)
+    try:
+        _llenar(carpeta, 0.5)
+        verificar_cuota(carpeta, int(0.4 * MB))
+        with pytest.raises(CuotaDiscoExcedida, match="cuota es 1 MB"):
+            verificar_cuota(carpeta, int(0.6 * MB))
+    finally:
+        liberar_espacio_trabajo(carpeta)
+
+
+def test_cuota_del_usuario_suma_sus_trabajos(monkeypatch):
+    monkeypatch.setattr(et, 'CUOTA_USUARIO_MB', 1)
+    primera = crear_espacio_trabajo("ana", "a", cuota_mb=10)
+    segunda = crear_espacio_trabajo("ana", "b", cuota_mb=10)
+    otra = crear_espacio_trabajo("luis", "a", cuota_mb=10)
+    try:
+        _llenar(primera, 0.6)
+        _llenar(otra, 0.6)
+        verificar_cuota(segunda)
+        _llenar(segunda, 0.6)
+        with pytest.raises(CuotaDiscoExcedida, match="ana"):
+            verificar_cuota(segunda)
+        # Los trabajos de otro usuario no cuentan
+        verificar_cuota(otra)
+    finally:
+        for carpeta in (primera, segunda, otra):
+            liberar_espacio_trabajo(carpeta)
+
+
+def test_carpetas_no_creadas_aqui_no_se_controlan(tmp_path):
+    verificar_cuota(str(tmp_path / "otra"), 10 ** 15)
+
+
+def test_limpiar_huerfanos(raiz):
+    muerta = _carpeta_con_marca(raiz, "muerta", _pid_muerto())
+    viva = _carpeta_con_marca(raiz, "viva", os.getpid())
+    vieja = raiz / "usuario" / "vieja_sin_marca"
+    reciente = raiz / "usuario" / "reciente_sin_marca"
+    vieja.mkdir()
+    reciente.mkdir()
+    hace_un_dia = time.time() - 24 * 3600
+    os.utime(vieja, (hace_un_dia, hace_un_dia))
+
+    assert limpiar_espacios_huerfanos(horas=6) == 2
+    assert not muerta.exists() and not vieja.exists()
+    assert viva.exists() and reciente.exists()
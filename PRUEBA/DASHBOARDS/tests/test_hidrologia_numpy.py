@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""💧 Relleno, D8, acumulación y umbral de ríos de hidrologia_numpy sobre DEM sintéticos pequeños"""
+
+import numpy as np
+
+from hidrologia_numpy import (preparar_dem, rellenar_depresiones, direcciones_d8, receptores_d8,
+                              acumulacion_flujo, extraer_rios)
+
+
+def _plano_al_este(filas=4, columnas=5):
+    """Plano que baja una unidad por columna hacia el este"""
+    return np.tile(np.arange(columnas, 0, -1, dtype=np.float64), (filas, 1))
+
+
+def _dem_con_hoyo():
+    """Borde a 10, interior a 5 y un hoyo a 1 en el centro: todo el interior es una depresión"""
+    dem = np.full((7, 7), 10.0)
+    dem[1:-1, 1:-1] = 5.0
+    dem[3, 3] = 1.0
+    return dem
+
+
+def test_preparar_dem_marca_nodata_como_invalido():
+    elevacion = np.array([[1.0, -9999.0], [np.nan, 4.0]])
+    dem, valido = preparar_dem(elevacion, nodata=-9999.0)
+    assert valido.tolist() == [[True, False], [False, True]]
+    assert dem[~valido].tolist() == [0.0, 0.0]
+
+
+def test_relleno_elimina_depresiones():
+    dem = _dem_con_hoyo()
+    valido = np.ones(dem.shape, dtype=bool)
+    relleno = rellenar_depresiones(dem, valido)
+
+    # El borde no cambia y el interior queda por encima del desborde (10)
+    assert np.array_equal(relleno[0], dem[0])
+    assert (relleno[1:-1, 1:-1] > 10.0).all()
+    # Nunca baja una celda
+    assert (relleno >= dem).all()
+    # Sin planos: cada celda interior tiene un vecino estrictamente más bajo, así que tiene dirección
+    punteros = direcciones_d8(relleno, valido)
+    assert (punteros[1:-1, 1:-1] > 0).all()
+
+
+def test_relleno_no_toca_un_dem_sin_depresiones():
+    dem = _plano_al_este()
+    valido = np.ones(dem.shape, dtype=bool)
+    assert np.array_equal(rellenar_depresiones(dem, valido), dem)
+
+
+def test_direcciones_d8_siguen_la_maxima_pendiente():
+    dem = _plano_al_este()
+    punteros = direcciones_d8(dem, np.ones(dem.shape, dtype=bool))
+    # Código 2 = este (WhiteboxTools); la última columna es salida
+    assert (punteros[:, :-1] == 2).all()
+    assert (punteros[:, -1] == 0).all()
+
+    # Girado 90°: el plano baja hacia el sur (código 8)
+    punteros_sur = direcciones_d8(dem.T.copy(), np.ones(dem.T.shape, dtype=bool))
+    assert (punteros_sur[:-1] == 8).all()
+
+
+def test_direcciones_d8_usan_la_resolucion_de_la_celda():
+    # Desde (0, 0) baja 1 al este, 1.5 al sur y 1.8 en diagonal
+    dem = np.array([[3.0, 2.0], [1.5, 1.2]])
+    valido = np.ones(dem.shape, dtype=bool)
+    # Celdas cuadradas: gana el sur (1.5 > 1.8 / √2 > 1)
+    assert direcciones_d8(dem, valido)[0, 0] == 8
+    # Celdas de 1 x 2 (alto): el sur queda en 0.75 y la diagonal en 1.8 / √5; gana el este
+    assert direcciones_d8(dem, valido, res_x=1.0, res_y=2.0)[0, 0] == 2
+
+
+def test_receptores_tratan_como_salida_los_punteros_que_salen_de_la_ventana():
+    punteros = np.array([[128, 2], [0, 1]], dtype=np.uint8)
+    assert receptores_d8(punteros).tolist() == [-1, -1, -1, -1]
+
+
+def test_acumulacion_por_filas_en_un_plano():
+    dem = _plano_al_este()
+    valido = np.ones(dem.shape, dtype=bool)
+    acumulado = acumulacion_flujo(direcciones_d8(dem, valido), valido)
+    assert (acumulado == np.arange(1, dem.shape[1] + 1)).all()
+
+
+def test_acumulacion_total_en_salidas_es_el_numero_de_celdas_validas():
+    dem = _dem_con_hoyo()
+    valido = np.ones(dem.shape, dtype=bool)
+    valido[0, 0] = False
+    relleno = rellenar_depresiones(dem, valido)
+    punteros = direcciones_d8(relleno, valido)
+    acumulado = acumulacion_flujo(punteros, valido)
+
+    salidas = (receptores_d8(punteros) < 0).reshape(dem.shape) & valido
+    assert acumulado[salidas].sum() == valido.sum()
+    assert (acumulado[valido] >= 1).all()
+    assert (acumulado[~valido] == 0).all()
+
+
+def test_rios_coinciden_con_el_umbral():
+    dem = _plano_al_este(filas=3, columnas=6)
+    valido = np.ones(dem.shape, dtype=bool)
+    punteros = direcciones_d8(dem, valido)
+    acumulado = acumulacion_flujo(punteros, valido)
+
+    rios = extraer_rios(acumulado, 3)
+    assert np.array_equal(rios, acumulado > 3)
+    assert rios[:, 3:].all() and not rios[:, :3].any()
+    # Aguas abajo de una celda de río siempre hay río (o la salida)
+    receptor = receptores_d8(punteros)
+    for i in np.flatnonzero(rios.ravel()):
+        assert receptor[i] < 0 or rios.ravel()[receptor[i]]
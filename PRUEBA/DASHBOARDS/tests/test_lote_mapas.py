@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""🗺️ Archivo de control (checkpoint) de lote_mapas: lectura tolerante y reanudación de una corrida"""
+
+import json
+import datetime
+
+import pytest
+
+import lote_mapas
+from lote_mapas import clave_tarea, leer_checkpoint, ejecutar_lote
+
+DISTRITOS = [
+    {'ubigeo': '080101', 'departamento': 'CUSCO', 'provincia': 'CUSCO', 'distrito': 'CUSCO'},
+    {'ubigeo': '080301', 'departamento': 'CUSCO', 'provincia': 'ANTA', 'distrito': 'ANTA'},
+]
+TIPOS = ['geografico', 'vias']
+
+
+def _registro(ubigeo, tipo, estado):
+    return {'clave': clave_tarea(ubigeo, tipo), 'ubigeo': ubigeo, 'distrito': ubigeo, 'tipo': tipo,
+            'estado': estado, 'ruta': None, 'error': None, 'segundos': 0.0, 'fecha': '2026-01-01T00:00:00'}
+
+
+def _renderizar_falso(nombre_usuario, info_distrito, tipos, *_):
+    """Sustituye a renderizar_distrito en los procesos del pool (se heredan con fork)"""
+    return [dict(_registro(info_distrito['ubigeo'], t, 'ok'),
+                 fecha=datetime.datetime.now().isoformat(timespec='seconds')) for t in tipos]
+
+
+@pytest.fixture
+def lote_sin_mapas(monkeypatch):
+    monkeypatch.setattr(lote_mapas, 'renderizar_distrito', _renderizar_falso)
+    monkeypatch.setattr(lote_mapas, 'precargar_capas_base', lambda: None)
+
+
+def _escribir(ruta, registros, truncada=None):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        for r in registros:
+            f.write(json.dumps(r) + "\n")
+        if truncada:
+            f.write(truncada)
+
+
+def test_leer_checkpoint_solo_cuenta_los_mapas_ok(tmp_path):
+    ruta = tmp_path / "lote.jsonl"
+    _escribir(ruta, [_registro('080101', 'geografico', 'ok'), _registro('080101', 'vias', 'error')],
+              truncada='{"clave": "080301:geo')
+    assert leer_checkpoint(str(ruta)) == {'080101:geografico'}
+
+
+def test_leer_checkpoint_inexistente(tmp_path):
+    assert leer_checkpoint(str(tmp_path / "no_existe.jsonl")) == set()
+
+
+def test_reanudar_solo_genera_lo_que_falta(tmp_path, lote_sin_mapas):
+    ruta = tmp_path / "lote.jsonl"
+    # Corrida interrumpida: un mapa listo, uno con error y una línea a medio escribir
+    _escribir(ruta, [_registro('080101', 'geografico', 'ok'), _registro('080101', 'vias', 'error')],
+              truncada='{"clave": "080301:geo')
+
+    resumen = ejecutar_lote(DISTRITOS, TIPOS, procesos=1, ruta_checkpoint=str(ruta))
+    assert resumen['ok'] == 3 and resumen['error'] == 0
+
+    nuevas = [json.loads(l) for l in ruta.read_text(encoding='utf-8').splitlines()[3:]]
+    assert sorted(r['clave'] for r in nuevas) == ['080101:vias', '080301:geografico', '080301:vias']
+    assert leer_checkpoint(str(ruta)) == {clave_tarea(d['ubigeo'], t) for d in DISTRITOS for t in TIPOS}
+
+
+def test_lote_completo_no_hace_nada(tmp_path, lote_sin_mapas):
+    ruta = tmp_path / "lote.jsonl"
+    _escribir(ruta, [_registro(d['ubigeo'], t, 'ok') for d in DISTRITOS for t in TIPOS])
+    assert ejecutar_lote(DISTRITOS, TIPOS, procesos=1, ruta_checkpoint=str(ruta))['ok'] == 0
+
+
+def test_reiniciar_ignora_el_checkpoint(tmp_path, lote_sin_mapas):
+    ruta = tmp_path / "lote.jsonl"
+    _escribir(ruta, [_registro(d['ubigeo'], t, 'ok') for d in DISTRITOS for t in TIPOS])
+    assert ejecutar_lote(DISTRITOS, TIPOS, procesos=1, ruta_checkpoint=str(ruta), reiniciar=True)['ok'] == 4
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""🌧️ Escenarios de PP máxima: capa por periodo de retorno y caché propia de cada escenario"""
+
+import pytest
+
+import mapa_peligro
+from mapa_peligro import (ESCENARIO_PPMAX, _entradas_ppmax, _ruta_ppmax, escenarios_ppmax_disponibles,
+                          ruta_escenario_ppmax)
+from modelos_peligro import firma_modelo, obtener_modelo
+from peligro_raster import firma_fuentes, ruta_cubo_peligro
+
+
+@pytest.fixture
+def ppmax(tmp_path, monkeypatch):
+    monkeypatch.setattr(mapa_peligro, 'RUTA_BASE_PPMAX', str(tmp_path))
+    for tr in (50, 100, 500):
+        (tmp_path / f"CUSCO_TR_{tr}_ANIOS_PPMAX.shp").write_bytes(f"ppmax {tr}".encode())
+    return tmp_path
+
+
+def test_capa_de_cada_periodo_de_retorno(ppmax):
+    assert ruta_escenario_ppmax(100) == str(ppmax / "CUSCO_TR_100_ANIOS_PPMAX.shp")
+    # TR 5 no confunde las capas de TR 50 ni TR 500
+    assert ruta_escenario_ppmax(5) is None
+    assert escenarios_ppmax_disponibles() == [50, 100, 500]
+
+
+def test_capa_sin_periodo_de_retorno_solo_vale_para_el_escenario_por_defecto(tmp_path, monkeypatch):
+    monkeypatch.setattr(mapa_peligro, 'RUTA_BASE_PPMAX', str(tmp_path))
+    (tmp_path / "PESO_PPMAX.shp").write_bytes(b"ppmax")
+    assert _ruta_ppmax({'escenario': ESCENARIO_PPMAX}) == str(tmp_path / "PESO_PPMAX.shp")
+    assert _ruta_ppmax({'escenario': 100 if ESCENARIO_PPMAX != 100 else 50}) is None
+
+
+def test_cada_escenario_tiene_su_propia_cache(ppmax):
+    firma = firma_modelo(obtener_modelo('inundacion'))
+    claves = {tr: firma_fuentes(_entradas_ppmax({'escenario': tr})) for tr in (50, 100, 500)}
+    assert len(set(map(tuple, claves.values()))) == 3
+    cubos = {ruta_cubo_peligro("080301", [firma] + _entradas_ppmax({'escenario': tr})) for tr in (50, 100, 500)}
+    assert len(cubos) == 3
+    # Sin escenario en el contexto se usa el de DASH_ESCENARIO_PPMAX
+    assert _entradas_ppmax({}) == _entradas_ppmax({'escenario': ESCENARIO_PPMAX})
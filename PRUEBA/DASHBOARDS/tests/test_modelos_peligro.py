@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""🧭 Registro de modelos de peligro: ponderaciones por modelo y columnas de peso de cada factor"""
+
+import numpy as np
+import pytest
+
+from modelos_peligro import (MODELOS_PELIGRO, Factor, columnas_modelo, firma_modelo, obtener_modelo,
+                             pesos_modelo)
+from peligro_raster import COLUMNAS_PESO, normalizar_pesos
+
+
+def test_obtener_modelo():
+    assert obtener_modelo().clave == 'inundacion'
+    assert obtener_modelo(MODELOS_PELIGRO['heladas']) is MODELOS_PELIGRO['heladas']
+    with pytest.raises(ValueError, match="desconocido"):
+        obtener_modelo('sequia')
+
+
+def test_inundacion_conserva_las_cinco_columnas_de_siempre():
+    assert columnas_modelo(obtener_modelo('inundacion')) == COLUMNAS_PESO
+
+
+def test_pesos_por_defecto_de_cada_modelo():
+    assert pesos_modelo(obtener_modelo('heladas')) == {'PESO_ALTIT': 0.75, 'PESO_PENDI': 0.25}
+    deslizamiento = obtener_modelo('deslizamiento')
+    assert pesos_modelo(deslizamiento) == deslizamiento.esquemas['igual'][1]
+    assert pesos_modelo(deslizamiento, [4, 3, 2, 1]) == [4, 3, 2, 1]
+    with pytest.raises(ValueError, match="no tiene el esquema"):
+        pesos_modelo(obtener_modelo('heladas'), 'ahp')
+
+
+@pytest.mark.parametrize("clave", sorted(MODELOS_PELIGRO))
+def test_esquemas_de_cada_modelo_se_normalizan_sobre_sus_columnas(clave):
+    modelo = MODELOS_PELIGRO[clave]
+    columnas = columnas_modelo(modelo)
+    for esquema, (_, pesos) in modelo.esquemas.items():
+        assert set(pesos) == set(columnas), esquema
+        assert normalizar_pesos(pesos_modelo(modelo, esquema), columnas).sum() == pytest.approx(1)
+
+
+def test_firmas_distintas_por_modelo():
+    firmas = {firma_modelo(m) for m in MODELOS_PELIGRO.values()}
+    assert len(firmas) == len(MODELOS_PELIGRO)
+
+
+# ════════════════════════════════════════════════════════════════════════
+# CAPA DE CADA FACTOR (mapa_peligro)
+# ════════════════════════════════════════════════════════════════════════
+@pytest.fixture
+def pendiente():
+    gpd = pytest.importorskip("geopandas")
+    from shapely.geometry import box
+
+    return gpd.GeoDataFrame({'CLASE': [1, 3, 6], 'OTRA': ['a', 'b', 'c']},
+                            geometry=[box(i, 0, i + 1, 1) for i in range(3)], crs="EPSG:3857")
+
+
+def test_capa_factor_traduce_las_clases(pendiente):
+    from mapa_peligro import capa_factor
+
+    gdf = capa_factor(pendiente, Factor('pendiente', 'PESO_PENDI', {1: 5, 2: 4, 3: 3, 4: 2, 5: 1}))
+    # La clase 6 no tiene peso en el modelo: queda fuera, como un hueco en la intersección
+    assert list(gdf.columns) == ['PESO_PENDI', 'geometry']
+    assert gdf['PESO_PENDI'].tolist() == [5, 3]
+
+
+def test_capa_factor_sin_las_columnas_del_factor(pendiente):
+    from mapa_peligro import capa_factor
+
+    with pytest.raises(ValueError, match="CLASE"):
+        capa_factor(pendiente.drop(columns='CLASE'), Factor('pendiente', 'PESO_PENDI', {1: 1}))
+    with pytest.raises(ValueError, match="PESO_GEOL"):
+        capa_factor(pendiente, Factor('geologia', 'PESO_GEOL', None))
+
+
+def test_pendiente_vectorial_recupera_la_clase_desde_su_peso(pendiente):
+    from mapa_peligro import capa_factor, clase_pendiente_vectorial
+
+    vectorial = pendiente.drop(columns='CLASE').assign(PESO_PENDI=[5.0, 3.0, np.nan])
+    gdf = clase_pendiente_vectorial(vectorial)
+    assert gdf['CLASE'].tolist()[:2] == [1, 3] and np.isnan(gdf['CLASE'].iloc[2])
+    # Con la CLASE recuperada, el deslizamiento puede usar la capa vectorial
+    factor = obtener_modelo('deslizamiento').factores[0]
+    assert capa_factor(gdf, factor)['PESO_PENDI'].tolist() == [1, 3]
+    # Si la capa ya trae CLASE no se toca
+    assert clase_pendiente_vectorial(pendiente) is pendiente
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""🧩 Overlay por teselas: mismo resultado que la cadena secuencial, y columnas completas si queda vacío"""
+
+import pytest
+from shapely.geometry import Polygon, box
+
+import overlay_paralelo
+from overlay_paralelo import cadena_overlay, podar_columnas, superponer_capas
+
+CRS = "EPSG:3857"
+COLUMNAS = ['PESO_PENDI', 'PESO_GEOMO', 'PESO_RIO']
+
+
+def _capas():
+    """Franjas verticales, franjas horizontales y dos mitades en diagonal sobre un cuadrado de 120 m"""
+    gpd = pytest.importorskip("geopandas")
+
+    franjas_v = [box(30 * i, 0, 30 * (i + 1), 120) for i in range(4)]
+    franjas_h = [box(0, 40 * i, 120, 40 * (i + 1)) for i in range(3)]
+    mitades = [Polygon([(0, 0), (120, 0), (0, 120)]), Polygon([(120, 0), (120, 120), (0, 120)])]
+    return {
+        'PESO_PENDI': gpd.GeoDataFrame({'PESO_PENDI': [1, 2, 3, 4], 'OTRA': list("abcd")}, geometry=franjas_v, crs=CRS),
+        'PESO_GEOMO': gpd.GeoDataFrame({'PESO_GEOMO': [1, 2, 3]}, geometry=franjas_h, crs=CRS),
+        'PESO_RIO': gpd.GeoDataFrame({'PESO_RIO': [5, 1]}, geometry=mitades, crs=CRS),
+    }
+
+
+def _area_por_combinacion(gdf):
+    return gdf.assign(area=gdf.area).groupby(COLUMNAS)['area'].sum().round(6).to_dict()
+
+
+def test_teselas_dan_el_mismo_resultado_que_la_cadena_secuencial(monkeypatch):
+    monkeypatch.setattr(overlay_paralelo, 'MIN_POLIGONOS_PARALELO', 0)
+    capas = _capas()
+
+    secuencial = superponer_capas(capas, COLUMNAS, procesos=1)
+    teselas = superponer_capas(capas, COLUMNAS, limite=box(0, 0, 120, 120), procesos=2)
+
+    assert list(teselas.columns) == list(secuencial.columns) == COLUMNAS + ['geometry']
+    assert _area_por_combinacion(teselas) == _area_por_combinacion(secuencial)
+    # Los pedazos que cortó una costura se vuelven a unir
+    assert len(teselas) == len(secuencial)
+    assert teselas.area.sum() == pytest.approx(120 * 120)
+
+
+def test_cadena_vacia_conserva_las_columnas_de_todas_las_capas():
+    capas = _capas()
+    capas['PESO_GEOMO'] = capas['PESO_GEOMO'].iloc[:0]
+    resultado = cadena_overlay(podar_columnas(capas, COLUMNAS))
+    assert resultado.empty
+    assert list(resultado.columns) == COLUMNAS + ['geometry']
+
+
+def test_capas_sin_interseccion_en_paralelo(monkeypatch):
+    monkeypatch.setattr(overlay_paralelo, 'MIN_POLIGONOS_PARALELO', 0)
+    capas = _capas()
+    capas['PESO_RIO'] = capas['PESO_RIO'].set_geometry(capas['PESO_RIO'].translate(1000, 1000))
+    resultado = superponer_capas(capas, COLUMNAS, limite=box(0, 0, 1120, 1120), procesos=2)
+    assert resultado.empty
+    assert list(resultado.columns) == COLUMNAS + ['geometry']
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""🧮 Ponderación de los factores, cubo de pesos, clasificación y motor ráster sobre un distrito sintético"""
+
+import numpy as np
+import pytest
+
+from peligro_raster import (COLUMNAS_PESO, CONSISTENCIA_AHP, ESCALA_CUBO, SIN_CLASE, clasificar_peligro,
+                            cubo_pesos, normalizar_pesos, peligro_desde_cubo, peligro_raster, pesos_ahp)
+
+RANGOS = [1.0, 1.8, 2.6, 3.4, 4.2, 5.0]
+X0, Y0 = 500000.0, 8500000.0      # UTM 18S
+
+
+def test_pesos_ahp_de_una_matriz_consistente():
+    w = [0.4, 0.3, 0.2, 0.1]
+    columnas = ['A', 'B', 'C', 'D']
+    pesos, rc = pesos_ahp([[wi / wj for wj in w] for wi in w], columnas)
+    assert list(pesos) == columnas
+    np.testing.assert_allclose(list(pesos.values()), w)
+    assert rc == pytest.approx(0, abs=1e-9)
+
+
+def test_matriz_ahp_por_defecto_es_consistente():
+    assert CONSISTENCIA_AHP < 0.10
+
+
+def test_normalizar_pesos():
+    np.testing.assert_allclose(normalizar_pesos(), [0.2] * 5)
+    np.testing.assert_allclose(normalizar_pesos({'PESO_PENDI': 3, 'PESO_RIO': 1}), [0.75, 0, 0, 0.25, 0])
+    np.testing.assert_allclose(normalizar_pesos([2, 2], columnas=['A', 'B']), [0.5, 0.5])
+    assert normalizar_pesos('ahp').sum() == pytest.approx(1)
+
+
+@pytest.mark.parametrize("pesos, columnas", [
+    ([1, -1, 1, 1, 1], None),
+    ([0, 0, 0, 0, 0], None),
+    ([1, 1], None),
+    ('no_existe', None),
+    ('ahp', ['A', 'B']),
+])
+def test_normalizar_pesos_rechaza(pesos, columnas):
+    with pytest.raises(ValueError):
+        normalizar_pesos(pesos, columnas)
+
+
+def test_clasificar_peligro_usa_los_limites_de_los_rangos():
+    peligro = np.array([1.0, 1.79, 1.8, 3.0, 4.2, 5.0, np.nan])
+    assert clasificar_peligro(peligro, RANGOS).tolist() == [1, 1, 2, 3, 5, 5, SIN_CLASE]
+
+
+def test_clasificar_peligro_fuera_de_rango_va_al_nivel_extremo():
+    assert clasificar_peligro(np.array([0.2, 7.0]), RANGOS).tolist() == [1, 5]
+
+
+def _distrito_y_capas():
+    """Rectángulo de 200 x 100 m: mitad oeste con peso 1 y mitad este con peso 5 en los cinco factores"""
+    gpd = pytest.importorskip("geopandas")
+    from shapely.geometry import box
+
+    crs = "EPSG:32718"
+    distrito = gpd.GeoDataFrame(geometry=[box(X0, Y0, X0 + 200, Y0 + 100)], crs=crs)
+    mitades = [box(X0, Y0, X0 + 100, Y0 + 100), box(X0 + 100, Y0, X0 + 200, Y0 + 100)]
+    capas = {c: gpd.GeoDataFrame({c: [1.0, 5.0]}, geometry=mitades, crs=crs) for c in COLUMNAS_PESO}
+    return distrito, capas
+
+
+def test_motor_raster_en_un_distrito_sintetico():
+    pytest.importorskip("rasterio")
+    distrito, capas = _distrito_y_capas()
+
+    gdf = peligro_raster(capas, distrito, RANGOS, resolucion=10, tamiz=0)
+
+    assert gdf.crs == distrito.crs
+    assert gdf['NIVEL'].tolist() == [1, 5]
+    np.testing.assert_allclose(gdf['PELIGRO'], [1.0, 5.0], rtol=1e-6)
+    np.testing.assert_allclose(gdf['AREA_KM2'], [0.01, 0.01], rtol=1e-6)
+    assert gdf.geometry.union_all().area == pytest.approx(200 * 100)
+
+
+def test_cubo_de_pesos_guarda_los_pesos_escalados_y_sin_clase_afuera():
+    pytest.importorskip("rasterio")
+    from shapely.geometry import Polygon
+
+    distrito, capas = _distrito_y_capas()
+    # Triángulo: la esquina noreste de la grilla queda fuera del distrito
+    distrito.geometry = [Polygon([(X0, Y0), (X0 + 200, Y0), (X0, Y0 + 100)])]
+    # A la geología le falta la mitad este
+    capas['PESO_GEOL'] = capas['PESO_GEOL'].iloc[:1]
+
+    cubo, transform, crs, columnas = cubo_pesos(capas, distrito, resolucion=10)
+
+    assert cubo.dtype == np.uint8 and cubo.shape == (5, 10, 20)
+    assert columnas == list(capas) and abs(transform.a) == 10
+    assert cubo[0, 9, 0] == ESCALA_CUBO and cubo[0, 9, 15] == 5 * ESCALA_CUBO
+    assert (cubo[:, 0, 19] == SIN_CLASE).all()
+    assert cubo[4, 9, 15] == SIN_CLASE
+
+    peligro = peligro_desde_cubo(cubo, columnas=columnas)
+    assert peligro[9, 0] == pytest.approx(1.0)
+    assert np.isnan(peligro[9, 15]) and np.isnan(peligro[0, 19])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""🗺️ Regiones publicadas de peligro_regional: listado, publicación atómica y nombres de los distritos"""
+
+import json
+import os
+
+import pytest
+
+import peligro_regional
+from peligro_regional import NOMBRE_META, _nombre_distrito, _publicar_carpeta, listar_regiones
+
+COLUMNAS = ('NOMBDEP', 'NOMBPROV', 'NOMBDIST')
+
+
+@pytest.fixture
+def raiz(tmp_path, monkeypatch):
+    monkeypatch.setattr(peligro_regional, 'RUTA_PELIGRO_REGIONAL', str(tmp_path))
+    return tmp_path
+
+
+def _region(carpeta, **meta):
+    carpeta.mkdir(parents=True)
+    (carpeta / NOMBRE_META).write_text(json.dumps(meta), encoding="utf-8")
+
+
+def test_listar_regiones_omite_carpetas_temporales_y_apartadas(raiz):
+    _region(raiz / "inundacion" / "CUSCO_ANTA", nombre="CUSCO_ANTA")
+    _region(raiz / "inundacion" / "CUSCO_ANTA.4242.old", nombre="vieja")
+    _region(raiz / "inundacion" / ".CUSCO_URUBAMBA.tmp", nombre="a medio publicar")
+    (raiz / "inundacion" / "SIN_META").mkdir()
+    _region(raiz / "heladas" / "PUNO", nombre="PUNO")
+
+    assert [r['nombre'] for r in listar_regiones('inundacion')] == ["CUSCO_ANTA"]
+    regiones = listar_regiones()
+    assert sorted(r['nombre'] for r in regiones) == ["CUSCO_ANTA", "PUNO"]
+    assert all(os.path.isdir(r['carpeta']) for r in regiones)
+
+
+def test_listar_regiones_sin_carpeta(raiz):
+    assert listar_regiones('deslizamiento') == []
+
+
+def test_publicar_reemplaza_la_region_anterior(tmp_path):
+    carpeta = tmp_path / "inundacion" / "CUSCO"
+    for contenido in ("primera", "segunda"):
+        temporal = tmp_path / f".CUSCO.{contenido}"
+        temporal.mkdir()
+        (temporal / "niveles.tif").write_text(contenido)
+        _publicar_carpeta(str(temporal), str(carpeta))
+    assert (carpeta / "niveles.tif").read_text() == "segunda"
+    assert os.listdir(tmp_path / "inundacion") == ["CUSCO"]
+
+
+def test_nombre_distrito_con_y_sin_ubigeo():
+    pd = pytest.importorskip("pandas")
+    # Dos distritos con el mismo nombre en provincias distintas no se pisan
+    anta = pd.Series({'NOMBDEP': "CUSCO", 'NOMBPROV': "ANTA", 'NOMBDIST': "ANTA", 'UBIGEO': "080301"})
+    assert _nombre_distrito(anta, COLUMNAS) == "080301_ANTA_ANTA"
+    sin_ubigeo = pd.Series({'NOMBDEP': "CUSCO", 'NOMBPROV': "LA CONVENCIÓN", 'NOMBDIST': "SANTA ANA"})
+    assert _nombre_distrito(sin_ubigeo, COLUMNAS) == "LA_CONVENCIÓN_SANTA_ANA"
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""🧱 Tamaño de bloque y ventanas (núcleo, lectura con halo, interior) de procesamiento_bloques"""
+
+import numpy as np
+import pytest
+
+from procesamiento_bloques import LADO_MINIMO, lado_bloque, ventanas_bloques
+
+
+def test_lado_bloque_es_multiplo_del_minimo_y_respeta_la_memoria():
+    lado = lado_bloque(bytes_por_pixel=8, halo=3, memoria_mb=64, hilos=2)
+    assert lado % LADO_MINIMO == 0
+    assert (lado + 6) ** 2 * 8 <= 64 * 1024 * 1024 / 2
+
+
+def test_lado_bloque_no_baja_del_minimo():
+    assert lado_bloque(bytes_por_pixel=1000, halo=50, memoria_mb=1, hilos=8) == LADO_MINIMO
+
+
+def test_ventanas_cubren_la_ventana_sin_solaparse():
+    windows = pytest.importorskip("rasterio.windows")
+    ventana = windows.Window(7, 3, 600, 530)
+    cubierto = np.zeros((530, 600), dtype=np.uint8)
+    for bloque in ventanas_bloques(ventana, 256):
+        n = bloque.nucleo
+        cubierto[n.row_off - 3:n.row_off - 3 + n.height, n.col_off - 7:n.col_off - 7 + n.width] += 1
+    assert (cubierto == 1).all()
+
+
+def test_ventanas_en_los_bordes():
+    windows = pytest.importorskip("rasterio.windows")
+    halo = 2
+    bloques = list(ventanas_bloques(windows.Window(0, 0, 300, 260), 256, halo=halo))
+    assert len(bloques) == 4
+
+    ultimo = bloques[-1]
+    # El último núcleo se recorta al borde de la ventana
+    assert (ultimo.nucleo.col_off, ultimo.nucleo.row_off) == (256, 256)
+    assert (ultimo.nucleo.width, ultimo.nucleo.height) == (44, 4)
+    # La lectura agrega el halo por los cuatro lados (se sale del raster en el origen: boundless)
+    primero = bloques[0]
+    assert (primero.lectura.col_off, primero.lectura.row_off) == (-halo, -halo)
+    assert (ultimo.lectura.width, ultimo.lectura.height) == (44 + 2 * halo, 4 + 2 * halo)
+    # El interior devuelve exactamente el núcleo dentro de lo leído
+    datos = np.zeros((ultimo.lectura.height, ultimo.lectura.width))
+    assert datos[ultimo.interior].shape == (4, 44)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""⚖️ Tablas de pesos: lectura estricta de la tabla y traducción de códigos sobre la capa base"""
+
+import numpy as np
+import pytest
+
+import tablas_pesos
+from tablas_pesos import aplicar_tabla_pesos, leer_tabla_pesos, ruta_tabla_pesos
+
+
+def _tabla(tmp_path, texto, nombre="geologia.csv"):
+    ruta = tmp_path / nombre
+    ruta.write_text(texto, encoding="utf-8-sig")
+    return str(ruta)
+
+
+def test_leer_tabla_normaliza_codigos_y_pesos(tmp_path):
+    ruta = _tabla(tmp_path, "Codigo;DESCRIPCION;peso\n10.0;Aluvial;4,5\n ki-a ;Calizas;2\n20;Granito;1\n")
+    campo, tabla = leer_tabla_pesos(ruta)
+    assert campo == "Codigo"
+    assert tabla.to_dict() == {"10": 4.5, "KI-A": 2.0, "20": 1.0}
+
+
+@pytest.mark.parametrize("texto, mensaje", [
+    ("GEOLOGIA,PESO\n10,4\n10.0,3\n", "repite"),
+    ("GEOLOGIA,PESO\n10,4\n20,alto\n", "no numéricos"),
+    ("GEOLOGIA,PESO\n10,4\n20,\n", "no numéricos"),
+    ("GEOLOGIA,DESCRIPCION\n10,Aluvial\n", "PESO"),
+])
+def test_leer_tabla_rechaza(tmp_path, texto, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        leer_tabla_pesos(_tabla(tmp_path, texto))
+
+
+def test_aplicar_tabla_traduce_codigos_y_descarta_unidades_sin_peso(tmp_path):
+    gpd = pytest.importorskip("geopandas")
+    from shapely.geometry import box
+
+    _, tabla = leer_tabla_pesos(_tabla(tmp_path, "GEOLOGIA,PESO\n10,4\nKI-A,2\n"))
+    # En la capa los códigos llegan como números con '.0', en minúsculas o con espacios
+    capa = gpd.GeoDataFrame({'geologia': ["10.0", "ki-a ", "99", "10"], 'OTRA': list("abcd")},
+                            geometry=[box(i, 0, i + 1, 1) for i in range(4)], crs="EPSG:3857")
+
+    gdf = aplicar_tabla_pesos(capa, "GEOLOGIA", tabla, 'PESO_GEOL')
+
+    assert list(gdf.columns) == ['geologia', 'geometry', 'PESO_GEOL']
+    assert gdf['PESO_GEOL'].tolist() == [4.0, 2.0, 4.0]
+    assert gdf.index.tolist() == [0, 1, 3]
+    with pytest.raises(ValueError, match="UNIDAD"):
+        aplicar_tabla_pesos(capa, "UNIDAD", tabla, 'PESO_GEOL')
+
+
+def test_codigos_numericos_de_la_capa(tmp_path):
+    gpd = pytest.importorskip("geopandas")
+    from shapely.geometry import box
+
+    _, tabla = leer_tabla_pesos(_tabla(tmp_path, "CODIGO,PESO\n1,5\n2,3\n"))
+    capa = gpd.GeoDataFrame({'CODIGO': np.array([2.0, 1.0])}, geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1)])
+    assert aplicar_tabla_pesos(capa, "CODIGO", tabla, 'PESO_GEOMO')['PESO_GEOMO'].tolist() == [3.0, 5.0]
+
+
+def test_tabla_del_departamento_antes_que_la_nacional(tmp_path, monkeypatch):
+    monkeypatch.setattr(tablas_pesos, 'RUTA_PESOS', str(tmp_path))
+    nacional = _tabla(tmp_path, "GEOLOGIA,PESO\n10,4\n")
+    assert ruta_tabla_pesos('geologia', 'CUSCO') == nacional
+    cusco = _tabla(tmp_path, "GEOLOGIA,PESO\n10,3\n", "geologia_cusco.csv")
+    assert ruta_tabla_pesos('geologia', 'CUSCO') == cusco
+    assert ruta_tabla_pesos('geomorfologia', 'CUSCO') is None
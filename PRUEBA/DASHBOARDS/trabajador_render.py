@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+🖥️ trabajador_render.py - HOST DE RENDER PARA EL MODO DISTRIBUIDO
+- Reclama trabajos de la tabla compartida (almacen_trabajos) y genera los mapas
+- Varios procesos/hosts a la vez: la capacidad escala horizontalmente. Conviene un hilo por proceso
+  (matplotlib.pyplot no es seguro entre hilos); --hilos > 1 solo para pruebas
+- Cada trabajo pasa por el planificador local (carriles, núcleos, tiempo límite) y reporta progreso
+  en la carpeta compartida, así cualquier worker web puede mostrarlo
+- El resultado se publica en DASH_RESULTADOS (carpeta compartida) si está definida; con el
+  almacenamiento S3 (DASH_ALMACEN=s3) el mapa ya queda compartido y no se copia. Los archivos que
+  lo acompañan (estadísticas, GeoPackage) se publican con él
+
+Prueba en una sola máquina Linux (todas las terminales con las mismas variables):
+    export DASH_MODO=distribuido DASH_COMPARTIDO=/tmp/dash_compartido
+    gunicorn -w 3 -b :8051 app:server                 # workers web del dashboard
+    gunicorn -w 2 -b :8052 app_peligro:server
+    python trabajador_render.py --carriles ligero &
+    python trabajador_render.py --carriles ligero &
+    python trabajador_render.py --carriles pesado &
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import threading
+import importlib
+
+from almacen_trabajos import (reclamar_trabajo, finalizar_trabajo, latir, recuperar_abandonados,
+                              limpiar_trabajos_antiguos, nombre_trabajador, LATIDO_S)
+from progreso import trabajo_en_curso
+from planificador import turno, TrabajoCancelado, TrabajoRechazado
+from capas_cache import precargar_capas_base
+# RUTA_RESULTADOS: carpeta compartida donde se publican los mapas (None: se dejan donde los guarda
+# el generador); almacenamiento la conoce para dar a sus archivos claves 'USUARIOS/...'
+from almacenamiento import existe, ruta_local, asociado, RUTA_RESULTADOS
+
+INTERVALO_SONDEO_S = 2.0
+
+# Tipos de mapa que sabe generar un trabajador: clave -> (módulo, función generadora)
+GENERADORES = {
+    'geografico': ('geografica_final', 'generar_mapa_final'),
+    'geomorfologia': ('geomorfologia_final', 'generar_mapa_geomorfologia'),
+    'climatica': ('climatica_final', 'generar_mapa_climatica'),
+    'pendientes': ('pendientes_final', 'generar_mapa_pendientes'),
+    'vias': ('vias_final', 'generar_mapa_vias'),
+    'centros': ('poblacion_final', 'generar_mapa_poblacion'),
+    'geologia': ('geologia_final', 'generar_mapa_geologia'),
+    'rios': ('rios_final', 'generar_mapa_rios'),
+    'inundacion': ('mapa_peligro', 'generar_mapa_peligro'),
+    'deslizamiento': ('mapa_peligro', 'generar_mapa_peligro'),
+    'heladas': ('mapa_peligro', 'generar_mapa_peligro'),
+}
+
+_EN_CURSO = set()
+_BLOQUEO = threading.Lock()
+
+
+def archivos_asociados(ruta):
+    """Archivos guardados junto al mapa con su mismo nombre base (estadísticas, GeoPackage, ...)"""
+    patron = glob.escape(asociado(ruta, "_")) + "*"
+    return sorted(r for r in glob.glob(patron) if not r.endswith(".tmp"))
+
+
+def publicar_resultado(ruta, nombre_usuario):
+    """Copia el mapa y sus archivos asociados a la carpeta compartida de resultados y devuelve la nueva ruta"""
+    if not RUTA_RESULTADOS or ruta_local(ruta) is None:
+        return ruta
+    carpeta_mapa = os.path.basename(os.path.dirname(ruta))
+    carpeta_destino = os.path.join(RUTA_RESULTADOS, nombre_usuario, carpeta_mapa)
+    os.makedirs(carpeta_destino, exist_ok=True)
+    # El mapa al final: cuando aparece, sus estadísticas ya están publicadas
+    for origen in archivos_asociados(ruta) + [ruta]:
+        destino = os.path.join(carpeta_destino, os.path.basename(origen))
+        temporal = f"{destino}.{os.getpid()}.tmp"
+        shutil.copy2(origen, temporal)
+        os.replace(temporal, destino)
+    return os.path.join(carpeta_destino, os.path.basename(ruta))
+
+
+def ejecutar_trabajo(trabajo):
+    """Genera el mapa de un trabajo reclamado y registra el resultado en la tabla"""
+    id_trab = trabajo['id']
+    p = trabajo['parametros']
+    usuario = trabajo['usuario']
+    print(f"\n▶️ [{nombre_trabajador()}] {id_trab}: {trabajo['tipo']} - {p['distrito']}")
+
+    with _BLOQUEO:
+        _EN_CURSO.add(id_trab)
+    try:
+        modulo, funcion = GENERADORES[trabajo['tipo']]
+        generador = getattr(importlib.import_module(modulo), funcion)
+        with trabajo_en_curso(id_trab, f"{trabajo['tipo']} - {p['distrito']}"), \
+                turno(id_trab, usuario, trabajo['tipo'], p.get('estimacion')):
+            # 'opciones': parámetros propios del tipo de mapa (p. ej. la intensidad de la red de ríos)
+            ruta = generador(usuario, p['departamento'], p['provincia'], p['distrito'], **p.get('opciones', {}))
+
+        if existe(ruta):
+            finalizar_trabajo(id_trab, 'terminado', ruta=publicar_resultado(ruta, usuario))
+        else:
+            finalizar_trabajo(id_trab, 'error', error="El generador no devolvió un archivo")
+    except (TrabajoCancelado, TrabajoRechazado) as e:
+        finalizar_trabajo(id_trab, 'cancelado', error=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        finalizar_trabajo(id_trab, 'error', error=str(e))
+    finally:
+        with _BLOQUEO:
+            _EN_CURSO.discard(id_trab)
+
+
+def bucle_hilo(carriles, parar):
+    while not parar.is_set():
+        try:
+            recuperar_abandonados()
+            trabajo = reclamar_trabajo(carriles)
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar la cola de trabajos: {e}")
+            trabajo = None
+        if trabajo is None:
+            parar.wait(INTERVALO_SONDEO_S)
+            continue
+        ejecutar_trabajo(trabajo)
+
+
+def bucle_latidos(parar):
+    """Mantiene vivos los trabajos de este proceso mientras se generan"""
+    while not parar.wait(LATIDO_S):
+        with _BLOQUEO:
+            ids = list(_EN_CURSO)
+        try:
+            latir(ids)
+        except Exception as e:
+            print(f"⚠️ No se pudo registrar el latido: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trabajador de render para el modo distribuido")
+    parser.add_argument("--carriles", default="ligero,pesado", help="Carriles que atiende (ligero, pesado)")
+    parser.add_argument("--hilos", type=int, default=1, help="Trabajos simultáneos en este proceso")
+    args = parser.parse_args(argv)
+
+    carriles = [c.strip() for c in args.carriles.split(',') if c.strip()]
+    print(f"\n{'='*80}")
+    print(f"🖥️ TRABAJADOR DE RENDER {nombre_trabajador()}".center(80))
+    print(f"{'='*80}")
+    print(f"   - Carriles: {', '.join(carriles)}")
+    print(f"   - Hilos: {args.hilos}")
+    print(f"   - Resultados: {RUTA_RESULTADOS or 'carpeta USUARIOS de cada generador'}")
+
+    precargar_capas_base()
+    limpiar_trabajos_antiguos()
+
+    parar = threading.Event()
+    hilos = [threading.Thread(target=bucle_latidos, args=(parar,), daemon=True)]
+    hilos += [threading.Thread(target=bucle_hilo, args=(carriles, parar), daemon=True) for _ in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Deteniendo trabajador (los trabajos en curso se reencolarán si no terminan)...")
+        parar.set()
+    return 0
+
+
+if __name__ == '__main__':
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.exit(main())